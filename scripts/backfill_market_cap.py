@@ -12,7 +12,10 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 if SCRIPT_DIR not in sys.path:
     sys.path.append(SCRIPT_DIR)
 
+import backfill_planner  # noqa: E402
 import kis_master_loader  # noqa: E402
+import pg_bulk  # noqa: E402
+from keyset_pager import fetch_all  # noqa: E402
 
 
 load_dotenv(".env.local")
@@ -26,7 +29,6 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-PAGE_SIZE = 1000
 UPSERT_CHUNK_SIZE = 500
 DEFAULT_START_DATE = "2026-01-01"
 DEFAULT_END_DATE = "2026-02-28"
@@ -39,6 +41,10 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument("--start-date", default=DEFAULT_START_DATE, help="YYYY-MM-DD")
     parser.add_argument("--end-date", default=DEFAULT_END_DATE, help="YYYY-MM-DD")
+    parser.add_argument(
+        "--plan",
+        help="market_cap plan from backfill_planner.py: fill its holes instead of scanning the date range",
+    )
     return parser.parse_args()
 
 
@@ -65,40 +71,38 @@ def fetch_existing_price_dates(
     start_date: str, end_date: str, target_codes: set[str]
 ) -> dict[str, set[str]]:
     code_dates: dict[str, set[str]] = defaultdict(set)
-    offset = 0
-    scanned_rows = 0
-
-    while True:
-        response = (
-            supabase.table("daily_prices_v2")
-            .select("code, date")
-            .gte("date", start_date)
-            .lte("date", end_date)
-            .is_("market_cap", "null")
-            .range(offset, offset + PAGE_SIZE - 1)
-            .execute()
-        )
-        rows = response.data or []
-        if not rows:
-            break
-
-        scanned_rows += len(rows)
-
-        for row in rows:
-            code = row.get("code")
-            date = row.get("date")
-            if code in target_codes and isinstance(date, str):
-                code_dates[code].add(date)
-
-        if len(rows) < PAGE_SIZE:
-            break
-
-        offset += PAGE_SIZE
+    rows = fetch_all(
+        supabase,
+        "daily_prices_v2",
+        "code, date",
+        keys=("date", "code"),
+        filters=lambda q: q.is_("market_cap", "null"),
+        start=start_date,
+        end=end_date,
+        label="fetch_existing_price_dates",
+    )
+    scanned_rows = len(rows)
+
+    for row in rows:
+        code = row.get("code")
+        date = row.get("date")
+        if code in target_codes and isinstance(date, str):
+            code_dates[code].add(date)
 
     print(f"  Rows with NULL market_cap in date range: {scanned_rows}")
     return code_dates
 
 
+def planned_price_dates(path: str, target_codes: set[str]) -> tuple[dict[str, set[str]], dict]:
+    plan = backfill_planner.load_plan(path, ("market_cap",))
+    code_dates: dict[str, set[str]] = defaultdict(set)
+    for request in plan["requests"]:
+        if request["code"] in target_codes:
+            code_dates[request["code"]].update(backfill_planner.hole_dates(plan, request))
+    print(f"  Plan: {path} ({plan['missing']} missing cells)")
+    return code_dates, plan
+
+
 def fetch_kis_market_cap_map() -> dict[str, float]:
     stocks_df = kis_master_loader.get_all_stocks()
     if stocks_df.empty:
@@ -116,12 +120,14 @@ def fetch_kis_market_cap_map() -> dict[str, float]:
 
 
 def upsert_market_caps(records: list[dict]) -> None:
-    for idx in range(0, len(records), UPSERT_CHUNK_SIZE):
-        chunk = records[idx : idx + UPSERT_CHUNK_SIZE]
-        supabase.table("daily_prices_v2").upsert(
-            chunk,
-            on_conflict="code, date",
-        ).execute()
+    # COPY when SUPABASE_DB_URL is set, PostgREST chunks otherwise.
+    pg_bulk.upsert(
+        supabase,
+        "daily_prices_v2",
+        records,
+        on_conflict="code, date",
+        chunk_size=UPSERT_CHUNK_SIZE,
+    )
 
 
 def main() -> None:
@@ -133,13 +139,18 @@ def main() -> None:
         raise ValueError("start-date must be on or before end-date")
 
     print("Starting market_cap backfill...")
-    print(f"  Date range: {start_date} ~ {end_date}")
+    if not args.plan:
+        print(f"  Date range: {start_date} ~ {end_date}")
     print("  Source: current KIS master snapshot")
 
     target_codes = fetch_target_codes()
     print(f"  Target companies: {len(target_codes)}")
 
-    code_dates = fetch_existing_price_dates(start_date, end_date, target_codes)
+    if args.plan:
+        code_dates, plan = planned_price_dates(args.plan, target_codes)
+        print(f"  Date range: {plan['start']} ~ {plan['end']}")
+    else:
+        code_dates = fetch_existing_price_dates(start_date, end_date, target_codes)
     print(f"  Target codes with rows in daily_prices_v2: {len(code_dates)}")
 
     market_cap_map = fetch_kis_market_cap_map()
@@ -0,0 +1,450 @@
+"""Gap planner for the daily_prices_v2 backfills.
+
+fill_trading_value_safe.py refetched its whole date range for every code,
+and backfill_market_cap.py rewrote every NULL market_cap row of a window.
+The planner finds exactly which (code, trading day) cells are missing and
+turns them into the fewest KIS requests that cover them:
+
+1. One scan of daily_prices_v2 over [start, end] (a server-side cursor when
+   SUPABASE_DB_URL is set, keyset pages otherwise) fills code x trading-day
+   bitmaps: row present, close / trading_value / market_cap not null. The
+   trading days are the dates any code has a bar on.
+2. A cell is expected when
+   - close: the day is on or after the code's first session, the earlier of
+     its KIS master ListingDate and its first bar in the scan (``start``
+     when it has neither), and, for a code missing from the current master
+     (delisted; every code when the master cannot be loaded), on or before
+     its last bar, since KIS has no later bars to return;
+   - trading_value, market_cap: the code has a bar that day (those
+     backfills fill columns of existing bars).
+   The holes are expected & ~present, less the cells KIS already answered
+   without a bar: suspended codes stay in the master but have no bars for
+   the suspended days, so those holes would come back in every plan.
+   Executors record such answers in
+   scripts/output/backfill_plans/empty_answers.json (``record_empty_answers``);
+   ``--retry-empty`` plans them again. The runs of consecutive holes of
+   every code come out of one np.diff over the whole matrix.
+3. Runs are packed greedily into requests of at most MAX_REQUEST_DAYS
+   trading days (KIS returns at most 100 bars per daily chart call), which
+   is the fewest requests that cover every hole. A request may span present
+   days between two holes; executors write only the holes. market_cap is
+   not fetched by range, so its plan has one entry per code.
+
+Plans are JSON files, scripts/output/backfill_plans/<column>_<timestamp>.json:
+
+    {"column": "trading_value", "start": "2015-01-01", "end": "2023-12-31",
+     "days": ["2015-01-02", ...], "codes": 812, "missing": 20414, "known_empty": 310,
+     "requests": [
+        {"code": "005930", "start": "2019-03-04", "end": "2019-07-22",
+         "holes": [["2019-03-04", "2019-03-06"], ["2019-07-22", "2019-07-22"]],
+         "missing": 4},
+        ...]}
+
+``fill_trading_value_safe.py --plan`` executes close and trading_value
+plans, ``backfill_market_cap.py --plan`` market_cap plans. Planning again
+after a partial run is the resume: only what is still missing comes back.
+
+Usage:
+    python3 scripts/backfill_planner.py --start-date 2015-01-01
+    python3 scripts/backfill_planner.py --columns trading_value --start-date 2015-01-01 --end-date 2023-12-31
+"""
+
+import argparse
+import bisect
+import json
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from supabase import Client
+
+import kis_master_loader
+import pg_bulk
+from keyset_pager import KeysetPager, fetch_all, split_date_range
+from pipeline_metrics import report_on_exit
+from supabase_batch import get_supabase_client, load_env
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PLAN_DIR = os.path.join(SCRIPT_DIR, "output", "backfill_plans")
+EMPTY_ANSWERS_PATH = os.path.join(PLAN_DIR, "empty_answers.json")
+DEFAULT_START_DATE = "2015-01-01"
+COLUMNS = ("close", "trading_value", "market_cap")
+# KIS daily chart calls return at most 100 bars; a few are kept spare for
+# sessions missing from the calendar (a day no code has a bar on yet).
+MAX_REQUEST_DAYS = 95
+REQUEST_DAYS = {"close": MAX_REQUEST_DAYS, "trading_value": MAX_REQUEST_DAYS, "market_cap": None}
+SCAN_WORKERS = 4
+SCAN_PAGE_SIZE = 10000
+
+
+@dataclass
+class Presence:
+    """Code x trading-day bitmaps of one daily_prices_v2 scan."""
+
+    codes: List[str]
+    days: np.ndarray  # datetime64[D], ascending
+    row: np.ndarray  # bool (codes x days): a bar exists
+    filled: Dict[str, np.ndarray]  # column -> bool (codes x days): not null
+
+    def day_strings(self) -> List[str]:
+        return [str(day) for day in self.days]
+
+
+class _ScanCollector:
+    """Accumulates scan batches as compact arrays (threads add concurrently)."""
+
+    def __init__(self, codes: Sequence[str]):
+        self.code_index = pd.Index(codes)
+        self.day_parts: List[np.ndarray] = []
+        self.cell_parts: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self.lock = threading.Lock()
+        self.rows = 0
+
+    def add(self, batch: List[tuple]) -> None:
+        """``batch``: (code, date, close is not null, trading_value ..., market_cap ...)."""
+        if not batch:
+            return
+        codes, dates, *flags = zip(*batch)
+        days = np.array(dates, dtype="datetime64[D]")
+        code_idx = self.code_index.get_indexer(codes)
+        keep = code_idx >= 0
+        flag_matrix = np.array(flags, dtype=bool).T[keep]
+        with self.lock:
+            # Every code (indices, delisted codes) counts for the calendar.
+            self.day_parts.append(np.unique(days))
+            self.cell_parts.append((code_idx[keep].astype(np.int32), days[keep], flag_matrix))
+            self.rows += len(batch)
+
+    def presence(self) -> Presence:
+        n_codes = len(self.code_index)
+        days = np.unique(np.concatenate(self.day_parts)) if self.day_parts else np.array([], dtype="datetime64[D]")
+        row = np.zeros((n_codes, len(days)), dtype=bool)
+        filled = {column: np.zeros_like(row) for column in COLUMNS}
+        for code_idx, cell_days, flags in self.cell_parts:
+            day_idx = np.searchsorted(days, cell_days)
+            row[code_idx, day_idx] = True
+            for i, column in enumerate(COLUMNS):
+                filled[column][code_idx, day_idx] = flags[:, i]
+        return Presence(list(self.code_index), days, row, filled)
+
+
+def _scan_postgres(collector: _ScanCollector, start: str, end: str) -> None:
+    query = (
+        "select code, date, close is not null, trading_value is not null, market_cap is not null "
+        "from public.daily_prices_v2 where date >= %s and date <= %s"
+    )
+    for batch in pg_bulk.stream_rows(query, (start, end)):
+        collector.add(batch)
+
+
+def _scan_postgrest(supabase: Client, collector: _ScanCollector, start: str, end: str, workers: int) -> None:
+    def run_slice(bounds: Tuple[str, str]) -> None:
+        pager = KeysetPager(
+            supabase,
+            "daily_prices_v2",
+            "code, date, close, trading_value, market_cap",
+            start=bounds[0],
+            end=bounds[1],
+            label="backfill_planner",
+        )
+        pager.sizer.size = SCAN_PAGE_SIZE
+        for page in pager:
+            collector.add(
+                [
+                    (
+                        row["code"],
+                        row["date"],
+                        row.get("close") is not None,
+                        row.get("trading_value") is not None,
+                        row.get("market_cap") is not None,
+                    )
+                    for row in page
+                ]
+            )
+            print(f"   {collector.rows:,}건 스캔 중...", end="\r")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(run_slice, split_date_range(start, end, workers)))
+    print()
+
+
+def scan_presence(supabase: Client, codes: Sequence[str], start: str, end: str, workers: int = SCAN_WORKERS) -> Presence:
+    """Presence bitmaps of ``codes`` over [start, end] from one daily_prices_v2 scan."""
+    collector = _ScanCollector(codes)
+    if pg_bulk.enabled():
+        _scan_postgres(collector, start, end)
+    else:
+        _scan_postgrest(supabase, collector, start, end, workers)
+    return collector.presence()
+
+
+def expected_cells(presence: Presence, column: str, listing_dates: Optional[Dict[str, Optional[str]]] = None) -> np.ndarray:
+    """Cells the ``column`` backfill should fill (codes x days).
+
+    ``listing_dates`` maps every code of the current KIS master to its
+    ListingDate (None when blank).
+    """
+    if column != "close":
+        return presence.row
+    listing_dates = listing_dates or {}
+    n_days = len(presence.days)
+    has_bar = presence.row.any(axis=1)
+    first = np.where(has_bar, presence.row.argmax(axis=1), n_days)
+    listed = [listing_dates.get(code) for code in presence.codes]
+    listed_days = np.array([value or "9999-12-31" for value in listed], dtype="datetime64[D]")
+    first = np.minimum(first, np.searchsorted(presence.days, listed_days))
+    known = has_bar | np.array([value is not None for value in listed], dtype=bool)
+    # Nothing known about the code: every day of the range.
+    first = np.where(known, first, 0)
+    # Delisted: nothing after the last bar (no bar at all: nothing to fetch).
+    last_bar = n_days - 1 - presence.row[:, ::-1].argmax(axis=1)
+    active = np.array([code in listing_dates for code in presence.codes], dtype=bool)
+    last = np.where(active, n_days - 1, np.where(has_bar, last_bar, -1))
+    day_index = np.arange(n_days)[None, :]
+    return (day_index >= first[:, None]) & (day_index <= last[:, None])
+
+
+def drop_empty_answers(presence: Presence, cells: np.ndarray, empty_answers: Optional[Dict[str, Iterable[str]]]) -> np.ndarray:
+    """``cells`` without the ones KIS answered without a bar (code -> dates, see record_empty_answers)."""
+    if not empty_answers:
+        return cells
+    cells = cells.copy()
+    code_index = {code: i for i, code in enumerate(presence.codes)}
+    for code, dates in empty_answers.items():
+        row = code_index.get(code)
+        if row is None:
+            continue
+        days = np.array(sorted(dates), dtype="datetime64[D]")
+        day_idx = np.searchsorted(presence.days, days)
+        on_calendar = day_idx < len(presence.days)
+        day_idx, days = day_idx[on_calendar], days[on_calendar]
+        cells[row, day_idx[presence.days[day_idx] == days]] = False
+    return cells
+
+
+def hole_runs(holes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(code index, first day index, last day index) of every run of True, by code then day."""
+    padded = np.zeros((holes.shape[0], holes.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = holes
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, stops = np.nonzero(edges == -1)
+    return rows, starts, stops - 1
+
+
+def pack_runs(
+    rows: np.ndarray, starts: np.ndarray, ends: np.ndarray, max_days: Optional[int]
+) -> List[Tuple[int, List[Tuple[int, int]]]]:
+    """Greedy cover of the runs with requests of at most ``max_days`` days: (code index, holes)."""
+    requests: List[Tuple[int, List[Tuple[int, int]]]] = []
+    current_row = -1
+    first = 0
+    holes: List[Tuple[int, int]] = []
+    for row, lo, hi in zip(rows.tolist(), starts.tolist(), ends.tolist()):
+        while lo <= hi:
+            limit = hi if max_days is None else first + max_days - 1
+            if row != current_row or lo > limit:
+                if holes:
+                    requests.append((current_row, holes))
+                current_row, first, holes = row, lo, []
+                limit = hi if max_days is None else first + max_days - 1
+            piece_end = min(hi, limit)
+            holes.append((lo, piece_end))
+            lo = piece_end + 1
+    if holes:
+        requests.append((current_row, holes))
+    return requests
+
+
+def build_plan(
+    presence: Presence,
+    column: str,
+    start: str,
+    end: str,
+    listing_dates: Optional[Dict[str, Optional[str]]] = None,
+    empty_answers: Optional[Dict[str, Iterable[str]]] = None,
+) -> dict:
+    if column not in COLUMNS:
+        raise ValueError(f"unknown column {column!r} (expected one of {', '.join(COLUMNS)})")
+    listed_holes = expected_cells(presence, column, listing_dates) & ~presence.filled[column]
+    holes = drop_empty_answers(presence, listed_holes, empty_answers)
+    max_days = REQUEST_DAYS[column]
+    days = presence.day_strings()
+    requests = []
+    for row, runs in pack_runs(*hole_runs(holes), max_days):
+        requests.append(
+            {
+                "code": presence.codes[row],
+                "start": days[runs[0][0]],
+                "end": days[runs[-1][1]],
+                "holes": [[days[lo], days[hi]] for lo, hi in runs],
+                "missing": sum(hi - lo + 1 for lo, hi in runs),
+            }
+        )
+    return {
+        "column": column,
+        "start": start,
+        "end": end,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "max_request_days": max_days,
+        "days": days,
+        "codes": len({request["code"] for request in requests}),
+        "missing": int(holes.sum()),
+        "known_empty": int(listed_holes.sum() - holes.sum()),
+        "requests": requests,
+    }
+
+
+def write_plan(plan: dict, plan_dir: str = PLAN_DIR) -> str:
+    os.makedirs(plan_dir, exist_ok=True)
+    path = os.path.join(plan_dir, f"{plan['column']}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, ensure_ascii=False)
+    return path
+
+
+def load_plan(path: str, columns: Iterable[str]) -> dict:
+    """A plan written by this module; its column must be one of ``columns``."""
+    with open(path, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    columns = tuple(columns)
+    if plan.get("column") not in columns:
+        raise ValueError(f"{path}: plan for {plan.get('column')!r}, this backfill runs {', '.join(columns)}")
+    return plan
+
+
+def load_empty_answers(path: str = EMPTY_ANSWERS_PATH) -> Dict[str, Dict[str, List[str]]]:
+    """Column -> code -> dates KIS answered without a bar (empty when none were recorded)."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def record_empty_answers(column: str, answers: Dict[str, Iterable[str]], path: str = EMPTY_ANSWERS_PATH) -> int:
+    """Add hole dates that a successful KIS request returned no bar for; returns how many were new.
+
+    Only for requests that got an answer: a failed call says nothing about
+    the dates. Shards writing at the same time may drop each other's
+    additions, which only brings those cells back in the next plan.
+    """
+    recorded = load_empty_answers(path)
+    by_code = recorded.setdefault(column, {})
+    added = 0
+    for code, dates in answers.items():
+        known = set(by_code.get(code, ()))
+        new = set(dates) - known
+        if new:
+            by_code[code] = sorted(known | new)
+            added += len(new)
+    if added:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(recorded, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    return added
+
+
+def requests_by_code(plan: dict) -> Dict[str, List[dict]]:
+    grouped: Dict[str, List[dict]] = {}
+    for request in plan["requests"]:
+        grouped.setdefault(request["code"], []).append(request)
+    return grouped
+
+
+def in_holes(request: dict, date: str) -> bool:
+    return any(lo <= date <= hi for lo, hi in request["holes"])
+
+
+def hole_dates(plan: dict, request: dict) -> List[str]:
+    """The trading days of ``request``'s holes, from the plan's calendar."""
+    days = plan["days"]
+    dates: List[str] = []
+    for lo, hi in request["holes"]:
+        dates.extend(days[bisect.bisect_left(days, lo) : bisect.bisect_right(days, hi)])
+    return dates
+
+
+def fetch_universe(supabase: Client) -> List[str]:
+    rows = fetch_all(supabase, "companies", "code", keys=("code",), label="companies")
+    return sorted({row["code"] for row in rows if isinstance(row.get("code"), str) and len(row["code"]) == 6})
+
+
+def fetch_listing_dates() -> Dict[str, Optional[str]]:
+    """Code -> ListingDate (None when blank) of every code in the (cached) KIS
+    master; empty when it cannot be loaded."""
+    try:
+        stocks = kis_master_loader.get_all_stocks()
+    except Exception as exc:
+        stocks = None
+        print(f"[WARN] KIS master unavailable ({exc}).")
+    if stocks is None or stocks.empty or "ListingDate" not in stocks.columns:
+        print("[WARN] No KIS master: close holes run from each code's first bar to its last.")
+        return {}
+    return {str(code): listed or None for code, listed in zip(stocks["Code"], stocks["ListingDate"])}
+
+
+def full_refetch_requests(codes: int, start: str, end: str) -> int:
+    """KIS calls of the old loop: every code, the whole range in 100-day windows."""
+    span = (datetime.strptime(end, "%Y-%m-%d") - datetime.strptime(start, "%Y-%m-%d")).days + 1
+    return codes * math.ceil(span / 100)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Plan the KIS requests that fill daily_prices_v2's missing cells.")
+    parser.add_argument("--start-date", default=DEFAULT_START_DATE, help="YYYY-MM-DD")
+    parser.add_argument("--end-date", default=datetime.now().strftime("%Y-%m-%d"), help="YYYY-MM-DD")
+    parser.add_argument("--columns", default=",".join(COLUMNS), help=f"Comma-separated, of {', '.join(COLUMNS)}")
+    parser.add_argument("--workers", type=int, default=SCAN_WORKERS, help="Parallel scan slices (PostgREST only)")
+    parser.add_argument("--plan-dir", default=PLAN_DIR)
+    parser.add_argument(
+        "--retry-empty",
+        action="store_true",
+        help=f"Plan cells KIS already answered without a bar again (ignore {os.path.relpath(EMPTY_ANSWERS_PATH, SCRIPT_DIR)})",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    start = datetime.strptime(args.start_date, "%Y-%m-%d").strftime("%Y-%m-%d")
+    end = datetime.strptime(args.end_date, "%Y-%m-%d").strftime("%Y-%m-%d")
+    columns = [column.strip() for column in args.columns.split(",") if column.strip()]
+    unknown = set(columns) - set(COLUMNS)
+    if unknown:
+        raise SystemExit(f"unknown columns: {', '.join(sorted(unknown))}")
+
+    load_env()
+    report_on_exit("backfill_planner")
+    supabase = get_supabase_client()
+
+    codes = fetch_universe(supabase)
+    listing_dates = fetch_listing_dates() if "close" in columns else {}
+    print(f"[INFO] {len(codes)} codes, {start} ~ {end} ({'Postgres' if pg_bulk.enabled() else 'PostgREST'} scan)")
+    presence = scan_presence(supabase, codes, start, end, args.workers)
+    print(f"[INFO] {int(presence.row.sum()):,} bars over {len(presence.days)} trading days")
+
+    empty_answers = {} if args.retry_empty else load_empty_answers()
+    for column in columns:
+        plan = build_plan(presence, column, start, end, listing_dates, empty_answers.get(column))
+        path = write_plan(plan, args.plan_dir)
+        summary = f"{plan['missing']:,} missing cells in {plan['codes']} codes"
+        if plan["known_empty"]:
+            summary += f" ({plan['known_empty']:,} more KIS already answered empty)"
+        if plan["max_request_days"] is not None:
+            summary += (
+                f", {len(plan['requests']):,} KIS requests"
+                f" (full refetch: {full_refetch_requests(len(codes), start, end):,})"
+            )
+        print(f"[PLAN] {column}: {summary} -> {path}")
+
+
+if __name__ == "__main__":
+    main()
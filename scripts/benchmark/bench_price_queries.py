@@ -0,0 +1,286 @@
+"""Replay the scripts' daily_prices_v2 queries on a local Postgres, before and after partitioning.
+
+Builds a scratch database with the dashboard-era daily_prices_v2 (primary
+key (code, date) only) and get_latest_prices_by_code as in
+scripts/create_rpc_get_latest_prices_by_code.sql before 20261019009100,
+loads a synthetic market with pg_bulk, and times the SQL the scripts'
+PostgREST requests turn into:
+
+- latest_date        fetch_latest_date (leaders, group indices)
+- day_count          count=exact on one date (equal-weight indices)
+- day_close          code, close on one date
+- day_volume_pages   code, date, close, volume on one date, 1,000-row offset pages by code (trading value rank)
+- window_keyset      code, date, close over PRICE_WINDOW_DAYS in keyset pages (pipeline_context, RS)
+- leaders_keyset     date, code, close, trading_value over 30 days in keyset pages (leaders)
+- code_history       date, close for single codes in date order (indicators, group indices)
+- code_recent        date, close, trading_value for single codes, newest 260 first
+- latest_prices_rpc  get_latest_prices_by_code() (update_today_v3)
+
+Then applies 20261019009000 and 20261019009100 and runs the same queries
+again. Every query must return the same rows in both phases. Results go to
+scripts/output/benchmarks/price_queries_<timestamp>.json.
+
+Usage:
+    python3 scripts/benchmark/bench_price_queries.py --dsn postgresql://postgres:pw@localhost/postgres
+    python3 scripts/benchmark/bench_price_queries.py --codes 2700 --years 10 --repeat 3
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_DIR = os.path.dirname(BENCH_DIR)
+for path in (BENCH_DIR, SCRIPT_DIR):
+    if path not in sys.path:
+        sys.path.append(path)
+
+import psycopg
+
+import pg_bulk
+from local_postgres import DEFAULT_DSN, apply_migration, create_base_tables, scratch_database, supabase_roles
+from synthetic_market import SyntheticMarket
+
+OUTPUT_DIR = os.path.join(SCRIPT_DIR, "output", "benchmarks")
+DATABASE = "price_bench"
+PRICE_WINDOW_DAYS = 400
+LEADER_WINDOW_DAYS = 30
+PAGE_SIZE = 1000
+HISTORY_CODES = 50
+LOAD_CHUNK = 200_000
+
+BEFORE_LATEST_PRICES_RPC = """
+create or replace function public.get_latest_prices_by_code()
+returns table(code text, date text, close numeric)
+language sql
+as $function$
+  select distinct on (code) code, date::text, close
+  from daily_prices_v2
+  order by code, date desc;
+$function$;
+"""
+
+PARTITION_MIGRATIONS = (
+    "20261019009000_partition_daily_prices_v2_by_year.sql",
+    "20261019009100_daily_prices_v2_covering_indexes.sql",
+)
+
+Query = Callable[[psycopg.Connection], List[tuple]]
+
+
+def keyset(columns: str, start: str, end: str) -> Query:
+    """fetch_all(keys=("date", "code")): date >= d AND (date > d OR code > c) ORDER BY date, code."""
+
+    def run(conn: psycopg.Connection) -> List[tuple]:
+        rows: List[tuple] = []
+        after = None
+        while True:
+            if after is None:
+                page = conn.execute(
+                    f"select {columns} from daily_prices_v2 where date >= %s and date <= %s "
+                    "order by date, code limit %s",
+                    (start, end, PAGE_SIZE),
+                ).fetchall()
+            else:
+                page = conn.execute(
+                    f"select {columns} from daily_prices_v2 where date >= %s and date <= %s "
+                    "and date >= %s and (date > %s or code > %s) order by date, code limit %s",
+                    (start, end, after[0], after[0], after[1], PAGE_SIZE),
+                ).fetchall()
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+            last = page[-1]
+            after = (last[columns.split(", ").index("date")], last[columns.split(", ").index("code")])
+
+    return run
+
+
+def offset_pages(columns: str, day: str) -> Query:
+    def run(conn: psycopg.Connection) -> List[tuple]:
+        rows: List[tuple] = []
+        offset = 0
+        while True:
+            page = conn.execute(
+                f"select {columns} from daily_prices_v2 where date = %s order by code limit %s offset %s",
+                (day, PAGE_SIZE, offset),
+            ).fetchall()
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+            offset += PAGE_SIZE
+
+    return run
+
+
+def per_code(sql_text: str, codes: List[str]) -> Query:
+    def run(conn: psycopg.Connection) -> List[tuple]:
+        rows: List[tuple] = []
+        for code in codes:
+            rows.extend(conn.execute(sql_text, (code,)).fetchall())
+        return rows
+
+    return run
+
+
+def single(sql_text: str, params: tuple = (), ordered: bool = True) -> Query:
+    def run(conn: psycopg.Connection) -> List[tuple]:
+        rows = conn.execute(sql_text, params).fetchall()
+        return rows if ordered else sorted(rows)
+
+    return run
+
+
+def build_queries(market: SyntheticMarket) -> Dict[str, Query]:
+    last = market.last_date
+    last_day = date.fromisoformat(last)
+    window_start = (last_day - timedelta(days=PRICE_WINDOW_DAYS)).isoformat()
+    leader_start = (last_day - timedelta(days=LEADER_WINDOW_DAYS)).isoformat()
+    step = max(1, len(market.codes) // HISTORY_CODES)
+    codes = market.codes[::step][:HISTORY_CODES]
+    return {
+        "latest_date": single("select date from daily_prices_v2 order by date desc limit 1"),
+        "day_count": single("select count(*) from daily_prices_v2 where date = %s", (last,)),
+        "day_close": single("select code, close from daily_prices_v2 where date = %s", (last,), ordered=False),
+        "day_volume_pages": offset_pages("code, date, close, volume", last),
+        "window_keyset": keyset("code, date, close", window_start, last),
+        "leaders_keyset": keyset("date, code, close, trading_value", leader_start, last),
+        "code_history": per_code("select date, close from daily_prices_v2 where code = %s order by date", codes),
+        "code_recent": per_code(
+            "select date, close, trading_value from daily_prices_v2 where code = %s order by date desc limit 260",
+            codes,
+        ),
+        "latest_prices_rpc": single("select * from get_latest_prices_by_code()", ordered=False),
+    }
+
+
+def digest(rows: List[tuple]) -> str:
+    return hashlib.sha1(repr(rows).encode("utf-8")).hexdigest()
+
+
+def run_phase(conn: psycopg.Connection, queries: Dict[str, Query], repeat: int) -> Tuple[Dict[str, dict], Tuple[int, int]]:
+    """Per-query timings and the table/index size, after a vacuum."""
+    conn.autocommit = True
+    conn.execute("vacuum (analyze) daily_prices_v2")
+    results = {}
+    for name, query in queries.items():
+        rows = query(conn)  # warm-up, also the rows compared across phases
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query(conn)
+            timings.append(time.perf_counter() - started)
+        results[name] = {
+            "rows": len(rows),
+            "digest": digest(rows),
+            "median_sec": statistics.median(timings),
+            "min_sec": min(timings),
+        }
+    size = table_size(conn)
+    conn.autocommit = False
+    return results, size
+
+
+def load_prices(conn: psycopg.Connection, market: SyntheticMarket) -> int:
+    rows = market.price_rows(market.last_date)
+    for i in range(0, len(rows), LOAD_CHUNK):
+        pg_bulk.copy_upsert(conn, "daily_prices_v2", rows[i : i + LOAD_CHUNK], "code,date")
+    return len(rows)
+
+
+def table_size(conn: psycopg.Connection) -> Tuple[int, int]:
+    """(table bytes, index bytes) summed over partitions."""
+    row = conn.execute(
+        """
+        select coalesce(sum(pg_table_size(c.oid)), 0), coalesce(sum(pg_indexes_size(c.oid)), 0)
+        from pg_class c
+        where c.oid = 'daily_prices_v2'::regclass
+           or c.oid in (select inhrelid from pg_inherits where inhparent = 'daily_prices_v2'::regclass)
+        """
+    ).fetchone()
+    return int(row[0]), int(row[1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="daily_prices_v2 query latency before/after partitioning.")
+    parser.add_argument("--dsn", default=os.environ.get("LOCAL_PG_DSN", DEFAULT_DSN))
+    parser.add_argument("--codes", type=int, default=1000)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"[INFO] Generating market: {args.codes} codes x {args.years} years")
+    market = SyntheticMarket(n_codes=args.codes, years=args.years, seed=args.seed)
+    queries = build_queries(market)
+
+    with scratch_database(args.dsn, DATABASE) as conn:
+        supabase_roles(conn)
+        create_base_tables(conn)
+        with conn.transaction():
+            conn.execute(BEFORE_LATEST_PRICES_RPC)
+        apply_migration(conn, "20261019004000_create_company_listing_stats.sql")
+
+        started = time.perf_counter()
+        loaded = load_prices(conn, market)
+        print(f"[INFO] Loaded {loaded:,} rows in {time.perf_counter() - started:.1f}s")
+
+        before, before_size = run_phase(conn, queries, args.repeat)
+
+        started = time.perf_counter()
+        for migration in PARTITION_MIGRATIONS:
+            apply_migration(conn, migration)
+        migrate_sec = time.perf_counter() - started
+        print(f"[INFO] Migrations applied in {migrate_sec:.1f}s")
+
+        after, after_size = run_phase(conn, queries, args.repeat)
+        partitions = conn.execute(
+            "select count(*) from pg_inherits where inhparent = 'daily_prices_v2'::regclass"
+        ).fetchone()[0]
+        conn.rollback()
+
+    print(f"\n{'query':<20} {'rows':>9} {'before ms':>10} {'after ms':>10} {'change':>8}  same")
+    all_same = True
+    for name in queries:
+        b, a = before[name], after[name]
+        same = b["digest"] == a["digest"]
+        all_same &= same
+        print(
+            f"{name:<20} {a['rows']:>9,} {b['median_sec'] * 1000:>10.1f} {a['median_sec'] * 1000:>10.1f} "
+            f"{b['median_sec'] / a['median_sec']:>7.1f}x  {'yes' if same else 'NO'}"
+        )
+    mb = 1024 * 1024
+    print(
+        f"\nsize (table + indexes): before {before_size[0] / mb:.0f} + {before_size[1] / mb:.0f} MB, "
+        f"after {after_size[0] / mb:.0f} + {after_size[1] / mb:.0f} MB over {partitions} partitions"
+    )
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(OUTPUT_DIR, f"price_queries_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "config": {k: v for k, v in vars(args).items() if k != "dsn"},
+                "rows": loaded,
+                "migrate_sec": migrate_sec,
+                "before": before,
+                "after": after,
+                "size_bytes": {"before": before_size, "after": after_size},
+            },
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+    print(f"\n[DONE] Results written: {path}")
+    sys.exit(0 if all_same else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""Local stand-in for the KIS Open API, served from a SyntheticMarket.
+
+Implements the endpoints the ingest uses, with the behaviour that shapes its
+throughput:
+
+- ``POST /oauth2/tokenP`` issues a bearer token; a second issue for the same
+  appkey inside ``token_issue_interval_sec`` is refused with EGW00133, and
+  tokens expire after ``token_ttl_sec`` (EGW00123 on use);
+- every quotation call counts against a per-appkey sliding one-second window
+  of ``rate_limit_per_sec``; going over returns HTTP 500 + EGW00201 like the
+  real gateway;
+- daily chart endpoints return at most 100 bars, newest first;
+- ``POST /oauth2/Approval`` issues websocket approval keys (the websocket
+  itself is kis_ws_replay.py).
+
+    with FakeKisServer(market, rate_limit_per_sec=20) as kis:
+        update_today_v3.KIS_BASE_URL = kis.base_url
+"""
+
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, urlparse
+
+from synthetic_market import INDEX_CODES, SyntheticMarket
+
+MAX_CHART_ROWS = 100
+
+DAILY_CHART_PATH = "/uapi/domestic-stock/v1/quotations/inquire-daily-itemchartprice"
+PRICE_PATH = "/uapi/domestic-stock/v1/quotations/inquire-price"
+INDEX_CHART_PATH = "/uapi/domestic-stock/v1/quotations/inquire-daily-indexchartprice"
+
+
+def _kis_date(value: str) -> str:
+    return f"{value[:4]}-{value[4:6]}-{value[6:8]}"
+
+
+def _num(value) -> str:
+    return str(int(round(float(value))))
+
+
+class FakeKisServer:
+    def __init__(
+        self,
+        market: SyntheticMarket,
+        rate_limit_per_sec: int = 20,
+        token_ttl_sec: float = 86_400,
+        token_issue_interval_sec: float = 60,
+        latency_sec: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.market = market
+        self.rate_limit_per_sec = rate_limit_per_sec
+        self.token_ttl_sec = token_ttl_sec
+        self.token_issue_interval_sec = token_issue_interval_sec
+        self.latency_sec = latency_sec
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, tuple] = {}  # token -> (appkey, expires_at)
+        self._last_issue: Dict[str, float] = {}
+        self._windows: Dict[str, deque] = defaultdict(deque)
+        self.stats: Dict[str, int] = defaultdict(int)
+
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeKisServer":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-kis", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeKisServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats = defaultdict(int)
+
+    # ------------------------------------------------------------------
+    # Gateway rules
+    # ------------------------------------------------------------------
+    def issue_token(self, appkey: str) -> tuple:
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_issue.get(appkey)
+            if last is not None and now - last < self.token_issue_interval_sec:
+                self.stats["token_refused"] += 1
+                return 403, {
+                    "error_code": "EGW00133",
+                    "error_description": "접근토큰 발급 잠시 후 다시 시도하세요(1분당 1회)",
+                }
+            self._last_issue[appkey] = now
+            token = f"fake-{appkey}-{len(self._tokens) + 1}"
+            self._tokens[token] = (appkey, now + self.token_ttl_sec)
+            self.stats["tokens_issued"] += 1
+        return 200, {
+            "access_token": token,
+            "token_type": "Bearer",
+            "expires_in": int(self.token_ttl_sec),
+        }
+
+    def issue_approval_key(self, appkey: str) -> tuple:
+        with self._lock:
+            self.stats["approval_keys_issued"] += 1
+            return 200, {"approval_key": f"fake-approval-{appkey}-{self.stats['approval_keys_issued']}"}
+
+    def check_request(self, headers) -> Optional[tuple]:
+        """Return an error response for a bad token or a rate-limit hit."""
+        auth = headers.get("authorization", "")
+        token = auth[len("Bearer "):] if auth.startswith("Bearer ") else ""
+        now = time.monotonic()
+        with self._lock:
+            self.stats["requests"] += 1
+            entry = self._tokens.get(token)
+            if entry is None:
+                self.stats["bad_token"] += 1
+                return 500, {"rt_cd": "1", "msg_cd": "EGW00121", "msg1": "유효하지 않은 token 입니다."}
+            appkey, expires_at = entry
+            if now >= expires_at:
+                self.stats["expired_token"] += 1
+                return 500, {"rt_cd": "1", "msg_cd": "EGW00123", "msg1": "기간이 만료된 token 입니다."}
+            window = self._windows[appkey]
+            while window and now - window[0] >= 1.0:
+                window.popleft()
+            if len(window) >= self.rate_limit_per_sec:
+                self.stats["throttled"] += 1
+                return 500, {"rt_cd": "1", "msg_cd": "EGW00201", "msg1": "초당 거래건수를 초과하였습니다."}
+            window.append(now)
+        return None
+
+    # ------------------------------------------------------------------
+    # Endpoints
+    # ------------------------------------------------------------------
+    def daily_chart(self, params: dict) -> dict:
+        code = params.get("FID_INPUT_ISCD", "")
+        df = self.market.bars(
+            code,
+            _kis_date(params["FID_INPUT_DATE_1"]),
+            _kis_date(params["FID_INPUT_DATE_2"]),
+            adjusted=params.get("FID_ORG_ADJ_PRC", "0") == "0",
+        )
+        df = df.iloc[::-1].head(MAX_CHART_ROWS)
+        output2 = [
+            {
+                "stck_bsop_date": d.replace("-", ""),
+                "stck_oprc": _num(o),
+                "stck_hgpr": _num(h),
+                "stck_lwpr": _num(lo),
+                "stck_clpr": _num(c),
+                "acml_vol": _num(v),
+                "acml_tr_pbmn": _num(tv),
+            }
+            for d, o, h, lo, c, v, tv in zip(
+                df["date"], df["open"], df["high"], df["low"], df["close"], df["volume"], df["trading_value"]
+            )
+        ]
+        return {"rt_cd": "0", "msg_cd": "MCA00000", "msg1": "정상처리 되었습니다.", "output1": {}, "output2": output2}
+
+    def current_price(self, params: dict) -> dict:
+        code = params.get("FID_INPUT_ISCD", "")
+        df = self.market.bars(code, self.market.last_date, self.market.last_date)
+        if df.empty:
+            return {"rt_cd": "0", "msg_cd": "MCA00000", "output": {}}
+        close = df["close"].iloc[-1]
+        return {
+            "rt_cd": "0",
+            "msg_cd": "MCA00000",
+            "output": {
+                "stck_prpr": _num(close),
+                "acml_vol": _num(df["volume"].iloc[-1]),
+                "acml_tr_pbmn": _num(df["trading_value"].iloc[-1]),
+                # hts_avls is in 억원.
+                "hts_avls": _num(self.market.market_cap(code) / 1e8),
+            },
+        }
+
+    def index_chart(self, params: dict) -> dict:
+        name = INDEX_CODES.get(params.get("FID_INPUT_ISCD", ""))
+        if name is None:
+            return {"rt_cd": "0", "output2": []}
+        df = self.market.index_bars(
+            name, _kis_date(params["FID_INPUT_DATE_1"]), _kis_date(params["FID_INPUT_DATE_2"])
+        )
+        df = df.iloc[::-1].head(MAX_CHART_ROWS)
+        output2 = [
+            {
+                "stck_bsop_date": d.replace("-", ""),
+                "bstp_nmix_oprc": f"{c:.2f}",
+                "bstp_nmix_hgpr": f"{c:.2f}",
+                "bstp_nmix_lwpr": f"{c:.2f}",
+                "bstp_nmix_prpr": f"{c:.2f}",
+                "acml_vol": "0",
+                "acml_tr_pbmn": "0",
+            }
+            for d, c in zip(df["date"], df["close"])
+        ]
+        return {"rt_cd": "0", "msg_cd": "MCA00000", "output2": output2}
+
+    def _handler_class(self):
+        server = self
+        routes = {
+            DAILY_CHART_PATH: server.daily_chart,
+            PRICE_PATH: server.current_price,
+            INDEX_CHART_PATH: server.index_chart,
+        }
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def _send(self, status: int, payload: dict) -> None:
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b"{}"
+                path = urlparse(self.path).path
+                if path not in ("/oauth2/tokenP", "/oauth2/Approval"):
+                    self._send(404, {"msg1": "not found"})
+                    return
+                try:
+                    body = json.loads(raw or b"{}")
+                except ValueError:
+                    body = {}
+                if path == "/oauth2/Approval":
+                    self._send(*server.issue_approval_key(body.get("appkey", "")))
+                else:
+                    self._send(*server.issue_token(body.get("appkey", "")))
+
+            def do_GET(self) -> None:
+                url = urlparse(self.path)
+                route = routes.get(url.path)
+                if route is None:
+                    self._send(404, {"rt_cd": "1", "msg1": "not found"})
+                    return
+                error = server.check_request(self.headers)
+                if error is not None:
+                    self._send(*error)
+                    return
+                if server.latency_sec:
+                    time.sleep(server.latency_sec)
+                with server._lock:
+                    server.stats[url.path.rsplit("/", 1)[-1]] += 1
+                self._send(200, route(dict(parse_qsl(url.query))))
+
+        return Handler
@@ -0,0 +1,466 @@
+"""In-memory PostgREST-compatible store for the offline benchmarks.
+
+Speaks enough of the PostgREST dialect for supabase-py's query builder as the
+daily scripts use it: ``select``, ``eq/neq/gt/gte/lt/lte/in/is`` filters
+(with ``not.``), flat ``or=(...)`` filters, ``order``, ``offset/limit`` (or a
+Range header, capped at ``max_rows`` like the real server), upsert
+via ``Prefer: resolution=merge-duplicates`` + ``on_conflict``, PATCH,
+DELETE and registered RPC functions. Responses carry Content-Range like the
+real server so the metrics hooks count rows read.
+
+Tables are keyed by their unique constraint (see TABLE_KEYS) and indexed on
+``code`` and ``date``, so per-date and per-code reads stay cheap even with a
+few hundred thousand price rows.
+
+    with FakePostgrestServer() as store:
+        store.load("companies", rows)
+        supabase = create_client(store.base_url, "bench-key")
+"""
+
+import bisect
+import json
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, unquote, urlparse
+
+TABLE_KEYS: Dict[str, Tuple[str, ...]] = {
+    "companies": ("code",),
+    "daily_prices_v2": ("code", "date"),
+    "rs_rankings_v2": ("code", "date"),
+    "trading_value_rankings": ("code", "date"),
+    "leader_stocks_daily": ("code", "date"),
+    "equal_weight_indices": ("index_type", "index_code", "date"),
+    "index_constituents_monthly": ("index_type", "index_code", "rebalance_date", "code"),
+    "industries": ("code",),
+    "themes": ("code",),
+    "company_industries": ("industry_id", "company_code"),
+    "company_themes": ("theme_id", "company_code"),
+    "industry_trading_metrics": ("industry_id", "date"),
+    "theme_trading_metrics": ("theme_id", "date"),
+    "daily_indicators": ("code", "date"),
+    "indicator_states": ("code",),
+    "pattern_screen_results": ("date", "code", "pattern_id"),
+    "forward_high_returns": ("code", "date"),
+    "forward_high_states": ("code",),
+    "company_listing_stats": ("code",),
+    "rs_rankings_provisional": ("date", "code"),
+    "leader_stocks_provisional": ("date", "code"),
+    "realtime_quotes": ("code",),
+    "user_portfolio": ("id",),
+    "user_portfolio_transactions": ("id",),
+    "user_portfolio_group_averages": ("user_id", "company_code", "position_type"),
+    "user_portfolio_snapshots": ("user_id", "date", "company_code", "position_type"),
+    "user_portfolio_nav": ("user_id", "date"),
+    "user_favorite_stocks": ("user_id", "company_code"),
+    "ingest_shards": ("run_date", "shard_count", "shard"),
+    "company_shares_history": ("code", "date"),
+}
+INDEXED_COLUMNS = ("code", "date")
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+class QueryError(Exception):
+    def __init__(self, status: int, code: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+def _coerce(raw: str, sample):
+    """Turn a filter literal into the type of the stored value."""
+    if isinstance(sample, bool):
+        return raw.lower() == "true"
+    if isinstance(sample, (int, float)):
+        try:
+            return float(raw)
+        except ValueError:
+            return raw
+    return raw
+
+
+def _split_in_list(raw: str) -> List[str]:
+    inner = raw[1:-1] if raw.startswith("(") and raw.endswith(")") else raw
+    return [item.strip().strip('"') for item in inner.split(",") if item.strip()]
+
+
+class Filter:
+    def __init__(self, column: str, expr: str):
+        self.column = column
+        self.negate = expr.startswith("not.")
+        if self.negate:
+            expr = expr[4:]
+        self.op, _, self.raw = expr.partition(".")
+        if self.op not in {"eq", "neq", "gt", "gte", "lt", "lte", "in", "is"}:
+            raise QueryError(400, "PGRST100", f"unsupported operator {self.op}")
+        self.values = _split_in_list(self.raw) if self.op == "in" else None
+
+    def matches(self, row: dict) -> bool:
+        value = row.get(self.column)
+        if self.op == "is":
+            target = {"null": None, "true": True, "false": False}.get(self.raw.lower())
+            result = value is target if target is None else value == target
+        elif value is None:
+            result = False
+        elif self.op == "in":
+            result = value in {_coerce(v, value) for v in self.values}
+        else:
+            other = _coerce(self.raw, value)
+            try:
+                result = {
+                    "eq": value == other,
+                    "neq": value != other,
+                    "gt": value > other,
+                    "gte": value >= other,
+                    "lt": value < other,
+                    "lte": value <= other,
+                }[self.op]
+            except TypeError:
+                result = False
+        return not result if self.negate else result
+
+
+class MemoryTable:
+    def __init__(self, name: str, key: Tuple[str, ...]):
+        self.name = name
+        self.key = key
+        self.rows: Dict[tuple, dict] = {}
+        self.index: Dict[str, Dict[object, set]] = {
+            col: defaultdict(set) for col in INDEXED_COLUMNS
+        }
+        self._sorted: Dict[str, list] = {}
+
+    def _pk(self, row: dict) -> tuple:
+        missing = [col for col in self.key if col not in row]
+        if missing:
+            raise QueryError(400, "23502", f"{self.name}: missing key columns {missing}")
+        return tuple(row[col] for col in self.key)
+
+    def _index_add(self, pk: tuple, row: dict) -> None:
+        for col, entries in self.index.items():
+            if col in row:
+                if row[col] not in entries:
+                    self._sorted.pop(col, None)
+                entries[row[col]].add(pk)
+
+    def _index_remove(self, pk: tuple, row: dict) -> None:
+        for col, entries in self.index.items():
+            if col in row and row[col] in entries:
+                bucket = entries[row[col]]
+                bucket.discard(pk)
+                if not bucket:
+                    del entries[row[col]]
+                    self._sorted.pop(col, None)
+
+    def upsert(self, row: dict, merge: bool) -> dict:
+        pk = self._pk(row)
+        current = self.rows.get(pk)
+        if current is not None and not merge:
+            raise QueryError(409, "23505", f"duplicate key value violates unique constraint on {self.name}")
+        if current is not None:
+            self._index_remove(pk, current)
+            row = {**current, **row}
+        else:
+            row = dict(row)
+        self.rows[pk] = row
+        self._index_add(pk, row)
+        return row
+
+    def delete(self, pk: tuple) -> dict:
+        row = self.rows.pop(pk)
+        self._index_remove(pk, row)
+        return row
+
+    def _sorted_values(self, col: str) -> list:
+        if col not in self._sorted:
+            self._sorted[col] = sorted(self.index[col])
+        return self._sorted[col]
+
+    def candidates(self, filters: List[Filter]) -> List[tuple]:
+        """Narrow by the code/date indexes before the row-by-row filter."""
+        narrowed: Optional[set] = None
+        for f in filters:
+            if f.column not in self.index or f.negate:
+                continue
+            entries = self.index[f.column]
+            if f.op == "eq":
+                keys = entries.get(f.raw, set())
+            elif f.op == "in":
+                keys = set().union(*(entries.get(v, set()) for v in f.values)) if f.values else set()
+            elif f.op in ("gt", "gte", "lt", "lte") and f.column == "date":
+                values = self._sorted_values(f.column)
+                if f.op in ("gt", "gte"):
+                    lo = bisect.bisect_right(values, f.raw) if f.op == "gt" else bisect.bisect_left(values, f.raw)
+                    selected = values[lo:]
+                else:
+                    hi = bisect.bisect_left(values, f.raw) if f.op == "lt" else bisect.bisect_right(values, f.raw)
+                    selected = values[:hi]
+                keys = set().union(*(entries[v] for v in selected)) if selected else set()
+            else:
+                continue
+            narrowed = set(keys) if narrowed is None else narrowed & keys
+        return list(self.rows) if narrowed is None else list(narrowed)
+
+    def select(self, filters: List[Filter]) -> List[dict]:
+        rows = (self.rows[pk] for pk in self.candidates(filters))
+        return [row for row in rows if all(f.matches(row) for f in filters)]
+
+
+class OrFilter:
+    """``or=(a.gt.1,b.eq.x)``: a flat disjunction of simple filters."""
+
+    column = "or"
+    negate = False
+
+    def __init__(self, expr: str):
+        inner = expr[1:-1] if expr.startswith("(") and expr.endswith(")") else expr
+        self.terms = []
+        for term in _split_in_list(f"({inner})"):
+            column, _, rest = term.partition(".")
+            self.terms.append(Filter(column, rest))
+
+    def matches(self, row: dict) -> bool:
+        return any(term.matches(row) for term in self.terms)
+
+
+def _parse_filter(key: str, value: str):
+    return OrFilter(value) if key == "or" else Filter(key, value)
+
+
+def _parse_order(raw: str) -> List[Tuple[str, bool, Optional[bool]]]:
+    orders = []
+    for part in raw.split(","):
+        pieces = part.strip().split(".")
+        column = pieces[0]
+        desc = "desc" in pieces[1:]
+        nulls_first = True if "nullsfirst" in pieces[1:] else False if "nullslast" in pieces[1:] else None
+        orders.append((column, desc, nulls_first))
+    return orders
+
+
+def _apply_order(rows: List[dict], orders) -> List[dict]:
+    for column, desc, nulls_first in reversed(orders):
+        # PostgREST default: NULLS LAST for asc, NULLS FIRST for desc.
+        if nulls_first is None:
+            nulls_first = desc
+        present = [r for r in rows if r.get(column) is not None]
+        missing = [r for r in rows if r.get(column) is None]
+        present.sort(key=lambda r: r[column], reverse=desc)
+        rows = missing + present if nulls_first else present + missing
+    return rows
+
+
+def _project(rows: List[dict], select: str) -> List[dict]:
+    columns = [c.strip() for c in select.split(",") if c.strip()]
+    if not columns or "*" in columns:
+        return [dict(r) for r in rows]
+    for column in columns:
+        if "(" in column or ":" in column:
+            raise QueryError(400, "PGRST100", f"embedding/aliases are not supported: {column}")
+    return [{c: r.get(c) for c in columns} for r in rows]
+
+
+class FakePostgrestServer:
+    def __init__(
+        self,
+        latency_sec: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        max_rows: Optional[int] = None,
+    ):
+        self.latency_sec = latency_sec
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self.tables: Dict[str, MemoryTable] = {}
+        self.rpcs: Dict[str, Callable[["FakePostgrestServer", dict], object]] = {
+            "get_latest_prices_by_code": rpc_get_latest_prices_by_code,
+        }
+        self.stats: Dict[str, int] = defaultdict(int)
+        self.reset()
+
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakePostgrestServer":
+        threading.Thread(target=self._server.serve_forever, name="fake-postgrest", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakePostgrestServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+    # ------------------------------------------------------------------
+    # Direct access (seeding and assertions, no HTTP)
+    # ------------------------------------------------------------------
+    def reset(self) -> None:
+        with self._lock:
+            self.tables = {name: MemoryTable(name, key) for name, key in TABLE_KEYS.items()}
+            self.stats = defaultdict(int)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats = defaultdict(int)
+
+    def table(self, name: str) -> MemoryTable:
+        table = self.tables.get(name)
+        if table is None:
+            raise QueryError(404, "42P01", f'relation "public.{name}" does not exist')
+        return table
+
+    def load(self, name: str, rows: List[dict]) -> None:
+        with self._lock:
+            table = self.table(name)
+            for row in rows:
+                table.upsert(row, merge=True)
+
+    def count(self, name: str, **equals) -> int:
+        with self._lock:
+            rows = self.table(name).rows.values()
+            return sum(1 for r in rows if all(r.get(k) == v for k, v in equals.items()))
+
+    # ------------------------------------------------------------------
+    # HTTP semantics
+    # ------------------------------------------------------------------
+    def handle(self, method: str, path: str, query: str, headers, body: bytes) -> Tuple[int, object, dict]:
+        parts = path.strip("/").split("/")
+        if len(parts) < 3 or parts[0] != "rest" or parts[1] != "v1":
+            raise QueryError(404, "PGRST000", f"unknown path {path}")
+        params = parse_qsl(query, keep_blank_values=True)
+        prefer = headers.get("Prefer", "") or ""
+
+        if parts[2] == "rpc":
+            name = unquote(parts[3]) if len(parts) > 3 else ""
+            fn = self.rpcs.get(name)
+            if fn is None:
+                raise QueryError(404, "PGRST202", f"Could not find the function public.{name}")
+            args = json.loads(body) if body else {}
+            with self._lock:
+                self.stats[f"rpc:{name}"] += 1
+                return 200, fn(self, args), {}
+
+        name = unquote(parts[2])
+        filters = [_parse_filter(k, v) for k, v in params if k not in RESERVED_PARAMS]
+        opts = {k: v for k, v in params if k in RESERVED_PARAMS}
+
+        with self._lock:
+            table = self.table(name)
+            self.stats[f"{method}:{name}"] += 1
+
+            if method == "GET":
+                rows = table.select(filters)
+                total = len(rows)
+                if "order" in opts:
+                    rows = _apply_order(rows, _parse_order(opts["order"]))
+                offset, limit = int(opts.get("offset", 0)), opts.get("limit")
+                range_header = headers.get("Range")
+                if range_header and "-" in range_header:
+                    start, _, end = range_header.partition("-")
+                    offset, limit = int(start), int(end) - int(start) + 1
+                if self.max_rows is not None:
+                    limit = min(int(limit), self.max_rows) if limit is not None else self.max_rows
+                rows = rows[offset: offset + int(limit)] if limit is not None else rows[offset:]
+                rows = _project(rows, opts.get("select", "*"))
+                self.stats["rows_read"] += len(rows)
+                count = str(total) if "count=exact" in prefer else "*"
+                content_range = f"{offset}-{offset + len(rows) - 1}/{count}" if rows else f"*/{count}"
+                return 200, rows, {"Content-Range": content_range}
+
+            if method == "POST":
+                payload = json.loads(body) if body else []
+                items = payload if isinstance(payload, list) else [payload]
+                conflict = opts.get("on_conflict")
+                if conflict:
+                    columns = {c.strip() for c in conflict.split(",")}
+                    if columns != set(table.key):
+                        raise QueryError(
+                            400, "42P10",
+                            "there is no unique or exclusion constraint matching the ON CONFLICT specification",
+                        )
+                merge = "resolution=merge-duplicates" in prefer
+                written = [table.upsert(item, merge=merge) for item in items]
+                self.stats["rows_written"] += len(written)
+                return 201, written, {}
+
+            matched = table.select(filters)
+            if method == "PATCH":
+                changes = json.loads(body) if body else {}
+                updated = []
+                for row in matched:
+                    pk = table._pk(row)
+                    table.delete(pk)
+                    updated.append(table.upsert({**row, **changes}, merge=True))
+                self.stats["rows_written"] += len(updated)
+                return 200, updated, {}
+            if method == "DELETE":
+                removed = [table.delete(table._pk(row)) for row in matched]
+                self.stats["rows_deleted"] += len(removed)
+                return 200, removed, {}
+
+        raise QueryError(405, "PGRST000", f"unsupported method {method}")
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def _dispatch(self) -> None:
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                if server.latency_sec:
+                    time.sleep(server.latency_sec)
+                try:
+                    status, payload, extra = server.handle(
+                        self.command, url.path, url.query, self.headers, body
+                    )
+                    if "return=minimal" in (self.headers.get("Prefer") or "") and self.command != "GET":
+                        payload = None
+                except QueryError as exc:
+                    status, payload, extra = exc.status, {
+                        "code": exc.code, "message": str(exc), "details": None, "hint": None,
+                    }, {}
+                except (ValueError, KeyError) as exc:
+                    status, payload, extra = 400, {
+                        "code": "PGRST102", "message": str(exc), "details": None, "hint": None,
+                    }, {}
+
+                data = b"" if payload is None else json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                for key, value in extra.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = _dispatch
+
+        return Handler
+
+
+def rpc_get_latest_prices_by_code(store: FakePostgrestServer, args: dict) -> List[dict]:
+    """Mirror of scripts/create_rpc_get_latest_prices_by_code.sql."""
+    latest: Dict[str, dict] = {}
+    for row in store.table("daily_prices_v2").rows.values():
+        current = latest.get(row["code"])
+        if current is None or row["date"] > current["date"]:
+            latest[row["code"]] = row
+    return [{"code": code, "date": row["date"], "close": row["close"]} for code, row in latest.items()]
@@ -0,0 +1,104 @@
+"""Check kis_master_loader.get_all_stocks end to end on .mst rows.
+
+Writes one KOSPI and one KOSDAQ row laid out like the KIS master files
+(ShortCode, StandardCode, cp949 name, then the fixed-width tail) into a
+dated cache directory, so the loader reads them without a download, and
+checks the columns market_cap_history.py and the sector sync rely on:
+Marcap in won, the listed share count, ListingDate and SecurityType.
+
+The two files carry Shares in different units (thousands and a plain
+count) because the loader infers the unit per load from Marcap.
+
+Usage:
+    python3 scripts/benchmark/kis_master_check.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_DIR = os.path.dirname(BENCH_DIR)
+if SCRIPT_DIR not in sys.path:
+    sys.path.append(SCRIPT_DIR)
+
+import kis_master_loader
+
+# (spec, code, standard code, name, fixed fields, expected row)
+ROWS = [
+    (
+        kis_master_loader.KOSPI_MASTER,
+        "005930",
+        "KR7005930003",
+        "삼성전자",
+        {
+            "GroupCode": "ST", "SectorLarge": "0013", "SectorMedium": "0013", "SectorSmall": "0000",
+            "BasePrice": "55000", "ListingDate": "19750611", "Shares": "5969783",
+            "Preferred": "0", "ETP": " ", "SPAC": "N", "Marcap": "3283380",
+        },
+        {"Marcap": 3283380 * 100000000, "Shares": 5969783000, "ListingDate": "1975-06-11", "SecurityType": "COMMON"},
+    ),
+    (
+        kis_master_loader.KOSDAQ_MASTER,
+        "247540",
+        "KR7247540008",
+        "에코프로비엠",
+        {
+            "GroupCode": "ST", "SectorLarge": "1012", "SectorMedium": "1027", "SectorSmall": "0000",
+            "BasePrice": "200000", "ListingDate": "20190305", "Shares": "97801344",
+            "Preferred": "0", "ETP": " ", "SPAC": "N", "Marcap": "195602",
+        },
+        {"Marcap": 195602 * 100000000, "Shares": 97801344, "ListingDate": "2019-03-05", "SecurityType": "COMMON"},
+    ),
+]
+
+
+def mst_line(spec: dict, code: str, standard_code: str, name: str, fields: dict) -> bytes:
+    head = code.ljust(9).encode("cp949") + standard_code.ljust(12).encode("cp949") + name.encode("cp949")
+    tail = b""
+    for width, column in zip(spec["field_specs"], spec["columns"]):
+        value = fields.get(column, "")
+        text = value.rjust(width) if value.strip().isdigit() else value.ljust(width)
+        assert len(text) == width, f"{column}: {value!r} does not fit {width}"
+        tail += text.encode("ascii")
+    return head + tail
+
+
+def write_cache(cache_dir: str) -> None:
+    today = datetime.now().strftime("%Y-%m-%d")
+    for spec, code, standard_code, name, fields, _ in ROWS:
+        mst_path, meta_path = kis_master_loader._cache_paths(cache_dir, spec)
+        with open(mst_path, "wb") as f:
+            f.write(mst_line(spec, code, standard_code, name, fields) + b"\n")
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"date": today}, f)
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as cache_dir:
+        write_cache(cache_dir)
+        df = kis_master_loader.get_all_stocks(cache_dir).set_index("Code")
+
+    failures = []
+    for _, code, _, name, _, expected in ROWS:
+        if code not in df.index:
+            failures.append(f"{code}: missing")
+            continue
+        row = df.loc[code]
+        if row["Name"] != name:
+            failures.append(f"{code}: Name {row['Name']!r} != {name!r}")
+        for column, value in expected.items():
+            if row[column] != value:
+                failures.append(f"{code}: {column} {row[column]!r} != {value!r}")
+        print(f"{code} {row['Name']}: Marcap={row['Marcap']:,.0f} Shares={row['Shares']:,.0f} ListingDate={row['ListingDate']}")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print("ok" if not failures else f"{len(failures)} failure(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
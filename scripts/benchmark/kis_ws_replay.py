@@ -0,0 +1,280 @@
+"""Local stand-in for the KIS real-time websocket, replaying trade ticks.
+
+Speaks the part of the protocol stream_watchlist_quotes.py relies on:
+
+- subscribe / unsubscribe requests (tr_type 1 / 2) need an approval_key and
+  are answered like the gateway: SUBSCRIBE SUCCESS, ALREADY IN SUBSCRIBE,
+  UNSUBSCRIBE ERROR, and MAX SUBSCRIBE OVER past ``max_subscriptions``;
+- trade frames ("0|H0STCNT0|<n>|f^f^...") are sent at their recorded offset
+  divided by ``speed``, counted from the connection, and only for codes the
+  connection subscribed to;
+- a PINGPONG frame goes out every ``ping_interval_sec``; echoes are counted.
+
+Ticks come from a JSON lines file written by
+``stream_watchlist_quotes.py --record`` ({"t": seconds, "frame": ...} per
+line) or from ``synthetic_ticks`` for a SyntheticMarket session.
+
+    with KisReplayServer(synthetic_ticks(market, codes), speed=10) as replay:
+        stream_watchlist_quotes.run(supabase, date, url=replay.url, approval_key="replay")
+
+Standalone:
+    python3 scripts/benchmark/kis_ws_replay.py --recording ticks.jsonl --port 21000
+    python3 scripts/benchmark/kis_ws_replay.py --synthetic 300 --port 21000 --speed 5
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import websockets
+
+from synthetic_market import SyntheticMarket
+
+TRADE_TR_ID = "H0STCNT0"
+TRADE_FIELD_COUNT = 46
+MAX_SUBSCRIPTIONS = 41
+SESSION_OPEN_SEC = 9 * 3600
+SESSION_SECONDS = 6 * 3600 + 30 * 60
+
+Tick = Tuple[float, str]
+
+
+def load_recording(path: str) -> List[Tick]:
+    ticks = []
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                entry = json.loads(line)
+                ticks.append((float(entry["t"]), entry["frame"]))
+    ticks.sort(key=lambda tick: tick[0])
+    return ticks
+
+
+def _frame_code(frame: str) -> str:
+    return frame.split("|", 3)[3].split("^", 1)[0]
+
+
+def trade_frame(fields: Dict[int, object]) -> str:
+    values = ["0"] * TRADE_FIELD_COUNT
+    for position, value in fields.items():
+        values[position] = str(value)
+    return f"0|{TRADE_TR_ID}|001|" + "^".join(values)
+
+
+def synthetic_ticks(
+    market: SyntheticMarket,
+    codes: Sequence[str],
+    seconds: float = 60.0,
+    ticks_per_sec: float = 5.0,
+    seed: int = 0,
+) -> List[Tick]:
+    """Trade frames for the last session of ``market``, compressed into ``seconds``.
+
+    Each code trades at random times on a path from its open to its close,
+    with the accumulated volume and trading value reaching the day's bar, so
+    the last tick of every code is the stored daily close.
+    """
+    rng = np.random.default_rng(seed)
+    prev_date = market.session(1)
+    ticks: List[Tick] = []
+    for code in codes:
+        bars = market.bars(code, prev_date, market.last_date)
+        if bars.empty or bars["date"].iloc[-1] != market.last_date:
+            continue
+        day = bars.iloc[-1]
+        prev_close = float(bars["close"].iloc[-2]) if len(bars) > 1 else float(day["open"])
+        n = max(2, int(rng.poisson(seconds * ticks_per_sec)))
+        offsets = np.sort(rng.uniform(0, seconds, n))
+        offsets[-1] = seconds
+        # Brownian bridge from open to close, kept inside the day's range.
+        steps = rng.normal(0, 1, n).cumsum()
+        bridge = steps - np.linspace(0, 1, n) * steps[-1]
+        path = np.linspace(float(day["open"]), float(day["close"]), n) + bridge * (float(day["high"]) - float(day["low"])) / (4 * np.sqrt(n))
+        prices = np.clip(np.round(path), round(float(day["low"])), round(float(day["high"])))
+        prices[-1] = round(float(day["close"]))
+        volumes = np.diff(np.round(np.linspace(0, float(day["volume"]), n + 1)))
+
+        high = low = prices[0]
+        acml_vol = acml_value = 0.0
+        for offset, price, volume in zip(offsets, prices, volumes):
+            high, low = max(high, price), min(low, price)
+            acml_vol += volume
+            acml_value += price * volume
+            clock = SESSION_OPEN_SEC + int(offset / seconds * SESSION_SECONDS)
+            change = price - prev_close
+            ticks.append((
+                float(offset),
+                trade_frame({
+                    0: code,
+                    1: f"{clock // 3600:02d}{clock // 60 % 60:02d}{clock % 60:02d}",
+                    2: int(price),
+                    3: 2 if change > 0 else 5 if change < 0 else 3,
+                    4: int(change),
+                    5: f"{change / prev_close * 100:.2f}" if prev_close else "0.00",
+                    7: round(float(day["open"])),
+                    8: int(high),
+                    9: int(low),
+                    12: int(volume),
+                    13: int(acml_vol),
+                    14: int(acml_value),
+                }),
+            ))
+    ticks.sort(key=lambda tick: tick[0])
+    return ticks
+
+
+def _answer(tr_key: str, msg_cd: str, msg1: str, ok: bool = True) -> str:
+    return json.dumps({
+        "header": {"tr_id": TRADE_TR_ID, "tr_key": tr_key, "encrypt": "N"},
+        "body": {"rt_cd": "0" if ok else "1", "msg_cd": msg_cd, "msg1": msg1},
+    })
+
+
+class KisReplayServer:
+    def __init__(
+        self,
+        ticks: List[Tick],
+        speed: float = 1.0,
+        max_subscriptions: int = MAX_SUBSCRIPTIONS,
+        ping_interval_sec: float = 10.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.ticks = ticks
+        self.speed = speed
+        self.max_subscriptions = max_subscriptions
+        self.ping_interval_sec = ping_interval_sec
+        self.host = host
+        self.port = port
+        self.stats: Dict[str, int] = defaultdict(int)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    def start(self) -> "KisReplayServer":
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._serve()), name="kis-ws-replay", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "KisReplayServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+    async def _serve(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        async with websockets.serve(self._connection, self.host, self.port) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            self._ready.set()
+            await self._stop.wait()
+
+    async def _connection(self, ws) -> None:
+        self.stats["connections"] += 1
+        subscribed: set = set()
+        tasks = [
+            asyncio.create_task(self._replay(ws, subscribed)),
+            asyncio.create_task(self._ping(ws)),
+        ]
+        try:
+            async for message in ws:
+                await self._request(ws, message, subscribed)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _request(self, ws, message, subscribed: set) -> None:
+        data = json.loads(message)
+        header = data.get("header") or {}
+        if header.get("tr_id") == "PINGPONG":
+            self.stats["pongs"] += 1
+            return
+        tr_input = (data.get("body") or {}).get("input") or {}
+        code = tr_input.get("tr_key", "")
+        if not header.get("approval_key"):
+            await ws.send(_answer(code, "OPSP0011", "invalid approval : NOT FOUND", ok=False))
+            return
+        if header.get("tr_type") == "1":
+            if code in subscribed:
+                await ws.send(_answer(code, "OPSP0002", "ALREADY IN SUBSCRIBE", ok=False))
+            elif len(subscribed) >= self.max_subscriptions:
+                self.stats["refused"] += 1
+                await ws.send(_answer(code, "OPSP0008", "MAX SUBSCRIBE OVER", ok=False))
+            else:
+                subscribed.add(code)
+                self.stats["subscribed"] += 1
+                await ws.send(_answer(code, "OPSP0000", "SUBSCRIBE SUCCESS"))
+        elif header.get("tr_type") == "2":
+            if code in subscribed:
+                subscribed.discard(code)
+                self.stats["unsubscribed"] += 1
+                await ws.send(_answer(code, "OPSP0001", "UNSUBSCRIBE SUCCESS"))
+            else:
+                await ws.send(_answer(code, "OPSP0003", "UNSUBSCRIBE ERROR(not found!)", ok=False))
+
+    async def _replay(self, ws, subscribed: set) -> None:
+        started = time.monotonic()
+        for offset, frame in self.ticks:
+            delay = started + offset / self.speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if _frame_code(frame) in subscribed:
+                await ws.send(frame)
+                self.stats["frames_sent"] += 1
+        self.stats["replays_done"] += 1
+
+    async def _ping(self, ws) -> None:
+        while True:
+            await asyncio.sleep(self.ping_interval_sec)
+            await ws.send(json.dumps({"header": {"tr_id": "PINGPONG", "datetime": time.strftime("%Y%m%d%H%M%S")}}))
+            self.stats["pings"] += 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay KIS trade ticks over a local websocket.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--recording", help="JSON lines file from stream_watchlist_quotes.py --record.")
+    source.add_argument("--synthetic", type=int, metavar="CODES", help="Synthetic market with this many codes.")
+    parser.add_argument("--seconds", type=float, default=300.0, help="Synthetic session length.")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--port", type=int, default=21000)
+    args = parser.parse_args()
+
+    if args.recording:
+        ticks = load_recording(args.recording)
+    else:
+        market = SyntheticMarket(n_codes=args.synthetic, years=2)
+        ticks = synthetic_ticks(market, market.codes[:MAX_SUBSCRIPTIONS], seconds=args.seconds)
+        print(f"[INFO] Synthetic session {market.last_date}, codes {', '.join(market.codes[:MAX_SUBSCRIPTIONS])}")
+
+    with KisReplayServer(ticks, speed=args.speed, port=args.port) as replay:
+        print(f"[INFO] Replaying {len(ticks)} frames on {replay.url} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Throwaway schemas and databases on a local Postgres for the database-side benchmarks.
+
+daily_prices_v2, companies and the theme/industry mappings were created in
+the Supabase dashboard, not in supabase/migrations, so the base tables the
+migrations build on are declared here.
+
+- ``scratch_schema``: a schema first on the connection's search_path (so
+  unqualified table names resolve to it), dropped on exit;
+- ``scratch_database``: a whole database, for migrations that name
+  ``public.`` objects and grant to the Supabase roles (``supabase_roles``).
+
+    with scratch_schema(dsn, "bulk_check") as conn:
+        create_base_tables(conn)
+        pg_bulk.copy_upsert(conn, "daily_prices_v2", rows, "code,date")
+
+    with scratch_database(dsn, "price_bench") as conn:
+        supabase_roles(conn)
+        create_base_tables(conn)
+        apply_migration(conn, "20261019004000_create_company_listing_stats.sql")
+
+Any Postgres 14+ works, e.g. ``docker run -e POSTGRES_PASSWORD=pw -p
+5432:5432 postgres:16`` and ``--dsn postgresql://postgres:pw@localhost/postgres``.
+"""
+
+import contextlib
+import os
+from typing import Iterator
+
+import psycopg
+from psycopg import sql
+from psycopg.conninfo import conninfo_to_dict, make_conninfo
+
+DEFAULT_DSN = "postgresql://postgres@localhost:5432/postgres"
+MIGRATIONS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "supabase", "migrations"
+)
+SUPABASE_ROLES = ("anon", "authenticated", "service_role")
+
+BASE_TABLES = """
+create table companies (
+  code text primary key,
+  name text,
+  market text,
+  marcap numeric,
+  security_type text,
+  is_rs_eligible boolean
+);
+
+create table daily_prices_v2 (
+  code text not null,
+  date date not null,
+  open numeric,
+  high numeric,
+  low numeric,
+  close numeric,
+  volume numeric,
+  trading_value numeric,
+  change numeric,
+  market_cap numeric(20, 2),
+  primary key (code, date)
+);
+
+create table themes (id integer primary key, code text, name text);
+create table industries (id integer primary key, code text, name text);
+
+create table company_themes (
+  theme_id integer not null references themes(id),
+  company_code text not null,
+  primary key (theme_id, company_code)
+);
+
+create table company_industries (
+  industry_id integer not null references industries(id),
+  company_code text not null,
+  primary key (industry_id, company_code)
+);
+"""
+
+
+@contextlib.contextmanager
+def scratch_schema(dsn: str, schema: str) -> Iterator[psycopg.Connection]:
+    name = sql.Identifier(schema)
+    with psycopg.connect(dsn, autocommit=True) as admin:
+        admin.execute(sql.SQL("drop schema if exists {} cascade").format(name))
+        admin.execute(sql.SQL("create schema {}").format(name))
+    try:
+        with psycopg.connect(dsn, options=f"-c search_path={schema},public") as conn:
+            yield conn
+    finally:
+        with psycopg.connect(dsn, autocommit=True) as admin:
+            admin.execute(sql.SQL("drop schema if exists {} cascade").format(name))
+
+
+def create_base_tables(conn: psycopg.Connection) -> None:
+    with conn.transaction():
+        conn.execute(BASE_TABLES)
+
+
+@contextlib.contextmanager
+def scratch_database(dsn: str, name: str) -> Iterator[psycopg.Connection]:
+    ident = sql.Identifier(name)
+    with psycopg.connect(dsn, autocommit=True) as admin:
+        admin.execute(sql.SQL("drop database if exists {} with (force)").format(ident))
+        admin.execute(sql.SQL("create database {}").format(ident))
+    try:
+        params = conninfo_to_dict(dsn)
+        params["dbname"] = name
+        with psycopg.connect(make_conninfo(**params)) as conn:
+            yield conn
+    finally:
+        with psycopg.connect(dsn, autocommit=True) as admin:
+            admin.execute(sql.SQL("drop database if exists {} with (force)").format(ident))
+
+
+def supabase_roles(conn: psycopg.Connection) -> None:
+    """The roles Supabase migrations grant to (cluster-wide, kept if present)."""
+    with conn.transaction():
+        for role in SUPABASE_ROLES:
+            if not conn.execute("select 1 from pg_roles where rolname = %s", (role,)).fetchone():
+                conn.execute(sql.SQL("create role {} nologin").format(sql.Identifier(role)))
+
+
+def apply_migration(conn: psycopg.Connection, filename: str) -> None:
+    """Run one supabase/migrations file in a transaction, as the Supabase CLI does."""
+    with open(os.path.join(MIGRATIONS_DIR, filename), encoding="utf-8") as handle:
+        script = handle.read()
+    with conn.transaction():
+        conn.execute(script)
@@ -0,0 +1,150 @@
+"""Check pg_bulk against a local Postgres and time it against JSON chunks.
+
+Loads a synthetic market's daily_prices_v2 twice into a scratch schema:
+
+- ``copy``: pg_bulk.upsert with SUPABASE_DB_URL pointing at the schema
+  (COPY into a staging table, one merge);
+- ``json``: what PostgREST runs per request, ``insert ... select from
+  json_populate_recordset(...) on conflict ...`` in ``--chunk``-row chunks
+  (no HTTP; ``--rest-latency`` adds a round trip per request).
+
+Then applies the same partial upserts to both (trading_value only on
+existing keys plus new keys, a key repeated within one call, and an
+ignore_duplicates load) and checks that both tables end identical.
+
+Usage:
+    python3 scripts/benchmark/pg_bulk_check.py --dsn postgresql://postgres:pw@localhost/postgres
+    python3 scripts/benchmark/pg_bulk_check.py --codes 1000 --years 5 --rest-latency 0.1
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_DIR = os.path.dirname(BENCH_DIR)
+for path in (BENCH_DIR, SCRIPT_DIR):
+    if path not in sys.path:
+        sys.path.append(path)
+
+from psycopg import sql
+from psycopg.conninfo import make_conninfo
+
+from local_postgres import DEFAULT_DSN, create_base_tables, scratch_schema
+from synthetic_market import SyntheticMarket
+
+SCHEMA = "bulk_check"
+TABLE = "daily_prices_v2"
+JSON_TABLE = "daily_prices_v2_json"
+
+
+def json_upsert(conn, table: str, rows, on_conflict: str, chunk: int, ignore_duplicates: bool = False, latency: float = 0.0) -> None:
+    keys = [col.strip() for col in on_conflict.split(",")]
+    columns = list(rows[0].keys())
+    updates = [col for col in columns if col not in keys]
+    column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+    if ignore_duplicates:
+        action = sql.SQL("do nothing")
+    else:
+        action = sql.SQL("do update set ") + sql.SQL(", ").join(
+            sql.SQL("{0} = excluded.{0}").format(sql.Identifier(col)) for col in updates
+        )
+    query = sql.SQL(
+        "insert into {t} ({cols}) select {cols} from json_populate_recordset(null::{t}, %s) "
+        "on conflict ({keys}) {action}"
+    ).format(
+        t=sql.Identifier(table),
+        cols=column_list,
+        keys=sql.SQL(", ").join(map(sql.Identifier, keys)),
+        action=action,
+    )
+    for i in range(0, len(rows), chunk):
+        with conn.transaction():
+            conn.execute(query, (json.dumps(rows[i : i + chunk], allow_nan=False),))
+        time.sleep(latency)
+
+
+def differences(conn) -> int:
+    return conn.execute(
+        sql.SQL(
+            "select count(*) from ((table {a} except table {b}) union all (table {b} except table {a})) d"
+        ).format(a=sql.Identifier(TABLE), b=sql.Identifier(JSON_TABLE))
+    ).fetchone()[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="pg_bulk correctness and speed against a local Postgres.")
+    parser.add_argument("--dsn", default=os.environ.get("LOCAL_PG_DSN", DEFAULT_DSN))
+    parser.add_argument("--codes", type=int, default=300)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--chunk", type=int, default=1000, help="Rows per JSON request.")
+    parser.add_argument("--rest-latency", type=float, default=0.0, help="Seconds added per JSON request (HTTP round trip).")
+    args = parser.parse_args()
+
+    print(f"[INFO] Generating market: {args.codes} codes x {args.years} years")
+    market = SyntheticMarket(n_codes=args.codes, years=args.years, seed=args.seed)
+    rows = [
+        {**row, "market_cap": None, "volume": round(row["volume"]), "trading_value": round(row["trading_value"])}
+        for row in market.price_rows(market.last_date)
+    ]
+    print(f"[INFO] {len(rows):,} daily_prices_v2 rows")
+
+    # pg_bulk reads the connection string like the scripts do.
+    os.environ["SUPABASE_DB_URL"] = make_conninfo(args.dsn, options=f"-c search_path={SCHEMA},public")
+    import pg_bulk
+
+    with scratch_schema(args.dsn, SCHEMA) as conn:
+        create_base_tables(conn)
+        with conn.transaction():
+            conn.execute(sql.SQL("create table {} (like {} including all)").format(sql.Identifier(JSON_TABLE), sql.Identifier(TABLE)))
+
+        timings = {}
+        started = time.perf_counter()
+        pg_bulk.upsert(None, TABLE, rows, on_conflict="code,date")
+        timings["copy"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        json_upsert(conn, JSON_TABLE, rows, "code,date", args.chunk, latency=args.rest_latency)
+        timings["json"] = time.perf_counter() - started
+
+        print(f"\n{'path':<6} {'seconds':>9} {'rows/s':>12}")
+        for name, seconds in timings.items():
+            print(f"{name:<6} {seconds:>9.2f} {len(rows) / seconds:>12,.0f}")
+        print(f"speedup {timings['json'] / timings['copy']:.1f}x (json path with {args.rest_latency:.3f}s per request)")
+
+        checks = [("full load", differences(conn) == 0)]
+
+        # Partial columns, new keys and a repeated key (last one wins).
+        partial = [{"code": r["code"], "date": r["date"], "trading_value": r["trading_value"] + 1} for r in rows[::3]]
+        partial += [{"code": "NEW001", "date": d, "trading_value": 10} for d in market.day_strings[-100:]]
+        repeated = [dict(partial[0], trading_value=1), dict(partial[0], trading_value=2)]
+        pg_bulk.upsert(None, TABLE, partial + repeated, on_conflict="code,date")
+        latest = {(r["code"], r["date"]): r for r in partial + repeated}
+        json_upsert(conn, JSON_TABLE, list(latest.values()), "code,date", args.chunk)
+        checks.append(("partial upsert", differences(conn) == 0))
+        value = conn.execute(
+            sql.SQL("select trading_value from {} where code = %s and date = %s").format(sql.Identifier(TABLE)),
+            (partial[0]["code"], partial[0]["date"]),
+        ).fetchone()[0]
+        checks.append(("repeated key, last wins", value == 2))
+        kept_open = conn.execute(
+            sql.SQL("select count(*) from {} where open is null and code <> 'NEW001'").format(sql.Identifier(TABLE))
+        ).fetchone()[0]
+        checks.append(("untouched columns kept", kept_open == 0))
+
+        ignored = [dict(r, close=-1) for r in rows[:500]] + [{**rows[0], "code": "NEW002", "close": -1}]
+        pg_bulk.upsert(None, TABLE, ignored, on_conflict="code,date", ignore_duplicates=True)
+        json_upsert(conn, JSON_TABLE, ignored, "code,date", args.chunk, ignore_duplicates=True)
+        checks.append(("ignore_duplicates", differences(conn) == 0))
+
+    print()
+    for name, ok in checks:
+        print(f"[{'OK' if ok else 'FAIL'}] {name}")
+    sys.exit(0 if all(ok for _, ok in checks) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+"""Benchmark the daily scripts against a synthetic market, fully offline.
+
+Starts a fake KIS gateway and an in-memory PostgREST store on localhost,
+seeds the store as it would look after the previous session, then runs the
+daily chain in order and records, per script:
+
+- wall time (min/median over ``--repeat`` rounds),
+- KIS / PostgREST call counts, 429/EGW00201 hits and latency p50/p95
+  (from pipeline_metrics),
+- rows read and written, and the rows produced for the target date.
+
+Results go to scripts/output/benchmarks/bench_<timestamp>.json;
+``--baseline`` prints the wall-time change against an earlier result file.
+
+Usage:
+    python3 scripts/benchmark/run_benchmarks.py
+    python3 scripts/benchmark/run_benchmarks.py --codes 1000 --years 3 --repeat 3
+    python3 scripts/benchmark/run_benchmarks.py --only rs,trading_value_rank
+    python3 scripts/benchmark/run_benchmarks.py --only update_today_v3 --kis-keys 2
+    python3 scripts/benchmark/run_benchmarks.py --baseline scripts/output/benchmarks/bench_20260720_101500.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_DIR = os.path.dirname(BENCH_DIR)
+for path in (BENCH_DIR, SCRIPT_DIR):
+    if path not in sys.path:
+        sys.path.append(path)
+
+from fake_kis_server import FakeKisServer  # noqa: E402
+from fake_postgrest import FakePostgrestServer  # noqa: E402
+from synthetic_market import SyntheticMarket  # noqa: E402
+
+OUTPUT_DIR = os.path.join(SCRIPT_DIR, "output", "benchmarks")
+BENCH_KEY = "bench-service-role-key-0000000000000000"
+
+
+@dataclass
+class Benchmark:
+    key: str
+    run: Callable[["BenchEnv"], None]
+    output_table: Optional[str] = None
+    # False for tables without a date column: count every row.
+    dated: bool = True
+
+
+class BenchEnv:
+    """Market, fake servers and the Supabase client shared by the benchmarks."""
+
+    def __init__(self, market: SyntheticMarket, kis: FakeKisServer, store: FakePostgrestServer, supabase):
+        self.market = market
+        self.kis = kis
+        self.store = store
+        self.supabase = supabase
+
+    @property
+    def target_date(self) -> str:
+        return self.market.last_date
+
+    def seed(self, include_target: bool) -> None:
+        """Load the store as it looks before (or after) the target session's ingest."""
+        as_of = self.target_date if include_target else self.market.session(1)
+        self.store.reset()
+        self.store.load("companies", self.market.company_rows(as_of))
+        self.store.load("daily_prices_v2", self.market.price_rows(as_of))
+        for table, rows in self.market.group_rows().items():
+            self.store.load(table, rows)
+        # Equal-weight indices were last extended five sessions ago.
+        last_index_date = self.market.session(5)
+        self.store.load(
+            "equal_weight_indices",
+            [
+                {
+                    "index_type": group,
+                    "index_code": code,
+                    "index_name": name,
+                    "date": last_index_date,
+                    "index_value": 1000.0,
+                    "constituent_count": len(members),
+                    "base_date": self.market.day_strings[0],
+                }
+                for (group, code), (name, members) in self.market.groups.items()
+            ],
+        )
+
+
+def bench_ingest(env: BenchEnv) -> None:
+    import update_today_v3
+
+    update_today_v3.main()
+
+
+def bench_trading_value_rank(env: BenchEnv) -> None:
+    import calculate_trading_value_rank
+
+    calculate_trading_value_rank.run(env.supabase, env.target_date, env.target_date)
+
+
+def bench_rs(env: BenchEnv) -> None:
+    import calculate_rs_v2
+
+    calculate_rs_v2.run(env.supabase, env.target_date)
+
+
+def bench_leaders(env: BenchEnv) -> None:
+    import calculate_leader_stocks_daily
+
+    calculate_leader_stocks_daily.main(calculate_leader_stocks_daily.parse_date(env.target_date))
+
+
+def bench_group_indices(env: BenchEnv) -> None:
+    import update_group_indices_daily
+
+    update_group_indices_daily.main()
+
+
+def bench_indicators(env: BenchEnv) -> None:
+    import update_daily_indicators
+
+    update_daily_indicators.run(env.supabase, env.target_date)
+
+
+def bench_patterns(env: BenchEnv) -> None:
+    import screen_patterns
+
+    # A fresh cache each round: the window is rebuilt from the store.
+    with tempfile.TemporaryDirectory() as tmp:
+        screen_patterns.run(env.supabase, env.target_date, cache_path=os.path.join(tmp, "window.npz"))
+
+
+def bench_forward_highs(env: BenchEnv) -> None:
+    import update_forward_high_returns
+
+    update_forward_high_returns.run(env.supabase, env.target_date)
+
+
+def bench_trading_metrics(env: BenchEnv) -> None:
+    import calculate_trading_metrics
+
+    # Empty metrics tables: the default 90-day backfill.
+    calculate_trading_metrics.run(env.supabase, env.target_date)
+
+
+def bench_intraday(env: BenchEnv) -> None:
+    import intraday_snapshot
+
+    # One quote sweep of the RS universe at the target session's prices.
+    with tempfile.TemporaryDirectory() as tmp:
+        intraday_snapshot.run(env.supabase, env.target_date, once=True, cache_dir=tmp)
+
+
+def bench_stream(env: BenchEnv) -> None:
+    import stream_watchlist_quotes
+    from kis_ws_replay import KisReplayServer, synthetic_ticks
+
+    # A full watchlist (holdings, then favorites), 60s of ticks replayed at 10x.
+    codes = env.market.codes[: stream_watchlist_quotes.MAX_SUBSCRIPTIONS]
+    half = len(codes) // 2
+    env.store.load("user_portfolio", [
+        {"id": f"p{i}", "user_id": "u1", "company_code": code, "is_closed": False, "is_custom_asset": False}
+        for i, code in enumerate(codes[:half])
+    ])
+    env.store.load("user_favorite_stocks", [{"user_id": "u1", "company_code": code} for code in codes[half:]])
+
+    seconds, speed = 60.0, 10.0
+    with KisReplayServer(synthetic_ticks(env.market, codes, seconds=seconds), speed=speed) as replay:
+        stream_watchlist_quotes.run(env.supabase, env.target_date, url=replay.url, duration_sec=seconds / speed + 2)
+
+    # The last synthetic tick of each code is its daily close.
+    closes = {
+        row["code"]: round(row["close"])
+        for row in env.market.price_rows(env.target_date)
+        if row["date"] == env.target_date and row["code"] in codes
+    }
+    quotes = {row["code"]: row["price"] for row in env.store.table("realtime_quotes").rows.values()}
+    stale = sorted(code for code, close in closes.items() if quotes.get(code) != close)
+    if stale:
+        raise AssertionError(f"realtime_quotes differs from the close for {', '.join(stale)}")
+
+
+BENCHMARKS = [
+    Benchmark("update_today_v3", bench_ingest, "daily_prices_v2"),
+    Benchmark("trading_value_rank", bench_trading_value_rank, "trading_value_rankings"),
+    Benchmark("rs", bench_rs, "rs_rankings_v2"),
+    Benchmark("leaders", bench_leaders, "leader_stocks_daily"),
+    Benchmark("group_indices", bench_group_indices, "equal_weight_indices"),
+    Benchmark("indicators", bench_indicators, "daily_indicators"),
+    Benchmark("patterns", bench_patterns, "pattern_screen_results"),
+    Benchmark("forward_highs", bench_forward_highs, "forward_high_returns"),
+    Benchmark("trading_metrics", bench_trading_metrics, "theme_trading_metrics"),
+    Benchmark("intraday", bench_intraday, "rs_rankings_provisional"),
+    Benchmark("stream", bench_stream, "realtime_quotes", dated=False),
+]
+
+
+def summarize_metrics(snapshot: dict) -> dict:
+    calls: Dict[str, int] = {}
+    throttled: Dict[str, int] = {}
+    rows_read = rows_written = retries = 0
+    for counter in snapshot["counters"]:
+        labels, value = counter["labels"], int(counter["value"])
+        if counter["name"] == "api_calls_total":
+            calls[labels["api"]] = calls.get(labels["api"], 0) + value
+        elif counter["name"] == "api_throttled_total":
+            throttled[labels["api"]] = throttled.get(labels["api"], 0) + value
+        elif counter["name"] == "rows_read_total":
+            rows_read += value
+        elif counter["name"] == "rows_written_total":
+            rows_written += value
+        elif counter["name"] == "retries_total":
+            retries += value
+
+    latency: Dict[str, dict] = {}
+    for hist in snapshot["histograms"]:
+        if hist["name"] != "api_latency_seconds":
+            continue
+        api = hist["labels"]["api"]
+        entry = latency.setdefault(api, {"count": 0, "sum": 0.0, "p95": 0.0, "p50": 0.0})
+        entry["count"] += hist["count"]
+        entry["sum"] += hist["sum"]
+        # Worst endpoint per API; endpoints are few and bucket bounds are coarse.
+        entry["p50"] = max(entry["p50"], hist["p50"] or 0.0)
+        entry["p95"] = max(entry["p95"], hist["p95"] or 0.0)
+    for entry in latency.values():
+        entry["mean"] = round(entry.pop("sum") / entry["count"], 4) if entry["count"] else None
+
+    return {
+        "api_calls": calls,
+        "throttled": throttled,
+        "latency": latency,
+        "rows_read": rows_read,
+        "rows_written": rows_written,
+        "retries": retries,
+    }
+
+
+def run_round(env: BenchEnv, selected: List[Benchmark], verbose: bool) -> Dict[str, dict]:
+    from pipeline_metrics import metrics
+
+    env.seed(include_target=not any(b.key == "update_today_v3" for b in selected))
+    results: Dict[str, dict] = {}
+    for bench in selected:
+        metrics.reset()
+        env.kis.reset_stats()
+        env.store.reset_stats()
+        sink = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        started = time.perf_counter()
+        error = None
+        with sink:
+            try:
+                with metrics.step(bench.key):
+                    bench.run(env)
+            except Exception as exc:
+                error = f"{type(exc).__name__}: {exc}"
+        wall = time.perf_counter() - started
+
+        result = {"wall_sec": round(wall, 3), **summarize_metrics(metrics.snapshot(bench.key))}
+        if bench.output_table:
+            filters = {"date": env.target_date} if bench.dated else {}
+            result["output_rows"] = env.store.count(bench.output_table, **filters)
+        if error:
+            result["error"] = error
+        results[bench.key] = result
+        print(f"   {bench.key:<20} {wall:8.2f}s" + (f"  ERROR {error}" if error else ""))
+    return results
+
+
+def merge_rounds(rounds: List[Dict[str, dict]]) -> Dict[str, dict]:
+    merged: Dict[str, dict] = {}
+    for key in rounds[0]:
+        walls = [r[key]["wall_sec"] for r in rounds if key in r]
+        merged[key] = {
+            **rounds[-1][key],
+            "wall_sec": round(statistics.median(walls), 3),
+            "wall_sec_min": min(walls),
+            "wall_sec_runs": walls,
+        }
+    return merged
+
+
+def print_report(results: Dict[str, dict], baseline: Optional[dict]) -> None:
+    print("\n[RESULT]")
+    header = f"   {'benchmark':<20} {'wall(s)':>9} {'kis':>6} {'rest':>6} {'429':>5} {'read':>9} {'written':>9} {'out':>6}"
+    if baseline:
+        header += f" {'vs base':>9}"
+    print(header)
+    for key, r in results.items():
+        throttled = sum(r["throttled"].values())
+        line = (
+            f"   {key:<20} {r['wall_sec']:9.2f} {r['api_calls'].get('kis', 0):6d} "
+            f"{r['api_calls'].get('postgrest', 0):6d} {throttled:5d} {r['rows_read']:9d} "
+            f"{r['rows_written']:9d} {r.get('output_rows', 0):6d}"
+        )
+        base = (baseline or {}).get("results", {}).get(key)
+        if base and base.get("wall_sec"):
+            change = (r["wall_sec"] - base["wall_sec"]) / base["wall_sec"] * 100
+            line += f" {change:+8.1f}%"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the daily scripts.")
+    parser.add_argument("--codes", type=int, default=300)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--only", help="Comma-separated benchmark keys.")
+    parser.add_argument("--kis-rate-limit", type=int, default=20, help="Fake KIS requests/sec per appkey.")
+    parser.add_argument("--kis-keys", type=int, default=1, help="KIS app keys in the pool (each has its own limit).")
+    parser.add_argument("--kis-latency", type=float, default=0.0, help="Added seconds per KIS call.")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="Added seconds per PostgREST call.")
+    parser.add_argument(
+        "--kis-interval",
+        type=float,
+        help="Override update_today_v3's client-side pacing (seconds between calls).",
+    )
+    parser.add_argument("--baseline", help="Earlier bench_*.json to compare against.")
+    parser.add_argument("--verbose", action="store_true", help="Show the scripts' own output.")
+    args = parser.parse_args()
+
+    selected = BENCHMARKS
+    if args.only:
+        wanted = {k.strip() for k in args.only.split(",")}
+        unknown = wanted - {b.key for b in BENCHMARKS}
+        if unknown:
+            parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+        selected = [b for b in BENCHMARKS if b.key in wanted]
+
+    print(f"[INFO] Generating market: {args.codes} codes x {args.years} years (seed {args.seed})")
+    market = SyntheticMarket(n_codes=args.codes, years=args.years, seed=args.seed)
+
+    with FakeKisServer(market, rate_limit_per_sec=args.kis_rate_limit, latency_sec=args.kis_latency) as kis, \
+            FakePostgrestServer(latency_sec=args.db_latency) as store, \
+            tempfile.TemporaryDirectory() as token_dir:
+        # The scripts read these at import / client creation; they must point
+        # at the fakes before anything from scripts/ is imported.
+        os.environ["NEXT_PUBLIC_SUPABASE_URL"] = store.base_url
+        os.environ["SUPABASE_SERVICE_ROLE_KEY"] = BENCH_KEY
+        for n in range(1, args.kis_keys + 1):
+            suffix = "" if n == 1 else f"_{n}"
+            os.environ[f"KIS_APP_KEY{suffix}"] = f"bench-app-key-{n}"
+            os.environ[f"KIS_APP_SECRET{suffix}"] = f"bench-app-secret-{n}"
+        os.environ["KIS_TOKEN_CACHE_DIR"] = token_dir
+        os.environ["INDEX_BASE_DATE"] = market.day_strings[0]
+        os.environ.pop("TARGET_DATE", None)
+
+        import kis_master_loader
+        import pipeline_metrics
+        import update_today_v3
+
+        # Claim the exit report so the scripts under test don't each write one.
+        pipeline_metrics.report_on_exit("benchmark")
+        update_today_v3.KIS_BASE_URL = kis.base_url
+        kis_master_loader.get_all_stocks = market.master_frame
+        if args.kis_interval is not None:
+            update_today_v3.key_pool.set_interval(args.kis_interval)
+
+        env = BenchEnv(market, kis, store, update_today_v3.supabase)
+        rounds = []
+        for i in range(args.repeat):
+            print(f"[INFO] Round {i + 1}/{args.repeat} (target date {env.target_date})")
+            rounds.append(run_round(env, selected, args.verbose))
+
+    results = merge_rounds(rounds)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(OUTPUT_DIR, f"bench_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "config": vars(args),
+                "target_date": market.last_date,
+                "results": results,
+            },
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+    print(f"\n[DONE] Results written: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""Deterministic synthetic KRX-like market for the offline benchmarks.
+
+Generates ``n_codes`` stocks over ``years`` of weekday sessions ending today,
+with the events the daily scripts have to cope with:
+
+- splits: history before the split date is adjusted (what KIS returns with
+  FID_ORG_ADJ_PRC=0); the database copy is only adjusted for splits that
+  happened before it was last written, so a recent split makes the ingest
+  take its full-reload path;
+- halts: flat bars with zero volume, as KIS reports suspended sessions;
+- new listings: codes whose first bar is inside the window, a couple of them
+  on the last sessions so the ingest sees codes missing from the database;
+- ETF/preferred rows that are collected but not RS eligible;
+- industry/theme groups with monthly constituents for the group indices.
+
+Everything is derived from ``seed`` so two runs of the benchmark see the same
+market.
+"""
+
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+INDEX_CODES = {"0001": "KOSPI", "1001": "KOSDAQ"}
+
+
+class SyntheticMarket:
+    def __init__(
+        self,
+        n_codes: int = 300,
+        years: int = 3,
+        seed: int = 7,
+        end_date: Optional[date] = None,
+        split_ratio: float = 0.03,
+        halt_ratio: float = 0.03,
+        listing_ratio: float = 0.05,
+        non_equity_ratio: float = 0.05,
+        n_industries: int = 20,
+        n_themes: int = 10,
+    ):
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        end = pd.Timestamp(end_date or datetime.now().date())
+        self.days = pd.bdate_range(end=end, periods=max(years, 1) * 250)
+        self.day_strings = np.array(self.days.strftime("%Y-%m-%d"))
+        n_days = len(self.days)
+
+        self.codes = [f"{(i + 1) * 10:06d}" for i in range(n_codes)]
+        self.code_index = {code: i for i, code in enumerate(self.codes)}
+
+        # Listing dates: most codes trade for the whole window.
+        self.listed_from = np.zeros(n_codes, dtype=int)
+        n_new = max(2, int(n_codes * listing_ratio))
+        new_codes = rng.choice(n_codes, size=min(n_new, n_codes), replace=False)
+        self.listed_from[new_codes] = rng.integers(1, n_days, size=len(new_codes))
+        self.listed_from[new_codes[0]] = n_days - 1
+        if len(new_codes) > 1:
+            self.listed_from[new_codes[1]] = n_days - 2
+
+        # Adjusted closes from a per-code random walk.
+        vol = rng.uniform(0.01, 0.04, size=n_codes)
+        drift = rng.normal(0.0003, 0.0005, size=n_codes)
+        market = rng.normal(0.0, 0.008, size=(n_days, 1))
+        log_ret = market + drift + rng.standard_normal((n_days, n_codes)) * vol
+        base = rng.uniform(2_000, 200_000, size=n_codes)
+        close = base * np.exp(np.cumsum(log_ret, axis=0))
+
+        # Halts: a run of flat sessions with zero volume.
+        self.halts: Dict[str, Tuple[str, str]] = {}
+        halted = np.zeros((n_days, n_codes), dtype=bool)
+        for col in rng.choice(n_codes, size=int(n_codes * halt_ratio), replace=False):
+            first = self.listed_from[col] + 1
+            if first >= n_days:
+                continue
+            start = int(rng.integers(first, n_days))
+            length = int(rng.integers(1, 20))
+            stop = min(start + length, n_days)
+            halted[start:stop, col] = True
+            close[start:stop, col] = close[start - 1, col]
+            self.halts[self.codes[col]] = (self.day_strings[start], self.day_strings[stop - 1])
+
+        noise = np.abs(rng.normal(0.0, 0.01, size=(n_days, n_codes)))
+        prev_close = np.vstack([close[:1], close[:-1]])
+        open_ = prev_close * (1 + rng.normal(0.0, 0.005, size=(n_days, n_codes)))
+        high = np.maximum(open_, close) * (1 + noise)
+        low = np.minimum(open_, close) * (1 - noise)
+        volume = np.round(rng.lognormal(11, 1.2, size=(n_days, n_codes)))
+        open_[halted] = high[halted] = low[halted] = close[halted]
+        volume[halted] = 0
+
+        listed = np.arange(n_days)[:, None] >= self.listed_from[None, :]
+        self.listed = listed
+        self.open = np.where(listed, np.round(open_), np.nan)
+        self.high = np.where(listed, np.round(high), np.nan)
+        self.low = np.where(listed, np.round(low), np.nan)
+        self.close = np.where(listed, np.round(close), np.nan)
+        self.volume = np.where(listed, volume, np.nan)
+
+        # Splits: (day index, ratio). Some fall on the last sessions so the
+        # stored copy disagrees with KIS on the latest date.
+        self.splits: Dict[str, Tuple[int, int]] = {}
+        n_splits = max(1, int(n_codes * split_ratio))
+        for j, col in enumerate(rng.choice(n_codes, size=n_splits, replace=False)):
+            first = self.listed_from[col] + 1
+            if first >= n_days:
+                continue
+            day = n_days - 1 if j == 0 else int(rng.integers(first, n_days))
+            self.splits[self.codes[col]] = (day, int(rng.choice([2, 5, 10])))
+
+        self.shares = np.round(rng.uniform(5e6, 2e8, size=n_codes))
+        self.market_of = np.where(rng.random(n_codes) < 0.4, "KOSPI", "KOSDAQ")
+        self.security_type = np.full(n_codes, "COMMON", dtype=object)
+        n_other = int(n_codes * non_equity_ratio)
+        others = rng.choice(n_codes, size=n_other, replace=False)
+        self.security_type[others[: n_other // 2]] = "PREFERRED"
+        self.security_type[others[n_other // 2:]] = "ETP"
+
+        # Indices are the mean daily return of their market.
+        self.index_close: Dict[str, np.ndarray] = {}
+        rets = np.where(listed & ~halted, log_ret, 0.0)
+        for name, level in (("KOSPI", 2_500.0), ("KOSDAQ", 800.0)):
+            members = self.market_of == name
+            mean_ret = rets[:, members].mean(axis=1) if members.any() else np.zeros(n_days)
+            self.index_close[name] = np.round(level * np.exp(np.cumsum(mean_ret)), 2)
+
+        # Groups: one industry per code, themes overlap.
+        self.groups: Dict[Tuple[str, str], Tuple[str, List[str]]] = {}
+        industry_of = rng.integers(0, n_industries, size=n_codes)
+        for k in range(n_industries):
+            members = [self.codes[i] for i in np.flatnonzero(industry_of == k)]
+            self.groups[("industry", f"{k + 1:03d}")] = (f"합성업종{k + 1}", members)
+        for k in range(n_themes):
+            size = int(rng.integers(8, 25))
+            members = [self.codes[i] for i in rng.choice(n_codes, size=min(size, n_codes), replace=False)]
+            self.groups[("theme", f"{k + 1:03d}")] = (f"합성테마{k + 1}", sorted(members))
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    @property
+    def last_date(self) -> str:
+        return self.day_strings[-1]
+
+    def session(self, offset: int) -> str:
+        """Trading date ``offset`` sessions before the last one."""
+        return self.day_strings[-1 - offset]
+
+    def _adjustment(self, col: int, as_of_index: int) -> np.ndarray:
+        """Per-day multiplier turning adjusted prices into prices as stored on ``as_of``."""
+        factor = np.ones(len(self.days))
+        split = self.splits.get(self.codes[col])
+        if split is not None:
+            day, ratio = split
+            # Splits after as_of are not yet reflected: old bars stay unadjusted.
+            if day > as_of_index:
+                factor[:day] = ratio
+        return factor
+
+    def bars(
+        self,
+        code: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        as_of: Optional[str] = None,
+        adjusted: bool = True,
+    ) -> pd.DataFrame:
+        """OHLCV bars for one code; ``as_of`` gives the copy stored on that date,
+        ``adjusted=False`` the prices as traded (no split adjustment at all)."""
+        col = self.code_index.get(code)
+        if col is None:
+            return pd.DataFrame(columns=["date", "open", "high", "low", "close", "volume", "trading_value"])
+        lo = int(np.searchsorted(self.day_strings, start)) if start else 0
+        hi = int(np.searchsorted(self.day_strings, end, side="right")) if end else len(self.days)
+        lo = max(lo, int(self.listed_from[col]))
+        if as_of is not None:
+            hi = min(hi, int(np.searchsorted(self.day_strings, as_of, side="right")))
+        if lo >= hi:
+            return pd.DataFrame(columns=["date", "open", "high", "low", "close", "volume", "trading_value"])
+
+        as_of_index = len(self.days) - 1 if as_of is None else hi - 1
+        if not adjusted:
+            as_of_index = -1
+        factor = self._adjustment(col, as_of_index)[lo:hi]
+        close = self.close[lo:hi, col] * factor
+        volume = np.round(self.volume[lo:hi, col] / factor)
+        return pd.DataFrame(
+            {
+                "date": self.day_strings[lo:hi],
+                "open": self.open[lo:hi, col] * factor,
+                "high": self.high[lo:hi, col] * factor,
+                "low": self.low[lo:hi, col] * factor,
+                "close": close,
+                "volume": volume,
+                "trading_value": np.round(close * volume),
+            }
+        )
+
+    def market_cap(self, code: str) -> float:
+        col = self.code_index[code]
+        return float(self.close[-1, col] * self.shares[col])
+
+    def index_bars(self, name: str, start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+        lo = int(np.searchsorted(self.day_strings, start)) if start else 0
+        hi = int(np.searchsorted(self.day_strings, end, side="right")) if end else len(self.days)
+        close = self.index_close[name][lo:hi]
+        return pd.DataFrame({"date": self.day_strings[lo:hi], "close": close})
+
+    # ------------------------------------------------------------------
+    # Frames in the shapes the scripts consume
+    # ------------------------------------------------------------------
+    def master_frame(self) -> pd.DataFrame:
+        """Same columns as ``kis_master_loader.get_all_stocks()``."""
+        listed_today = self.listed[-1]
+        df = pd.DataFrame(
+            {
+                "Code": self.codes,
+                "Name": [f"합성{code}" for code in self.codes],
+                "Market": self.market_of,
+                "Marcap": np.nan_to_num(self.close[-1] * self.shares),
+                "SectorLarge": 0,
+                "SectorMedium": 0,
+                "SectorSmall": 0,
+                "ListingDate": self.day_strings[self.listed_from],
+                "Shares": self.shares,
+                "SecurityType": self.security_type,
+            }
+        )
+        df["IsRsEligible"] = df["SecurityType"] == "COMMON"
+        return df[listed_today].reset_index(drop=True)
+
+    def company_rows(self, as_of: str) -> List[dict]:
+        as_of_index = int(np.searchsorted(self.day_strings, as_of, side="right")) - 1
+        rows = []
+        for col, code in enumerate(self.codes):
+            if self.listed_from[col] > as_of_index:
+                continue
+            rows.append(
+                {
+                    "code": code,
+                    "name": f"합성{code}",
+                    "market": self.market_of[col],
+                    "marcap": float(self.close[as_of_index, col] * self.shares[col]),
+                    "security_type": self.security_type[col],
+                    "is_rs_eligible": bool(self.security_type[col] == "COMMON"),
+                }
+            )
+        return rows
+
+    def price_rows(self, as_of: str) -> List[dict]:
+        """``daily_prices_v2`` rows as the database would hold them on ``as_of``."""
+        rows: List[dict] = []
+        for code in self.codes:
+            df = self.bars(code, end=as_of, as_of=as_of)
+            if df.empty:
+                continue
+            df.insert(0, "code", code)
+            df["change"] = 0.0
+            df["market_cap"] = None
+            rows.extend(df.to_dict("records"))
+        for name, series in self.index_close.items():
+            hi = int(np.searchsorted(self.day_strings, as_of, side="right"))
+            for d, value in zip(self.day_strings[:hi], series[:hi]):
+                rows.append(
+                    {
+                        "code": name, "date": d, "open": value, "high": value, "low": value,
+                        "close": value, "volume": 0.0, "trading_value": 0.0,
+                        "change": 0.0, "market_cap": None,
+                    }
+                )
+        return rows
+
+    def rebalance_dates(self) -> List[str]:
+        """First session of every month in the window."""
+        months = pd.Series(self.day_strings).str[:7]
+        return list(self.day_strings[~months.duplicated().to_numpy()])
+
+    def group_rows(self) -> Dict[str, List[dict]]:
+        """industries, themes, their company mappings and index_constituents_monthly rows."""
+        tables: Dict[str, List[dict]] = {
+            "industries": [],
+            "themes": [],
+            "company_industries": [],
+            "company_themes": [],
+            "index_constituents_monthly": [],
+        }
+        rebalances = self.rebalance_dates()
+        for group_id, ((group, index_code), (name, members)) in enumerate(self.groups.items(), start=1):
+            tables["industries" if group == "industry" else "themes"].append(
+                {"id": group_id, "code": index_code, "name": name}
+            )
+            id_column = "industry_id" if group == "industry" else "theme_id"
+            tables["company_industries" if group == "industry" else "company_themes"].extend(
+                {id_column: group_id, "company_code": code} for code in members
+            )
+            for rebalance in rebalances:
+                r_idx = int(np.searchsorted(self.day_strings, rebalance))
+                for code in members:
+                    if self.listed_from[self.code_index[code]] <= r_idx:
+                        tables["index_constituents_monthly"].append(
+                            {
+                                "index_type": group,
+                                "index_code": index_code,
+                                "rebalance_date": rebalance,
+                                "code": code,
+                            }
+                        )
+        return tables
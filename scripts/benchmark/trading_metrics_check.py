@@ -0,0 +1,149 @@
+"""Check the trading-metrics SQL functions against trading_metrics_engine.
+
+Applies 20261019005000_create_trading_metrics_functions.sql to a scratch
+database on a local Postgres and loads a synthetic market into it: prices,
+themes, industries and their mappings. Some bars get zero volume and some
+are dropped, so the "counted bar", previous-trading-date and 20-bar window
+rules all apply. For one sample day, it compares what
+get_market_trading_totals and get_group_trading_metrics return with
+PriceMatrix / group_metrics. The prices are read the way
+calculate_trading_metrics.load_price_matrix reads them, LOOKBACK_DAYS before
+the day. The tolerance matches calculate_trading_metrics.verify.
+
+Usage:
+    python3 scripts/benchmark/trading_metrics_check.py --dsn postgresql://postgres:pw@localhost/postgres
+    python3 scripts/benchmark/trading_metrics_check.py --codes 500 --date 2025-06-02
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_DIR = os.path.dirname(BENCH_DIR)
+for path in (BENCH_DIR, SCRIPT_DIR):
+    if path not in sys.path:
+        sys.path.append(path)
+
+import pg_bulk
+from calculate_trading_metrics import GROUPS, METRIC_FIELDS
+from local_postgres import DEFAULT_DSN, apply_migration, create_base_tables, scratch_database, supabase_roles
+from synthetic_market import SyntheticMarket
+from trading_metrics_engine import LOOKBACK_DAYS, PriceMatrix, group_metrics
+
+DATABASE = "trading_metrics_check"
+MIGRATION = "20261019005000_create_trading_metrics_functions.sql"
+TABLE_KEYS = {
+    "themes": "id",
+    "industries": "id",
+    "company_themes": "theme_id,company_code",
+    "company_industries": "industry_id,company_code",
+}
+
+
+def perturbed_rows(market: SyntheticMarket, as_of: str, seed: int, zero_volume: float, dropped: float) -> List[dict]:
+    """The market's daily_prices_v2 rows with some volumes zeroed and some bars removed."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for row in market.price_rows(as_of):
+        draw = rng.random()
+        if draw < dropped:
+            continue
+        if draw < dropped + zero_volume:
+            row = {**row, "volume": 0.0, "trading_value": 0.0}
+        rows.append(row)
+    return rows
+
+
+def compare(local: Dict[int, dict], server: Dict[int, dict], tolerance: float) -> List[str]:
+    problems = []
+    for group_id in sorted(set(local) | set(server)):
+        a, b = local.get(group_id), server.get(group_id)
+        if a is None or b is None:
+            problems.append(f"group {group_id}: engine {a} / sql {b}")
+            continue
+        for field in METRIC_FIELDS:
+            x, y = float(a[field]), float(b[field])
+            if abs(x - y) > max(tolerance, abs(x) * 1e-9):
+                problems.append(f"group {group_id} {field}: engine {x} / sql {y}")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Trading-metrics SQL functions vs the matrix engine on a local Postgres.")
+    parser.add_argument("--dsn", default=os.environ.get("LOCAL_PG_DSN", DEFAULT_DSN))
+    parser.add_argument("--codes", type=int, default=300)
+    parser.add_argument("--years", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--date", help="Sample day (default: the market's last session).")
+    parser.add_argument("--zero-volume", type=float, default=0.02, help="Share of bars with volume 0.")
+    parser.add_argument("--dropped", type=float, default=0.02, help="Share of bars removed.")
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    market = SyntheticMarket(n_codes=args.codes, years=args.years, seed=args.seed)
+    day = args.date or market.last_date
+    rows = perturbed_rows(market, market.last_date, args.seed, args.zero_volume, args.dropped)
+    groups = market.group_rows()
+
+    load_start = (datetime.strptime(day, "%Y-%m-%d") - timedelta(days=LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+    frame = pd.DataFrame(rows)
+    frame = frame[(frame["date"] >= load_start) & (frame["date"] <= day)]
+    prices = PriceMatrix.from_frame(frame)
+    if np.datetime64(day, "D") not in prices.dates:
+        raise SystemExit(f"{day} is not a session of the synthetic market")
+
+    failures: List[str] = []
+    with scratch_database(args.dsn, DATABASE) as conn:
+        supabase_roles(conn)
+        create_base_tables(conn)
+        apply_migration(conn, MIGRATION)
+        pg_bulk.copy_upsert(conn, "daily_prices_v2", rows, "code,date")
+        for table, keys in TABLE_KEYS.items():
+            if groups[table]:
+                pg_bulk.copy_upsert(conn, table, groups[table], keys)
+        conn.commit()
+        print(f"[LOAD] {len(rows):,} bars, {len(groups['themes'])} themes, {len(groups['industries'])} industries")
+
+        market_total = conn.execute(
+            "select market_trading_value, stock_count from public.get_market_trading_totals(%s, %s)", (day, day)
+        ).fetchone()
+        d = int(np.searchsorted(prices.dates, np.datetime64(day, "D")))
+        engine_total = round(float(prices.market_total[d]), 2)
+        engine_count = int(prices.valid[d].sum())
+        if market_total is None:
+            failures.append(f"market total: no sql row for {day}")
+        else:
+            sql_total, sql_count = float(market_total[0]), int(market_total[1])
+            print(f"[MARKET] {day}: sql {sql_total:,.0f} ({sql_count} bars) / engine {engine_total:,.0f} ({engine_count} bars)")
+            if abs(sql_total - engine_total) > args.tolerance or sql_count != engine_count:
+                failures.append(f"market total: sql {sql_total}, {sql_count} / engine {engine_total}, {engine_count}")
+
+        for group_type, (_, member_table, id_column, _) in GROUPS.items():
+            members: Dict[int, set] = {}
+            for row in groups[member_table]:
+                members.setdefault(row[id_column], set()).add(row["company_code"])
+            local = {row["group_id"]: row for row in group_metrics(prices, members, day, day)}
+            cursor = conn.execute(
+                "select * from public.get_group_trading_metrics(%s, %s, %s)", (group_type, day, day)
+            )
+            names = [column.name for column in cursor.description]
+            server = {row[0]: dict(zip(names, row)) for row in cursor.fetchall()}
+            problems = compare(local, server, args.tolerance)
+            surges = sum(row["surge_count"] for row in local.values())
+            print(f"[{group_type.upper()}] {len(local)} groups (engine) / {len(server)} (sql), {surges} surges, mismatches {len(problems)}")
+            failures.extend(f"{group_type} {problem}" for problem in problems)
+
+    for failure in failures[:20]:
+        print(f"FAIL {failure}")
+    print("ok" if not failures else f"{len(failures)} mismatch(es)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
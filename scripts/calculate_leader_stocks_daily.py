@@ -1,12 +1,29 @@
+"""Leader stocks: top-200 trading value ∩ top-500 RS, scored by RS, trading
+value rank and 1-day return rank (LEADER_WEIGHT_RS/TV/RET).
+
+Usage:
+    python3 scripts/calculate_leader_stocks_daily.py
+    python3 scripts/calculate_leader_stocks_daily.py --date 2026-10-16
+    python3 scripts/calculate_leader_stocks_daily.py --start-date 2025-10-01 --end-date 2026-10-16
+"""
+
+import argparse
 import os
 import time
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
 import pandas as pd
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+from keyset_pager import fetch_all
+from pipeline_metrics import instrument_supabase, metrics, report_on_exit
+
+RANGE_FETCH_WORKERS = 4
+# Enough calendar days before the range to reach its first previous trading date.
+PREV_DATE_LOOKBACK_DAYS = 14
+
 
 def load_env() -> None:
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -22,7 +39,7 @@ def get_supabase_client() -> Client:
     key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
     if not url or not key:
         raise RuntimeError("Supabase credentials not found in .env.local/.env")
-    return create_client(url, key)
+    return instrument_supabase(create_client(url, key))
 
 
 def execute_with_retry(callable_fn, label: str, retries: int = 5, delay: float = 1.0):
@@ -35,6 +52,7 @@ def execute_with_retry(callable_fn, label: str, retries: int = 5, delay: float =
             if attempt > retries:
                 raise
             wait = delay * (2 ** (attempt - 1))
+            metrics.retry(label.split(":")[0])
             print(f"[WARN] {label} failed ({exc}), retrying in {wait:.1f}s...")
             time.sleep(wait)
 
@@ -75,25 +93,14 @@ def fetch_prev_trading_date(supabase: Client, target_date: date) -> Optional[dat
 def fetch_table_rows_by_date(
     supabase: Client, table: str, columns: str, target_date: date
 ) -> List[dict]:
-    rows: List[dict] = []
-    offset = 0
-    page_size = 1000
-    while True:
-        response = execute_with_retry(
-            lambda: supabase.table(table)
-            .select(columns)
-            .eq("date", target_date.isoformat())
-            .range(offset, offset + page_size - 1)
-            .execute(),
-            f"fetch_rows:{table}:{target_date}",
-        )
-        if not response.data:
-            break
-        rows.extend(response.data)
-        if len(response.data) < page_size:
-            break
-        offset += page_size
-    return rows
+    return fetch_all(
+        supabase,
+        table,
+        columns,
+        keys=("code",),
+        filters=lambda q: q.eq("date", target_date.isoformat()),
+        label=f"fetch_rows:{table}:{target_date}",
+    )
 
 
 def chunk_list(items: List[str], size: int) -> List[List[str]]:
@@ -143,12 +150,256 @@ def upsert_leader_rows(supabase: Client, rows: List[dict]) -> None:
             raise RuntimeError(response.error.message)
 
 
-def main() -> None:
+def build_rs_map(rs_rows: List[dict]) -> Dict[str, int]:
+    rs_map: Dict[str, int] = {}
+    for row in rs_rows:
+        code = row.get("code")
+        if not code:
+            continue
+        rank_rs = row.get("rank_weighted")
+        if rank_rs is None:
+            continue
+        rs_map[code] = int(rank_rs)
+    return rs_map
+
+
+def leader_weights() -> Tuple[float, float, float]:
+    return (
+        float(os.environ.get("LEADER_WEIGHT_RS", "0.2")),
+        float(os.environ.get("LEADER_WEIGHT_TV", "0.4")),
+        float(os.environ.get("LEADER_WEIGHT_RET", "0.4")),
+    )
+
+
+def _top_by_date(df: pd.DataFrame, column: str, n: int) -> pd.Series:
+    """Mask of each date's ``n`` largest ``column`` values (ties broken by code)."""
+    order = df.sort_values(["date", column, "code"], ascending=[True, False, True], kind="mergesort")
+    top = order.groupby("date", sort=False).cumcount() < n
+    return top.reindex(df.index)
+
+
+def score_leaders(df: pd.DataFrame) -> pd.DataFrame:
+    """Leader rows for every date in ``df`` at once.
+
+    ``df`` holds one row per (date, code) of the RS universe with ``close``,
+    ``prev_close`` (previous trading date), ``trading_value`` and ``rank_rs``.
+    """
+    df = df[
+        df["close"].notna()
+        & df["prev_close"].notna()
+        & (df["prev_close"] != 0)
+        & df["trading_value"].notna()
+        & df["rank_rs"].notna()
+    ].copy()
+    if df.empty:
+        return df
+    df["ret_1d"] = (df["close"].astype(float) / df["prev_close"].astype(float) - 1.0) * 100
+    df["trading_value"] = df["trading_value"].astype(float)
+    df["rank_rs"] = df["rank_rs"].astype(int)
+
+    df = df[_top_by_date(df, "trading_value", 200) & _top_by_date(df, "rank_rs", 500)].copy()
+    if df.empty:
+        return df
+    by_date = df.groupby("date", sort=False)
+    df["ret_rank"] = (
+        by_date["ret_1d"].rank(pct=True).fillna(0).round().astype(int).clip(1, 99)
+    )
+    df["rank_trading_value"] = (
+        by_date["trading_value"].rank(pct=True).fillna(0).round().astype(int).clip(1, 99)
+    )
+
+    weight_rs, weight_tv, weight_ret = leader_weights()
+    df["leader_score"] = (
+        (df["rank_rs"] * weight_rs)
+        + (df["rank_trading_value"] * weight_tv)
+        + (df["ret_rank"] * weight_ret)
+    )
+    return df.fillna(0)
+
+
+def leader_records(df: pd.DataFrame) -> List[dict]:
+    dates = pd.to_datetime(df["date"]).dt.strftime("%Y-%m-%d")
+    return [
+        {
+            "date": day,
+            "code": code,
+            "leader_score": float(score),
+            "trading_value": float(value),
+            "ret_1d": float(ret),
+            "ret_rank": int(ret_rank),
+            "rank_amount_60": int(tv_rank),
+            "rank_rs": int(rs_rank),
+        }
+        for day, code, score, value, ret, ret_rank, tv_rank, rs_rank in zip(
+            dates,
+            df["code"],
+            df["leader_score"],
+            df["trading_value"],
+            df["ret_1d"],
+            df["ret_rank"],
+            df["rank_trading_value"],
+            df["rank_rs"],
+        )
+    ]
+
+
+def compute_leader_rows(
+    target_date: date,
+    rs_map: Dict[str, int],
+    today_rows: List[dict],
+    prev_rows: List[dict],
+) -> List[dict]:
+    today_map: Dict[str, dict] = {row["code"]: row for row in today_rows if row.get("code")}
+    prev_close: Dict[str, float] = {
+        row["code"]: float(row["close"])
+        for row in prev_rows
+        if row.get("code") and row.get("close") is not None
+    }
+
+    codes = [code for code in sorted(rs_map) if code in today_map]
+    df = pd.DataFrame(
+        {
+            "date": pd.Timestamp(target_date),
+            "code": codes,
+            "close": [today_map[code].get("close") for code in codes],
+            "prev_close": [prev_close.get(code) for code in codes],
+            "trading_value": [today_map[code].get("trading_value") for code in codes],
+            "rank_rs": [rs_map[code] for code in codes],
+        },
+        columns=["date", "code", "close", "prev_close", "trading_value", "rank_rs"],
+    )
+    valid = (
+        df["close"].notna() & df["prev_close"].notna() & (df["prev_close"] != 0) & df["trading_value"].notna()
+    )
+    if not valid.any():
+        print("[ERROR] No rows with valid returns.")
+        return []
+
+    scored = score_leaders(df)
+    if scored.empty:
+        print("[ERROR] No rows after intersection filter.")
+        return []
+    return leader_records(scored)
+
+
+def frame_rows_for_date(prices: pd.DataFrame, target_date: date, columns: List[str]) -> List[dict]:
+    day = prices.loc[prices["date"] == pd.Timestamp(target_date), columns]
+    return day.astype(object).where(day.notna(), None).to_dict("records")
+
+
+def run_from_context(ctx) -> None:
+    """Leader step inside the daily pipeline: RS and prices come from memory.
+
+    RS is read from rs_rankings_v2 when the RS step did not run in this
+    process (``--resume``). A missing input raises RuntimeError so the step
+    fails; the pipeline skips it on days without bars.
+    """
+    target_date = parse_date(ctx.target_date)
+    if ctx.rs_today is not None:
+        rs_rows = ctx.rs_today[["code", "rank_weighted"]].to_dict("records")
+    else:
+        print("[WARN] No in-memory RS result, reading rs_rankings_v2.")
+        rs_rows = fetch_table_rows_by_date(ctx.supabase, "rs_rankings_v2", "code, rank_weighted", target_date)
+
+    prices = ctx.prices
+    earlier = prices.loc[prices["date"] < pd.Timestamp(target_date), "date"]
+    if earlier.empty:
+        raise RuntimeError(f"no trading date before {target_date}")
+    prev_date = earlier.max().date()
+
+    print(f"[INFO] Leader calculation target date: {target_date} (prev: {prev_date})")
+
+    rs_map = build_rs_map(rs_rows)
+    if not rs_map:
+        raise RuntimeError(f"no RS rows for {target_date}")
+
+    codes = set(rs_map.keys())
+    in_universe = prices[prices["code"].isin(codes)]
+    today_rows = frame_rows_for_date(in_universe, target_date, ["code", "close", "trading_value"])
+    prev_rows = frame_rows_for_date(in_universe, prev_date, ["code", "close"])
+    if not today_rows or not prev_rows:
+        raise RuntimeError(f"missing daily price rows for {target_date} or {prev_date}")
+
+    upload_list = compute_leader_rows(target_date, rs_map, today_rows, prev_rows)
+    if not upload_list:
+        raise RuntimeError(f"no leader rows computed for {target_date}")
+
+    upsert_leader_rows(ctx.supabase, upload_list)
+    ctx.leaders = pd.DataFrame(upload_list)
+    print(f"[DONE] Leader rows upserted: {len(upload_list)}")
+
+
+def run_range(supabase: Client, start_date: date, end_date: date) -> int:
+    """Leader rows for every RS date in [start_date, end_date] from one bulk load."""
+    print(f"[INFO] Leader backfill: {start_date} ~ {end_date}")
+    rs = pd.DataFrame(
+        fetch_all(
+            supabase,
+            "rs_rankings_v2",
+            "date, code, rank_weighted",
+            start=start_date.isoformat(),
+            end=end_date.isoformat(),
+            workers=RANGE_FETCH_WORKERS,
+            label="leader_range:rs",
+        ),
+        columns=["date", "code", "rank_weighted"],
+    )
+    rs = rs[rs["code"].notna() & rs["rank_weighted"].notna()]
+    if rs.empty:
+        print("[ERROR] No RS data in range.")
+        return 0
+
+    price_start = start_date - timedelta(days=PREV_DATE_LOOKBACK_DAYS)
+    prices = pd.DataFrame(
+        fetch_all(
+            supabase,
+            "daily_prices_v2",
+            "date, code, close, trading_value",
+            start=price_start.isoformat(),
+            end=end_date.isoformat(),
+            workers=RANGE_FETCH_WORKERS,
+            label="leader_range:prices",
+            progress=True,
+        ),
+        columns=["date", "code", "close", "trading_value"],
+    )
+    print(f"   RS {len(rs)}건, 주가 {len(prices)}건")
+
+    # Previous trading date = previous date present in daily_prices_v2.
+    trading_dates = pd.Series(sorted(prices["date"].unique()))
+    prev_of = dict(zip(trading_dates.iloc[1:], trading_dates.iloc[:-1]))
+    prev = prices.loc[prices["close"].notna(), ["date", "code", "close"]].rename(
+        columns={"date": "prev_date", "close": "prev_close"}
+    )
+
+    frame = rs.rename(columns={"rank_weighted": "rank_rs"}).merge(
+        prices, on=["date", "code"], how="inner"
+    )
+    frame["prev_date"] = frame["date"].map(prev_of)
+    frame = frame.merge(prev, on=["prev_date", "code"], how="left")
+    frame["date"] = pd.to_datetime(frame["date"])
+    frame = frame.sort_values(["date", "code"], kind="mergesort").reset_index(drop=True)
+
+    began = time.perf_counter()
+    upload_list = leader_records(score_leaders(frame))
+    print(
+        f"   {frame['date'].nunique()}일 점수 계산 {time.perf_counter() - began:.2f}s, "
+        f"{len(upload_list)}행"
+    )
+    upsert_leader_rows(supabase, upload_list)
+    print(f"[DONE] Leader rows upserted: {len(upload_list)}")
+    return len(upload_list)
+
+
+def main(target_date: Optional[date] = None) -> None:
     load_env()
+    report_on_exit("calculate_leader_stocks_daily")
     supabase = get_supabase_client()
 
     target_env = os.environ.get("TARGET_DATE")
-    if target_env:
+    if target_date is not None:
+        pass
+    elif target_env:
         target_date = parse_date(target_env)
     else:
         latest_price_date = fetch_latest_date(supabase, "daily_prices_v2")
@@ -178,15 +429,7 @@ def main() -> None:
         print("[ERROR] No RS data for target date.")
         return
 
-    rs_map: Dict[str, int] = {}
-    for row in rs_rows:
-        code = row.get("code")
-        if not code:
-            continue
-        rank_rs = row.get("rank_weighted")
-        if rank_rs is None:
-            continue
-        rs_map[code] = int(rank_rs)
+    rs_map = build_rs_map(rs_rows)
 
     codes = sorted(set(rs_map.keys()))
     if not codes:
@@ -204,89 +447,34 @@ def main() -> None:
         print("[ERROR] Missing daily price rows for target or prev date.")
         return
 
-    today_map: Dict[str, dict] = {row["code"]: row for row in today_rows if row.get("code")}
-    prev_close: Dict[str, float] = {
-        row["code"]: float(row["close"])
-        for row in prev_rows
-        if row.get("code") and row.get("close") is not None
-    }
-
-    rows: List[dict] = []
-    for code in codes:
-        today = today_map.get(code)
-        if not today:
-            continue
-        close_today = today.get("close")
-        close_prev = prev_close.get(code)
-        trading_value = today.get("trading_value")
-        if close_today is None or close_prev is None or close_prev == 0:
-            continue
-        if trading_value is None:
-            continue
-        ret_1d = (float(close_today) / close_prev - 1.0) * 100
-        rows.append(
-            {
-                "code": code,
-                "ret_1d": ret_1d,
-                "trading_value": float(trading_value),
-                "rank_rs": rs_map.get(code),
-            }
-        )
-
-    if not rows:
-        print("[ERROR] No rows with valid returns.")
+    upload_list = compute_leader_rows(target_date, rs_map, today_rows, prev_rows)
+    if not upload_list:
         return
 
-    df = pd.DataFrame(rows)
-    df = df[df["rank_rs"].notna()].copy()
-    df["rank_rs"] = df["rank_rs"].astype(int)
-    tv_top200 = set(
-        df.sort_values("trading_value", ascending=False).head(200)["code"].tolist()
-    )
-    rs_top500 = set(
-        df.sort_values("rank_rs", ascending=False).head(500)["code"].tolist()
-    )
-    target_codes = tv_top200 & rs_top500
-    df = df[df["code"].isin(target_codes)].copy()
-    if df.empty:
-        print("[ERROR] No rows after intersection filter.")
-        return
-    df["ret_rank"] = (
-        df["ret_1d"].rank(pct=True).fillna(0).round().astype(int).clip(1, 99)
-    )
-    df["rank_trading_value"] = (
-        df["trading_value"].rank(pct=True).fillna(0).round().astype(int).clip(1, 99)
-    )
+    upsert_leader_rows(supabase, upload_list)
+    print(f"[DONE] Leader rows upserted: {len(upload_list)}")
 
-    weight_rs = float(os.environ.get("LEADER_WEIGHT_RS", "0.2"))
-    weight_tv = float(os.environ.get("LEADER_WEIGHT_TV", "0.4"))
-    weight_ret = float(os.environ.get("LEADER_WEIGHT_RET", "0.4"))
 
-    df["leader_score"] = (
-        (df["rank_rs"] * weight_rs)
-        + (df["rank_trading_value"] * weight_tv)
-        + (df["ret_rank"] * weight_ret)
-    )
+def cli() -> None:
+    parser = argparse.ArgumentParser(description="Calculate leader_stocks_daily.")
+    parser.add_argument("--date", help="Single target date (default: TARGET_DATE or the latest RS date).")
+    parser.add_argument("--start-date", help="Backfill every RS date from here (range mode).")
+    parser.add_argument("--end-date", help="Last date of the range (default: latest RS date).")
+    args = parser.parse_args()
 
-    df = df.fillna(0)
-    upload_list = []
-    for _, row in df.iterrows():
-        upload_list.append(
-            {
-                "date": target_date.isoformat(),
-                "code": row["code"],
-                "leader_score": float(row["leader_score"]),
-                "trading_value": float(row["trading_value"]),
-                "ret_1d": float(row["ret_1d"]),
-                "ret_rank": int(row["ret_rank"]),
-                "rank_amount_60": int(row["rank_trading_value"]),
-                "rank_rs": int(row["rank_rs"]),
-            }
-        )
+    if not args.start_date:
+        main(parse_date(args.date) if args.date else None)
+        return
 
-    upsert_leader_rows(supabase, upload_list)
-    print(f"[DONE] Leader rows upserted: {len(upload_list)}")
+    load_env()
+    report_on_exit("calculate_leader_stocks_daily")
+    supabase = get_supabase_client()
+    end_date = parse_date(args.end_date) if args.end_date else fetch_latest_date(supabase, "rs_rankings_v2")
+    if end_date is None:
+        print("[ERROR] No RS data.")
+        return
+    run_range(supabase, parse_date(args.start_date), end_date)
 
 
 if __name__ == "__main__":
-    main()
+    cli()
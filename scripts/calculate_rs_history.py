@@ -3,11 +3,11 @@ import pandas as pd
 import numpy as np
 from supabase import create_client, Client
 from dotenv import load_dotenv
-import time
 from datetime import datetime, timedelta
 import gc # 가비지 컬렉터 (메모리 청소부)
 import argparse
 from rs_universe import load_rs_eligible_codes
+import pg_bulk
 
 # 1. 설정 및 연결
 load_dotenv('.env.local')
@@ -181,19 +181,13 @@ supabase.table('rs_rankings_v2').delete() \
     .lte('date', CALC_END_DATE_STR) \
     .execute()
     
-# 청크 업로드
-chunk_size = 5000 
-total_chunks = len(upload_list) // chunk_size + 1
-
-for i in range(0, len(upload_list), chunk_size):
-    chunk = upload_list[i:i+chunk_size]
-    try:
-        supabase.table('rs_rankings_v2').upsert(chunk, on_conflict="date, code").execute()
-        print(f"      [{i // chunk_size + 1}/{total_chunks}] 진행 중...", end='\r')
-    except Exception as e:
-        print(f"      ❌ 업로드 실패: {e}")
-        time.sleep(1)
-        
+# 업로드 (SUPABASE_DB_URL이 있으면 COPY 한 번, 없으면 5000개씩 PostgREST)
+try:
+    pg_bulk.upsert(supabase, 'rs_rankings_v2', upload_list, on_conflict="date, code", chunk_size=5000)
+    print(f"      {len(upload_list)}행 업로드 완료")
+except Exception as e:
+    print(f"      ❌ 업로드 실패: {e}")
+
 print(f"\n✨ {CALC_START_DATE_STR} ~ {CALC_END_DATE_STR} 기간 작업 완료!")
 
 print("\n🎉 모든 히스토리 작업 완료!")
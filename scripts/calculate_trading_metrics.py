@@ -5,451 +5,291 @@
 1. 거래대금 비중: (테마/업종 거래대금 / 전체 시장 거래대금) × 100
 2. 거래대금 가중 수익률: Σ(종목 수익률 × 테마 내 거래대금 비중)
 3. 거래대금 급증 비율: 당일 거래대금 / 20일 평균 거래대금
-"""
 
-import os
-import pandas as pd
-from supabase import create_client, Client
-from dotenv import load_dotenv
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+기본 엔진(matrix)은 기간의 날짜×종목 가격 행렬을 한 번 읽고 그룹 소속 행렬과
+곱해 모든 테마/업종의 지표를 한꺼번에 계산한다(trading_metrics_engine.py).
+긴 백필은 BACKFILL_CHUNK_DAYS 단위로 나눠 읽는다. --engine db 는 같은 계산을
+DB 함수(get_group_trading_metrics, 20261019005000_create_trading_metrics_functions.sql)
+로 한다.
 
-# ---------------------------------------------------------
-# 1. 환경설정
-# ---------------------------------------------------------
-current_dir = os.path.dirname(os.path.abspath(__file__))
-project_root = os.path.dirname(current_dir)
-env_path = os.path.join(project_root, '.env.local')
+날짜를 주지 않으면 테이블에 저장된 마지막 날짜 다음부터 이어서 계산한다
+(테이블이 비어 있으면 최근 90일). 파이프라인에서는 메모리의 가격 창을 쓴다.
 
-if not os.path.exists(env_path):
-    env_path = os.path.join(project_root, '.env')
-
-print(f"[ENV] Loading from: {env_path}")
-load_dotenv(dotenv_path=env_path)
+Usage:
+    python scripts/calculate_trading_metrics.py
+    python scripts/calculate_trading_metrics.py --start-date 2020-01-01 --end-date 2026-10-16
+    python scripts/calculate_trading_metrics.py --engine db --start-date 2026-07-01
+    python scripts/calculate_trading_metrics.py --verify 2026-10-16
+"""
 
-url: str = os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+import argparse
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
 
-if not url or not key:
-    print("[ERROR] Supabase credentials not found")
-    exit(1)
+import pandas as pd
+from supabase import Client
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPT_DIR not in sys.path:
+    sys.path.append(SCRIPT_DIR)
+
+from keyset_pager import fetch_all  # noqa: E402
+from pipeline_metrics import report_on_exit  # noqa: E402
+from supabase_batch import get_supabase_client, load_env, upsert_rows  # noqa: E402
+from trading_metrics_engine import LOOKBACK_DAYS, PriceMatrix, group_metrics  # noqa: E402
+
+# group_type -> (그룹 테이블, 매핑 테이블, 그룹 id 컬럼, 결과 테이블)
+GROUPS = {
+    'theme': ('themes', 'company_themes', 'theme_id', 'theme_trading_metrics'),
+    'industry': ('industries', 'company_industries', 'industry_id', 'industry_trading_metrics'),
+}
+DEFAULT_DAYS = 90
+# 백필 한 구간의 달력 일수. 전 종목 1년치 가격이면 행렬 몇 개가 수백 MB 이내다.
+BACKFILL_CHUNK_DAYS = 366
+PRICE_FETCH_WORKERS = 4
+# RPC 결과도 PostgREST max-rows(1000)에 잘리므로 그룹 수 × 일수가 이 안에 들게 나눈다.
+RPC_ROW_BUDGET = 1000
+METRIC_FIELDS = (
+    'total_trading_value',
+    'market_trading_value',
+    'trading_value_ratio',
+    'weighted_return',
+    'avg_surge_ratio',
+    'surge_count',
+    'total_stock_count',
+)
+
+_supabase: Optional[Client] = None
+
+
+def _client() -> Client:
+    global _supabase
+    if _supabase is None:
+        load_env()
+        _supabase = get_supabase_client()
+    return _supabase
+
+
+def _shift(date_str: str, days: int) -> str:
+    return (datetime.strptime(date_str, '%Y-%m-%d') + timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+def date_chunks(start_date: str, end_date: str, days: int) -> List[tuple]:
+    """[start_date, end_date]를 days일 단위 구간으로 나눈다."""
+    chunks = []
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(_shift(chunk_start, days - 1), end_date)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = _shift(chunk_end, 1)
+    return chunks
 
-supabase: Client = create_client(url, key)
 
 # ---------------------------------------------------------
-# 2. 유틸리티 함수
+# 1. 입력 데이터
 # ---------------------------------------------------------
-def get_trading_dates(start_date: str, end_date: str) -> List[str]:
-    """거래일 목록 가져오기"""
-    try:
-        response = supabase.table('daily_prices_v2')\
-            .select('date')\
-            .gte('date', start_date)\
-            .lte('date', end_date)\
-            .order('date')\
+def load_members(supabase: Client, group_type: str) -> Dict[int, set]:
+    """그룹 id -> 소속 종목 코드"""
+    _, member_table, id_column, _ = GROUPS[group_type]
+    rows = fetch_all(
+        supabase,
+        member_table,
+        f'{id_column}, company_code',
+        keys=(id_column, 'company_code'),
+        label=f'members:{group_type}',
+    )
+    members = defaultdict(set)
+    for row in rows:
+        members[row[id_column]].add(str(row['company_code']))
+    return members
+
+
+def load_price_matrix(supabase: Client, start_date: str, end_date: str, ctx=None) -> PriceMatrix:
+    """start_date - LOOKBACK_DAYS ~ end_date 의 전 종목 가격 행렬"""
+    load_start = _shift(start_date, -LOOKBACK_DAYS)
+    if ctx is not None and ctx.covers(load_start):
+        print("   (파이프라인 메모리의 주가 데이터를 사용합니다)")
+        return PriceMatrix.from_frame(ctx.price_rows(load_start, end_date))
+
+    print(f"   가격 로딩: {load_start} ~ {end_date}")
+    rows = fetch_all(
+        supabase,
+        'daily_prices_v2',
+        'code, date, close, volume',
+        keys=('date', 'code'),
+        start=load_start,
+        end=end_date,
+        workers=PRICE_FETCH_WORKERS,
+        label='trading_metrics_prices',
+        progress=True,
+    )
+    print(f"   {len(rows)}건 로드")
+    frame = pd.DataFrame(rows, columns=['code', 'date', 'close', 'volume'])
+    return PriceMatrix.from_frame(frame)
+
+
+def latest_stored_date(supabase: Client) -> Optional[str]:
+    """두 결과 테이블 중 더 뒤처진 쪽의 마지막 날짜 (하나라도 비면 None)"""
+    latest = []
+    for _, _, _, metrics_table in GROUPS.values():
+        response = (
+            supabase.table(metrics_table)
+            .select('date')
+            .order('date', desc=True)
+            .limit(1)
             .execute()
+        )
+        if not response.data:
+            return None
+        latest.append(str(response.data[0]['date'])[:10])
+    return min(latest)
 
-        dates = sorted(list(set([row['date'] for row in response.data])))
-        return dates
-    except Exception as e:
-        print(f"[ERROR] Failed to get trading dates: {e}")
-        return []
-
-def get_theme_companies(theme_id: int) -> List[str]:
-    """특정 테마에 속한 종목 코드 리스트"""
-    try:
-        response = supabase.table('company_themes')\
-            .select('company_code')\
-            .eq('theme_id', theme_id)\
-            .execute()
-
-        return [row['company_code'] for row in response.data]
-    except Exception as e:
-        print(f"[ERROR] Failed to get theme companies: {e}")
-        return []
 
-def get_industry_companies(industry_id: int) -> List[str]:
-    """특정 업종에 속한 종목 코드 리스트"""
-    try:
-        response = supabase.table('company_industries')\
-            .select('company_code')\
-            .eq('industry_id', industry_id)\
-            .execute()
-
-        return [row['company_code'] for row in response.data]
-    except Exception as e:
-        print(f"[ERROR] Failed to get industry companies: {e}")
+# ---------------------------------------------------------
+# 2. DB 함수 (--engine db, --verify)
+# ---------------------------------------------------------
+def rpc_group_metrics(supabase: Client, group_type: str, start_date: str, end_date: str) -> List[dict]:
+    """get_group_trading_metrics 결과 (그룹 수 × 일수가 max-rows 안에 들게 나눠 호출)"""
+    group_table = GROUPS[group_type][0]
+    group_count = len(supabase.table(group_table).select('id').execute().data or [])
+    if group_count == 0:
         return []
 
-def get_market_trading_value(date: str) -> float:
-    """전체 시장의 거래대금 계산"""
-    try:
-        response = supabase.table('daily_prices_v2')\
-            .select('close, volume')\
-            .eq('date', date)\
-            .execute()
+    # 달력 일수 ≥ 거래일 수이므로 구간당 행 수는 예산을 넘지 않는다.
+    days = max(1, RPC_ROW_BUDGET // group_count)
+    rows: List[dict] = []
+    for chunk_start, chunk_end in date_chunks(start_date, end_date, days):
+        response = supabase.rpc(
+            'get_group_trading_metrics',
+            {'group_type': group_type, 'start_date': chunk_start, 'end_date': chunk_end},
+        ).execute()
+        rows.extend(response.data or [])
+    return rows
 
-        total = 0
-        for row in response.data:
-            if row['close'] and row['volume']:
-                trading_value = float(row['close']) * float(row['volume'])
-                total += trading_value
 
-        return total
-    except Exception as e:
-        print(f"[ERROR] Failed to get market trading value: {e}")
+# ---------------------------------------------------------
+# 3. 계산/저장
+# ---------------------------------------------------------
+def save_group_metrics(supabase: Client, group_type: str, rows: List[dict]) -> int:
+    _, _, id_column, metrics_table = GROUPS[group_type]
+    records = [
+        {
+            id_column: row['group_id'],
+            'date': str(row['date'])[:10],
+            **{field: row[field] for field in METRIC_FIELDS},
+        }
+        for row in rows
+    ]
+    upsert_rows(supabase, metrics_table, records, f'{id_column},date')
+    return len(records)
+
+
+def run(
+    supabase: Client,
+    target_date: str,
+    ctx=None,
+    start_date: Optional[str] = None,
+    group_types: tuple = tuple(GROUPS),
+    engine: str = 'matrix',
+) -> int:
+    """start_date(기본: 저장된 마지막 날짜 다음) ~ target_date 의 지표를 계산해 upsert 한다."""
+    if start_date is None:
+        latest = latest_stored_date(supabase)
+        start_date = _shift(latest, 1) if latest else _shift(target_date, -DEFAULT_DAYS)
+    if start_date > target_date:
+        print(f"[INFO] Trading metrics already up to date ({target_date})")
         return 0
 
-def get_stock_data(codes: List[str], date: str) -> Dict[str, Dict]:
-    """특정 날짜의 종목별 가격/거래량 데이터"""
-    if not codes:
-        return {}
-
-    try:
-        batch_size = 1000
-        all_data = {}
-
-        for i in range(0, len(codes), batch_size):
-            batch_codes = codes[i:i+batch_size]
-
-            response = supabase.table('daily_prices_v2')\
-                .select('code, close, volume')\
-                .eq('date', date)\
-                .in_('code', batch_codes)\
-                .execute()
-
-            for row in response.data:
-                if row['close'] and row['volume']:
-                    all_data[row['code']] = {
-                        'close': float(row['close']),
-                        'volume': float(row['volume']),
-                        'trading_value': float(row['close']) * float(row['volume'])
-                    }
-
-        return all_data
-    except Exception as e:
-        print(f"[ERROR] Failed to get stock data: {e}")
-        return {}
-
-def get_20d_avg_trading_value(codes: List[str], end_date: str) -> Dict[str, float]:
-    """종목별 20일 평균 거래대금 계산"""
-    if not codes:
-        return {}
-
-    try:
-        # 20일 전 날짜 계산
-        end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-        start_dt = end_dt - timedelta(days=30)  # 여유있게 30일
-        start_date = start_dt.strftime('%Y-%m-%d')
-
-        batch_size = 1000
-        all_avg = {}
-
-        for i in range(0, len(codes), batch_size):
-            batch_codes = codes[i:i+batch_size]
-
-            response = supabase.table('daily_prices_v2')\
-                .select('code, date, close, volume')\
-                .in_('code', batch_codes)\
-                .gte('date', start_date)\
-                .lt('date', end_date)\
-                .order('date', desc=True)\
-                .execute()
-
-            # 종목별로 그룹화
-            code_data = {}
-            for row in response.data:
-                code = row['code']
-                if code not in code_data:
-                    code_data[code] = []
-
-                if row['close'] and row['volume']:
-                    trading_value = float(row['close']) * float(row['volume'])
-                    code_data[code].append(trading_value)
-
-            # 최근 20일 평균 계산
-            for code, values in code_data.items():
-                recent_20 = values[:20]
-                if recent_20:
-                    all_avg[code] = sum(recent_20) / len(recent_20)
-
-        return all_avg
-    except Exception as e:
-        print(f"[ERROR] Failed to get 20d avg trading value: {e}")
-        return {}
-
-def calculate_trading_metrics(
-    codes: List[str],
-    current_date: str,
-    previous_date: str,
-    market_total: float
-) -> Optional[Dict]:
-    """거래대금 지표 계산"""
-
-    # 현재일 데이터
-    current_data = get_stock_data(codes, current_date)
-    if not current_data:
-        return None
-
-    # 전일 데이터 (수익률 계산용)
-    previous_data = get_stock_data(codes, previous_date)
-
-    # 20일 평균 거래대금
-    avg_20d = get_20d_avg_trading_value(codes, current_date)
-
-    # 1. 총 거래대금 계산
-    total_trading_value = sum([d['trading_value'] for d in current_data.values()])
-
-    # 2. 거래대금 비중
-    trading_value_ratio = 0
-    if market_total > 0:
-        trading_value_ratio = (total_trading_value / market_total) * 100
-
-    # 3. 거래대금 가중 수익률 계산
-    weighted_returns = []
-    for code, curr in current_data.items():
-        if code in previous_data:
-            prev_price = previous_data[code]['close']
-            curr_price = curr['close']
-
-            if prev_price > 0:
-                # 종목 수익률
-                stock_return = ((curr_price - prev_price) / prev_price) * 100
-
-                # 해당 종목의 거래대금 비중
-                weight = curr['trading_value'] / total_trading_value if total_trading_value > 0 else 0
-
-                # 가중 수익률
-                weighted_returns.append(stock_return * weight)
-
-    weighted_return = sum(weighted_returns) if weighted_returns else 0
-
-    # 4. 거래대금 급증 비율 계산
-    surge_ratios = []
-    surge_count = 0
-
-    for code, curr in current_data.items():
-        if code in avg_20d and avg_20d[code] > 0:
-            surge_ratio = curr['trading_value'] / avg_20d[code]
-            surge_ratios.append(surge_ratio)
-
-            if surge_ratio >= 2.0:
-                surge_count += 1
-
-    avg_surge_ratio = sum(surge_ratios) / len(surge_ratios) if surge_ratios else 0
-
-    return {
-        'total_trading_value': round(total_trading_value, 2),
-        'market_trading_value': round(market_total, 2),
-        'trading_value_ratio': round(trading_value_ratio, 4),
-        'weighted_return': round(weighted_return, 4),
-        'avg_surge_ratio': round(avg_surge_ratio, 4),
-        'surge_count': surge_count,
-        'total_stock_count': len(current_data)
-    }
+    print(f"[INFO] Trading metrics {start_date} ~ {target_date} ({engine})")
+    members = {group_type: load_members(supabase, group_type) for group_type in group_types}
+    written = defaultdict(int)
+
+    for chunk_start, chunk_end in date_chunks(start_date, target_date, BACKFILL_CHUNK_DAYS):
+        if engine == 'db':
+            results = {
+                group_type: rpc_group_metrics(supabase, group_type, chunk_start, chunk_end)
+                for group_type in group_types
+            }
+        else:
+            prices = load_price_matrix(supabase, chunk_start, chunk_end, ctx)
+            results = {
+                group_type: group_metrics(prices, members[group_type], chunk_start, chunk_end)
+                for group_type in group_types
+            }
+            del prices
+        for group_type, rows in results.items():
+            written[group_type] += save_group_metrics(supabase, group_type, rows)
+        print(f"   {chunk_start} ~ {chunk_end}: " + ", ".join(f"{k} {v}" for k, v in written.items()))
+
+    total = sum(written.values())
+    print(f"[INFO] Trading metrics done: {total} rows written")
+    return total
+
 
-# ---------------------------------------------------------
-# 3. 테마 거래대금 지표 계산
-# ---------------------------------------------------------
 def calculate_theme_trading_metrics(start_date: str, end_date: str):
     """테마별 거래대금 지표 계산"""
-
     print("\n[STEP 1] Calculating Theme Trading Metrics...")
+    run(_client(), end_date, start_date=start_date, group_types=('theme',))
 
-    # 모든 테마 가져오기
-    try:
-        response = supabase.table('themes').select('id, code, name').execute()
-        themes = response.data
-    except Exception as e:
-        print(f"[ERROR] Failed to load themes: {e}")
-        return
-
-    # 거래일 목록
-    trading_dates = get_trading_dates(start_date, end_date)
-    if not trading_dates:
-        print("[ERROR] No trading dates found")
-        return
-
-    print(f"[INFO] Processing {len(themes)} themes for {len(trading_dates)} trading days")
-
-    # 각 테마별로 지표 계산
-    for idx, theme in enumerate(themes):
-        theme_id = theme['id']
-        theme_name = theme['name']
-
-        print(f"[{idx+1}/{len(themes)}] {theme_name}...", end=" ")
-
-        # 해당 테마의 종목 코드들
-        company_codes = get_theme_companies(theme_id)
-
-        if not company_codes:
-            print("No companies")
-            continue
-
-        # 날짜별 지표 계산
-        metrics_records = []
-
-        for date_idx, current_date in enumerate(trading_dates):
-            # 첫날은 이전 데이터가 없으므로 스킵
-            if date_idx == 0:
-                continue
-
-            previous_date = trading_dates[date_idx - 1]
-
-            # 시장 전체 거래대금
-            market_total = get_market_trading_value(current_date)
-
-            if market_total == 0:
-                continue
-
-            # 거래대금 지표 계산
-            result = calculate_trading_metrics(
-                company_codes,
-                current_date,
-                previous_date,
-                market_total
-            )
-
-            if result is None:
-                continue
-
-            metrics_records.append({
-                'theme_id': theme_id,
-                'date': current_date,
-                **result
-            })
-
-        # DB에 저장 (upsert)
-        try:
-            if metrics_records:
-                # 기존 데이터 삭제
-                supabase.table('theme_trading_metrics')\
-                    .delete()\
-                    .eq('theme_id', theme_id)\
-                    .gte('date', start_date)\
-                    .lte('date', end_date)\
-                    .execute()
-
-                # 새 데이터 삽입
-                batch_size = 1000
-                for i in range(0, len(metrics_records), batch_size):
-                    batch = metrics_records[i:i+batch_size]
-                    supabase.table('theme_trading_metrics').insert(batch).execute()
-
-                print(f"OK ({len(metrics_records)} records)")
-            else:
-                print("No data")
-        except Exception as e:
-            print(f"DB Error: {e}")
 
-# ---------------------------------------------------------
-# 4. 업종 거래대금 지표 계산
-# ---------------------------------------------------------
 def calculate_industry_trading_metrics(start_date: str, end_date: str):
     """업종별 거래대금 지표 계산"""
-
     print("\n[STEP 2] Calculating Industry Trading Metrics...")
+    run(_client(), end_date, start_date=start_date, group_types=('industry',))
 
-    # 모든 업종 가져오기
-    try:
-        response = supabase.table('industries').select('id, code, name').execute()
-        industries = response.data
-    except Exception as e:
-        print(f"[ERROR] Failed to load industries: {e}")
-        return
-
-    # 거래일 목록
-    trading_dates = get_trading_dates(start_date, end_date)
-    if not trading_dates:
-        print("[ERROR] No trading dates found")
-        return
-
-    print(f"[INFO] Processing {len(industries)} industries for {len(trading_dates)} trading days")
-
-    # 각 업종별로 지표 계산
-    for idx, industry in enumerate(industries):
-        industry_id = industry['id']
-        industry_name = industry['name']
-
-        print(f"[{idx+1}/{len(industries)}] {industry_name}...", end=" ")
-
-        # 해당 업종의 종목 코드들
-        company_codes = get_industry_companies(industry_id)
-
-        if not company_codes:
-            print("No companies")
-            continue
-
-        # 날짜별 지표 계산
-        metrics_records = []
-
-        for date_idx, current_date in enumerate(trading_dates):
-            if date_idx == 0:
-                continue
-
-            previous_date = trading_dates[date_idx - 1]
-            market_total = get_market_trading_value(current_date)
-
-            if market_total == 0:
-                continue
-
-            result = calculate_trading_metrics(
-                company_codes,
-                current_date,
-                previous_date,
-                market_total
-            )
-
-            if result is None:
-                continue
-
-            metrics_records.append({
-                'industry_id': industry_id,
-                'date': current_date,
-                **result
-            })
-
-        # DB에 저장
-        try:
-            if metrics_records:
-                supabase.table('industry_trading_metrics')\
-                    .delete()\
-                    .eq('industry_id', industry_id)\
-                    .gte('date', start_date)\
-                    .lte('date', end_date)\
-                    .execute()
-
-                batch_size = 1000
-                for i in range(0, len(metrics_records), batch_size):
-                    batch = metrics_records[i:i+batch_size]
-                    supabase.table('industry_trading_metrics').insert(batch).execute()
-
-                print(f"OK ({len(metrics_records)} records)")
-            else:
-                print("No data")
-        except Exception as e:
-            print(f"DB Error: {e}")
 
 # ---------------------------------------------------------
-# 5. 메인 실행
+# 4. 검증 (행렬 엔진 vs DB 함수)
 # ---------------------------------------------------------
-def main():
-    print("=" * 60)
-    print("Trading Metrics Calculation")
-    print("=" * 60)
+def verify(supabase: Client, date: str, tolerance: float = 1e-3) -> bool:
+    """한 날짜의 지표를 시장 전체 가격으로 직접 계산해 DB 함수 결과와 비교한다."""
+    print(f"\n[VERIFY] {date}")
+    prices = load_price_matrix(supabase, date, date)
+    ok = True
+    for group_type in GROUPS:
+        local = {row['group_id']: row for row in group_metrics(prices, load_members(supabase, group_type), date, date)}
+        server = {row['group_id']: row for row in rpc_group_metrics(supabase, group_type, date, date)}
+        mismatches = 0
+        for group_id in sorted(set(local) | set(server)):
+            a, b = local.get(group_id), server.get(group_id)
+            if a is None or b is None or any(
+                abs(float(a[field]) - float(b[field])) > max(tolerance, abs(float(a[field])) * 1e-9)
+                for field in METRIC_FIELDS
+            ):
+                mismatches += 1
+                if mismatches <= 5:
+                    print(f"   ❌ {group_type} {group_id}: local {a} / server {b}")
+        print(f"   {group_type}: {len(local)} groups, mismatches {mismatches}")
+        ok = ok and mismatches == 0
+
+    print("✅ 일치" if ok else "❌ 불일치")
+    return ok
 
-    # 계산 기간 설정 (최근 3개월)
-    end_date = datetime.now().strftime('%Y-%m-%d')
-    start_date = (datetime.now() - timedelta(days=90)).strftime('%Y-%m-%d')
 
-    print(f"\n[INFO] Calculation Period: {start_date} ~ {end_date}")
+# ---------------------------------------------------------
+# 5. 메인 실행
+# ---------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Theme/industry trading-value metrics.")
+    parser.add_argument("--start-date", help="YYYY-MM-DD (default: day after the last stored date)")
+    parser.add_argument("--end-date", default=datetime.now().strftime('%Y-%m-%d'), help="YYYY-MM-DD")
+    parser.add_argument("--engine", choices=("matrix", "db"), default="matrix")
+    parser.add_argument("--verify", metavar="DATE", help="Compare the matrix engine with the DB functions for one date.")
+    args = parser.parse_args()
 
-    # 테마 거래대금 지표 계산
-    calculate_theme_trading_metrics(start_date, end_date)
+    supabase = _client()
+    report_on_exit("calculate_trading_metrics")
 
-    # 업종 거래대금 지표 계산
-    calculate_industry_trading_metrics(start_date, end_date)
+    if args.verify:
+        sys.exit(0 if verify(supabase, args.verify) else 1)
 
+    print("=" * 60)
+    print("Trading Metrics Calculation")
+    print("=" * 60)
+    run(supabase, args.end_date, start_date=args.start_date, engine=args.engine)
     print("\n" + "=" * 60)
     print("[DONE] Trading metrics calculation completed!")
     print("=" * 60)
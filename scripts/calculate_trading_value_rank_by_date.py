@@ -59,6 +59,7 @@ try:
             res = supabase.table('daily_prices_v2') \
                 .select('code, date, close, volume') \
                 .eq('date', target_day) \
+                .order('code') \
                 .range(day_offset, day_offset + 999) \
                 .execute()
             
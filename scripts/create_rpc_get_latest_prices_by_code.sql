@@ -1,5 +1,7 @@
 -- Supabase RPC 함수 생성 SQL
 -- 이 파일을 Supabase SQL Editor에서 실행하세요.
+-- 최초 버전이다. 현재 정의는 supabase/migrations/20261019009100_daily_prices_v2_covering_indexes.sql에 있으며,
+-- 이 파일을 다시 실행하면 느린 DISTINCT ON 버전으로 되돌아간다.
 
 CREATE OR REPLACE FUNCTION public.get_latest_prices_by_code()
 RETURNS TABLE(code text, date text, close numeric)
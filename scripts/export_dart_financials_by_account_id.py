@@ -28,6 +28,7 @@ from dotenv import load_dotenv
 from supabase import Client, create_client
 
 from financials_account_map import parse_amount, select_account_row_by_priority
+from pipeline_metrics import instrument_supabase, metrics, report_on_exit
 
 DART_API_BASE = "https://opendart.fss.or.kr/api"
 REPORT_CODE_BY_QUARTER = {
@@ -133,13 +134,20 @@ def load_env() -> tuple[str, Client]:
             "was not found in .env.local or .env."
         )
 
-    return dart_api_key, create_client(url, key)
+    return dart_api_key, instrument_supabase(create_client(url, key))
 
 
 def get_json(path: str, params: dict[str, Any]) -> dict[str, Any]:
+    started = time.monotonic()
     response = requests.get(f"{DART_API_BASE}/{path}", params=params, timeout=60)
+    latency = time.monotonic() - started
+    if response.status_code >= 400:
+        metrics.record_call("dart", path, latency, error=True)
     response.raise_for_status()
-    return response.json()
+    data = response.json()
+    # DART reports its daily/minute quota being exhausted as status "020".
+    metrics.record_call("dart", path, latency, throttled=data.get("status") == "020")
+    return data
 
 
 def ensure_excel_engine() -> None:
@@ -190,11 +198,18 @@ def get_corp_map(api_key: str) -> dict[str, dict[str, str]]:
     last_error: str | None = None
     for attempt in range(1, 4):
         try:
+            started = time.monotonic()
             response = requests.get(
                 f"{DART_API_BASE}/corpCode.xml",
                 params={"crtfc_key": api_key},
                 timeout=60,
             )
+            metrics.record_call(
+                "dart",
+                "corpCode.xml",
+                time.monotonic() - started,
+                error=response.status_code >= 400,
+            )
             response.raise_for_status()
             with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
                 xml_content = archive.read("CORPCODE.xml")
@@ -537,6 +552,7 @@ def main() -> int:
     ensure_excel_engine()
 
     api_key, supabase = load_env()
+    report_on_exit("export_dart_financials")
     corp_map = get_corp_map(api_key)
     companies = get_companies(
         supabase,
@@ -96,11 +96,11 @@ def main() -> None:
     os.makedirs(output_dir, exist_ok=True)
 
     print("Downloading KIS master files...")
-    kospi_df = kis_master_loader.download_and_parse_kospi_master(os.getcwd())
+    kospi_df = kis_master_loader.download_and_parse_kospi_master()
     if not kospi_df.empty:
         kospi_df["Market"] = "KOSPI"
 
-    kosdaq_df = kis_master_loader.download_and_parse_kosdaq_master(os.getcwd())
+    kosdaq_df = kis_master_loader.download_and_parse_kosdaq_master()
     if not kosdaq_df.empty:
         kosdaq_df["Market"] = "KOSDAQ"
 
@@ -1,59 +1,39 @@
+import argparse
 import os
-import requests
 import json
+import threading
 import pandas as pd
-from supabase import create_client, Client
-from dotenv import load_dotenv
-import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import signal
 import sys
 
-# 환경변수 로드
-load_dotenv('.env.local')
+# KIS 호출은 update_today_v3의 앱키 풀을 쓴다 (KIS_APP_KEY, KIS_APP_KEY_2, ...).
+# 키마다 토큰과 초당 한도가 따로라 키를 추가하면 그만큼 빨라진다.
+import update_today_v3 as kis
+import pg_bulk
+import backfill_planner
+from keyset_pager import fetch_all
 
-supabase_url = os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
-supabase_key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
-APP_KEY = os.environ.get("KIS_APP_KEY")
-APP_SECRET = os.environ.get("KIS_APP_SECRET")
+supabase = kis.supabase
 
 # 설정
 START_DATE = '20150101'
 END_DATE = '20231231'
 PROGRESS_FILE = 'scripts/fill_trading_value_progress.json'
 ERROR_EXPORT_FILE = f'scripts/trading_value_errors_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
+MIN_INTERVAL_SEC = 0.06  # 키당 약 16req/sec (안전 마진)
+WORKERS_PER_KEY = 3
 
 # 전역 변수
 completed_codes = set()
 error_logs = []
-access_token = None
-
-if not supabase_url or not supabase_key:
-    print("❌ Supabase 환경변수 오류")
-    exit()
-
-if not APP_KEY or not APP_SECRET:
-    print("❌ 한국투자증권 API 환경변수 오류")
-    exit()
-
-supabase: Client = create_client(supabase_url, supabase_key)
-
-def get_kis_token():
-    """한국투자증권 API 접근 토큰 발급"""
-    url = "https://openapi.koreainvestment.com:9443/oauth2/tokenP"
-    headers = {"content-type": "application/json"}
-    body = {
-        "grant_type": "client_credentials",
-        "appkey": APP_KEY,
-        "appsecret": APP_SECRET
-    }
-    try:
-        res = requests.post(url, headers=headers, data=json.dumps(body))
-        res.raise_for_status()
-        return res.json()["access_token"]
-    except Exception as e:
-        print(f"❌ 토큰 발급 실패: {e}")
-        return None
+plan_column = None  # --plan: 'close'(봉 전체) 또는 'trading_value'
+plan_written = [0]
+active_plan = None  # --plan: 실행 중인 계획 (구멍 날짜 계산용)
+plan_empty_answers = {}  # --plan: 종목 -> KIS가 봉 없이 답한 구멍 날짜 (거래정지 등)
+progress_lock = threading.Lock()
+stop_event = threading.Event()
 
 def load_progress():
     """진행 상황 로드"""
@@ -67,8 +47,10 @@ def load_progress():
 
 def save_progress():
     """진행 상황 저장"""
+    with progress_lock:
+        codes = list(completed_codes)
     with open(PROGRESS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(list(completed_codes), f)
+        json.dump(codes, f)
 
 def save_error_log():
     """오류 로그 엑셀 저장"""
@@ -79,170 +61,249 @@ def save_error_log():
     else:
         print("\n✨ 발생한 오류가 없습니다.")
 
+def load_companies():
+    """companies 전체 (code, name). 한 번에 select하면 PostgREST max-rows(1000)에서 잘린다."""
+    return fetch_all(supabase, "companies", "code, name", keys=("code",), label="companies")
+
 def signal_handler(sig, frame):
-    """강제 종료(Ctrl+C) 시 처리"""
-    print("\n\n🛑 프로그램이 중단되었습니다. 진행 상황을 저장합니다...")
-    save_progress()
-    save_error_log()
-    sys.exit(0)
+    """강제 종료(Ctrl+C) 시 처리: 처리 중인 종목만 마치고 진행 상황을 저장한다."""
+    if stop_event.is_set():
+        sys.exit(1)
+    print("\n\n🛑 중단 요청을 받았습니다. 처리 중인 종목을 마치고 진행 상황을 저장합니다...")
+    stop_event.set()
 
 # 시그널 핸들러 등록
 signal.signal(signal.SIGINT, signal_handler)
 
+def fill_stock(stock):
+    """한 종목의 기간 거래대금을 받아 저장한다. 오류 없이 끝나면 완료 처리."""
+    if stop_event.is_set():
+        return
+    code = stock['code']
+    name = stock['name']
+
+    try:
+        # 기간 루프 (100일 단위)
+        current_start = datetime.strptime(START_DATE, '%Y%m%d')
+        end_dt = datetime.strptime(END_DATE, '%Y%m%d')
+
+        stock_data = []
+        has_error = False
+
+        while current_start <= end_dt:
+            current_end = min(current_start + timedelta(days=99), end_dt)
+            # 토큰 재발급, 초당 한도 초과 재시도는 kis_request가 처리한다.
+            # 재시도 뒤에도 한도 초과/토큰 오류면 KisApiError: 이 종목은 완료 처리하지 않는다.
+            # 거래정지·없는 종목처럼 다시 물어도 같은 거부는 빈 목록으로 온다.
+            try:
+                rows = kis.get_kis_daily_ohlcv(
+                    code,
+                    current_start.strftime('%Y%m%d'),
+                    current_end.strftime('%Y%m%d'),
+                )
+            except Exception as req_e:
+                print(f"\n   ⚠️ API 호출 중 에러 ({name}): {req_e}")
+                error_logs.append({
+                    "code": code,
+                    "name": name,
+                    "date_range": f"{current_start.strftime('%Y%m%d')}-{current_end.strftime('%Y%m%d')}",
+                    "error": str(req_e)
+                })
+                has_error = True
+                break
+
+            # 데이터 없음 등은 에러 아님, 패스
+            for item in rows:
+                d = item.get("stck_bsop_date")
+                v = int(item.get("acml_tr_pbmn", "0") or 0)
+                if d and v > 0:
+                    stock_data.append({
+                        "code": code,
+                        "date": f"{d[:4]}-{d[4:6]}-{d[6:]}",
+                        "trading_value": v
+                    })
+
+            current_start = current_end + timedelta(days=1)
+
+        # DB 저장 (SUPABASE_DB_URL이 있으면 COPY, 없으면 1000개씩 PostgREST upsert)
+        if stock_data:
+            try:
+                pg_bulk.upsert(supabase, "daily_prices_v2", stock_data, on_conflict="code,date", chunk_size=1000)
+            except Exception as db_e:
+                print(f"\n   ❌ DB 저장 실패 {name}: {db_e}")
+                error_logs.append({"code": code, "name": name, "error": f"DB Save: {db_e}"})
+                has_error = True
+
+        if not has_error:
+            with progress_lock:
+                completed_codes.add(code)
+
+    except Exception as e:
+        print(f"\n   ❌ {name} 처리 중 치명적 에러: {e}")
+        error_logs.append({"code": code, "name": name, "error": str(e)})
+
+
+def planned_row(code, date, item):
+    """계획 컬럼에 맞는 daily_prices_v2 행. 0원도 기록해야 다음 계획에서 구멍으로 잡히지 않는다."""
+    normalized = kis.normalize_kis_row(item)
+    if plan_column == 'trading_value':
+        return {"code": code, "date": date, "trading_value": normalized["trading_value"]}
+    return {"code": code, "date": date, **normalized, "change": 0.0}
+
+def fill_planned_stock(work):
+    """backfill_planner 계획의 한 종목: 요청 구간을 받아 구멍 날짜만 저장한다."""
+    if stop_event.is_set():
+        return
+    code, name, requests = work
+    stock_data = []
+
+    try:
+        for request in requests:
+            try:
+                rows = kis.get_kis_daily_ohlcv(
+                    code,
+                    request['start'].replace('-', ''),
+                    request['end'].replace('-', ''),
+                )
+            except Exception as req_e:
+                print(f"\n   ⚠️ API 호출 중 에러 ({name}): {req_e}")
+                error_logs.append({
+                    "code": code,
+                    "name": name,
+                    "date_range": f"{request['start']}-{request['end']}",
+                    "error": str(req_e)
+                })
+                continue
+
+            answered = set()
+            for item in rows:
+                d = item.get("stck_bsop_date")
+                if not d:
+                    continue
+                date = f"{d[:4]}-{d[4:6]}-{d[6:]}"
+                answered.add(date)
+                if backfill_planner.in_holes(request, date):
+                    stock_data.append(planned_row(code, date, item))
+
+            # 답은 왔는데 봉이 없는 구멍(거래정지 등)은 다음 계획에서 빼도록 기록한다.
+            empty = [date for date in backfill_planner.hole_dates(active_plan, request) if date not in answered]
+            if empty:
+                with progress_lock:
+                    plan_empty_answers.setdefault(code, []).extend(empty)
+
+        if stock_data:
+            pg_bulk.upsert(supabase, "daily_prices_v2", stock_data, on_conflict="code,date", chunk_size=1000)
+            with progress_lock:
+                plan_written[0] += len(stock_data)
+
+    except Exception as e:
+        print(f"\n   ❌ {name} 처리 중 치명적 에러: {e}")
+        error_logs.append({"code": code, "name": name, "error": str(e)})
+
+def run_plan(path, shard):
+    """--plan: backfill_planner가 찾은 구멍만 요청한다. 진행 파일 대신 계획을 다시 세우면 남은 구멍만 나온다."""
+    global plan_column, active_plan
+
+    plan = backfill_planner.load_plan(path, ("close", "trading_value"))
+    plan_column = plan['column']
+    active_plan = plan
+    plan_written[0] = 0
+    plan_empty_answers.clear()
+    grouped = backfill_planner.requests_by_code(plan)
+    if shard:
+        grouped = {code: reqs for code, reqs in grouped.items() if kis.shard_of(code, shard[1]) == shard[0]}
+        print(f"   🧩 샤드 {shard[0]}/{shard[1]}")
+
+    names = {row['code']: row['name'] for row in load_companies()}
+    work = [(code, names.get(code, code), reqs) for code, reqs in sorted(grouped.items())]
+    missing = sum(r['missing'] for reqs in grouped.values() for r in reqs)
+    requests = sum(len(reqs) for reqs in grouped.values())
+    print(f"   📋 계획: {path}")
+    print(f"   컬럼 {plan_column}, {plan['start']} ~ {plan['end']}")
+    print(f"   대상 종목 {len(work)}개, 빈 칸 {missing}개, KIS 요청 {requests}건\n")
+
+    workers = WORKERS_PER_KEY * len(kis.key_pool)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for idx, ((code, name, _), _) in enumerate(zip(work, pool.map(fill_planned_stock, work))):
+            print(f"[{idx+1}/{len(work)}] {name}({code}) 처리 완료", end='\r')
+
+    save_error_log()
+    print(f"\n   💾 {plan_written[0]}/{missing}칸 채움 (KIS에 없는 날은 상장 전/데이터 없음)")
+    empty = backfill_planner.record_empty_answers(plan_column, plan_empty_answers)
+    if empty:
+        print(f"   🕳️ KIS가 봉 없이 답한 {empty}칸은 {backfill_planner.EMPTY_ANSWERS_PATH}에 기록 (다음 계획에서 제외)")
+    if stop_event.is_set():
+        print("🛑 중단되었습니다. backfill_planner.py로 계획을 다시 세우면 남은 구멍부터 이어서 합니다.")
+    else:
+        print("🎉 모든 작업이 완료되었습니다.")
+
+def parse_shard(value):
+    """'i/K' -> (i, K)"""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError("--shard는 i/K 형식입니다 (예: 0/4)")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"잘못된 샤드: {value}")
+    return index, count
+
 def main():
-    global access_token, completed_codes
-    
+    global completed_codes, PROGRESS_FILE, ERROR_EXPORT_FILE
+
+    parser = argparse.ArgumentParser(description="KIS 거래대금 과거 데이터 채우기")
+    parser.add_argument('--shard', type=parse_shard, help="i/K: update_today_v3.shard_of 기준 i번 샤드만 처리 (프로세스/서버별 분할)")
+    parser.add_argument('--plan', help="backfill_planner.py가 만든 close/trading_value 계획 파일: 구멍만 요청한다")
+    args = parser.parse_args()
+    if args.shard:
+        # 샤드마다 진행 상황/오류 파일을 따로 둔다.
+        suffix = f"_shard{args.shard[0]}of{args.shard[1]}"
+        PROGRESS_FILE = PROGRESS_FILE.replace('.json', f'{suffix}.json')
+        ERROR_EXPORT_FILE = ERROR_EXPORT_FILE.replace('.xlsx', f'{suffix}.xlsx')
+
+    workers = WORKERS_PER_KEY * len(kis.key_pool)
     print(f"🚀 거래대금 과거 데이터 채우기 (안전 모드)")
-    print(f"   📅 대상 기간: {START_DATE} ~ {END_DATE}")
-    print(f"   💾 진행 상황 파일: {PROGRESS_FILE}")
-    
+    if not args.plan:
+        print(f"   📅 대상 기간: {START_DATE} ~ {END_DATE}")
+        print(f"   💾 진행 상황 파일: {PROGRESS_FILE}")
+    print(f"   🔑 KIS 앱키 {len(kis.key_pool)}개, 동시 작업 {workers}개")
+
     # 1. 토큰 발급
-    access_token = get_kis_token()
-    if not access_token:
+    kis.key_pool.set_interval(MIN_INTERVAL_SEC)
+    kis.key_pool.warm()
+
+    if args.plan:
+        run_plan(args.plan, args.shard)
         return
 
     # 2. 종목 로드
     print("📊 종목 목록 조회 중...")
-    res = supabase.table('companies').select('code, name').execute()
-    all_stocks = res.data
-    
+    all_stocks = load_companies()
+    if args.shard:
+        all_stocks = [s for s in all_stocks if kis.shard_of(s['code'], args.shard[1]) == args.shard[0]]
+        print(f"   🧩 샤드 {args.shard[0]}/{args.shard[1]}")
+
     # 3. 진행 상황 로드
     completed_codes = load_progress()
     target_stocks = [s for s in all_stocks if s['code'] not in completed_codes]
-    
+
     print(f"   총 종목: {len(all_stocks)}개")
     print(f"   완료됨: {len(completed_codes)}개")
     print(f"   남은 대상: {len(target_stocks)}개\n")
-    
-    total_calls = 0
-    
-    for idx, stock in enumerate(target_stocks):
-        code = stock['code']
-        name = stock['name']
-        
-        print(f"[{idx+1}/{len(target_stocks)}] {name}({code}) 처리 중...", end='\r')
-        
-        try:
-            # 기간 루프 (100일 단위)
-            current_start = datetime.strptime(START_DATE, '%Y%m%d')
-            end_dt = datetime.strptime(END_DATE, '%Y%m%d')
-            
-            stock_data = []
-            has_error = False
-            
-            while current_start <= end_dt:
-                current_end = min(current_start + timedelta(days=99), end_dt)
-                
-                # API 호출 준비
-                headers = {
-                    "content-type": "application/json; charset=utf-8",
-                    "authorization": f"Bearer {access_token}",
-                    "appkey": APP_KEY,
-                    "appsecret": APP_SECRET,
-                    "tr_id": "FHKST03010100"
-                }
-                params = {
-                    "FID_COND_MRKT_DIV_CODE": "J",
-                    "FID_INPUT_ISCD": code,
-                    "FID_INPUT_DATE_1": current_start.strftime('%Y%m%d'),
-                    "FID_INPUT_DATE_2": current_end.strftime('%Y%m%d'),
-                    "FID_PERIOD_DIV_CODE": "D",
-                    "FID_ORG_ADJ_PRC": "0"
-                }
-                
-                # 호출 및 속도 제한
-                time.sleep(0.06) # 약 16req/sec (안전 마진)
-                
-                try:
-                    res = requests.get(
-                        "https://openapi.koreainvestment.com:9443/uapi/domestic-stock/v1/quotations/inquire-daily-itemchartprice",
-                        headers=headers,
-                        params=params
-                    )
-                    total_calls += 1
-                    
-                    if res.status_code != 200:
-                        raise Exception(f"HTTP {res.status_code}")
-                        
-                    data = res.json()
-                    
-                    # 토큰 만료 체크
-                    if data.get('msg1') and '초과' in data['msg1']: # 접근토큰 등 에러 메시지 확인 필요하나 단순화
-                        pass
-                        
-                    if data.get("rt_cd") == "0" and "output2" in data:
-                        for item in data["output2"]:
-                            d = item.get("stck_bsop_date")
-                            v = int(item.get("acml_tr_pbmn", "0"))
-                            if d and v > 0:
-                                stock_data.append({
-                                    "code": code,
-                                    "date": f"{d[:4]}-{d[4:6]}-{d[6:]}",
-                                    "trading_value": v
-                                })
-                    else:
-                        # 데이터 없음 등은 에러 아님, 패스
-                        pass
-                        
-                except Exception as req_e:
-                    # 토큰 만료 가능성
-                    print(f"\n   ⚠️ API 호출 중 에러 ({name}): {req_e}")
-                    # 토큰 재발급 시도
-                    new_token = get_kis_token()
-                    if new_token:
-                        access_token = new_token
-                        print("   🔄 토큰 재발급 완료, 재시도합니다.")
-                        time.sleep(1)
-                        continue # 현재 구간 다시 시도 (while 루프 제어 필요하나 여기선 다음 구간으로 넘어가지 않게 주의)
-                        # 간단한 재시도 로직: 실패한 구간은 건너뛰거나 에러 로그 남김
-                    
-                    error_logs.append({
-                        "code": code,
-                        "name": name,
-                        "date_range": f"{current_start.strftime('%Y%m%d')}-{current_end.strftime('%Y%m%d')}",
-                        "error": str(req_e)
-                    })
-                    has_error = True
-                    break
-
-                current_start = current_end + timedelta(days=1)
-                
-                # 토큰 주기적 갱신 (약 500회 호출마다)
-                if total_calls % 500 == 0:
-                    t = get_kis_token()
-                    if t: access_token = t
-
-            # DB 저장
-            if stock_data:
-                # 1000개씩 분할 저장
-                for i in range(0, len(stock_data), 1000):
-                    chunk = stock_data[i:i+1000]
-                    try:
-                        supabase.table("daily_prices_v2").upsert(
-                            chunk, 
-                            on_conflict="code,date",
-                            ignore_duplicates=False # 덮어쓰기
-                        ).execute()
-                    except Exception as db_e:
-                        print(f"\n   ❌ DB 저장 실패 {name}: {db_e}")
-                        error_logs.append({"code": code, "name": name, "error": f"DB Save: {db_e}"})
-                        has_error = True
-            
-            if not has_error:
-                completed_codes.add(code)
-                
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for idx, (stock, _) in enumerate(zip(target_stocks, pool.map(fill_stock, target_stocks))):
+            print(f"[{idx+1}/{len(target_stocks)}] {stock['name']}({stock['code']}) 처리 완료", end='\r')
             # 주기적 저장 (10개 종목마다)
             if idx > 0 and idx % 10 == 0:
                 save_progress()
-                
-        except Exception as e:
-            print(f"\n   ❌ {name} 처리 중 치명적 에러: {e}")
-            error_logs.append({"code": code, "name": name, "error": str(e)})
-            
+
     # 마무리
     save_progress()
     save_error_log()
-    print("\n🎉 모든 작업이 완료되었습니다.")
+    if stop_event.is_set():
+        print("\n🛑 중단되었습니다. 다음 실행은 남은 종목부터 이어서 합니다.")
+    else:
+        print("\n🎉 모든 작업이 완료되었습니다.")
 
 if __name__ == "__main__":
     main()
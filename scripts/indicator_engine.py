@@ -0,0 +1,225 @@
+"""Incremental chart indicators for many codes at once.
+
+Python port of src/utils/indicators.ts with the parameters the chart pages
+use on daily bars: EMA20, SMA30/50, WMA150, ATR20, Keltner(20, ATR10, 2.25)
+and MACD(3, 10, 16). Values follow the TypeScript definitions, including
+their warm-up rules:
+
+- SMA/WMA/ATR are plain window averages; the first bar's true range is 0;
+- EMAs are seeded with the simple mean of their first ``period`` closes;
+- the MACD signal is seeded with the mean of the 16 MACD values *before*
+  the bar it first appears on, then smoothed as an EMA.
+
+``IndicatorState`` holds one row per code (the trailing close/TR/MACD
+windows and every EMA's last value) as NumPy arrays, so a day is one
+vectorized ``update`` over all codes regardless of history length. A code's
+row serializes to JSON for ``indicator_states``; a full rebuild replays the
+same ``update`` over a date x code matrix.
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+SMA_PERIODS = (30, 50)
+EMA_PERIOD = 20
+WMA_PERIOD = 150
+ATR_PERIOD = 20
+KELTNER_PERIOD = 20
+KELTNER_ATR_PERIOD = 10
+KELTNER_MULTIPLIER = 2.25
+MACD_FAST = 3
+MACD_SLOW = 10
+MACD_SIGNAL = 16
+
+EMA_PERIODS = tuple(sorted({EMA_PERIOD, KELTNER_PERIOD, MACD_FAST, MACD_SLOW}))
+CLOSE_WINDOW = max(max(SMA_PERIODS), WMA_PERIOD, max(EMA_PERIODS))
+TR_WINDOW = max(ATR_PERIOD, KELTNER_ATR_PERIOD)
+# Bar count at which the signal line first exists (startIdx + 1 in the TS).
+MACD_SIGNAL_START = MACD_SLOW + MACD_SIGNAL
+
+OUTPUT_COLUMNS = (
+    "ema20",
+    "sma30",
+    "sma50",
+    "wma150",
+    "atr20",
+    "keltner_upper",
+    "keltner_middle",
+    "keltner_lower",
+    "macd",
+    "macd_signal",
+    "macd_histogram",
+)
+
+_WMA_WEIGHTS = np.arange(1, WMA_PERIOD + 1, dtype=float)  # oldest -> newest
+_WMA_DENOMINATOR = WMA_PERIOD * (WMA_PERIOD + 1) / 2
+
+
+def _push(window: np.ndarray, rows: np.ndarray, values: np.ndarray) -> None:
+    """Shift ``window[rows]`` left by one and append ``values`` (oldest -> newest)."""
+    window[rows, :-1] = window[rows, 1:]
+    window[rows, -1] = values
+
+
+def _tail_mean(window: np.ndarray, period: int, ready: np.ndarray) -> np.ndarray:
+    return np.where(ready, window[:, -period:].sum(axis=1) / period, np.nan)
+
+
+class IndicatorState:
+    def __init__(self, n: int):
+        self.count = np.zeros(n, dtype=np.int64)
+        self.prev_close = np.full(n, np.nan)
+        self.closes = np.full((n, CLOSE_WINDOW), np.nan)
+        self.trs = np.full((n, TR_WINDOW), np.nan)
+        self.ema = {period: np.full(n, np.nan) for period in EMA_PERIODS}
+        self.macd_window = np.full((n, MACD_SIGNAL), np.nan)
+        self.signal = np.full(n, np.nan)
+
+    def __len__(self) -> int:
+        return len(self.count)
+
+    def update(
+        self,
+        close: np.ndarray,
+        high: np.ndarray,
+        low: np.ndarray,
+        mask: np.ndarray,
+    ) -> Dict[str, np.ndarray]:
+        """Advance codes where ``mask`` is true by one bar.
+
+        Returns each output column for all codes; rows outside ``mask`` are NaN.
+        Missing highs/lows fall back to the close.
+        """
+        rows = np.flatnonzero(mask)
+        out = {name: np.full(len(self), np.nan) for name in OUTPUT_COLUMNS}
+        if rows.size == 0:
+            return out
+
+        c = close[rows].astype(float)
+        h = np.where(np.isnan(high[rows]), c, high[rows])
+        lo = np.where(np.isnan(low[rows]), c, low[rows])
+        first = self.count[rows] == 0
+        prev = np.where(first, c, self.prev_close[rows])
+        tr = np.maximum.reduce([h - lo, np.abs(h - prev), np.abs(lo - prev)])
+        tr = np.where(first, 0.0, tr)
+
+        _push(self.closes, rows, c)
+        _push(self.trs, rows, tr)
+        self.prev_close[rows] = c
+        self.count[rows] += 1
+        count = self.count[rows]
+        closes = self.closes[rows]
+        trs = self.trs[rows]
+
+        for period in EMA_PERIODS:
+            k = 2 / (period + 1)
+            prev_ema = self.ema[period][rows]
+            seed = _tail_mean(closes, period, count == period)
+            step = c * k + prev_ema * (1 - k)
+            self.ema[period][rows] = np.where(
+                count < period, np.nan, np.where(count == period, seed, step)
+            )
+
+        ema20 = self.ema[EMA_PERIOD][rows]
+        for period in SMA_PERIODS:
+            out[f"sma{period}"][rows] = _tail_mean(closes, period, count >= period)
+        out["ema20"][rows] = ema20
+        out["wma150"][rows] = np.where(
+            count >= WMA_PERIOD,
+            (closes[:, -WMA_PERIOD:] * _WMA_WEIGHTS).sum(axis=1) / _WMA_DENOMINATOR,
+            np.nan,
+        )
+        out["atr20"][rows] = _tail_mean(trs, ATR_PERIOD, count >= ATR_PERIOD)
+
+        middle = self.ema[KELTNER_PERIOD][rows]
+        atr_k = _tail_mean(trs, KELTNER_ATR_PERIOD, count >= KELTNER_ATR_PERIOD)
+        band = ~np.isnan(middle) & ~np.isnan(atr_k)
+        out["keltner_middle"][rows] = np.where(band, middle, np.nan)
+        out["keltner_upper"][rows] = np.where(band, middle + atr_k * KELTNER_MULTIPLIER, np.nan)
+        out["keltner_lower"][rows] = np.where(band, middle - atr_k * KELTNER_MULTIPLIER, np.nan)
+
+        macd = self.ema[MACD_FAST][rows] - self.ema[MACD_SLOW][rows]
+        k = 2 / (MACD_SIGNAL + 1)
+        # The seed averages the previous MACD_SIGNAL values, not today's.
+        seed = self.macd_window[rows].mean(axis=1)
+        step = macd * k + self.signal[rows] * (1 - k)
+        signal = np.where(
+            count < MACD_SIGNAL_START,
+            np.nan,
+            np.where(count == MACD_SIGNAL_START, seed, step),
+        )
+        self.signal[rows] = signal
+        valid_macd = ~np.isnan(macd)
+        _push(self.macd_window, rows[valid_macd], macd[valid_macd])
+
+        out["macd"][rows] = macd
+        out["macd_signal"][rows] = signal
+        out["macd_histogram"][rows] = macd - signal
+        return out
+
+    # ------------------------------------------------------------------
+    # Persistence (one JSON document per code)
+    # ------------------------------------------------------------------
+    def to_json(self, i: int) -> dict:
+        def tail(values: np.ndarray) -> List[float]:
+            return [float(v) for v in values[~np.isnan(values)]]
+
+        def scalar(value: float) -> Optional[float]:
+            return None if np.isnan(value) else float(value)
+
+        return {
+            "count": int(self.count[i]),
+            "prev_close": scalar(self.prev_close[i]),
+            "closes": tail(self.closes[i]),
+            "trs": tail(self.trs[i]),
+            "ema": {str(p): scalar(self.ema[p][i]) for p in EMA_PERIODS},
+            "macd": tail(self.macd_window[i]),
+            "signal": scalar(self.signal[i]),
+        }
+
+    @classmethod
+    def from_json(cls, documents: List[dict]) -> "IndicatorState":
+        state = cls(len(documents))
+
+        def fill(window: np.ndarray, i: int, values: List[float]) -> None:
+            values = values[-window.shape[1]:]
+            if values:
+                window[i, -len(values):] = values
+
+        for i, doc in enumerate(documents):
+            state.count[i] = int(doc.get("count") or 0)
+            if doc.get("prev_close") is not None:
+                state.prev_close[i] = float(doc["prev_close"])
+            fill(state.closes, i, doc.get("closes") or [])
+            fill(state.trs, i, doc.get("trs") or [])
+            fill(state.macd_window, i, doc.get("macd") or [])
+            for period in EMA_PERIODS:
+                value = (doc.get("ema") or {}).get(str(period))
+                if value is not None:
+                    state.ema[period][i] = float(value)
+            if doc.get("signal") is not None:
+                state.signal[i] = float(doc["signal"])
+        return state
+
+
+def compute_indicator_frame(
+    close: np.ndarray,
+    high: np.ndarray,
+    low: np.ndarray,
+    state: Optional[IndicatorState] = None,
+) -> Dict[str, np.ndarray]:
+    """Run a (dates x codes) matrix through ``update``; NaN close = no bar.
+
+    Returns each output column as a (dates x codes) matrix and leaves the
+    final per-code state in ``state`` when one is passed.
+    """
+    n_days, n_codes = close.shape
+    if state is None:
+        state = IndicatorState(n_codes)
+    out = {name: np.full((n_days, n_codes), np.nan) for name in OUTPUT_COLUMNS}
+    for d in range(n_days):
+        step = state.update(close[d], high[d], low[d], ~np.isnan(close[d]))
+        for name in OUTPUT_COLUMNS:
+            out[name][d] = step[name]
+    return out
@@ -0,0 +1,329 @@
+"""Sharded KIS ingest: update_today_v3's stock loop split over processes or hosts.
+
+The universe is cut into K shards by update_today_v3.shard_of (SHA-1 of the
+code, so every process and host agrees). The ingest_shards table
+(20261019008000_create_ingest_shards.sql) is both the work queue and the
+checkpoint store, so workers only need the database in common:
+
+- ``plan`` adds the run's K shards as pending (existing rows are kept);
+- ``work`` claims pending shards one at a time (the pending -> running
+  update only succeeds for one claimant) and runs the ingest on it, saving
+  the finished and failed codes with a heartbeat every CHECKPOINT_EVERY
+  codes. A shard ends done, or failed if any code or the run itself failed.
+  Start it on as many processes and hosts as wanted;
+- ``requeue`` puts failed shards, and running shards whose heartbeat is
+  older than STALE_MINUTES, back to pending. A re-run skips the codes the
+  shard already finished;
+- ``status`` merges the shards: counts per status, totals, failed codes;
+- ``run`` is the single-machine mode: plan, start ``--processes`` local
+  workers, re-queue what failed and repeat up to ``--max-attempts`` rounds.
+
+Every process builds its own key pool, so N processes on the same app keys
+would each pace a key at KIS's per-key rate and together exceed it N times
+(EGW00201). ``work --key-share N`` spaces each key's calls N times further
+apart; ``run`` passes its worker count, and warms the token cache once
+before starting them so they do not race to issue tokens. Processes add
+database and parsing throughput, not KIS throughput, so ``--processes``
+defaults to the number of app keys (at most MAX_DEFAULT_PROCESSES).
+
+Shard 0 also writes the KOSPI/KOSDAQ bars and the companies table. Start
+the steps after the ingest (RS, leaders, ...) once every shard is done;
+``run`` and ``status`` exit non-zero otherwise.
+
+Usage:
+    python3 scripts/ingest_shards.py run --shards 8 --processes 4
+    python3 scripts/ingest_shards.py plan --shards 8      # coordinator
+    python3 scripts/ingest_shards.py work --shards 8      # on each host
+    python3 scripts/ingest_shards.py work --shards 8 --key-share 2   # two hosts, same keys
+    python3 scripts/ingest_shards.py requeue --shards 8
+    python3 scripts/ingest_shards.py status --shards 8
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from supabase import Client
+
+import update_today_v3 as kis
+from pipeline_metrics import report_on_exit
+from supabase_batch import execute_with_retry
+
+TABLE = "ingest_shards"
+CHECKPOINT_EVERY = 50
+CHECKPOINT_SEC = 30
+STALE_MINUTES = 15
+DEFAULT_MAX_ATTEMPTS = 3
+MAX_DEFAULT_PROCESSES = 4
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def _run_rows(supabase: Client, run_date: str, shard_count: int) -> List[dict]:
+    return execute_with_retry(
+        lambda: supabase.table(TABLE)
+        .select("*")
+        .eq("run_date", run_date)
+        .eq("shard_count", shard_count)
+        .order("shard")
+        .execute(),
+        f"select:{TABLE}",
+    ).data or []
+
+
+def _update_shard(supabase: Client, run_date: str, shard_count: int, shard: int, fields: dict, status: Optional[str] = None) -> List[dict]:
+    """Update one shard row; with ``status`` only while it still has that status."""
+
+    def query():
+        q = (
+            supabase.table(TABLE)
+            .update({**fields, "updated_at": _now()})
+            .eq("run_date", run_date)
+            .eq("shard_count", shard_count)
+            .eq("shard", shard)
+        )
+        if status is not None:
+            q = q.eq("status", status)
+        return q.execute()
+
+    return execute_with_retry(query, f"update:{TABLE}").data or []
+
+
+class ShardCheckpoint:
+    """A claimed shard, as update_today_v3.main(shard=...) sees it."""
+
+    def __init__(self, supabase: Client, run_date: str, row: dict):
+        self.supabase = supabase
+        self.run_date = run_date
+        self.index = int(row["shard"])
+        self.count = int(row["shard_count"])
+        self.done_codes = set(row.get("done_codes") or [])
+        self.stats: dict = row.get("stats") or {}
+        # Codes that failed last time are tried again.
+        self.failed_codes: set = set()
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+
+    def record(self, code: str, ok: bool) -> None:
+        if ok:
+            self.done_codes.add(code)
+            self.failed_codes.discard(code)
+        else:
+            self.failed_codes.add(code)
+        self._unsaved += 1
+        if self._unsaved >= CHECKPOINT_EVERY or time.monotonic() - self._saved_at >= CHECKPOINT_SEC:
+            self.save()
+
+    def merge_stats(self, stats: Optional[dict]) -> dict:
+        """This attempt's counters added to the earlier attempts' ones."""
+        merged = dict(self.stats)
+        for key, value in (stats or {}).items():
+            merged[key] = merged.get(key, 0) + value
+        # Counted per code, not per attempt.
+        merged["stocks"] = len(self.done_codes) + len(self.failed_codes)
+        merged["failed"] = len(self.failed_codes)
+        return merged
+
+    def save(self, **fields) -> None:
+        _update_shard(
+            self.supabase,
+            self.run_date,
+            self.count,
+            self.index,
+            {
+                "done_codes": sorted(self.done_codes),
+                "failed_codes": sorted(self.failed_codes),
+                "heartbeat_at": _now(),
+                **fields,
+            },
+        )
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+
+
+def plan(supabase: Client, run_date: str, shard_count: int) -> int:
+    """Add the run's missing shards as pending; returns how many were added."""
+    existing = {row["shard"] for row in _run_rows(supabase, run_date, shard_count)}
+    rows = [
+        {"run_date": run_date, "shard_count": shard_count, "shard": shard, "status": "pending", "attempts": 0}
+        for shard in range(shard_count)
+        if shard not in existing
+    ]
+    if rows:
+        execute_with_retry(
+            lambda: supabase.table(TABLE).upsert(rows, on_conflict="run_date,shard_count,shard").execute(),
+            f"upsert:{TABLE}",
+        )
+    print(f"[INFO] {run_date}: {shard_count} shards, {len(rows)} added")
+    return len(rows)
+
+
+def claim(supabase: Client, run_date: str, shard_count: int, worker: str) -> Optional[dict]:
+    """Take the first pending shard nobody else took in between."""
+    for row in _run_rows(supabase, run_date, shard_count):
+        if row["status"] != "pending":
+            continue
+        claimed = _update_shard(
+            supabase,
+            run_date,
+            shard_count,
+            row["shard"],
+            {"status": "running", "worker": worker, "attempts": row["attempts"] + 1, "heartbeat_at": _now(), "error": None},
+            status="pending",
+        )
+        if claimed:
+            return claimed[0]
+    return None
+
+
+def work(supabase: Client, run_date: str, shard_count: int, key_share: int = 1) -> int:
+    """Ingest pending shards until none is left; returns how many failed.
+
+    ``key_share`` is how many processes use the same app keys at once; each
+    key's calls are spaced that many times the single-process interval.
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    kis.key_pool.set_interval(kis.API_MIN_INTERVAL_SEC * max(1, key_share))
+    failed = 0
+    while True:
+        row = claim(supabase, run_date, shard_count, worker)
+        if row is None:
+            return failed
+        checkpoint = ShardCheckpoint(supabase, run_date, row)
+        print(f"\n[INFO] {worker} took shard {checkpoint.index}/{shard_count} (attempt {row['attempts']}, {len(checkpoint.done_codes)} codes already done)")
+        try:
+            stats = kis.main(shard=checkpoint)
+        except Exception as exc:
+            failed += 1
+            checkpoint.save(status="failed", error=f"{type(exc).__name__}: {exc}")
+            print(f"[ERROR] shard {checkpoint.index}: {exc}")
+            continue
+
+        if stats is None:
+            status, error = "failed", "stock master unavailable"
+        elif checkpoint.failed_codes:
+            status, error = "failed", f"{len(checkpoint.failed_codes)} codes failed"
+        else:
+            status, error = "done", None
+        failed += status == "failed"
+        checkpoint.save(status=status, stats=checkpoint.merge_stats(stats), error=error)
+        print(f"[INFO] shard {checkpoint.index}: {status}" + (f" ({error})" if error else ""))
+
+
+def requeue(supabase: Client, run_date: str, shard_count: int, stale_minutes: float = STALE_MINUTES) -> int:
+    """Failed shards and stalled running shards back to pending."""
+    stale_before = datetime.now(timezone.utc) - timedelta(minutes=stale_minutes)
+    requeued = 0
+    for row in _run_rows(supabase, run_date, shard_count):
+        heartbeat = row.get("heartbeat_at")
+        stalled = row["status"] == "running" and (
+            heartbeat is None or datetime.fromisoformat(str(heartbeat)) <= stale_before
+        )
+        if row["status"] == "failed" or stalled:
+            if _update_shard(supabase, run_date, shard_count, row["shard"], {"status": "pending"}, status=row["status"]):
+                requeued += 1
+                print(f"[INFO] shard {row['shard']} requeued (was {row['status']}: {row.get('error') or 'no heartbeat'})")
+    return requeued
+
+
+def status(supabase: Client, run_date: str, shard_count: int) -> Dict[str, object]:
+    """Merged view of the run's shards."""
+    rows = _run_rows(supabase, run_date, shard_count)
+    by_status: Dict[str, int] = {}
+    totals: Dict[str, int] = {}
+    failed_codes: List[str] = []
+    done_codes = 0
+    for row in rows:
+        by_status[row["status"]] = by_status.get(row["status"], 0) + 1
+        done_codes += len(row.get("done_codes") or [])
+        failed_codes.extend(row.get("failed_codes") or [])
+        for key, value in (row.get("stats") or {}).items():
+            totals[key] = totals.get(key, 0) + int(value)
+
+    print(f"[STATUS] {run_date}, {len(rows)}/{shard_count} shards: " + ", ".join(f"{k} {v}" for k, v in sorted(by_status.items())))
+    for row in rows:
+        if row["status"] != "done":
+            print(
+                f"   shard {row['shard']:>3} {row['status']:<8} attempts {row['attempts']} "
+                f"done {len(row.get('done_codes') or [])} failed {len(row.get('failed_codes') or [])} "
+                f"{row.get('worker') or ''} {row.get('error') or ''}"
+            )
+    print(f"   codes done {done_codes}, failed {len(failed_codes)}, totals {totals}")
+    return {
+        "complete": len(rows) == shard_count and by_status.get("done", 0) == shard_count,
+        "by_status": by_status,
+        "totals": totals,
+        "done_codes": done_codes,
+        "failed_codes": sorted(failed_codes),
+    }
+
+
+def run(supabase: Client, run_date: str, shard_count: int, processes: int, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> bool:
+    """Plan, work the shards with local processes, re-queue failures; True when all are done."""
+    plan(supabase, run_date, shard_count)
+    processes = max(1, min(processes, shard_count))
+    command = [
+        sys.executable, os.path.abspath(__file__), "work", "--shards", str(shard_count), "--date", run_date,
+        "--key-share", str(processes),
+    ]
+    # Tokens land in the shared cache file here, so the workers only read it.
+    kis.key_pool.warm()
+    for attempt in range(1, max_attempts + 1):
+        print(f"\n[INFO] Round {attempt}/{max_attempts}: {processes} worker processes")
+        workers = [subprocess.Popen(command) for _ in range(processes)]
+        for proc in workers:
+            proc.wait()
+
+        summary = status(supabase, run_date, shard_count)
+        if summary["complete"]:
+            return True
+        # Every local worker has exited, so a shard still running was abandoned.
+        if not requeue(supabase, run_date, shard_count, stale_minutes=0):
+            break
+    return False
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sharded KIS daily ingest.")
+    parser.add_argument("command", choices=("run", "plan", "work", "requeue", "status"))
+    parser.add_argument("--shards", type=int, required=True, help="Number of shards (K).")
+    parser.add_argument("--date", default=datetime.now().strftime("%Y-%m-%d"), help="Run date (ingest day).")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=min(len(kis.key_pool), MAX_DEFAULT_PROCESSES),
+        help=f"Local workers for run (default: one per app key, at most {MAX_DEFAULT_PROCESSES}).",
+    )
+    parser.add_argument(
+        "--key-share",
+        type=int,
+        default=1,
+        help="work: processes (on every host) using the same app keys; each key is paced this many times slower.",
+    )
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS, help="Rounds for run.")
+    parser.add_argument("--stale-minutes", type=float, default=STALE_MINUTES, help="Heartbeat age for requeue.")
+    args = parser.parse_args()
+
+    report_on_exit(f"ingest_shards_{args.command}")
+    supabase = kis.supabase
+    if args.command == "plan":
+        plan(supabase, args.date, args.shards)
+    elif args.command == "work":
+        sys.exit(1 if work(supabase, args.date, args.shards, args.key_share) else 0)
+    elif args.command == "requeue":
+        requeue(supabase, args.date, args.shards, args.stale_minutes)
+    elif args.command == "status":
+        sys.exit(0 if status(supabase, args.date, args.shards)["complete"] else 1)
+    else:
+        sys.exit(0 if run(supabase, args.date, args.shards, args.processes, args.max_attempts) else 1)
+
+
+if __name__ == "__main__":
+    main()
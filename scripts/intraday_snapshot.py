@@ -0,0 +1,291 @@
+"""Provisional RS ranks and leader scores during the trading session.
+
+rs_rankings_v2 and leader_stocks_daily only exist once the post-close chain
+has run. This script polls KIS current prices (inquire-price) for the RS
+universe every few minutes and writes what the two steps would produce if
+the session closed at those prices:
+
+- RS: the weighted score of calculate_rs_v2 only needs today's price and the
+  closes 63/126/189/252 bars back. Those parts are computed once per day
+  from daily_prices_v2 (``RSBase``, cached in scripts/output/intraday/), so
+  a refresh is one vectorised formula over the quotes, ranked with the same
+  ``calc_rank_single_day``.
+- Leaders: the quotes' price and accumulated trading value, the previous
+  close and the provisional RS rank go through
+  calculate_leader_stocks_daily.score_leaders unchanged.
+
+Results replace the day's rows in rs_rankings_provisional and
+leader_stocks_provisional. Quotes are fetched concurrently through
+update_today_v3's KIS client, so they share its app-key pool and rate limits;
+rate-limit answers (EGW00201) are retried.
+
+Usage:
+    python3 scripts/intraday_snapshot.py                  # every 5 minutes until 15:30
+    python3 scripts/intraday_snapshot.py --interval 180 --until 15:20
+    python3 scripts/intraday_snapshot.py --once
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from supabase import Client
+
+import update_today_v3 as kis
+from calculate_leader_stocks_daily import leader_records, score_leaders
+from calculate_rs_v2 import P3, P6, P9, P12, calc_rank_single_day
+from pipeline_context import load_price_window
+from pipeline_metrics import metrics, report_on_exit
+from rs_universe import load_rs_eligible_codes
+from supabase_batch import execute_with_retry, upsert_rows
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(SCRIPT_DIR, "output", "intraday")
+# Same window calculate_rs_v2 loads, so the shifts see the same bars.
+HISTORY_DAYS = 400
+QUOTE_WORKERS = 8
+QUOTE_RETRIES = 4
+DEFAULT_INTERVAL_SEC = 300
+DEFAULT_UNTIL = "15:30"
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if np.isfinite(number) else None
+
+
+class RSBase:
+    """Per-code parts of the weighted RS score that only depend on stored bars.
+
+    With today's bar appended at position n, calculate_rs_v2 compares it with
+    the bars at n-63, n-126, n-189 and n-252, so
+
+        score = 0.4 * (price - s_3m) / s_3m + fixed
+
+    where ``fixed`` holds the three older period returns. ``prev_close`` is
+    the close on the last stored trading date (NaN if the code did not
+    trade then), the base of the leader 1-day return.
+    """
+
+    def __init__(self, session_date: str, codes: List[str], s_3m: np.ndarray, fixed: np.ndarray, prev_close: np.ndarray):
+        self.session_date = session_date
+        self.codes = list(codes)
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        self.s_3m = s_3m
+        self.fixed = fixed
+        self.prev_close = prev_close
+
+    @classmethod
+    def build(cls, prices: pd.DataFrame, session_date: str) -> "RSBase":
+        df = prices[prices["date"] < pd.Timestamp(session_date)][["code", "date", "close"]].copy()
+        df["close"] = df["close"].astype(float)
+        df = df.sort_values(["code", "date"])
+        codes = sorted(df["code"].unique())
+        # 1 for each code's last stored bar, k for the bar k-1 before it.
+        back = df.groupby("code").cumcount(ascending=False) + 1
+
+        def close_back(k: int) -> np.ndarray:
+            rows = df[back == k].set_index("code")["close"]
+            return rows.reindex(codes).replace(0, np.nan).to_numpy(float)
+
+        s_3m, s_6m, s_9m, s_12m = (close_back(k) for k in (P3, P6, P9, P12))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fixed = 0.2 * ((s_3m - s_6m) / s_6m) + 0.2 * ((s_6m - s_9m) / s_9m) + 0.2 * ((s_9m - s_12m) / s_12m)
+
+        last = df[back == 1].set_index("code").reindex(codes)
+        prev_close = np.array(last["close"], dtype=float)
+        prev_close[(last["date"] != df["date"].max()).to_numpy()] = np.nan
+        return cls(session_date, codes, s_3m, fixed, prev_close)
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            session_date=np.array(self.session_date),
+            codes=np.array(self.codes),
+            s_3m=self.s_3m,
+            fixed=self.fixed,
+            prev_close=self.prev_close,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, session_date: str) -> Optional["RSBase"]:
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as cached:
+            if str(cached["session_date"]) != session_date:
+                return None
+            return cls(
+                session_date,
+                cached["codes"].tolist(),
+                cached["s_3m"],
+                cached["fixed"],
+                cached["prev_close"],
+            )
+
+    def lookup(self, codes: List[str], values: np.ndarray) -> np.ndarray:
+        positions = np.array([self.index.get(code, -1) for code in codes], dtype=int)
+        out = np.full(len(codes), np.nan)
+        known = positions >= 0
+        out[known] = values[positions[known]]
+        return out
+
+    def scores(self, codes: List[str], prices: np.ndarray) -> np.ndarray:
+        s_3m = self.lookup(codes, self.s_3m)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return 0.4 * ((prices - s_3m) / s_3m) + self.lookup(codes, self.fixed)
+
+
+def load_base(supabase: Client, session_date: str, cache_dir: str = CACHE_DIR, codes=None) -> RSBase:
+    """The session's RSBase, from the day's cache file or daily_prices_v2."""
+    path = os.path.join(cache_dir, "rs_base.npz")
+    base = RSBase.load(path, session_date)
+    if base is not None:
+        print(f"[INFO] RS base from cache ({len(base.codes)} codes)")
+        return base
+
+    start = (datetime.strptime(session_date, "%Y-%m-%d") - timedelta(days=HISTORY_DAYS)).strftime("%Y-%m-%d")
+    end = (datetime.strptime(session_date, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+    prices = pd.DataFrame(load_price_window(supabase, start, end), columns=["code", "date", "close"])
+    prices["date"] = pd.to_datetime(prices["date"])
+    if codes is not None:
+        prices = prices[prices["code"].astype(str).isin(codes)]
+    base = RSBase.build(prices, session_date)
+    base.save(path)
+    print(f"[INFO] RS base built ({len(base.codes)} codes)")
+    return base
+
+
+def fetch_quote(code: str) -> Optional[dict]:
+    """Price and accumulated trading value, or None (no trade, bad answer)."""
+    for attempt in range(QUOTE_RETRIES + 1):
+        data = kis.request_current_quote(code)
+        if data.get("rt_cd") == "0":
+            output = data.get("output") or {}
+            price = _to_float(output.get("stck_prpr"))
+            if not price:
+                return None
+            return {"price": price, "trading_value": _to_float(output.get("acml_tr_pbmn"))}
+        if data.get("msg_cd") in kis.RATE_LIMIT_CODES and attempt < QUOTE_RETRIES:
+            metrics.retry("kis_quote")
+            time.sleep(0.2 * (attempt + 1))
+            continue
+        return None
+    return None
+
+
+def fetch_quotes(codes: List[str], workers: int = QUOTE_WORKERS) -> Dict[str, dict]:
+    kis.key_pool.warm()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(fetch_quote, codes)
+    return {code: quote for code, quote in zip(codes, results) if quote is not None}
+
+
+def provisional_frames(base: RSBase, quotes: Dict[str, dict], session_date: str):
+    """(rs frame, leader frame) for the quoted codes."""
+    codes = sorted(quotes)
+    price = np.array([quotes[code]["price"] for code in codes], dtype=float)
+    rs = pd.DataFrame({"code": codes, "price": price, "score_weighted": base.scores(codes, price)})
+    rs["rank_weighted"] = calc_rank_single_day(rs["score_weighted"])
+
+    frame = pd.DataFrame(
+        {
+            "date": pd.Timestamp(session_date),
+            "code": codes,
+            "close": price,
+            "prev_close": base.lookup(codes, base.prev_close),
+            "trading_value": [quotes[code]["trading_value"] for code in codes],
+            "rank_rs": rs["rank_weighted"].to_numpy(),
+        }
+    )
+    return rs, score_leaders(frame)
+
+
+def replace_snapshot(supabase: Client, table: str, rows: List[dict], session_date: str, as_of: str) -> None:
+    """Upsert the refresh and drop the date's rows an earlier refresh left."""
+    upsert_rows(supabase, table, rows, "date,code")
+    execute_with_retry(
+        lambda: supabase.table(table).delete().eq("date", session_date).lt("as_of", as_of).execute(),
+        f"prune:{table}",
+    )
+
+
+def refresh(supabase: Client, base: RSBase, universe: List[str], session_date: str, workers: int = QUOTE_WORKERS) -> dict:
+    started = time.monotonic()
+    as_of = datetime.now().astimezone().isoformat(timespec="seconds")
+    quotes = fetch_quotes(universe, workers)
+    quoted_sec = time.monotonic() - started
+    if not quotes:
+        print("[WARN] No quotes, snapshot skipped.")
+        return {"quotes": 0, "rs": 0, "leaders": 0}
+
+    rs, leaders = provisional_frames(base, quotes, session_date)
+    rs_rows = [
+        {
+            "date": session_date,
+            "code": code,
+            "as_of": as_of,
+            "price": float(price),
+            "score_weighted": None if pd.isna(score) else float(score),
+            "rank_weighted": int(rank),
+        }
+        for code, price, score, rank in zip(rs["code"], rs["price"], rs["score_weighted"], rs["rank_weighted"])
+    ]
+    leader_rows = [{**row, "as_of": as_of} for row in leader_records(leaders)] if not leaders.empty else []
+
+    replace_snapshot(supabase, "rs_rankings_provisional", rs_rows, session_date, as_of)
+    replace_snapshot(supabase, "leader_stocks_provisional", leader_rows, session_date, as_of)
+    print(
+        f"[INFO] {as_of} quotes {len(quotes)}/{len(universe)} ({quoted_sec:.1f}s), "
+        f"RS {len(rs_rows)}, leaders {len(leader_rows)} ({time.monotonic() - started:.1f}s)"
+    )
+    return {"quotes": len(quotes), "rs": len(rs_rows), "leaders": len(leader_rows)}
+
+
+def run(
+    supabase: Client,
+    session_date: str,
+    once: bool = False,
+    interval_sec: float = DEFAULT_INTERVAL_SEC,
+    until: str = DEFAULT_UNTIL,
+    workers: int = QUOTE_WORKERS,
+    cache_dir: str = CACHE_DIR,
+) -> dict:
+    universe = sorted(load_rs_eligible_codes(supabase))
+    base = load_base(supabase, session_date, cache_dir, set(universe))
+    print(f"[INFO] Intraday snapshot for {session_date}: {len(universe)} codes")
+
+    stop_at = datetime.strptime(f"{session_date} {until}", "%Y-%m-%d %H:%M")
+    while True:
+        began = time.monotonic()
+        result = refresh(supabase, base, universe, session_date, workers)
+        if once or datetime.now() + timedelta(seconds=interval_sec) > stop_at:
+            return result
+        time.sleep(max(0.0, interval_sec - (time.monotonic() - began)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Provisional intraday RS ranks and leader scores.")
+    parser.add_argument("--date", default=datetime.now().strftime("%Y-%m-%d"), help="Session date.")
+    parser.add_argument("--once", action="store_true", help="Take one snapshot and exit.")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL_SEC, help="Seconds between refreshes.")
+    parser.add_argument("--until", default=DEFAULT_UNTIL, help="Last refresh start (HH:MM).")
+    parser.add_argument("--workers", type=int, default=QUOTE_WORKERS, help="Concurrent quote requests.")
+    args = parser.parse_args()
+
+    report_on_exit("intraday_snapshot")
+    run(kis.supabase, args.date, args.once, args.interval, args.until, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Keyset pagination for large PostgREST scans.
+
+``.range(offset, offset + 999)`` makes Postgres walk and discard ``offset``
+rows on every page, so a full scan of daily_prices_v2 is quadratic and the
+late pages hit the statement timeout (hence the 31-day windows the RS loader
+used to need). ``fetch_all`` instead orders by a unique key and asks for the
+rows after the last one it saw:
+
+    date >= d AND (date > d OR code > c)  ORDER BY date, code  LIMIT n
+
+The ``>=`` bound on the leading key keeps the scan an index range scan, so
+every page costs the same no matter how deep into the table it is.
+
+- ``workers > 1`` splits the leading key's ``start``/``end`` range (dates)
+  into disjoint slices and pages them in parallel threads.
+- The page size adapts per slice: it doubles while pages come back well
+  under ``target_sec`` and halves when they are slow or time out.
+- A short page is confirmed with one more request, so a server-side
+  ``max-rows`` cap below the requested page size cannot truncate a scan.
+
+    rows = fetch_all(
+        supabase, "daily_prices_v2", "code, date, close",
+        start="2025-01-01", end="2025-12-31", workers=4,
+    )
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from pipeline_metrics import metrics
+
+DEFAULT_PAGE_SIZE = 1000
+MIN_PAGE_SIZE = 250
+MAX_PAGE_SIZE = 10000
+TARGET_PAGE_SEC = 1.0
+RETRIES = 5
+TIMEOUT_MARKERS = ("57014", "statement timeout", "canceling statement")
+
+
+def _literal(value) -> str:
+    """Quote a value for use inside a PostgREST ``or=(...)`` expression."""
+    text = str(value)
+    if any(ch in text for ch in ',.:()" '):
+        return '"' + text.replace('"', '\\"') + '"'
+    return text
+
+
+def split_date_range(start: str, end: str, parts: int) -> List[Tuple[str, str]]:
+    """Split [start, end] (inclusive, YYYY-MM-DD) into up to ``parts`` disjoint slices."""
+    start_dt = datetime.strptime(start, "%Y-%m-%d")
+    end_dt = datetime.strptime(end, "%Y-%m-%d")
+    days = (end_dt - start_dt).days + 1
+    parts = max(1, min(parts, days))
+    slices = []
+    for i in range(parts):
+        lo = start_dt + timedelta(days=days * i // parts)
+        hi = start_dt + timedelta(days=days * (i + 1) // parts - 1)
+        slices.append((lo.strftime("%Y-%m-%d"), hi.strftime("%Y-%m-%d")))
+    return slices
+
+
+class PageSizer:
+    """Page size steered by the latency of the previous page."""
+
+    def __init__(
+        self,
+        size: int = DEFAULT_PAGE_SIZE,
+        min_size: int = MIN_PAGE_SIZE,
+        max_size: int = MAX_PAGE_SIZE,
+        target_sec: float = TARGET_PAGE_SEC,
+    ):
+        self.size = size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_sec = target_sec
+        # Largest page the server actually returns (PostgREST max-rows).
+        self.cap: Optional[int] = None
+
+    def observe(self, elapsed: float, returned: int) -> None:
+        if returned < self.size // 2 or returned == 0:
+            return
+        if elapsed < self.target_sec / 2:
+            self.size = min(self.size * 2, self.max_size, self.cap or self.max_size)
+        elif elapsed > self.target_sec:
+            self.size = max(self.size // 2, self.min_size)
+
+    def shrink(self) -> None:
+        self.size = max(self.size // 2, self.min_size)
+
+
+class KeysetPager:
+    """Pages one table (optionally one leading-key slice) in key order."""
+
+    def __init__(
+        self,
+        supabase,
+        table: str,
+        columns: str,
+        keys: Sequence[str] = ("date", "code"),
+        filters: Optional[Callable] = None,
+        start=None,
+        end=None,
+        sizer: Optional[PageSizer] = None,
+        label: Optional[str] = None,
+    ):
+        if not 1 <= len(keys) <= 2:
+            raise ValueError("keyset pagination supports one or two key columns")
+        self.supabase = supabase
+        self.table = table
+        self.keys = tuple(keys)
+        selected = [c.strip() for c in columns.split(",") if c.strip()]
+        if "*" not in selected:
+            selected += [key for key in self.keys if key not in selected]
+        self.columns = ", ".join(selected)
+        self.filters = filters
+        self.start = start
+        self.end = end
+        self.sizer = sizer or PageSizer()
+        self.label = label or f"keyset:{table}"
+
+    def _query(self, after: Optional[tuple], size: int):
+        first = self.keys[0]
+        q = self.supabase.table(self.table).select(self.columns)
+        if self.filters is not None:
+            q = self.filters(q)
+        if self.start is not None:
+            q = q.gte(first, self.start)
+        if self.end is not None:
+            q = q.lte(first, self.end)
+        if after is not None:
+            if len(self.keys) == 1:
+                q = q.gt(first, after[0])
+            else:
+                q = q.gte(first, after[0]).or_(
+                    f"{first}.gt.{_literal(after[0])},{self.keys[1]}.gt.{_literal(after[1])}"
+                )
+        for key in self.keys:
+            q = q.order(key)
+        return q.limit(size)
+
+    def _page(self, after: Optional[tuple]) -> List[dict]:
+        attempt = 0
+        while True:
+            size = self.sizer.size
+            began = time.perf_counter()
+            try:
+                rows = self._query(after, size).execute().data or []
+            except Exception as exc:
+                attempt += 1
+                if attempt > RETRIES:
+                    raise
+                if any(marker in str(exc) for marker in TIMEOUT_MARKERS):
+                    self.sizer.shrink()
+                wait = 2 ** (attempt - 1)
+                metrics.retry(self.label.split(":")[0])
+                print(f"[WARN] {self.label} page failed ({exc}), retrying in {wait:.1f}s...")
+                time.sleep(wait)
+                continue
+            self.sizer.observe(time.perf_counter() - began, len(rows))
+            self._last_requested = size
+            return rows
+
+    def __iter__(self):
+        after = None
+        while True:
+            rows = self._page(after)
+            if not rows:
+                return
+            yield rows
+            last = rows[-1]
+            after = tuple(last[key] for key in self.keys)
+            if len(rows) < self._last_requested:
+                # Either the end, or the server capped the page: one more
+                # request tells them apart and the cap is remembered.
+                more = self._page(after)
+                if not more:
+                    return
+                self.sizer.cap = len(rows)
+                self.sizer.size = min(self.sizer.size, len(rows))
+                yield more
+                after = tuple(more[-1][key] for key in self.keys)
+
+    def fetch(self) -> List[dict]:
+        rows: List[dict] = []
+        for page in self:
+            rows.extend(page)
+        return rows
+
+
+def fetch_all(
+    supabase,
+    table: str,
+    columns: str,
+    keys: Sequence[str] = ("date", "code"),
+    filters: Optional[Callable] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    workers: int = 1,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    label: Optional[str] = None,
+    progress: bool = False,
+) -> List[dict]:
+    """Every matching row in key order.
+
+    ``filters`` is applied to each page's query builder (``.eq``/``.in_``/...).
+    ``start``/``end`` bound the leading key inclusively; with ``workers > 1``
+    they must be YYYY-MM-DD dates, and the range is fetched in parallel slices.
+    """
+    if workers > 1 and start is not None and end is not None:
+        slices = split_date_range(start, end, workers)
+    else:
+        slices = [(start, end)]
+
+    loaded = [0]
+    lock = threading.Lock()
+
+    def run_slice(bounds) -> List[dict]:
+        pager = KeysetPager(
+            supabase, table, columns, keys, filters, bounds[0], bounds[1],
+            PageSizer(size=page_size), label,
+        )
+        rows: List[dict] = []
+        for page in pager:
+            rows.extend(page)
+            if progress:
+                with lock:
+                    loaded[0] += len(page)
+                    print(f"   {loaded[0]}건 로드 중...", end="\r")
+        return rows
+
+    if len(slices) == 1:
+        results = [run_slice(slices[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=len(slices)) as pool:
+            results = list(pool.map(run_slice, slices))
+    if progress and loaded[0]:
+        print()
+    return [row for part in results for row in part]
@@ -1,196 +1,311 @@
+import io
+import json
 import os
 import zipfile
+from datetime import datetime
+
+import numpy as np
 import pandas as pd
 import requests
-import io
 
-def download_and_parse_kospi_master(base_dir):
-    url = "https://new.real.download.dws.co.kr/common/master/kospi_code.mst.zip"
-    mst_file_name = "kospi_code.mst"
-    
-    # Download
-    print(f"   Downloading {mst_file_name}...")
+# Raw .mst files are cached here per market with the ETag/Content-Length of
+# the zip they came from: a second call on the same day does no network I/O,
+# and a later day only downloads again when the server's zip changed.
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output", "kis_master")
+DOWNLOAD_TIMEOUT_SEC = 30
+
+KOSPI_MASTER = {
+    "market": "KOSPI",
+    "url": "https://new.real.download.dws.co.kr/common/master/kospi_code.mst.zip",
+    "mst_file_name": "kospi_code.mst",
+    # Fixed-width part at the end of every row (the name before it varies).
+    # Logic adapted from kis_kospi_code_mst.py:
+    #   ShortCode = row[0:9], StandardCode = row[9:21], Name = row[21:-228]
+    "field_specs": [2, 1, 4, 4, 4,
+                    1, 1, 1, 1, 1,
+                    1, 1, 1, 1, 1,
+                    1, 1, 1, 1, 1,
+                    1, 1, 1, 1, 1,
+                    1, 1, 1, 1, 1,
+                    1, 9, 5, 5, 1,
+                    1, 1, 2, 1, 1,
+                    1, 2, 2, 2, 3,
+                    1, 3, 12, 12, 8,
+                    15, 21, 2, 7, 1,
+                    1, 1, 1, 1, 9,
+                    9, 9, 5, 9, 8,
+                    9, 3, 1, 1, 1],
+    "columns": ['GroupCode', 'MarcapScale', 'SectorLarge', 'SectorMedium', 'SectorSmall',
+                'Manufacturing', 'LowLiquidity', 'Governance', 'KOSPI200Sector', 'KOSPI100',
+                'KOSPI50', 'KRX', 'ETP', 'ELW', 'KRX100',
+                'KRXAuto', 'KRXSemi', 'KRXBio', 'KRXBank', 'SPAC',
+                'KRXEnergy', 'KRXSteel', 'ShortTermOverheat', 'KRXMedia', 'KRXConst',
+                'Non1', 'KRXSec', 'KRXShip', 'KRXSectorIns', 'KRXSectorTrans',
+                'SRI', 'BasePrice', 'Unit', 'UnitOvertime', 'Stop',
+                'Cleanup', 'Managed', 'Warning', 'WarningNotice', 'Unfaithful',
+                'Backdoor', 'Lock', 'Split', 'CapitalIncrease', 'MarginRatio',
+                'Credit', 'CreditTerm', 'PrevVol', 'FaceValue', 'ListingDate',
+                'Shares', 'Capital', 'SettleMonth', 'PublicPrice', 'Preferred',
+                'ShortOverheat', 'Surge', 'KRX300', 'KOSPI', 'Sales',
+                'OpProfit', 'NetProfit', 'NetIncome', 'ROE', 'BaseYM',
+                'Marcap', 'GroupCode2', 'CreditLimitExceeded', 'CollateralLoan', 'StockLoan'],
+}
+
+KOSDAQ_MASTER = {
+    "market": "KOSDAQ",
+    "url": "https://new.real.download.dws.co.kr/common/master/kosdaq_code.mst.zip",
+    "mst_file_name": "kosdaq_code.mst",
+    "field_specs": [2, 1,
+                    4, 4, 4, 1, 1,
+                    1, 1, 1, 1, 1,
+                    1, 1, 1, 1, 1,
+                    1, 1, 1, 1, 1,
+                    1, 1, 1, 1, 9,
+                    5, 5, 1, 1, 1,
+                    2, 1, 1, 1, 2,
+                    2, 2, 3, 1, 3,
+                    12, 12, 8, 15, 21,
+                    2, 7, 1, 1, 1,
+                    1, 9, 9, 9, 5,
+                    9, 8, 9, 3, 1,
+                    1, 1],
+    "columns": ['GroupCode', 'MarcapScale',
+                'SectorLarge', 'SectorMedium', 'SectorSmall', 'Venture',
+                'LowLiquidity', 'KRXStock', 'ETP', 'KRX100',
+                'KRXAuto', 'KRXSemi', 'KRXBio', 'KRXBank', 'SPAC',
+                'KRXEnergy', 'KRXSteel', 'ShortTermOverheat', 'KRXMedia',
+                'KRXConst', 'Caution', 'KRXSec', 'KRXShip',
+                'KRXSectorIns', 'KRXSectorTrans', 'KOSDAQ150', 'BasePrice',
+                'Unit', 'UnitOvertime', 'Stop', 'Cleanup',
+                'Managed', 'Warning', 'WarningNotice', 'Unfaithful',
+                'Backdoor', 'Lock', 'Split', 'CapitalIncrease', 'MarginRatio',
+                'Credit', 'CreditTerm', 'PrevVol', 'FaceValue', 'ListingDate', 'Shares',
+                'Capital', 'SettleMonth', 'PublicPrice', 'Preferred', 'ShortOverheat', 'Surge',
+                'KRX300', 'Sales', 'OpProfit', 'NetProfit', 'NetIncome', 'ROE',
+                'BaseYM', 'Marcap', 'GroupCode2', 'CreditLimitExceeded', 'CollateralLoan', 'StockLoan'],
+}
+
+_parsed_today = {}
+
+
+_POWERS_OF_TEN = 10 ** np.arange(19, dtype=np.int64)
+
+
+def _digit_column(field: np.ndarray):
+    """Integer values of an (n x width) byte field of space-padded digits.
+
+    Returns None unless every row is blank or one run of digits, in which
+    case blanks become NaN (read_fwf's typing without the string round trip).
+    """
+    if field.shape[1] > 18:
+        return None
+    is_digit = (field >= 48) & (field <= 57)
+    is_space = field == 32
+    if not (is_digit | is_space).all():
+        return None
+    runs = is_digit[:, 0].astype(np.int8) + (is_digit[:, 1:] & ~is_digit[:, :-1]).sum(axis=1)
+    if (runs > 1).any():
+        return None
+    digits_after = np.cumsum(is_digit[:, ::-1], axis=1)[:, ::-1] - is_digit
+    values = np.where(is_digit, (field.astype(np.int64) - 48) * _POWERS_OF_TEN[digits_after], 0).sum(axis=1)
+    blank = runs == 0
+    if blank.any():
+        return np.where(blank, np.nan, values.astype(float))
+    return values
+
+
+def _infer_types(series: pd.Series) -> pd.Series:
+    """Blank -> NaN, and numbers where every value is one (as read_fwf did)."""
+    series = series.replace("", np.nan)
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        with zipfile.ZipFile(io.BytesIO(response.content)) as z:
-            z.extract(mst_file_name, base_dir)
-    except Exception as e:
-        print(f"   ❌ KOSPI Master Download Failed: {e}")
+        return pd.to_numeric(series)
+    except (TypeError, ValueError):
+        return series
+
+
+def _fixed_columns(block: np.ndarray, widths, names) -> dict:
+    """Slice an (n x width) uint8 array into typed columns."""
+    columns = {}
+    start = 0
+    for width, name in zip(widths, names):
+        field = block[:, start:start + width]
+        values = _digit_column(field)
+        if values is None:
+            text = np.ascontiguousarray(field).view(f"S{width}").ravel()
+            values = _infer_types(pd.Series(np.char.strip(np.char.decode(text, "cp949"))))
+        columns[name] = values
+        start += width
+    return columns
+
+
+def parse_master(raw: bytes, spec: dict) -> pd.DataFrame:
+    """Parse a KIS .mst buffer without touching the disk.
+
+    Every row is ``ShortCode(9) StandardCode(12) Name(variable) fixed part``;
+    the fixed part is pure ASCII, so it is cut from the end of each row in
+    bytes and sliced into columns as one uint8 matrix.
+    """
+    widths = spec["field_specs"]
+    tail = sum(widths)
+    lines = [line.rstrip(b"\r") for line in raw.split(b"\n")]
+    lines = [line for line in lines if len(line) > tail]
+    if not lines:
         return pd.DataFrame()
 
-    file_path = os.path.join(base_dir, mst_file_name)
-    
-    # Parse
-    # Part 1: Fixed columns (Short Code, Standard Code, Name) - First 21+ bytes?
-    # Logic adapted from kis_kospi_code_mst.py: 
-    # rf1 = row[0:len(row) - 228]
-    # rf1_1 = rf1[0:9].rstrip() (Short Code)
-    # rf1_2 = rf1[9:21].rstrip() (Standard Code)
-    # rf1_3 = rf1[21:].strip() (Name)
-    
-    # We will read line by line to separate Part 1 and Part 2
-    part1_rows = []
-    part2_rows = []
-    
-    with open(file_path, mode="r", encoding="cp949") as f:
-        for row in f:
-            # 228 is the length of the fixed width part at the end
-            # The name part is variable length (left over)
-            rf1 = row[0:len(row) - 228]
-            rf1_1 = rf1[0:9].strip() # Short Code
-            rf1_2 = rf1[9:21].strip() # Standard Code
-            rf1_3 = rf1[21:].strip() # Name
-            
-            part1_rows.append([rf1_1, rf1_2, rf1_3])
-            
-            rf2 = row[-228:]
-            part2_rows.append(rf2)
-
-    df1 = pd.DataFrame(part1_rows, columns=['ShortCode', 'StandardCode', 'Name'])
-    
-    # Part 2 specs
-    field_specs = [2, 1, 4, 4, 4,
-                   1, 1, 1, 1, 1,
-                   1, 1, 1, 1, 1,
-                   1, 1, 1, 1, 1,
-                   1, 1, 1, 1, 1,
-                   1, 1, 1, 1, 1,
-                   1, 9, 5, 5, 1,
-                   1, 1, 2, 1, 1,
-                   1, 2, 2, 2, 3,
-                   1, 3, 12, 12, 8,
-                   15, 21, 2, 7, 1,
-                   1, 1, 1, 1, 9,
-                   9, 9, 5, 9, 8,
-                   9, 3, 1, 1, 1]
-    
-    part2_columns = ['GroupCode', 'MarcapScale', 'SectorLarge', 'SectorMedium', 'SectorSmall',
-                     'Manufacturing', 'LowLiquidity', 'Governance', 'KOSPI200Sector', 'KOSPI100',
-                     'KOSPI50', 'KRX', 'ETP', 'ELW', 'KRX100',
-                     'KRXAuto', 'KRXSemi', 'KRXBio', 'KRXBank', 'SPAC',
-                     'KRXEnergy', 'KRXSteel', 'ShortTermOverheat', 'KRXMedia', 'KRXConst',
-                     'Non1', 'KRXSec', 'KRXShip', 'KRXSectorIns', 'KRXSectorTrans',
-                     'SRI', 'BasePrice', 'Unit', 'UnitOvertime', 'Stop',
-                     'Cleanup', 'Managed', 'Warning', 'WarningNotice', 'Unfaithful',
-                     'Backdoor', 'Lock', 'Split', 'CapitalIncrease', 'MarginRatio',
-                     'Credit', 'CreditTerm', 'PrevVol', 'FaceValue', 'ListingDate',
-                     'Shares', 'Capital', 'SettleMonth', 'PublicPrice', 'Preferred',
-                     'ShortOverheat', 'Surge', 'KRX300', 'KOSPI', 'Sales',
-                     'OpProfit', 'NetProfit', 'NetIncome', 'ROE', 'BaseYM',
-                     'Marcap', 'GroupCode2', 'CreditLimitExceeded', 'CollateralLoan', 'StockLoan']
-
-    # Using a temporary file for read_fwf is easiest given the list of strings
-    tmp_path = os.path.join(base_dir, "kospi_part2.tmp")
-    with open(tmp_path, "w") as f:
-        f.writelines(part2_rows)
-        
-    df2 = pd.read_fwf(tmp_path, widths=field_specs, names=part2_columns)
-    
-    # Merge
-    df = pd.concat([df1, df2], axis=1)
-    
-    # Cleanup
-    if os.path.exists(file_path): os.remove(file_path)
-    if os.path.exists(tmp_path): os.remove(tmp_path)
-    
-    return df
+    tails = np.frombuffer(b"".join(line[-tail:] for line in lines), dtype=np.uint8).reshape(len(lines), tail)
+    heads = [line[:-tail] for line in lines]
+    df = pd.DataFrame(
+        {
+            "ShortCode": [head[0:9].decode("cp949").strip() for head in heads],
+            "StandardCode": [head[9:21].decode("cp949").strip() for head in heads],
+            "Name": [head[21:].decode("cp949").strip() for head in heads],
+        }
+    )
+    fixed = pd.DataFrame(_fixed_columns(tails, widths, spec["columns"]))
+    return pd.concat([df, fixed], axis=1)
 
-def download_and_parse_kosdaq_master(base_dir):
-    url = "https://new.real.download.dws.co.kr/common/master/kosdaq_code.mst.zip"
-    mst_file_name = "kosdaq_code.mst"
-    
-    # Download
-    print(f"   Downloading {mst_file_name}...")
+
+def _cache_paths(cache_dir: str, spec: dict):
+    market = spec["market"].lower()
+    return os.path.join(cache_dir, f"{market}.mst"), os.path.join(cache_dir, f"{market}.json")
+
+
+def _read_meta(meta_path: str) -> dict:
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache(mst_path: str, meta_path: str, raw, meta: dict) -> None:
+    os.makedirs(os.path.dirname(mst_path), exist_ok=True)
+    if raw is not None:
+        with open(f"{mst_path}.tmp", "wb") as f:
+            f.write(raw)
+        os.replace(f"{mst_path}.tmp", mst_path)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def load_master_bytes(spec: dict, cache_dir: str = CACHE_DIR) -> bytes:
+    """The market's .mst contents, from the dated cache when possible."""
+    today = datetime.now().strftime("%Y-%m-%d")
+    mst_path, meta_path = _cache_paths(cache_dir, spec)
+    meta = _read_meta(meta_path)
+    cached = os.path.exists(mst_path)
+    if cached and meta.get("date") == today:
+        with open(mst_path, "rb") as f:
+            return f.read()
+
+    validator = {}
+    if cached:
+        try:
+            head = requests.head(spec["url"], timeout=DOWNLOAD_TIMEOUT_SEC)
+            head.raise_for_status()
+            validator = {
+                "etag": head.headers.get("ETag"),
+                "content_length": head.headers.get("Content-Length"),
+            }
+        except Exception:
+            pass
+
+    unchanged = cached and any(validator.values()) and all(
+        meta.get(key) == value for key, value in validator.items()
+    )
+    if unchanged:
+        _write_cache(mst_path, meta_path, None, {**meta, "date": today})
+        with open(mst_path, "rb") as f:
+            return f.read()
+
+    print(f"   Downloading {spec['mst_file_name']}...")
     try:
-        response = requests.get(url)
+        response = requests.get(spec["url"], timeout=DOWNLOAD_TIMEOUT_SEC)
         response.raise_for_status()
         with zipfile.ZipFile(io.BytesIO(response.content)) as z:
-            z.extract(mst_file_name, base_dir)
+            raw = z.read(spec["mst_file_name"])
+    except Exception:
+        if cached:
+            print(f"   ⚠️ {spec['market']} master download failed, using the cached file from {meta.get('date')}.")
+            with open(mst_path, "rb") as f:
+                return f.read()
+        raise
+
+    _write_cache(
+        mst_path,
+        meta_path,
+        raw,
+        {
+            "date": today,
+            "etag": response.headers.get("ETag") or validator.get("etag"),
+            "content_length": response.headers.get("Content-Length") or validator.get("content_length"),
+        },
+    )
+    return raw
+
+
+def _download_and_parse(spec: dict, cache_dir: str) -> pd.DataFrame:
+    key = (spec["market"], cache_dir, datetime.now().strftime("%Y-%m-%d"))
+    if key in _parsed_today:
+        return _parsed_today[key].copy()
+    try:
+        raw = load_master_bytes(spec, cache_dir)
     except Exception as e:
-        print(f"   ❌ KOSDAQ Master Download Failed: {e}")
+        print(f"   ❌ {spec['market']} Master Download Failed: {e}")
         return pd.DataFrame()
+    df = parse_master(raw, spec)
+    _parsed_today[key] = df
+    return df.copy()
+
+
+def download_and_parse_kospi_master(cache_dir: str = CACHE_DIR) -> pd.DataFrame:
+    return _download_and_parse(KOSPI_MASTER, cache_dir)
+
+
+def download_and_parse_kosdaq_master(cache_dir: str = CACHE_DIR) -> pd.DataFrame:
+    return _download_and_parse(KOSDAQ_MASTER, cache_dir)
 
-    file_path = os.path.join(base_dir, mst_file_name)
-    
-    part1_rows = []
-    part2_rows = []
-    
-    with open(file_path, mode="r", encoding="cp949") as f:
-        for row in f:
-            # 222 length for KOSDAQ fixed part
-            rf1 = row[0:len(row) - 222]
-            rf1_1 = rf1[0:9].strip()
-            rf1_2 = rf1[9:21].strip()
-            rf1_3 = rf1[21:].strip()
-            
-            part1_rows.append([rf1_1, rf1_2, rf1_3])
-            
-            rf2 = row[-222:]
-            part2_rows.append(rf2)
-
-    df1 = pd.DataFrame(part1_rows, columns=['ShortCode', 'StandardCode', 'Name'])
-    
-    field_specs = [2, 1,
-                   4, 4, 4, 1, 1,
-                   1, 1, 1, 1, 1,
-                   1, 1, 1, 1, 1,
-                   1, 1, 1, 1, 1,
-                   1, 1, 1, 1, 9,
-                   5, 5, 1, 1, 1,
-                   2, 1, 1, 1, 2,
-                   2, 2, 3, 1, 3,
-                   12, 12, 8, 15, 21,
-                   2, 7, 1, 1, 1,
-                   1, 9, 9, 9, 5,
-                   9, 8, 9, 3, 1,
-                   1, 1]
-
-    part2_columns = ['GroupCode', 'MarcapScale',
-                     'SectorLarge', 'SectorMedium', 'SectorSmall', 'Venture',
-                     'LowLiquidity', 'KRXStock', 'ETP', 'KRX100',
-                     'KRXAuto', 'KRXSemi', 'KRXBio', 'KRXBank', 'SPAC',
-                     'KRXEnergy', 'KRXSteel', 'ShortTermOverheat', 'KRXMedia',
-                     'KRXConst', 'Caution', 'KRXSec', 'KRXShip',
-                     'KRXSectorIns', 'KRXSectorTrans', 'KOSDAQ150', 'BasePrice',
-                     'Unit', 'UnitOvertime', 'Stop', 'Cleanup',
-                     'Managed', 'Warning', 'WarningNotice', 'Unfaithful',
-                     'Backdoor', 'Lock', 'Split', 'CapitalIncrease', 'MarginRatio',
-                     'Credit', 'CreditTerm', 'PrevVol', 'FaceValue', 'ListingDate', 'Shares',
-                     'Capital', 'SettleMonth', 'PublicPrice', 'Preferred', 'ShortOverheat', 'Surge',
-                     'KRX300', 'Sales', 'OpProfit', 'NetProfit', 'NetIncome', 'ROE',
-                     'BaseYM', 'Marcap', 'GroupCode2', 'CreditLimitExceeded', 'CollateralLoan', 'StockLoan']
-
-    tmp_path = os.path.join(base_dir, "kosdaq_part2.tmp")
-    with open(tmp_path, "w") as f:
-        f.writelines(part2_rows)
-        
-    df2 = pd.read_fwf(tmp_path, widths=field_specs, names=part2_columns)
-    
-    df = pd.concat([df1, df2], axis=1)
-    
-    if os.path.exists(file_path): os.remove(file_path)
-    if os.path.exists(tmp_path): os.remove(tmp_path)
-    
-    return df
 
-def get_all_stocks():
+def listed_shares(full_df: pd.DataFrame) -> pd.Series:
+    """Listed shares as a count, from one master file's raw columns.
+
+    The master layout does not state the field's unit, so it is taken as
+    the power of ten that best reconciles Marcap (still in 억) with
+    BasePrice x Shares over the file's rows.
+    """
+    shares = pd.to_numeric(full_df['Shares'], errors='coerce')
+    marcap_won = pd.to_numeric(full_df['Marcap'], errors='coerce') * 100000000
+    base_price = pd.to_numeric(full_df['BasePrice'], errors='coerce')
+    ratio = marcap_won / (base_price * shares)
+    ratio = ratio[np.isfinite(ratio) & (ratio > 0)]
+    unit = 10 ** round(float(np.log10(ratio).median())) if len(ratio) else 1
+    return shares.where(shares > 0) * unit
+
+
+def get_all_stocks(cache_dir: str = CACHE_DIR):
     """
     Downloads and parses KOSPI and KOSDAQ master files to get every six-digit
     listed security, including preferred shares, ETFs/ETNs, and SPACs.
 
     Returns columns:
-      Code, Name, Market, Marcap, SecurityType, IsRsEligible
+      Code, Name, Market, Marcap, SectorLarge, SectorMedium, SectorSmall,
+      ListingDate, Shares, SecurityType, IsRsEligible
+
+    ListingDate is YYYY-MM-DD, or None when the master has no valid date.
+    Shares is the listed share count (NaN when blank).
+
+    cache_dir holds the dated .mst cache (see load_master_bytes).
+
+    The Sector* columns are the raw index-sector codes (see kis_sector_codes).
 
     IsRsEligible deliberately preserves the former common-stock analysis
     universe: ETPs, SPACs, and preferred shares are collected but excluded.
     """
-    base_dir = os.getcwd() # Or use a temp dir
-    
     print("   Downloading & Parsing KOSPI Master...")
-    kospi_df = download_and_parse_kospi_master(base_dir)
+    kospi_df = download_and_parse_kospi_master(cache_dir)
     if not kospi_df.empty:
         kospi_df['Market'] = 'KOSPI'
+        kospi_df['Shares'] = listed_shares(kospi_df)
         # Filter
         # ETP: 'Y' (ETF/ETN)
         # SPAC: 'Y'
@@ -206,9 +321,10 @@ def get_all_stocks():
         pass
 
     print("   Downloading & Parsing KOSDAQ Master...")
-    kosdaq_df = download_and_parse_kosdaq_master(base_dir)
+    kosdaq_df = download_and_parse_kosdaq_master(cache_dir)
     if not kosdaq_df.empty:
         kosdaq_df['Market'] = 'KOSDAQ'
+        kosdaq_df['Shares'] = listed_shares(kosdaq_df)
         
     
     # Combine
@@ -225,7 +341,15 @@ def get_all_stocks():
     # Cleaning
     full_df['Marcap'] = pd.to_numeric(full_df['Marcap'], errors='coerce').fillna(0) * 100000000 # 억 -> 원
     
-    result_df = full_df[['ShortCode', 'Name', 'Market', 'Marcap']].rename(columns={'ShortCode': 'Code'})
+    result_df = full_df[
+        ['ShortCode', 'Name', 'Market', 'Marcap', 'SectorLarge', 'SectorMedium', 'SectorSmall']
+    ].rename(columns={'ShortCode': 'Code'})
+
+    # YYYYMMDD digits, parsed as numbers (NaN when blank).
+    listing_digits = pd.to_numeric(full_df['ListingDate'], errors='coerce').astype('Int64').astype(str)
+    listing_date = pd.to_datetime(listing_digits, format='%Y%m%d', errors='coerce')
+    result_df['ListingDate'] = listing_date.dt.strftime('%Y-%m-%d').astype(object).where(listing_date.notna(), None)
+    result_df['Shares'] = full_df['Shares']
 
     def flag_value(value):
         if pd.isna(value):
@@ -0,0 +1,99 @@
+"""Sector names for the index-sector codes in the KIS master files.
+
+The KOSPI/KOSDAQ .mst rows carry the stock's index sector as three 4-digit
+codes (SectorLarge/SectorMedium/SectorSmall, "0000" when unused). The codes
+are the KRX industry-index codes of each market, so the same number means a
+different sector on KOSPI and KOSDAQ. Size and market-wide indices
+(종합, 대형주, ...) are not sectors and are left out on purpose.
+
+When KRX adds or renames a sector, update_companies_sector_kis.py prints
+the codes it could not map; add them here.
+"""
+
+from typing import Optional
+
+SECTOR_NAMES = {
+    "KOSPI": {
+        5: "음식료품",
+        6: "섬유의복",
+        7: "종이목재",
+        8: "화학",
+        9: "의약품",
+        10: "비금속광물",
+        11: "철강금속",
+        12: "기계",
+        13: "전기전자",
+        14: "의료정밀",
+        15: "운수장비",
+        16: "유통업",
+        17: "전기가스업",
+        18: "건설업",
+        19: "운수창고업",
+        20: "통신업",
+        21: "금융업",
+        22: "은행",
+        24: "증권",
+        25: "보험",
+        26: "서비스업",
+        27: "제조업",
+    },
+    "KOSDAQ": {
+        12: "제조",
+        15: "건설",
+        24: "유통",
+        26: "숙박·음식",
+        27: "운송",
+        29: "금융",
+        31: "오락·문화",
+        41: "통신방송서비스",
+        42: "IT S/W & SVC",
+        43: "IT H/W",
+        56: "음식료·담배",
+        58: "섬유·의류",
+        62: "종이·목재",
+        63: "출판·매체복제",
+        65: "화학",
+        66: "제약",
+        67: "비금속",
+        68: "금속",
+        70: "기계·장비",
+        72: "일반전기전자",
+        74: "의료·정밀기기",
+        75: "운송장비·부품",
+        77: "기타제조",
+        151: "통신서비스",
+        152: "방송서비스",
+        153: "인터넷",
+        154: "디지털컨텐츠",
+        155: "소프트웨어",
+        156: "컴퓨터서비스",
+        157: "통신장비",
+        158: "정보기기",
+        159: "반도체",
+        160: "IT부품",
+    },
+}
+
+
+def sector_code(value) -> Optional[int]:
+    """Master field -> code number; None for blanks and "0000".
+
+    The KOSDAQ file may prefix its codes with the market digit (1012), so
+    only the last three digits are kept.
+    """
+    try:
+        number = int(float(str(value).strip()))
+    except (TypeError, ValueError):
+        return None
+    number %= 1000
+    return number or None
+
+
+def sector_name(market: str, large, medium, small) -> Optional[str]:
+    """Most specific mapped sector of a master row, or None."""
+    names = SECTOR_NAMES.get(market, {})
+    for value in (small, medium, large):
+        code = sector_code(value)
+        if code is not None and code in names:
+            return names[code]
+    return None
@@ -0,0 +1,116 @@
+"""Keep company_listing_stats (first/latest bar per code) in step with the ingest.
+
+recent_listing_returns reads each code's first and latest close from this
+table instead of probing daily_prices_v2 twice per company. The ingest
+passes every batch of bars it writes to ``ListingStatsTracker.record`` and
+calls ``flush`` once at the end; only codes whose first or latest bar moved
+are written back.
+
+Bars are compared by date, so a full reload after an adjustment also
+refreshes the stored closes for the dates it rewrites. As in the view,
+only bars with a positive close count.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+PAGE_SIZE = 1000
+UPSERT_CHUNK = 1000
+
+
+class ListingStatsTracker:
+    def __init__(self, supabase):
+        self.supabase = supabase
+        self.stats: Optional[Dict[str, dict]] = None
+        self.dirty: set[str] = set()
+
+    def load(self) -> Dict[str, dict]:
+        if self.stats is not None:
+            return self.stats
+        self.stats = {}
+        offset = 0
+        while True:
+            response = (
+                self.supabase.table("company_listing_stats")
+                .select("code, first_date, first_close, latest_date, latest_close")
+                .order("code")
+                .range(offset, offset + PAGE_SIZE - 1)
+                .execute()
+            )
+            rows = response.data or []
+            for row in rows:
+                self.stats[str(row["code"])] = {
+                    "first_date": str(row["first_date"])[:10],
+                    "first_close": float(row["first_close"]),
+                    "latest_date": str(row["latest_date"])[:10],
+                    "latest_close": float(row["latest_close"]),
+                }
+            if len(rows) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+        return self.stats
+
+    def _fetch_first_bar(self, code: str) -> Optional[dict]:
+        response = (
+            self.supabase.table("daily_prices_v2")
+            .select("date, close")
+            .eq("code", code)
+            .gt("close", 0)
+            .order("date")
+            .limit(1)
+            .execute()
+        )
+        return response.data[0] if response.data else None
+
+    def record(self, code: str, rows: Iterable[dict]) -> None:
+        """Fold freshly written bars into the code's stats.
+
+        A code without stats looks up its first stored bar once, since even
+        a full reload only goes back to 2015.
+        """
+        bars = sorted(
+            (str(row["date"])[:10], float(row["close"]))
+            for row in rows
+            if row.get("close") is not None and float(row["close"]) > 0
+        )
+        if not bars:
+            return
+        stats = self.load()
+        current = stats.get(code)
+        if current is None:
+            first = self._fetch_first_bar(code)
+            first_date, first_close = bars[0]
+            if first is not None and str(first["date"])[:10] < first_date:
+                first_date, first_close = str(first["date"])[:10], float(first["close"])
+            current = {
+                "first_date": first_date,
+                "first_close": first_close,
+                "latest_date": bars[-1][0],
+                "latest_close": bars[-1][1],
+            }
+            stats[code] = current
+            self.dirty.add(code)
+            return
+
+        before = dict(current)
+        for date, close in bars:
+            if date <= current["first_date"]:
+                current["first_date"], current["first_close"] = date, close
+            if date >= current["latest_date"]:
+                current["latest_date"], current["latest_close"] = date, close
+        if current != before:
+            self.dirty.add(code)
+
+    def flush(self) -> int:
+        if not self.dirty:
+            return 0
+        now = datetime.now().isoformat(timespec="seconds")
+        rows: List[dict] = [
+            {"code": code, **self.stats[code], "updated_at": now} for code in sorted(self.dirty)
+        ]
+        for i in range(0, len(rows), UPSERT_CHUNK):
+            self.supabase.table("company_listing_stats").upsert(
+                rows[i : i + UPSERT_CHUNK], on_conflict="code"
+            ).execute()
+        self.dirty.clear()
+        return len(rows)
@@ -0,0 +1,393 @@
+"""Livermore ATR record engine, one bar at a time.
+
+Python port of ``computeLivermoreStateRows`` in src/lib/livermoreRecordEngine.ts
+(rules: scripts/livermore/livermore_atr_spec.md, atr_livermore_spec.md). The
+output rows match the TypeScript engine field for field so the frontend can
+read them from ``livermore_state_daily`` instead of recomputing.
+
+Unlike the TypeScript version the engine keeps its state between bars and can
+be serialized (``to_state``/``from_state``), so the daily batch restores the
+terminal state of each code and advances it by the new bar only.
+"""
+
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_REVERSAL_MULTIPLIER = 3.0
+DEFAULT_CONFIRM_MULTIPLIER = 1.5
+ATR_PERIOD = 20
+# The TypeScript engine allows at most this many chained transitions per bar.
+MAX_TRANSITIONS_PER_BAR = 6
+
+UPWARD_TREND = "upward_trend"
+DOWNWARD_TREND = "downward_trend"
+NATURAL_RALLY = "natural_rally"
+NATURAL_REACTION = "natural_reaction"
+SECONDARY_RALLY = "secondary_rally"
+SECONDARY_REACTION = "secondary_reaction"
+INSUFFICIENT_DATA = "insufficient_data"
+
+LEDGER_KEYS = (
+    UPWARD_TREND,
+    DOWNWARD_TREND,
+    NATURAL_RALLY,
+    NATURAL_REACTION,
+    SECONDARY_RALLY,
+    SECONDARY_REACTION,
+)
+EXTREME_KEYS = (NATURAL_RALLY, NATURAL_REACTION, SECONDARY_RALLY, SECONDARY_REACTION)
+PIVOT_KEYS = ("s", "b", "ss", "bb", "lined_natural_rally", "lined_natural_reaction")
+
+Pivot = Tuple[float, str]  # (price, date)
+
+
+def round_value(value: Optional[float]) -> Optional[float]:
+    """Math.round(value * 10000) / 10000 (half rounds up, like JavaScript)."""
+    if value is None or math.isnan(value):
+        return None
+    return math.floor(value * 10000 + 0.5) / 10000
+
+
+def higher_pivot(left: Optional[Pivot], right: Pivot) -> Pivot:
+    if left is None or right[0] >= left[0]:
+        return right
+    return left
+
+
+def lower_pivot(left: Optional[Pivot], right: Pivot) -> Pivot:
+    if left is None or right[0] <= left[0]:
+        return right
+    return left
+
+
+class LivermoreEngine:
+    def __init__(
+        self,
+        reversal_multiplier: float = DEFAULT_REVERSAL_MULTIPLIER,
+        confirm_multiplier: float = DEFAULT_CONFIRM_MULTIPLIER,
+    ):
+        self.reversal_multiplier = reversal_multiplier
+        self.confirm_multiplier = confirm_multiplier
+
+        self.state: Optional[str] = None
+        self.bootstrap_anchor: Optional[Pivot] = None
+        self.ledger: Dict[str, Optional[Pivot]] = dict.fromkeys(LEDGER_KEYS)
+        self.extremes: Dict[str, Optional[Pivot]] = dict.fromkeys(EXTREME_KEYS)
+        self.pivots: Dict[str, Optional[Pivot]] = dict.fromkeys(PIVOT_KEYS)
+
+        self.true_ranges: List[float] = []
+        self.prev_close: Optional[float] = None
+        self.last_date: Optional[str] = None
+        self.bar_count = 0
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def to_state(self) -> dict:
+        def pack(pivots: Dict[str, Optional[Pivot]]) -> dict:
+            return {k: (list(v) if v is not None else None) for k, v in pivots.items()}
+
+        return {
+            "state": self.state,
+            "bootstrap_anchor": list(self.bootstrap_anchor) if self.bootstrap_anchor else None,
+            "ledger": pack(self.ledger),
+            "extremes": pack(self.extremes),
+            "pivots": pack(self.pivots),
+            "true_ranges": list(self.true_ranges),
+            "prev_close": self.prev_close,
+            "last_date": self.last_date,
+            "bar_count": self.bar_count,
+        }
+
+    @classmethod
+    def from_state(
+        cls,
+        data: dict,
+        reversal_multiplier: float = DEFAULT_REVERSAL_MULTIPLIER,
+        confirm_multiplier: float = DEFAULT_CONFIRM_MULTIPLIER,
+    ) -> "LivermoreEngine":
+        def unpack(values: dict, keys: Iterable[str]) -> Dict[str, Optional[Pivot]]:
+            return {
+                k: (float(values[k][0]), values[k][1]) if values.get(k) else None
+                for k in keys
+            }
+
+        engine = cls(reversal_multiplier, confirm_multiplier)
+        engine.state = data.get("state")
+        anchor = data.get("bootstrap_anchor")
+        engine.bootstrap_anchor = (float(anchor[0]), anchor[1]) if anchor else None
+        engine.ledger = unpack(data.get("ledger") or {}, LEDGER_KEYS)
+        engine.extremes = unpack(data.get("extremes") or {}, EXTREME_KEYS)
+        engine.pivots = unpack(data.get("pivots") or {}, PIVOT_KEYS)
+        engine.true_ranges = [float(v) for v in data.get("true_ranges") or []]
+        engine.prev_close = data.get("prev_close")
+        engine.last_date = data.get("last_date")
+        engine.bar_count = int(data.get("bar_count") or 0)
+        return engine
+
+    # ------------------------------------------------------------------
+    # Bars
+    # ------------------------------------------------------------------
+    def _advance_atr(self, high: Optional[float], low: Optional[float], close: float) -> Optional[float]:
+        prev_close = self.prev_close if self.prev_close is not None else close
+        high = close if high is None else high
+        low = close if low is None else low
+        self.true_ranges.append(max(high - low, abs(high - prev_close), abs(low - prev_close)))
+        if len(self.true_ranges) > ATR_PERIOD:
+            del self.true_ranges[0]
+        self.prev_close = close
+        self.bar_count += 1
+        if self.bar_count < ATR_PERIOD:
+            return None
+        # Summed left to right like the TypeScript loop (sum() compensates).
+        total = 0.0
+        for value in self.true_ranges:
+            total += value
+        return total / ATR_PERIOD
+
+    def _row(
+        self,
+        bar: dict,
+        atr: Optional[float],
+        state: str,
+        changed: bool,
+        reason: str,
+        reversal: Optional[float],
+        confirm: Optional[float],
+    ) -> dict:
+        def price(key: str) -> Optional[float]:
+            pivot = self.pivots[key]
+            return round_value(pivot[0]) if pivot else None
+
+        def date(key: str) -> Optional[str]:
+            pivot = self.pivots[key]
+            return pivot[1] if pivot else None
+
+        return {
+            "date": bar["date"],
+            "open": bar.get("open"),
+            "high": bar.get("high"),
+            "low": bar.get("low"),
+            "close": bar["close"],
+            "atr20": round_value(atr),
+            "state": state,
+            "state_changed": changed,
+            "reason": reason,
+            "reversal_threshold_value": round_value(reversal),
+            "confirm_threshold_value": round_value(confirm),
+            "pivot_high": price("s"),
+            "pivot_high_date": date("s"),
+            "pivot_low": price("b"),
+            "pivot_low_date": date("b"),
+            "pivot_ss": price("ss"),
+            "pivot_ss_date": date("ss"),
+            "pivot_bb": price("bb"),
+            "pivot_bb_date": date("bb"),
+        }
+
+    def step(self, bar: dict) -> dict:
+        """Record one bar (date, open, high, low, close) and return its row."""
+        close = float(bar["close"])
+        atr = self._advance_atr(bar.get("high"), bar.get("low"), close)
+        self.last_date = bar["date"]
+
+        if atr is None:
+            return self._row(bar, None, INSUFFICIENT_DATA, False, "ATR20 unavailable", None, None)
+
+        reversal = atr * self.reversal_multiplier
+        confirm = atr * self.confirm_multiplier
+        point: Pivot = (close, bar["date"])
+
+        if self.state is None:
+            return self._bootstrap(bar, point, atr, reversal, confirm)
+
+        changed, reason = self._record(point, reversal, confirm)
+        return self._row(bar, atr, self.state, changed, reason, reversal, confirm)
+
+    def run(self, bars: Iterable[dict]) -> List[dict]:
+        return [self.step(bar) for bar in bars]
+
+    def _bootstrap(self, bar: dict, point: Pivot, atr: float, reversal: float, confirm: float) -> dict:
+        pending = "Bootstrap pending initial directional move"
+        if self.bootstrap_anchor is None:
+            self.bootstrap_anchor = point
+            return self._row(bar, atr, INSUFFICIENT_DATA, False, pending, reversal, confirm)
+
+        close = point[0]
+        if close >= self.bootstrap_anchor[0] + reversal:
+            self.state = UPWARD_TREND
+            self.ledger[UPWARD_TREND] = point
+            return self._row(bar, atr, self.state, True, "Bootstrap -> Upward trend", reversal, confirm)
+        if close <= self.bootstrap_anchor[0] - reversal:
+            self.state = DOWNWARD_TREND
+            self.ledger[DOWNWARD_TREND] = point
+            return self._row(bar, atr, self.state, True, "Bootstrap -> Downward trend", reversal, confirm)
+        return self._row(bar, atr, INSUFFICIENT_DATA, False, pending, reversal, confirm)
+
+    def _record(self, point: Pivot, reversal: float, confirm: float) -> Tuple[bool, str]:
+        """Apply the column rules to one close; mirrors the TypeScript loop."""
+        close = point[0]
+        ledger, extremes, pivots = self.ledger, self.extremes, self.pivots
+        changed = False
+        reason = "State maintained"
+
+        for _ in range(MAX_TRANSITIONS_PER_BAR):
+            transitioned = False
+            state = self.state
+
+            if state == UPWARD_TREND:
+                ledger[UPWARD_TREND] = higher_pivot(ledger[UPWARD_TREND], point)
+                if close <= ledger[UPWARD_TREND][0] - reversal:
+                    pivots["ss"] = ledger[UPWARD_TREND]
+                    ledger[NATURAL_REACTION] = point
+                    extremes[NATURAL_REACTION] = point
+                    self.state = NATURAL_REACTION
+                    changed = True
+                    reason = "Upward trend -> Natural reaction"
+                    break
+                reason = "Upward trend maintained"
+
+            elif state == DOWNWARD_TREND:
+                ledger[DOWNWARD_TREND] = lower_pivot(ledger[DOWNWARD_TREND], point)
+                if close >= ledger[DOWNWARD_TREND][0] + reversal:
+                    pivots["bb"] = ledger[DOWNWARD_TREND]
+                    ledger[NATURAL_RALLY] = point
+                    extremes[NATURAL_RALLY] = point
+                    self.state = NATURAL_RALLY
+                    changed = True
+                    reason = "Downward trend -> Natural rally"
+                    break
+                reason = "Downward trend maintained"
+
+            elif state == NATURAL_REACTION:
+                if close < ledger[NATURAL_REACTION][0]:
+                    ledger[NATURAL_REACTION] = point
+                    extremes[NATURAL_REACTION] = lower_pivot(extremes[NATURAL_REACTION], point)
+
+                lined = pivots["lined_natural_reaction"]
+                if ledger[DOWNWARD_TREND] is not None and close < ledger[DOWNWARD_TREND][0]:
+                    ledger[DOWNWARD_TREND] = point
+                    self.state = DOWNWARD_TREND
+                    reason = "Natural reaction -> Downward trend (broke last downward trend record)"
+                    transitioned = True
+                elif lined is not None and close <= lined[0] - confirm:
+                    ledger[DOWNWARD_TREND] = point
+                    self.state = DOWNWARD_TREND
+                    reason = "Natural reaction -> Downward trend (rule 5-B confirm below lined natural reaction)"
+                    transitioned = True
+                elif close >= extremes[NATURAL_REACTION][0] + reversal:
+                    pivots["b"] = extremes[NATURAL_REACTION]
+                    pivots["lined_natural_reaction"] = ledger[NATURAL_REACTION]
+                    transitioned = True
+                    if ledger[UPWARD_TREND] is not None and close > ledger[UPWARD_TREND][0]:
+                        ledger[UPWARD_TREND] = point
+                        self.state = UPWARD_TREND
+                        reason = "Natural reaction -> Upward trend (broke last upward trend record)"
+                    elif ledger[NATURAL_RALLY] is None or close > ledger[NATURAL_RALLY][0]:
+                        ledger[NATURAL_RALLY] = point
+                        extremes[NATURAL_RALLY] = point
+                        self.state = NATURAL_RALLY
+                        # The TS engine tests for "first record" after assigning,
+                        # so it always reports the "broke" wording.
+                        reason = "Natural reaction -> Natural rally (broke last natural rally record)"
+                    else:
+                        ledger[SECONDARY_RALLY] = point
+                        extremes[SECONDARY_RALLY] = point
+                        self.state = SECONDARY_RALLY
+                        reason = "Natural reaction -> Secondary rally"
+                else:
+                    reason = "Natural reaction maintained"
+
+            elif state == NATURAL_RALLY:
+                if close > ledger[NATURAL_RALLY][0]:
+                    ledger[NATURAL_RALLY] = point
+                    extremes[NATURAL_RALLY] = higher_pivot(extremes[NATURAL_RALLY], point)
+
+                lined = pivots["lined_natural_rally"]
+                if ledger[UPWARD_TREND] is not None and close > ledger[UPWARD_TREND][0]:
+                    ledger[UPWARD_TREND] = point
+                    self.state = UPWARD_TREND
+                    reason = "Natural rally -> Upward trend (broke last upward trend record)"
+                    transitioned = True
+                elif lined is not None and close >= lined[0] + confirm:
+                    ledger[UPWARD_TREND] = point
+                    self.state = UPWARD_TREND
+                    reason = "Natural rally -> Upward trend (rule 5-A confirm above lined natural rally)"
+                    transitioned = True
+                elif close <= extremes[NATURAL_RALLY][0] - reversal:
+                    pivots["s"] = extremes[NATURAL_RALLY]
+                    pivots["lined_natural_rally"] = ledger[NATURAL_RALLY]
+                    transitioned = True
+                    if ledger[DOWNWARD_TREND] is not None and close < ledger[DOWNWARD_TREND][0]:
+                        ledger[DOWNWARD_TREND] = point
+                        self.state = DOWNWARD_TREND
+                        reason = "Natural rally -> Downward trend (broke last downward trend record)"
+                    elif ledger[NATURAL_REACTION] is None or close < ledger[NATURAL_REACTION][0]:
+                        ledger[NATURAL_REACTION] = point
+                        extremes[NATURAL_REACTION] = point
+                        self.state = NATURAL_REACTION
+                        reason = "Natural rally -> Natural reaction (broke last natural reaction record)"
+                    else:
+                        ledger[SECONDARY_REACTION] = point
+                        extremes[SECONDARY_REACTION] = point
+                        self.state = SECONDARY_REACTION
+                        reason = "Natural rally -> Secondary reaction"
+                else:
+                    reason = "Natural rally maintained"
+
+            elif state == SECONDARY_RALLY:
+                if close > ledger[SECONDARY_RALLY][0]:
+                    ledger[SECONDARY_RALLY] = point
+                    extremes[SECONDARY_RALLY] = higher_pivot(extremes[SECONDARY_RALLY], point)
+
+                if ledger[NATURAL_RALLY] is not None and close > ledger[NATURAL_RALLY][0]:
+                    ledger[NATURAL_RALLY] = point
+                    extremes[NATURAL_RALLY] = higher_pivot(extremes[NATURAL_RALLY], point)
+                    self.state = NATURAL_RALLY
+                    reason = "Secondary rally -> Natural rally (broke last natural rally record)"
+                    transitioned = True
+                elif close <= extremes[SECONDARY_RALLY][0] - reversal:
+                    ledger[SECONDARY_REACTION] = point
+                    extremes[SECONDARY_REACTION] = point
+                    self.state = SECONDARY_REACTION
+                    reason = "Secondary rally -> Secondary reaction"
+                    transitioned = True
+                else:
+                    reason = "Secondary rally maintained"
+
+            elif state == SECONDARY_REACTION:
+                if close < ledger[SECONDARY_REACTION][0]:
+                    ledger[SECONDARY_REACTION] = point
+                    extremes[SECONDARY_REACTION] = lower_pivot(extremes[SECONDARY_REACTION], point)
+
+                if ledger[NATURAL_REACTION] is not None and close < ledger[NATURAL_REACTION][0]:
+                    ledger[NATURAL_REACTION] = point
+                    extremes[NATURAL_REACTION] = lower_pivot(extremes[NATURAL_REACTION], point)
+                    self.state = NATURAL_REACTION
+                    reason = "Secondary reaction -> Natural reaction (broke last natural reaction record)"
+                    transitioned = True
+                elif close >= extremes[SECONDARY_REACTION][0] + reversal:
+                    ledger[SECONDARY_RALLY] = point
+                    extremes[SECONDARY_RALLY] = point
+                    self.state = SECONDARY_RALLY
+                    reason = "Secondary reaction -> Secondary rally"
+                    transitioned = True
+                else:
+                    reason = "Secondary reaction maintained"
+
+            if transitioned:
+                changed = True
+            else:
+                break
+
+        return changed, reason
+
+
+def compute_livermore_state_rows(
+    bars: List[dict],
+    reversal_multiplier: float = DEFAULT_REVERSAL_MULTIPLIER,
+    confirm_multiplier: float = DEFAULT_CONFIRM_MULTIPLIER,
+) -> List[dict]:
+    """Whole-history equivalent of computeLivermoreStateRows()."""
+    engine = LivermoreEngine(reversal_multiplier, confirm_multiplier)
+    return engine.run(sorted(bars, key=lambda bar: bar["date"]))
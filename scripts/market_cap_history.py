@@ -0,0 +1,473 @@
+"""Historical market cap: daily_prices_v2.market_cap = close x point-in-time shares.
+
+backfill_market_cap.py can only stamp today's KIS master Marcap onto old
+rows, and update_today_v3 writes market_cap for the newest bar alone. This
+stage keeps a shares-outstanding history per code and derives every day's
+cap from it, without any per-day API call:
+
+1. ``shares`` collects company_shares_history
+   - DART 주식의 총수 현황 (stockTotqySttus): common shares issued at each
+     quarterly/annual report's settlement date. Reports already stored are
+     not requested again, and at most ``--api-limit`` calls go out per run
+     (DART's daily quota), so repeated runs fill the history in.
+   - the KIS master's listed shares (kis_master_loader ``Shares``), stored
+     at today's date whenever it differs from the code's newest row.
+   daily_prices_v2.close is split-adjusted while those counts are raw, so
+   where a code's count jumps by more than JUMP_TOLERANCE between two rows
+   (a split, bonus or rights issue, a new listing of shares) the older row
+   also gets KIS's unadjusted close of its date (price_date, price_raw).
+   That is one KIS call per jump, not per day.
+
+2. ``build`` turns the history into shares in today's units,
+   S = shares x price_raw / close(price_date), carried between jumps (a
+   code's newest row is already in today's units), then takes one pass over
+   daily_prices_v2: each bar gets the S of the newest row on or before its
+   date (the oldest row's S before that) and market_cap = close x S in won.
+   Only NULL market_cap cells are written unless ``--overwrite`` is given,
+   which also replaces snapshot-stamped values; writes go over COPY when
+   SUPABASE_DB_URL is set (pg_bulk).
+
+Run ``shares`` before ``build``: the newest row of each code is taken to be
+in today's units, which holds once the master's count is stored.
+
+Usage:
+    python3 scripts/market_cap_history.py shares --start-year 2015
+    python3 scripts/market_cap_history.py shares --skip-dart
+    python3 scripts/market_cap_history.py build --start-date 2015-01-01
+    python3 scripts/market_cap_history.py build --overwrite
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+from supabase import Client
+
+import kis_master_loader
+import pg_bulk
+from export_dart_account_ids_all_companies import get_corp_map
+from keyset_pager import fetch_all
+from pipeline_metrics import report_on_exit
+from supabase_batch import chunked, execute_with_retry, get_supabase_client, load_env
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DART_MISSES_FILE = os.path.join(SCRIPT_DIR, "output", "dart_shares_missing.json")
+DART_API_BASE = "https://opendart.fss.or.kr/api"
+DART_INTERVAL_SEC = 0.1
+DEFAULT_API_LIMIT = 9500
+# Report code -> quarter; bsns_year + quarter give the settlement date for
+# December year ends (the response's stlm_dt is used when present).
+REPORT_CODES = {"11013": 1, "11012": 2, "11014": 3, "11011": 4}
+# Reports are filed up to ~90 days after the settlement date; a missing one
+# younger than this is asked for again on the next run.
+FILING_GRACE_DAYS = 120
+DEFAULT_START_YEAR = 2015
+DEFAULT_START_DATE = "2015-01-01"
+# Counts within 1% of each other are treated as the same share base
+# (conversions, small issues) and share the price factor.
+JUMP_TOLERANCE = 0.01
+PRICE_LOOKBACK_DAYS = 20
+MIN_INTERVAL_SEC = 0.06
+WORKERS_PER_KEY = 3
+HISTORY_COLUMNS = (
+    "code", "date", "source", "shares", "bsns_year", "reprt_code", "rcept_no", "price_date", "price_raw"
+)
+WRITE_CHUNK = 100000
+
+
+class DartLimitReached(Exception):
+    pass
+
+
+# ----------------------------------------------------------------------
+# shares: DART reports and the KIS master
+# ----------------------------------------------------------------------
+def parse_count(value) -> Optional[int]:
+    text = str(value or "").replace(",", "").strip()
+    return int(text) if text.isdigit() and int(text) > 0 else None
+
+
+def settlement_date(bsns_year: int, reprt_code: str) -> date:
+    quarter = REPORT_CODES[reprt_code]
+    month = quarter * 3
+    return date(bsns_year, month, 30 if month in (6, 9) else 31)
+
+
+def dart_common_shares(api_key: str, corp_code: str, bsns_year: int, reprt_code: str) -> Optional[dict]:
+    """Common shares issued per one report, or None when DART has no such report."""
+    response = requests.get(
+        f"{DART_API_BASE}/stockTotqySttus.json",
+        params={"crtfc_key": api_key, "corp_code": corp_code, "bsns_year": str(bsns_year), "reprt_code": reprt_code},
+        timeout=30,
+    )
+    response.raise_for_status()
+    data = response.json()
+    status = data.get("status")
+    if status == "020":
+        raise DartLimitReached(data.get("message", "request limit exceeded"))
+    if status != "000":
+        return None
+    for item in data.get("list") or []:
+        if "보통" not in (item.get("se") or ""):
+            continue
+        shares = parse_count(item.get("istc_totqy"))
+        if shares is None:
+            return None
+        stlm_dt = (item.get("stlm_dt") or "").strip()
+        try:
+            settled = datetime.strptime(stlm_dt, "%Y-%m-%d").date()
+        except ValueError:
+            settled = settlement_date(bsns_year, reprt_code)
+        return {
+            "date": settled.isoformat(),
+            "source": "dart",
+            "shares": shares,
+            "bsns_year": bsns_year,
+            "reprt_code": reprt_code,
+            "rcept_no": item.get("rcept_no"),
+        }
+    return None
+
+
+def load_dart_misses() -> set:
+    if not os.path.exists(DART_MISSES_FILE):
+        return set()
+    with open(DART_MISSES_FILE, "r", encoding="utf-8") as f:
+        return set(json.load(f))
+
+
+def save_dart_misses(misses: set) -> None:
+    os.makedirs(os.path.dirname(DART_MISSES_FILE), exist_ok=True)
+    with open(DART_MISSES_FILE, "w", encoding="utf-8") as f:
+        json.dump(sorted(misses), f)
+
+
+def pending_reports(
+    codes: Sequence[str], start_year: int, stored: set, misses: set, today: date
+) -> Iterator[Tuple[str, int, str]]:
+    """(code, year, report code) not yet stored, oldest year first."""
+    for year in range(start_year, today.year + 1):
+        for reprt_code in REPORT_CODES:
+            if settlement_date(year, reprt_code) >= today:
+                continue
+            for code in codes:
+                key = (code, year, reprt_code)
+                if key not in stored and ":".join(map(str, key)) not in misses:
+                    yield key
+
+
+def collect_dart(
+    api_key: str, codes: Sequence[str], history: pd.DataFrame, start_year: int, api_limit: int
+) -> List[dict]:
+    corp_map = get_corp_map(api_key)
+    codes = [code for code in codes if code in corp_map]
+    dart_rows = history[history["source"] == "dart"]
+    stored = set(zip(dart_rows["code"], dart_rows["bsns_year"].astype(int), dart_rows["reprt_code"]))
+    misses = load_dart_misses()
+    today = date.today()
+    print(f"[DART] {len(codes)} codes with a DART corp code, {len(stored):,} reports stored")
+
+    rows: List[dict] = []
+    calls = 0
+    try:
+        for code, year, reprt_code in pending_reports(codes, start_year, stored, misses, today):
+            if calls >= api_limit:
+                print(f"[DART] API limit {api_limit} reached; run again to continue")
+                break
+            row = dart_common_shares(api_key, corp_map[code]["corp_code"], year, reprt_code)
+            calls += 1
+            if row is None:
+                if (today - settlement_date(year, reprt_code)).days > FILING_GRACE_DAYS:
+                    misses.add(f"{code}:{year}:{reprt_code}")
+            else:
+                rows.append({"code": code, **row})
+            if calls % 500 == 0:
+                print(f"   DART {calls:,}건 요청, {len(rows):,}건 수집")
+            time.sleep(DART_INTERVAL_SEC)
+    except DartLimitReached as exc:
+        print(f"[DART] Daily quota reached ({exc}); run again tomorrow to continue")
+    finally:
+        save_dart_misses(misses)
+    print(f"[DART] {calls:,} calls, {len(rows):,} reports collected")
+    return rows
+
+
+def collect_master(history: pd.DataFrame) -> List[dict]:
+    """Today's master count for codes whose newest row has another count."""
+    stocks = kis_master_loader.get_all_stocks()
+    if stocks.empty or "Shares" not in stocks.columns:
+        print("[MASTER] No listed shares in the KIS master")
+        return []
+    today = date.today().isoformat()
+    newest = history.sort_values("date").groupby("code").tail(1).set_index("code")
+    rows = []
+    for code, shares in zip(stocks["Code"].astype(str), stocks["Shares"]):
+        if len(code) != 6 or pd.isna(shares) or shares <= 0:
+            continue
+        if code in newest.index:
+            last = newest.loc[code]
+            if last["date"] >= today or int(last["shares"]) == int(shares):
+                continue
+        rows.append({"code": code, "date": today, "source": "kis_master", "shares": int(shares)})
+    print(f"[MASTER] {len(rows)} codes with a new listed share count")
+    return rows
+
+
+def rows_needing_price(history: pd.DataFrame) -> pd.DataFrame:
+    """Rows whose count differs from the code's next newer row, without a measured price."""
+    ordered = history.sort_values(["code", "date"])
+    newer = ordered.groupby("code")["shares"].shift(-1)
+    jump = (ordered["shares"] / newer - 1).abs() > JUMP_TOLERANCE
+    return ordered[jump & ordered["price_raw"].isna()]
+
+
+def raw_close_on(code: str, on: str) -> Optional[Tuple[str, float]]:
+    """(session date, unadjusted close) of the last session on or before ``on``."""
+    import update_today_v3 as kis
+
+    end = datetime.strptime(on, "%Y-%m-%d")
+    start = end - timedelta(days=PRICE_LOOKBACK_DAYS)
+    bars = kis.get_kis_daily_ohlcv(code, start.strftime("%Y%m%d"), end.strftime("%Y%m%d"), adjusted=False)
+    for bar in bars:  # newest first
+        day = bar.get("stck_bsop_date") or ""
+        close = float(bar.get("stck_clpr") or 0)
+        if day and day <= end.strftime("%Y%m%d") and close > 0:
+            return f"{day[:4]}-{day[4:6]}-{day[6:]}", close
+    return None
+
+
+def measure_prices(rows: pd.DataFrame) -> List[dict]:
+    # Imported here: update_today_v3 exits at import without KIS keys, which build does not need.
+    import update_today_v3 as kis
+
+    if rows.empty:
+        return []
+    kis.key_pool.set_interval(MIN_INTERVAL_SEC)
+    kis.key_pool.warm()
+    records = rows.to_dict("records")
+
+    def measure(record: dict) -> Optional[dict]:
+        try:
+            found = raw_close_on(record["code"], record["date"])
+        except Exception as exc:
+            print(f"  ERROR {record['code']} {record['date']}: {exc}")
+            return None
+        if found is None:
+            return None
+        return {**record, "price_date": found[0], "price_raw": found[1]}
+
+    with ThreadPoolExecutor(max_workers=WORKERS_PER_KEY * len(kis.key_pool)) as pool:
+        measured = [row for row in pool.map(measure, records) if row is not None]
+    print(f"[KIS] Unadjusted close for {len(measured)}/{len(records)} share count jumps")
+    return measured
+
+
+def history_rows(rows: List[dict]) -> List[dict]:
+    """Rows with every history column, so one COPY/upsert covers both sources."""
+    out = []
+    for row in rows:
+        record = {column: row.get(column) for column in HISTORY_COLUMNS}
+        for column in ("bsns_year", "shares"):
+            if record[column] is not None and not pd.isna(record[column]):
+                record[column] = int(record[column])
+        out.append({key: (None if isinstance(value, float) and np.isnan(value) else value) for key, value in record.items()})
+    return out
+
+
+def write_history(supabase: Client, rows: List[dict]) -> None:
+    pg_bulk.upsert(supabase, "company_shares_history", history_rows(rows), on_conflict="code,date")
+
+
+def load_history(supabase: Client) -> pd.DataFrame:
+    rows = fetch_all(supabase, "company_shares_history", ", ".join(HISTORY_COLUMNS), keys=("code", "date"))
+    history = pd.DataFrame(rows, columns=list(HISTORY_COLUMNS))
+    history["shares"] = pd.to_numeric(history["shares"])
+    history["price_raw"] = pd.to_numeric(history["price_raw"])
+    return history
+
+
+def fetch_codes(supabase: Client) -> List[str]:
+    rows = fetch_all(supabase, "companies", "code", keys=("code",), label="companies")
+    return sorted({row["code"] for row in rows if isinstance(row.get("code"), str) and len(row["code"]) == 6})
+
+
+def run_shares(supabase: Client, args: argparse.Namespace) -> None:
+    history = load_history(supabase)
+    print(f"[INFO] company_shares_history: {len(history):,} rows, {history['code'].nunique()} codes")
+
+    if not args.skip_dart:
+        api_key = os.environ.get("DART_API_KEY")
+        if not api_key:
+            raise RuntimeError("DART_API_KEY was not found in .env.local or .env.")
+        dart_rows = collect_dart(api_key, fetch_codes(supabase), history, args.start_year, args.api_limit)
+        write_history(supabase, dart_rows)
+        history = load_history(supabase)
+
+    write_history(supabase, collect_master(history))
+    history = load_history(supabase)
+
+    if not args.skip_prices:
+        write_history(supabase, measure_prices(rows_needing_price(history)))
+
+
+# ----------------------------------------------------------------------
+# build: close x shares over daily_prices_v2
+# ----------------------------------------------------------------------
+def fetch_closes_on(supabase: Client, pairs: pd.DataFrame) -> Dict[Tuple[str, str], float]:
+    """Stored (adjusted) close for (code, price_date) pairs."""
+    closes: Dict[Tuple[str, str], float] = {}
+    for day, group in pairs.groupby("price_date"):
+        for codes in chunked(sorted(set(group["code"])), 200):
+            rows = execute_with_retry(
+                lambda: supabase.table("daily_prices_v2")
+                .select("code, date, close")
+                .eq("date", day)
+                .in_("code", codes)
+                .execute(),
+                f"close {day}",
+            ).data or []
+            for row in rows:
+                if row.get("close"):
+                    closes[(row["code"], row["date"])] = float(row["close"])
+    return closes
+
+
+def current_shares(history: pd.DataFrame, closes: Dict[Tuple[str, str], float]) -> pd.DataFrame:
+    """code, date, shares in today's units (raw count x price factor)."""
+    out = []
+    unresolved = 0
+    for code, rows in history.sort_values("date", ascending=False).groupby("code", sort=False):
+        factor = 1.0
+        newer = None
+        for row in rows.itertuples(index=False):
+            measured = None
+            if not pd.isna(row.price_raw) and row.price_date:
+                adjusted = closes.get((code, row.price_date))
+                if adjusted:
+                    measured = float(row.price_raw) / adjusted
+            if measured is not None:
+                factor = measured
+            elif newer is not None and abs(row.shares / newer - 1) > JUMP_TOLERANCE:
+                unresolved += 1  # keeps the newer factor
+            out.append((code, row.date, float(row.shares) * factor))
+            newer = row.shares
+    if unresolved:
+        print(f"[WARN] {unresolved} share count jumps without a price; run `shares` to measure them")
+    frame = pd.DataFrame(out, columns=["code", "date", "shares"])
+    frame["date"] = pd.to_datetime(frame["date"])
+    return frame
+
+
+def load_prices(supabase: Client, start: str, end: str, workers: int) -> pd.DataFrame:
+    if pg_bulk.enabled():
+        parts = [
+            pd.DataFrame(batch, columns=["code", "date", "close", "market_cap"])
+            for batch in pg_bulk.stream_rows(
+                "select code, date, close, market_cap from public.daily_prices_v2 where date >= %s and date <= %s",
+                (start, end),
+            )
+        ]
+        prices = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=["code", "date", "close", "market_cap"])
+    else:
+        rows = fetch_all(
+            supabase,
+            "daily_prices_v2",
+            "code, date, close, market_cap",
+            start=start,
+            end=end,
+            workers=workers,
+            label="market_cap_history",
+            progress=True,
+        )
+        prices = pd.DataFrame(rows, columns=["code", "date", "close", "market_cap"])
+    prices["date"] = pd.to_datetime(prices["date"])
+    prices["close"] = pd.to_numeric(prices["close"])
+    prices["market_cap"] = pd.to_numeric(prices["market_cap"])
+    return prices
+
+
+def derive_market_caps(prices: pd.DataFrame, shares: pd.DataFrame) -> pd.Series:
+    """close x the shares in effect on each bar's date (NaN for codes without history)."""
+    left = prices[["code", "date"]].reset_index().sort_values("date")
+    right = shares.sort_values("date")
+    matched = pd.merge_asof(left, right, on="date", by="code", direction="backward")
+    # Bars before a code's first row take that row's shares.
+    earliest = right.groupby("code")["shares"].first()
+    matched["shares"] = matched["shares"].fillna(matched["code"].map(earliest))
+    per_bar = matched.set_index("index")["shares"].reindex(prices.index)
+    return (prices["close"] * per_bar).round()
+
+
+def run_build(supabase: Client, args: argparse.Namespace) -> None:
+    history = load_history(supabase)
+    if history.empty:
+        raise SystemExit("company_shares_history is empty; run `market_cap_history.py shares` first")
+    measured = history[history["price_raw"].notna() & history["price_date"].notna()]
+    closes = fetch_closes_on(supabase, measured[["code", "price_date"]])
+    shares = current_shares(history, closes)
+    print(f"[INFO] {len(history):,} share rows for {history['code'].nunique()} codes")
+
+    prices = load_prices(supabase, args.start_date, args.end_date, args.workers)
+    print(f"[INFO] {len(prices):,} bars {args.start_date} ~ {args.end_date}")
+    caps = derive_market_caps(prices, shares)
+
+    target = caps.notna() & (caps > 0)
+    if args.overwrite:
+        target &= ~np.isclose(caps, prices["market_cap"].fillna(-1), rtol=0, atol=1)
+    else:
+        target &= prices["market_cap"].isna()
+    updates = pd.DataFrame(
+        {
+            "code": prices.loc[target, "code"],
+            "date": prices.loc[target, "date"].dt.strftime("%Y-%m-%d"),
+            "market_cap": caps[target].astype("int64"),
+        }
+    )
+    skipped = prices.loc[caps.isna(), "code"].nunique()
+    print(f"[INFO] {len(updates):,} market_cap cells to write ({skipped} codes without share history)")
+
+    records = updates.to_dict("records")
+    for start in range(0, len(records), WRITE_CHUNK):
+        pg_bulk.upsert(supabase, "daily_prices_v2", records[start : start + WRITE_CHUNK], on_conflict="code,date")
+        print(f"   {min(start + WRITE_CHUNK, len(records)):,}/{len(records):,}건 저장")
+    print("[DONE] market_cap history written")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Historical market cap from shares-outstanding history.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    shares = sub.add_parser("shares", help="Collect DART / KIS master share counts into company_shares_history")
+    shares.add_argument("--start-year", type=int, default=DEFAULT_START_YEAR)
+    shares.add_argument("--api-limit", type=int, default=DEFAULT_API_LIMIT, help="DART calls per run")
+    shares.add_argument("--skip-dart", action="store_true", help="Only the KIS master count and price factors")
+    shares.add_argument("--skip-prices", action="store_true", help="Do not fetch unadjusted closes at jumps")
+
+    build = sub.add_parser("build", help="Write daily_prices_v2.market_cap = close x shares")
+    build.add_argument("--start-date", default=DEFAULT_START_DATE, help="YYYY-MM-DD")
+    build.add_argument("--end-date", default=datetime.now().strftime("%Y-%m-%d"), help="YYYY-MM-DD")
+    build.add_argument("--overwrite", action="store_true", help="Rewrite market_cap cells that already have a value")
+    build.add_argument("--workers", type=int, default=4, help="Parallel scan slices (PostgREST only)")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    load_env()
+    report_on_exit(f"market_cap_history_{args.command}")
+    supabase = get_supabase_client()
+    if args.command == "shares":
+        run_shares(supabase, args)
+    else:
+        run_build(supabase, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,539 @@
+"""Chart pattern detectors shared by the batch screener.
+
+Python port of src/utils/patternDetectors.ts (cup-and-handle, trend template,
+VCP, square box, high tight flag). Thresholds, loop orders and the first-hit
+rules are kept as in the TypeScript so a code flagged here shows the same
+badge on the chart page; ``meta`` carries the same keys.
+
+Inputs are one code's bars oldest -> newest as NumPy arrays. Two pieces also
+have matrix forms used by screen_patterns.py over the dense (codes x bars)
+window: ``trend_template_matrix`` evaluates every code at once and
+``swing_flags`` finds VCP swing points with a sliding window instead of the
+nested loop.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+Meta = Dict[str, float]
+DetectResult = Optional[Meta]  # None = not detected
+
+
+@dataclass
+class Bars:
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.close)
+
+    def tail(self, count: int) -> "Bars":
+        return Bars(*(values[-count:] for values in self._arrays()))
+
+    def _arrays(self) -> Tuple[np.ndarray, ...]:
+        return (self.open, self.high, self.low, self.close, self.volume)
+
+
+def _sum(values) -> float:
+    # Left-to-right like the TypeScript reduce (np.sum is pairwise).
+    total = 0.0
+    for value in values:
+        total += float(value)
+    return total
+
+
+def _mean(values) -> float:
+    return _sum(values) / len(values)
+
+
+def trailing_sma(closes: np.ndarray, period: int) -> float:
+    if len(closes) < period:
+        return float("nan")
+    return _sum(closes[len(closes) - period:]) / period
+
+
+def to_weekly(daily: Bars) -> Bars:
+    """Group every 5 bars from the first one (index based, like toWeekly)."""
+    n = len(daily)
+    starts = np.arange(0, n, 5)
+    ends = np.minimum(starts + 5, n) - 1
+    volume = np.array([_sum(daily.volume[s : e + 1]) for s, e in zip(starts, ends)])
+    return Bars(
+        daily.open[starts],
+        np.maximum.reduceat(daily.high, starts),
+        np.minimum.reduceat(daily.low, starts),
+        daily.close[ends],
+        volume,
+    )
+
+
+# ─── V-shape filter ────────────────────────────────────────────────────────
+
+V_SHAPE = {
+    "bottom_threshold_pct": 0.04,
+    "btr_hard": 0.08,
+    "btr_soft": 0.15,
+    "sym_hard": 0.25,
+    "sym_soft": 0.40,
+    "slope_hard": 0.30,
+    "slope_soft": 0.50,
+}
+
+
+def v_shape_penalty(cup: Bars, cup_bottom: float) -> Tuple[float, bool]:
+    """Return (penalty, is_hard_reject) for a cup candidate."""
+    cup_len = len(cup)
+    b_idx = int(np.argmin(cup.low))  # first minimum, as the strict < scan
+
+    bz_price = cup_bottom * (1 + V_SHAPE["bottom_threshold_pct"])
+    btr = int(np.count_nonzero(cup.close <= bz_price)) / cup_len
+
+    l_dur = b_idx
+    r_dur = (cup_len - 1) - b_idx
+    sym_time = min(l_dur, r_dur) / max(l_dur, r_dur) if l_dur > 0 and r_dur > 0 else 0.0
+
+    p_l = cup.close[0]
+    p_r = cup.close[cup_len - 1]
+    s_l = (p_l - cup_bottom) / max(1, l_dur)
+    s_r = (p_r - cup_bottom) / max(1, r_dur)
+    slope_sym = min(s_l, s_r) / max(s_l, s_r) if s_l > 0 and s_r > 0 else 0.0
+
+    curvature_adj = 0.0
+    edge_len = max(1, cup_len // 5)
+    if cup_len >= edge_len * 3:
+        def slope_abs(seg: np.ndarray) -> float:
+            return abs(seg[-1] - seg[0]) / (len(seg) - 1) if len(seg) > 1 else 0.0
+
+        edge_avg = (slope_abs(cup.close[:edge_len]) + slope_abs(cup.close[-edge_len:])) / 2
+        mid_slope = slope_abs(cup.close[edge_len : cup_len - edge_len])
+        if edge_avg > 0:
+            ratio = mid_slope / edge_avg
+            if ratio < 0.5:
+                curvature_adj = -0.5
+            if ratio > 1.5:
+                curvature_adj = 0.5
+
+    penalty = curvature_adj
+    big_hits = 0
+    for value, hard, soft in (
+        (btr, V_SHAPE["btr_hard"], V_SHAPE["btr_soft"]),
+        (sym_time, V_SHAPE["sym_hard"], V_SHAPE["sym_soft"]),
+        (slope_sym, V_SHAPE["slope_hard"], V_SHAPE["slope_soft"]),
+    ):
+        if value < hard:
+            penalty += 2
+            big_hits += 1
+        elif value < soft:
+            penalty += 1
+
+    return penalty, big_hits >= 3 or penalty >= 5
+
+
+# ─── Cup and handle (weekly) ───────────────────────────────────────────────
+
+def detect_cup_and_handle(data: Bars, weekly: Optional[Bars] = None) -> DetectResult:
+    weekly = weekly if weekly is not None else to_weekly(data)
+    n = len(weekly)
+    if n < 15:
+        return None
+
+    current = weekly.close[n - 1]
+    for handle_len in range(1, min(6, n - 14) + 1):
+        h_open = weekly.open[-handle_len:]
+        h_close = weekly.close[-handle_len:]
+        h_volume = weekly.volume[-handle_len:]
+        handle_low = weekly.low[-handle_len:].min()
+        handle_high = weekly.high[-handle_len:].max()
+
+        if current < handle_high * 0.92:
+            continue
+        if handle_len == 1:
+            if h_close[0] >= h_open[0]:
+                continue
+        elif h_close[handle_len - 1] >= h_close[0]:
+            continue
+
+        pre_volume = weekly.volume[max(0, n - handle_len - 5) : n - handle_len]
+        if len(pre_volume) >= 3 and _mean(h_volume) > _mean(pre_volume) * 1.1:
+            continue
+
+        if n - handle_len >= 10:
+            ma10 = _sum(weekly.close[n - handle_len - 10 : n - handle_len]) / 10
+            if handle_low < ma10:
+                continue
+
+        cup_end = n - handle_len
+        max_cup_len = min(65, cup_end - 7)
+        if max_cup_len < 7:
+            continue
+
+        for cup_len in range(7, max_cup_len + 1):
+            cup_start = cup_end - cup_len
+            if cup_start < 7:
+                continue
+
+            third = max(1, cup_len // 3)
+            left_high = weekly.high[cup_start : cup_start + third]
+            mid_high = weekly.high[cup_start + third : cup_end - third]
+            mid_low = weekly.low[cup_start + third : cup_end - third]
+            right_high = weekly.high[cup_end - third : cup_end]
+            if len(left_high) < 1 or len(mid_high) < 1 or len(right_high) < 1:
+                continue
+
+            left_rim = left_high.max()
+            cup_bottom = mid_low.min()
+            right_rim = right_high.max()
+
+            depth = (left_rim - cup_bottom) / left_rim
+            if depth < 0.12 or depth > 0.5:
+                continue
+            if mid_high.max() > left_rim * (1 - depth * 0.40):
+                continue
+            if right_rim < left_rim * 0.80 or right_rim > left_rim * 1.10:
+                continue
+
+            max_handle_drop = (left_rim - cup_bottom) / 3
+            if right_rim <= 0:
+                continue
+            if handle_low > right_rim * 0.95:
+                continue
+            if handle_low < right_rim - max_handle_drop:
+                continue
+
+            cup_mid_price = cup_bottom + (left_rim - cup_bottom) * 0.50
+            if handle_low < cup_mid_price:
+                continue
+
+            prior_low = weekly.low[:cup_start].min()
+            if prior_low <= 0:
+                continue
+            if (left_rim - prior_low) / prior_low < 0.30:
+                continue
+
+            cup = Bars(*(values[cup_start:cup_end] for values in weekly._arrays()))
+            penalty, hard_reject = v_shape_penalty(cup, cup_bottom)
+            if hard_reject:
+                continue
+
+            return {
+                "priorGain": float((left_rim - prior_low) / prior_low),
+                "cupWeeks": cup_len,
+                "cupDepth": float(depth),
+                "rightRimRatio": float(right_rim / left_rim),
+                "vPenalty": float(penalty),
+                "handleWeeks": handle_len,
+                "handleDrop": float((right_rim - handle_low) / right_rim) if right_rim > 0 else 0.0,
+            }
+    return None
+
+
+# ─── Trend template (daily) ────────────────────────────────────────────────
+
+def detect_trend_template(data: Bars) -> DetectResult:
+    n = len(data)
+    if n < 200:
+        return None
+    closes = data.close
+    current = closes[n - 1]
+    ma50 = trailing_sma(closes, 50)
+    ma150 = trailing_sma(closes, 150)
+    ma200 = trailing_sma(closes, 200)
+    if np.isnan(ma50) or np.isnan(ma150) or np.isnan(ma200):
+        return None
+    if current <= ma150 or current <= ma200:
+        return None
+    if ma150 <= ma200:
+        return None
+    ma200_prev = trailing_sma(closes[: n - 20], 200)
+    if np.isnan(ma200_prev) or ma200 <= ma200_prev:
+        return None
+    if ma50 <= ma150 or ma50 <= ma200:
+        return None
+    if current <= ma50:
+        return None
+
+    year_low = data.low[-250:].min()
+    year_high = data.high[-250:].max()
+    if current < year_low * 1.30:
+        return None
+    if current < year_high * 0.75:
+        return None
+
+    return {
+        "ma50": ma50,
+        "ma150": ma150,
+        "ma200": ma200,
+        "ma200Slope": ma200 - ma200_prev,
+        "distFromYearLow": float((current - year_low) / year_low),
+        "distFromYearHigh": float((current - year_high) / year_high),
+    }
+
+
+def trend_template_matrix(
+    close: np.ndarray, high: np.ndarray, low: np.ndarray, lengths: np.ndarray
+) -> np.ndarray:
+    """Trend template for every row of right-aligned (codes x bars) matrices.
+
+    ``lengths`` is each row's bar count; columns before it are padding.
+    Returns a boolean hit per code, identical to ``detect_trend_template``
+    (including its 250-bar minimum): the SMAs are summed left to right with
+    cumsum, not pairwise.
+    """
+    width = close.shape[1]
+    ok = lengths >= TREND_TEMPLATE_DETECTOR.min_bars
+
+    def sma(period: int, end: int) -> np.ndarray:
+        return np.cumsum(close[:, width - end - period : width - end], axis=1)[:, -1] / period
+
+    with np.errstate(invalid="ignore"):
+        current = close[:, -1]
+        ma50, ma150, ma200 = sma(50, 0), sma(150, 0), sma(200, 0)
+        ma200_prev = sma(200, 20)
+        year = slice(width - 250, width)
+        year_low = np.fmin.reduce(low[:, year], axis=1)
+        year_high = np.fmax.reduce(high[:, year], axis=1)
+        hit = (
+            ok
+            & (current > ma150)
+            & (current > ma200)
+            & (ma150 > ma200)
+            & (ma200 > ma200_prev)
+            & (ma50 > ma150)
+            & (ma50 > ma200)
+            & (current > ma50)
+            & (current >= year_low * 1.30)
+            & (current >= year_high * 0.75)
+        )
+    return hit
+
+
+# ─── VCP (daily) ───────────────────────────────────────────────────────────
+
+VCP_LOOKBACK = 325
+VCP_SWING_WIDTH = 5
+
+
+def swing_flags(high: np.ndarray, low: np.ndarray, width: int = VCP_SWING_WIDTH) -> Tuple[np.ndarray, np.ndarray]:
+    """Swing highs/lows for bars [width, n - width): no neighbour within
+    ``width`` bars is strictly higher (lower). Works on 1-D or (codes x bars)."""
+    window = 2 * width + 1
+    centre_high = high[..., width : high.shape[-1] - width]
+    centre_low = low[..., width : low.shape[-1] - width]
+    is_high = sliding_window_view(high, window, axis=-1).max(axis=-1) <= centre_high
+    is_low = sliding_window_view(low, window, axis=-1).min(axis=-1) >= centre_low
+    return is_high, is_low & ~is_high
+
+
+def detect_vcp(data: Bars, flags: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> DetectResult:
+    daily = data.tail(VCP_LOOKBACK)
+    n = len(daily)
+    if n < 60:
+        return None
+    sw = VCP_SWING_WIDTH
+
+    vol50 = _sum(daily.volume[-50:]) / 50
+    recent_avg_vol = _sum(daily.volume[-5:]) / 5
+
+    is_high, is_low = flags if flags is not None else swing_flags(daily.high, daily.low)
+    alt: List[Tuple[int, float, bool]] = []  # (idx, price, is_high)
+    for offset in np.flatnonzero(is_high | is_low):
+        idx = int(offset) + sw
+        point = (idx, float(daily.high[idx]), True) if is_high[offset] else (idx, float(daily.low[idx]), False)
+        if not alt:
+            alt.append(point)
+            continue
+        last = alt[-1]
+        if last[2] == point[2]:
+            if (point[1] > last[1]) if point[2] else (point[1] < last[1]):
+                alt[-1] = point
+        else:
+            alt.append(point)
+
+    current = daily.close[n - 1]
+    year_high = daily.high[-250:].max()
+
+    anchor = next((s for s, pt in enumerate(alt) if pt[2] and pt[1] >= year_high * 0.93), -1)
+    if anchor == -1:
+        return None
+
+    depths: List[float] = []
+    high_prices: List[float] = []
+    low_prices: List[float] = []
+    high_idxs: List[int] = []
+    low_idxs: List[int] = []
+    i = anchor
+    while i + 1 < len(alt) and len(depths) < 6:
+        if not alt[i][2] or alt[i + 1][2]:
+            break
+        h, lo = alt[i][1], alt[i + 1][1]
+        depths.append((h - lo) / h)
+        high_prices.append(h)
+        low_prices.append(lo)
+        high_idxs.append(alt[i][0])
+        low_idxs.append(alt[i + 1][0])
+        i += 2
+
+    t = len(depths)
+    if t < 2 or t > 6:
+        return None
+    if depths[0] < 0.20 or depths[0] > 0.50:
+        return None
+    start_price = high_prices[0]
+    if current < start_price * 0.85 or current > start_price * 1.05:
+        return None
+    if recent_avg_vol >= vol50:
+        return None
+
+    for t_cand in range(t, 1, -1):
+        if any(depths[k] > depths[k - 1] * 1.05 for k in range(1, t_cand)):
+            continue
+        if any(low_prices[k] < low_prices[k - 1] * 0.92 for k in range(1, t_cand)):
+            continue
+        if n - 1 - low_idxs[t_cand - 1] > 40:
+            continue
+        if current <= low_prices[t_cand - 1]:
+            continue
+        pivot_high = high_prices[t_cand - 1]
+        if current > pivot_high * 1.05:
+            continue
+        return {
+            "tCount": t_cand,
+            "t1Depth": depths[0],
+            "lastDepth": depths[t_cand - 1],
+            "pivotHigh": pivot_high,
+            "distFromPivot": float((pivot_high - current) / pivot_high),
+            "volRatio": recent_avg_vol / vol50,
+            "patternDays": low_idxs[t_cand - 1] - high_idxs[0],
+        }
+    return None
+
+
+# ─── Square box (weekly) ───────────────────────────────────────────────────
+
+def detect_square_box(data: Bars, weekly: Optional[Bars] = None) -> DetectResult:
+    weekly = weekly if weekly is not None else to_weekly(data)
+    n = len(weekly)
+    if n < 8:
+        return None
+    current = weekly.close[n - 1]
+
+    for box_len in range(3, min(6, n - 5) + 1):
+        box_high = weekly.high[-box_len:].max()
+        box_low = weekly.low[-box_len:].min()
+        depth = (box_high - box_low) / box_low
+        if depth >= 0.15:
+            continue
+        if current < box_high * 0.95:
+            continue
+        prior_low_window = weekly.low[max(0, n - box_len - 10) : n - box_len]
+        if len(prior_low_window) < 3:
+            continue
+        prior_low = prior_low_window.min()
+        if prior_low <= 0 or (box_high - prior_low) / prior_low < 0.20:
+            continue
+        pre_volume = weekly.volume[max(0, n - box_len - 5) : n - box_len]
+        if len(pre_volume) >= 3 and _mean(weekly.volume[-box_len:]) > _mean(pre_volume):
+            continue
+        return {
+            "boxWeeks": box_len,
+            "boxDepth": float(depth),
+            "priorGain": float((box_high - prior_low) / prior_low),
+            "distFromBoxHigh": float((box_high - current) / box_high),
+        }
+    return None
+
+
+# ─── High tight flag (weekly) ──────────────────────────────────────────────
+
+def detect_high_tight_flag(data: Bars, weekly: Optional[Bars] = None) -> DetectResult:
+    weekly = weekly if weekly is not None else to_weekly(data)
+    n = len(weekly)
+    if n < 7:
+        return None
+    current = weekly.close[n - 1]
+
+    for flag_len in range(3, min(5, n - 4) + 1):
+        flag_high = weekly.high[-flag_len:].max()
+        flag_low = weekly.low[-flag_len:].min()
+        if weekly.close[n - 1] >= weekly.open[n - flag_len]:
+            continue
+        if current < flag_high * 0.90:
+            continue
+        flag_avg_vol = _mean(weekly.volume[-flag_len:])
+
+        for pole_len in range(4, min(8, n - flag_len) + 1):
+            start = n - flag_len - pole_len
+            pole_start_price = weekly.open[start]
+            pole_high = weekly.high[start : n - flag_len].max()
+            if pole_start_price <= 0:
+                continue
+            pole_gain = (pole_high - pole_start_price) / pole_start_price
+            if pole_gain < 1.0:
+                continue
+            flag_drop = (pole_high - flag_low) / pole_high
+            if flag_drop < 0.10 or flag_drop > 0.25:
+                continue
+            pole_avg_vol = _mean(weekly.volume[start : n - flag_len])
+            if flag_avg_vol >= pole_avg_vol:
+                continue
+            return {
+                "poleWeeks": pole_len,
+                "poleGain": float(pole_gain),
+                "flagWeeks": flag_len,
+                "flagDrop": float(flag_drop),
+                "volRatio": flag_avg_vol / pole_avg_vol,
+                "distFromFlagHigh": float((flag_high - current) / flag_high),
+            }
+    return None
+
+
+# ─── Registry ──────────────────────────────────────────────────────────────
+
+@dataclass
+class PatternDetector:
+    id: str
+    label: str
+    short: str
+    min_bars: int
+    detect: Callable[..., DetectResult]
+    weekly: bool = False
+
+
+CUP_HANDLE_DETECTOR = PatternDetector("cup_handle", "컵앤핸들", "C&H", 75, detect_cup_and_handle, weekly=True)
+TREND_TEMPLATE_DETECTOR = PatternDetector("trend_template", "트렌드 템플레이트", "TT", 250, detect_trend_template)
+VCP_DETECTOR = PatternDetector("vcp", "VCP", "VCP", 100, detect_vcp)
+SQUARE_BOX_DETECTOR = PatternDetector("square_box", "스퀘어 박스", "SB", 40, detect_square_box, weekly=True)
+HIGH_TIGHT_FLAG_DETECTOR = PatternDetector(
+    "high_tight_flag", "하이 타이트 플래그", "HTF", 35, detect_high_tight_flag, weekly=True
+)
+
+ALL_DETECTORS: List[PatternDetector] = [
+    CUP_HANDLE_DETECTOR,
+    TREND_TEMPLATE_DETECTOR,
+    VCP_DETECTOR,
+    SQUARE_BOX_DETECTOR,
+    HIGH_TIGHT_FLAG_DETECTOR,
+]
+
+
+def run_detectors(data: Bars, detectors: Optional[List[PatternDetector]] = None) -> Dict[str, Meta]:
+    """Hits only: pattern id -> meta (runDetectors without the misses)."""
+    weekly = None
+    hits: Dict[str, Meta] = {}
+    for detector in detectors or ALL_DETECTORS:
+        if len(data) < detector.min_bars:
+            continue
+        if detector.weekly:
+            weekly = weekly if weekly is not None else to_weekly(data)
+            meta = detector.detect(data, weekly)
+        else:
+            meta = detector.detect(data)
+        if meta is not None:
+            hits[detector.id] = meta
+    return hits
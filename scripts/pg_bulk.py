@@ -0,0 +1,208 @@
+"""Bulk upserts straight into Postgres for backfills and full rebuilds.
+
+PostgREST upserts go out as 500-5,000-row JSON requests. When
+SUPABASE_DB_URL is set (Supabase > Project Settings > Database, the direct
+or session pooler connection string), ``upsert`` instead streams the rows
+with COPY into a temporary staging table and merges them into the target
+with a single INSERT ... ON CONFLICT, so multi-million-row loads run at
+database speed. Without it the same call goes through PostgREST in chunks,
+so scripts can call ``upsert`` either way.
+
+The merge behaves like the PostgREST upsert it replaces:
+
+- only the rows' columns are written (the first row's keys, or
+  ``columns``); other columns keep their value, or get their default on
+  insert;
+- ``on_conflict`` names the key; when a key repeats, the last row wins;
+- ``ignore_duplicates=True`` leaves existing rows alone.
+
+NaN is written as NULL, and whole-number floats (pandas' 12.0) are
+accepted by integer columns.
+
+``stream_rows`` reads a large result set over the same connection through a
+server-side cursor, for scans (backfill_planner) that would take hundreds of
+PostgREST pages.
+
+Needs psycopg 3 (``python3 -m pip install "psycopg[binary]"``) when
+SUPABASE_DB_URL is set. Checked against a local Postgres with
+``scripts/benchmark/pg_bulk_check.py``.
+"""
+
+import os
+import threading
+import time
+from typing import Iterator, List, Optional, Sequence
+
+from supabase import Client
+
+from pipeline_metrics import metrics
+from supabase_batch import chunked, execute_with_retry
+
+DB_URL_ENV = "SUPABASE_DB_URL"
+REST_CHUNK = 1000
+STREAM_BATCH = 50000
+STAGE_TABLE = "_bulk_stage"
+CONNECT_RETRIES = 3
+
+INTEGER_OIDS = {20, 21, 23}  # int8, int2, int4
+JSON_OIDS = {114, 3802}  # json, jsonb
+
+_local = threading.local()
+
+
+def database_url() -> Optional[str]:
+    return os.environ.get(DB_URL_ENV) or None
+
+
+def enabled() -> bool:
+    """True when upserts go over COPY instead of PostgREST."""
+    return database_url() is not None
+
+
+def connect(dsn: Optional[str] = None):
+    try:
+        import psycopg
+    except ModuleNotFoundError as exc:
+        raise RuntimeError(
+            f"{DB_URL_ENV} is set but psycopg is not installed. "
+            'Install it with `python3 -m pip install "psycopg[binary]"`.'
+        ) from exc
+    # No server-side prepared statements: the Supabase transaction pooler
+    # (port 6543) does not keep them between transactions.
+    return psycopg.connect(dsn or database_url(), prepare_threshold=None)
+
+
+def _connection():
+    """This thread's connection, opened on first use and reused."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or conn.closed:
+        conn = _local.conn = connect()
+    return conn
+
+
+def copy_upsert(
+    conn,
+    table: str,
+    rows: List[dict],
+    on_conflict: str,
+    columns: Optional[Sequence[str]] = None,
+    ignore_duplicates: bool = False,
+) -> int:
+    """COPY ``rows`` into a staging table and merge them into ``table`` in one transaction.
+
+    Returns the number of rows inserted or updated.
+    """
+    from psycopg import sql
+    from psycopg.types.json import Jsonb
+
+    if not rows:
+        return 0
+    columns = list(columns or rows[0].keys())
+    keys = [col.strip() for col in on_conflict.split(",")]
+    missing = [key for key in keys if key not in columns]
+    if missing:
+        raise ValueError(f"{table}: conflict columns {missing} are not in the rows")
+
+    # ON CONFLICT cannot touch the same row twice in one statement.
+    latest = {tuple(row.get(key) for key in keys): row for row in rows}
+
+    stage = sql.Identifier(STAGE_TABLE)
+    target = sql.Identifier(*table.split("."))
+    column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+    key_list = sql.SQL(", ").join(map(sql.Identifier, keys))
+    updates = [col for col in columns if col not in keys]
+    if ignore_duplicates or not updates:
+        action = sql.SQL("do nothing")
+    else:
+        action = sql.SQL("do update set ") + sql.SQL(", ").join(
+            sql.SQL("{0} = excluded.{0}").format(sql.Identifier(col)) for col in updates
+        )
+
+    started = time.monotonic()
+    with conn.transaction(), conn.cursor() as cur:
+        # Same column types as the target, none of its constraints or indexes.
+        cur.execute(
+            sql.SQL("create temp table {} on commit drop as select {} from {} with no data").format(
+                stage, column_list, target
+            )
+        )
+        cur.execute(sql.SQL("select * from {}").format(stage))
+        oids = [column.type_code for column in cur.description]
+        integers = [i for i, oid in enumerate(oids) if oid in INTEGER_OIDS]
+        jsons = [i for i, oid in enumerate(oids) if oid in JSON_OIDS]
+        with cur.copy(sql.SQL("copy {} ({}) from stdin").format(stage, column_list)) as copy:
+            for row in latest.values():
+                # v != v only for NaN.
+                values = [None if v != v else v for v in map(row.get, columns)]
+                for i in integers:
+                    if isinstance(values[i], float) and values[i].is_integer():
+                        values[i] = int(values[i])
+                for i in jsons:
+                    if values[i] is not None:
+                        values[i] = Jsonb(values[i])
+                copy.write_row(values)
+        cur.execute(
+            sql.SQL("insert into {} ({}) select {} from {} on conflict ({}) {}").format(
+                target, column_list, column_list, stage, key_list, action
+            )
+        )
+        merged = cur.rowcount
+
+    metrics.record_call("postgres", f"copy:{table}", time.monotonic() - started)
+    metrics.rows_written(table, len(latest))
+    return merged
+
+
+def upsert(
+    supabase: Client,
+    table: str,
+    rows: List[dict],
+    on_conflict: str,
+    ignore_duplicates: bool = False,
+    chunk_size: int = REST_CHUNK,
+    columns: Optional[Sequence[str]] = None,
+) -> None:
+    """Upsert ``rows`` over COPY when SUPABASE_DB_URL is set, else PostgREST in ``chunk_size`` chunks."""
+    if not rows:
+        return
+    if not enabled():
+        for chunk in chunked(rows, chunk_size):
+            execute_with_retry(
+                lambda chunk=chunk: supabase.table(table)
+                .upsert(chunk, on_conflict=on_conflict, ignore_duplicates=ignore_duplicates)
+                .execute(),
+                f"upsert:{table}",
+            )
+        return
+
+    import psycopg
+
+    for attempt in range(CONNECT_RETRIES + 1):
+        conn = _connection()
+        try:
+            copy_upsert(conn, table, rows, on_conflict, columns, ignore_duplicates)
+            return
+        except psycopg.OperationalError as exc:
+            # Connection-level failure; the transaction was rolled back.
+            conn.close()
+            if attempt == CONNECT_RETRIES:
+                raise
+            wait = 2.0 ** attempt
+            metrics.retry("copy")
+            print(f"[WARN] copy:{table} failed ({exc}), retrying in {wait:.1f}s...")
+            time.sleep(wait)
+
+
+def stream_rows(query: str, params: Optional[Sequence] = None, batch_size: int = STREAM_BATCH) -> Iterator[List[tuple]]:
+    """Rows of a read-only query in lists of up to ``batch_size``, over SUPABASE_DB_URL.
+
+    A server-side cursor keeps only one batch in memory at a time.
+    """
+    conn = _connection()
+    with conn.transaction(), conn.cursor(name="pg_bulk_stream") as cur:
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                return
+            yield rows
@@ -0,0 +1,208 @@
+"""Shared in-memory data for the single-process daily pipeline.
+
+The daily steps (ingest -> trading value rank -> RS -> leaders -> indices)
+all read overlapping slices of ``daily_prices_v2``. When they run inside
+``run_daily_pipeline.py`` they share one ``PipelineContext`` instead:
+
+- the recent price window is loaded once, in the background while the KIS
+  ingest is running, and the bars the ingest just wrote are merged into it;
+- the RS-eligible universe comes from the KIS master the ingest already
+  parsed;
+- each step leaves its result on the context for the next one.
+
+Every step still runs standalone with ``ctx=None`` and then reads the
+database exactly as before.
+"""
+
+import contextvars
+import threading
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional
+
+import pandas as pd
+
+from keyset_pager import fetch_all
+from rs_universe import load_rs_eligible_codes
+
+PRICE_FRAME_COLUMNS = ["code", "date", "close", "volume", "trading_value"]
+PRICE_COLUMNS = ", ".join(PRICE_FRAME_COLUMNS)
+# RS needs 252 trading days plus slack, the same window calculate_rs_v2 uses.
+PRICE_WINDOW_DAYS = 400
+PRICE_FETCH_WORKERS = 4
+# Requested rows per page; a lower PostgREST max-rows cap is detected and used.
+PRICE_PAGE_SIZE = 10000
+
+
+def load_price_window(
+    supabase,
+    start_date: str,
+    end_date: str,
+    columns: str = "code, date, close",
+    workers: int = PRICE_FETCH_WORKERS,
+    page_size: int = PRICE_PAGE_SIZE,
+) -> List[dict]:
+    """Read ``daily_prices_v2`` rows between two dates, ordered by (date, code).
+
+    Keyset pages keep every request an index range scan, so the old 31-day
+    windows are no longer needed to stay under the statement timeout; the
+    range is split into ``workers`` date slices fetched in parallel instead.
+    """
+    all_rows = fetch_all(
+        supabase,
+        "daily_prices_v2",
+        columns,
+        keys=("date", "code"),
+        start=start_date,
+        end=end_date,
+        workers=workers,
+        page_size=page_size,
+        label="load_price_window",
+        progress=True,
+    )
+    print(f"✅ 로드 완료: {len(all_rows)}건")
+    return all_rows
+
+
+class PipelineContext:
+    def __init__(self, supabase, target_date: str, window_days: int = PRICE_WINDOW_DAYS):
+        self.supabase = supabase
+        self.target_date = target_date
+        self.window_start = (
+            datetime.strptime(target_date, "%Y-%m-%d") - timedelta(days=window_days)
+        ).strftime("%Y-%m-%d")
+
+        # Step outputs.
+        self.stocks_df: Optional[pd.DataFrame] = None
+        self.eligible_codes: Optional[set] = None
+        self.trading_value_rankings: Optional[pd.DataFrame] = None
+        self.rs_today: Optional[pd.DataFrame] = None
+        self.leaders: Optional[pd.DataFrame] = None
+
+        self._prefetch_thread: Optional[threading.Thread] = None
+        self._prefetch_rows: Optional[List[dict]] = None
+        self._prefetch_error: Optional[Exception] = None
+        self._ingested_rows: List[dict] = []
+        self._reloaded_codes: set = set()
+        self._prices: Optional[pd.DataFrame] = None
+        # Steps may run in parallel; lazy loads happen once under this lock.
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------
+    # Prices
+    # ------------------------------------------------------------------
+    def start_price_prefetch(self) -> None:
+        """Load the price window in a background thread."""
+        with self._lock:
+            if self._prefetch_thread is not None or self._prices is not None:
+                return
+            self._start_prefetch_locked()
+
+    def _start_prefetch_locked(self) -> None:
+        def _load() -> None:
+            try:
+                self._prefetch_rows = load_price_window(
+                    self.supabase, self.window_start, self.target_date, PRICE_COLUMNS
+                )
+            except Exception as exc:
+                self._prefetch_error = exc
+
+        self._prefetch_thread = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(_load,),
+            name="price-prefetch",
+            daemon=True,
+        )
+        self._prefetch_thread.start()
+
+    def record_ingested_rows(
+        self, code: str, rows: Iterable[dict], full_reload: bool = False
+    ) -> None:
+        """Remember bars the ingest wrote so they override the prefetched copy."""
+        if full_reload:
+            self._reloaded_codes.add(str(code))
+        self._ingested_rows.extend(
+            row
+            for row in rows
+            if self.window_start <= row["date"] <= self.target_date
+        )
+
+    @property
+    def reloaded_codes(self) -> frozenset:
+        """Codes whose whole history the ingest rewrote this run (adjusted prices)."""
+        return frozenset(self._reloaded_codes)
+
+    @property
+    def prices(self) -> pd.DataFrame:
+        """Window of ``daily_prices_v2`` as of the end of the ingest step.
+
+        Columns: code, date (Timestamp), close, volume, trading_value.
+        """
+        with self._lock:
+            if self._prices is None:
+                self._prices = self._build_prices()
+            return self._prices
+
+    def _build_prices(self) -> pd.DataFrame:
+        if self._prefetch_thread is None:
+            self._start_prefetch_locked()
+        self._prefetch_thread.join()
+        if self._prefetch_error is not None:
+            raise self._prefetch_error
+
+        base = pd.DataFrame(self._prefetch_rows or [])
+        self._prefetch_rows = None
+        if not base.empty and self._reloaded_codes:
+            # Adjusted histories were rewritten wholesale by the ingest.
+            base = base[~base["code"].astype(str).isin(self._reloaded_codes)]
+
+        ingested = pd.DataFrame(self._ingested_rows)
+        if not ingested.empty:
+            ingested = ingested[[c for c in PRICE_FRAME_COLUMNS if c in ingested.columns]]
+        frames = [df for df in (base, ingested) if not df.empty]
+        if not frames:
+            return pd.DataFrame(columns=PRICE_FRAME_COLUMNS)
+
+        df = pd.concat(frames, ignore_index=True)
+        df["code"] = df["code"].astype(str)
+        df = df.drop_duplicates(subset=["code", "date"], keep="last")
+        df["date"] = pd.to_datetime(df["date"])
+        for column in ("close", "volume", "trading_value"):
+            if column in df.columns:
+                df[column] = pd.to_numeric(df[column], errors="coerce")
+        return df.sort_values(["code", "date"]).reset_index(drop=True)
+
+    def has_bars(self, day) -> bool:
+        """Whether any code has a bar on ``day`` (none on a KRX holiday)."""
+        return bool((self.prices["date"] == pd.Timestamp(day)).any())
+
+    def covers(self, start_date) -> bool:
+        """Whether the in-memory window reaches back to ``start_date``."""
+        if isinstance(start_date, (date, datetime)):
+            start_date = start_date.strftime("%Y-%m-%d")
+        return start_date >= self.window_start
+
+    def price_rows(
+        self,
+        start_date: str,
+        end_date: str,
+        codes: Optional[Iterable[str]] = None,
+        end_inclusive: bool = True,
+    ) -> pd.DataFrame:
+        df = self.prices
+        mask = df["date"] >= pd.Timestamp(start_date)
+        if end_inclusive:
+            mask &= df["date"] <= pd.Timestamp(end_date)
+        else:
+            mask &= df["date"] < pd.Timestamp(end_date)
+        if codes is not None:
+            mask &= df["code"].isin(set(codes))
+        return df[mask]
+
+    # ------------------------------------------------------------------
+    # Universe
+    # ------------------------------------------------------------------
+    def get_eligible_codes(self) -> set:
+        with self._lock:
+            if self.eligible_codes is None:
+                self.eligible_codes = load_rs_eligible_codes(self.supabase)
+            return self.eligible_codes
@@ -0,0 +1,345 @@
+"""Run metrics for the batch scripts: step timings, API calls, rows, retries.
+
+Every script shares the module-level ``metrics`` registry:
+
+    from pipeline_metrics import metrics, instrument_supabase, report_on_exit
+
+    supabase = instrument_supabase(create_client(url, key))
+    report_on_exit("calculate_rs_v2")
+    with metrics.step("load prices"):
+        ...
+    metrics.record_call("kis", path, latency_sec, throttled=False)
+
+Counters and histograms are labelled with the step that was running, so a
+slower nightly run can be traced to a step or to one external API. On exit a
+JSON report is written to scripts/output/pipeline_metrics/, plus a Prometheus
+textfile (<run>.prom) when PIPELINE_METRICS_PROMETHEUS is set.
+"""
+
+import atexit
+import contextlib
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIR = os.path.join(SCRIPT_DIR, "output", "pipeline_metrics")
+PROMETHEUS_ENV = "PIPELINE_METRICS_PROMETHEUS"
+METRIC_PREFIX = "my_stock"
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_step: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "pipeline_step", default=None
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    step = _current_step.get()
+    if step is not None and "step" not in labels:
+        labels = {**labels, "step": step}
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bucket bound holding the q-th observation."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": {str(b): n for b, n in zip(self.buckets, self.counts)},
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Drop everything recorded so far (used between benchmark runs)."""
+        with self._lock:
+            self.started_at = datetime.now()
+            self._started = time.monotonic()
+            self.counters: Dict[str, Dict[LabelKey, float]] = {}
+            self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+            self.steps: list = []
+
+    # -- primitives -------------------------------------------------------
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            series.setdefault(key, Histogram()).observe(value)
+
+    # -- helpers ----------------------------------------------------------
+    def record_call(
+        self,
+        api: str,
+        endpoint: str,
+        latency_sec: float,
+        throttled: bool = False,
+        error: bool = False,
+    ) -> None:
+        """One request to an external API (kis, dart, postgrest, storage)."""
+        self.inc("api_calls_total", api=api, endpoint=endpoint)
+        self.observe("api_latency_seconds", latency_sec, api=api, endpoint=endpoint)
+        if throttled:
+            self.inc("api_throttled_total", api=api, endpoint=endpoint)
+        if error:
+            self.inc("api_errors_total", api=api, endpoint=endpoint)
+
+    def rows_read(self, table: str, count: int) -> None:
+        self.inc("rows_read_total", count, table=table)
+
+    def rows_written(self, table: str, count: int) -> None:
+        self.inc("rows_written_total", count, table=table)
+
+    def retry(self, label: str) -> None:
+        self.inc("retries_total", target=label)
+
+    @contextlib.contextmanager
+    def step(self, name: str):
+        """Time a step and label everything recorded inside it."""
+        token = _current_step.set(name)
+        started = time.monotonic()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "failed"
+            raise
+        finally:
+            _current_step.reset(token)
+            with self._lock:
+                self.steps.append(
+                    {
+                        "name": name,
+                        "status": status,
+                        "duration_sec": round(time.monotonic() - started, 3),
+                    }
+                )
+
+    # -- output -----------------------------------------------------------
+    def snapshot(self, run_name: str) -> dict:
+        with self._lock:
+            return {
+                "run": run_name,
+                "started_at": self.started_at.isoformat(timespec="seconds"),
+                "finished_at": datetime.now().isoformat(timespec="seconds"),
+                "duration_sec": round(time.monotonic() - self._started, 3),
+                "steps": list(self.steps),
+                "counters": [
+                    {"name": name, "labels": dict(key), "value": value}
+                    for name, series in sorted(self.counters.items())
+                    for key, value in sorted(series.items())
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(key), **hist.to_dict()}
+                    for name, series in sorted(self.histograms.items())
+                    for key, hist in sorted(series.items())
+                ],
+            }
+
+    def to_prometheus(self, run_name: str) -> str:
+        lines = []
+
+        def fmt(name: str, labels: Dict[str, str]) -> str:
+            labels = {"run": run_name, **labels}
+            body = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+            return f"{METRIC_PREFIX}_{name}{{{body}}}"
+
+        with self._lock:
+            lines.append(f"# TYPE {METRIC_PREFIX}_step_duration_seconds gauge")
+            for step in self.steps:
+                lines.append(
+                    f"{fmt('step_duration_seconds', {'step': step['name'], 'status': step['status']})} "
+                    f"{step['duration_sec']}"
+                )
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{fmt(name, dict(key))} {value}")
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name} histogram")
+                for key, hist in sorted(series.items()):
+                    labels = dict(key)
+                    cumulative = 0
+                    for bound, n in zip(hist.buckets, hist.counts):
+                        cumulative += n
+                        lines.append(f"{fmt(name + '_bucket', {**labels, 'le': bound})} {cumulative}")
+                    lines.append(f"{fmt(name + '_bucket', {**labels, 'le': '+Inf'})} {hist.count}")
+                    lines.append(f"{fmt(name + '_sum', labels)} {hist.total}")
+                    lines.append(f"{fmt(name + '_count', labels)} {hist.count}")
+            lines.append(
+                f"{fmt('run_duration_seconds', {})} {round(time.monotonic() - self._started, 3)}"
+            )
+        return "\n".join(lines) + "\n"
+
+    def write_report(
+        self,
+        run_name: str,
+        output_dir: str = OUTPUT_DIR,
+        prometheus: Optional[bool] = None,
+    ) -> str:
+        os.makedirs(output_dir, exist_ok=True)
+        stamp = self.started_at.strftime("%Y%m%d_%H%M%S")
+        json_path = os.path.join(output_dir, f"{run_name}_{stamp}.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(run_name), f, ensure_ascii=False, indent=2)
+
+        if prometheus is None:
+            prometheus = os.environ.get(PROMETHEUS_ENV, "").strip().lower() in {"1", "true", "yes"}
+        if prometheus:
+            # Fixed name so a node_exporter textfile collector always sees the latest run.
+            prom_path = os.path.join(output_dir, f"{run_name}.prom")
+            tmp_path = prom_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus(run_name))
+            os.replace(tmp_path, prom_path)
+        return json_path
+
+
+metrics = MetricsRegistry()
+_report_run_name: Optional[str] = None
+
+
+def report_on_exit(run_name: str) -> None:
+    """Write the metrics report when the process exits (first caller wins)."""
+    global _report_run_name
+    if _report_run_name is not None:
+        return
+    _report_run_name = run_name
+
+    def _write() -> None:
+        try:
+            path = metrics.write_report(run_name)
+            print(f"[METRICS] report written: {path}")
+        except Exception as exc:
+            print(f"[METRICS] failed to write report: {exc}")
+
+    atexit.register(_write)
+
+
+_REST_PATH = re.compile(r"/rest/v1/(rpc/)?([^/?]+)")
+_STORAGE_PATH = re.compile(r"/storage/v1/object/(?:public/|sign/)?([^/?]+)")
+_CONTENT_RANGE = re.compile(r"(\d+)-(\d+)/")
+
+
+def _supabase_target(url) -> Tuple[str, str]:
+    path = urlparse(str(url)).path
+    match = _REST_PATH.search(path)
+    if match:
+        return "postgrest", ("rpc/" if match.group(1) else "") + match.group(2)
+    match = _STORAGE_PATH.search(path)
+    if match:
+        return "storage", match.group(1)
+    return "supabase", path
+
+
+def _count_payload_rows(content: bytes) -> int:
+    if not content:
+        return 0
+    if content.lstrip()[:1] == b"[":
+        try:
+            return len(json.loads(content))
+        except ValueError:
+            return 0
+    return 1
+
+
+def instrument_supabase(client, registry: MetricsRegistry = metrics):
+    """Count PostgREST/Storage calls, latency, 429s and row volumes.
+
+    Hooks the underlying httpx sessions, so every ``.execute()`` and storage
+    upload made through ``client`` is recorded without touching call sites.
+    Returns the client for chaining.
+    """
+    if getattr(client, "_metrics_instrumented", False):
+        return client
+
+    def on_request(request) -> None:
+        request.extensions["metrics_started"] = time.monotonic()
+
+    def on_response(response) -> None:
+        request = response.request
+        started = request.extensions.get("metrics_started")
+        latency = time.monotonic() - started if started is not None else 0.0
+        api, endpoint = _supabase_target(request.url)
+        registry.record_call(
+            api,
+            endpoint,
+            latency,
+            throttled=response.status_code == 429,
+            error=response.status_code >= 500,
+        )
+        if api != "postgrest" or endpoint.startswith("rpc/"):
+            return
+        if request.method == "GET":
+            match = _CONTENT_RANGE.match(response.headers.get("content-range", ""))
+            if match:
+                registry.rows_read(endpoint, int(match.group(2)) - int(match.group(1)) + 1)
+        elif request.method in ("POST", "PATCH") and response.status_code < 300:
+            registry.rows_written(endpoint, _count_payload_rows(request.content))
+
+    sessions = [client.postgrest.session]
+    storage_session = getattr(client.storage, "session", None) or getattr(client.storage, "_client", None)
+    if storage_session is not None:
+        sessions.append(storage_session)
+    for session in sessions:
+        session.event_hooks["request"].append(on_request)
+        session.event_hooks["response"].append(on_response)
+
+    client._metrics_instrumented = True
+    return client
@@ -1,10 +1,28 @@
 import os
+import sys
+import subprocess
+import tempfile
 import FinanceDataReader as fdr
 import pandas as pd
 from supabase import create_client, Client
 from dotenv import load_dotenv
-import time
 import json
+import argparse
+from storage_uploader import StorageUploader, load_failed_log
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+parser = argparse.ArgumentParser(description="Supabase Storage JSON 재업로드")
+parser.add_argument(
+    "--failed-log",
+    help="failed_log.json 형식 파일을 주면 전체 대신 해당 종목만 재시도",
+)
+parser.add_argument(
+    "--skip-rs",
+    action="store_true",
+    help="--failed-log 재시도 뒤 update_rs_json.py로 rs 컬럼을 다시 붙이지 않는다",
+)
+args = parser.parse_args()
 
 load_dotenv('.env.local')
 
@@ -19,15 +37,20 @@ supabase: Client = create_client(url, key)
 
 print("🔍 누락된 종목 찾기 시작...")
 
-# 1. KRX 전체 종목 리스트 가져오기
-print("   - KRX 전체 종목 리스트 조회 중...")
-try:
-    df_krx = fdr.StockListing('KRX')
-    all_stocks = df_krx[['Code', 'Name']].set_index('Code')['Name'].to_dict() # {code: name} 형태
-    print(f"     ✅ 전체 대상: {len(all_stocks)}개")
-except Exception as e:
-    print(f"     ❌ 실패: {e}")
-    exit()
+# 1. KRX 전체 종목 리스트 가져오기 (실패 로그가 있으면 그 종목만)
+if args.failed_log:
+    print(f"   - 실패 로그에서 대상 로드 중: {args.failed_log}")
+    all_stocks = {row['code']: row.get('name', '') for row in load_failed_log(args.failed_log)}
+    print(f"     ✅ 재시도 대상: {len(all_stocks)}개")
+else:
+    print("   - KRX 전체 종목 리스트 조회 중...")
+    try:
+        df_krx = fdr.StockListing('KRX')
+        all_stocks = df_krx[['Code', 'Name']].set_index('Code')['Name'].to_dict() # {code: name} 형태
+        print(f"     ✅ 전체 대상: {len(all_stocks)}개")
+    except Exception as e:
+        print(f"     ❌ 실패: {e}")
+        exit()
 
 # 2. Supabase Storage에 이미 있는 파일 목록 가져오기
 print("   - Supabase 저장된 파일 확인 중...")
@@ -74,6 +97,7 @@ START_DATE = '2010-01-01'
 print(f"🚀 안정적인 재업로드 스크립트 시작 (실패 시 기록 남김)...")
 
 failed_stocks = []
+uploader = StorageUploader(supabase)
 
 for idx, (code, name) in enumerate(all_stocks.items()):
     
@@ -99,20 +123,44 @@ for idx, (code, name) in enumerate(all_stocks.items()):
         
         json_data = df.to_json(orient='records')
 
-        # 업로드
-        res = supabase.storage.from_("stocks").upload(
-            file=json_data.encode('utf-8'),
-            path=f"{code}.json",
-            file_options={"content-type": "application/json", "upsert": "true"}
-        )
-        
+        # 업로드 (동시 업로더가 429를 보고 동시성을 조절하며 재시도)
+        uploader.submit(f"{code}.json", json_data, code=code, name=name)
+
     except Exception as e:
         # ★ 실패 시 멈추지 않고 리스트에 적어두고 넘어감
         print(f"   ❌ {name}({code}) 실패: {str(e)[:50]}...")
         failed_stocks.append({"code": code, "name": name, "error": str(e)})
-        
-    # 속도 조절 (너무 빠르면 에러남)
-    time.sleep(0.1)
+
+failed_stocks.extend(uploader.close())
+
+# 가격만으로 다시 만든 파일에는 update_rs_json.py가 붙인 rs가 없다.
+# RS 순위는 전체 종목 기준이라, 다시 올린 종목만 update_rs_json.py로 rs를 다시 붙인다.
+if args.failed_log and not args.skip_rs:
+    failed_codes = {row['code'] for row in failed_stocks}
+    replayed = [{"code": code, "name": name} for code, name in all_stocks.items() if code not in failed_codes]
+    if replayed:
+        print(f"\n🧮 다시 올린 {len(replayed)}개 종목에 RS 재적용 (update_rs_json.py)...")
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False, encoding='utf-8') as f:
+            json.dump(replayed, f, ensure_ascii=False)
+            replay_log = f.name
+        # 실패 기록은 새 임시 경로로 받는다 (cwd의 failed_log.json은 방금 재시도한 입력일 수 있다)
+        rs_failures = replay_log[:-len('.json')] + '.failed.json'
+        try:
+            rs_run = subprocess.run([
+                sys.executable, os.path.join(SCRIPT_DIR, 'update_rs_json.py'),
+                '--failed-log', replay_log, '--failures-out', rs_failures,
+            ])
+            if rs_run.returncode != 0:
+                # update_rs_json.py가 실패 종목을 남기기 전에 죽었으면 다시 올린 종목 전체를 재시도 대상으로
+                try:
+                    rs_failed = load_failed_log(rs_failures)
+                except (OSError, ValueError):
+                    rs_failed = [dict(row, error="update_rs_json.py failed") for row in replayed]
+                failed_stocks.extend(row for row in rs_failed if row['code'] not in failed_codes)
+        finally:
+            for path in (replay_log, rs_failures):
+                if os.path.exists(path):
+                    os.remove(path)
 
 # 결과 리포트
 print("\n" + "="*30)
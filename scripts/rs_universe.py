@@ -1,28 +1,19 @@
 """Shared helpers that keep RS rankings limited to the stock universe."""
 
-PAGE_SIZE = 1000
+from keyset_pager import fetch_all
 
 
 def load_rs_eligible_codes(supabase) -> set[str]:
     """Load every company code explicitly marked as eligible for RS."""
-    codes: set[str] = set()
-    offset = 0
-
-    while True:
-        response = (
-            supabase.table("companies")
-            .select("code")
-            .eq("is_rs_eligible", True)
-            .order("code")
-            .range(offset, offset + PAGE_SIZE - 1)
-            .execute()
-        )
-        rows = response.data or []
-        codes.update(str(row["code"]) for row in rows if row.get("code"))
-
-        if len(rows) < PAGE_SIZE:
-            break
-        offset += PAGE_SIZE
+    rows = fetch_all(
+        supabase,
+        "companies",
+        "code",
+        keys=("code",),
+        filters=lambda q: q.eq("is_rs_eligible", True),
+        label="rs_universe",
+    )
+    codes = {str(row["code"]) for row in rows if row.get("code")}
 
     if not codes:
         raise RuntimeError(
@@ -0,0 +1,382 @@
+"""Run the daily post-close chain in a single Python process.
+
+Replaces the five interpreter launches in run_daily_stock_local.sh. The steps
+share one PipelineContext (see pipeline_context.py), so prices, the RS
+universe and RS results are passed in memory instead of re-read from
+Supabase, and each step's wall time is printed to the launchd log.
+
+Steps are declared with the data they read and write and run as a
+dependency graph: trading value rank and RS both start as soon as prices
+are ingested, and group indices overlap with the leader calculation. A
+failing step is retried, its dependents are skipped, and the run state is
+kept in scripts/output/daily_pipeline_state/<date>.json so ``--resume``
+only reruns what did not finish.
+
+Step durations, KIS/DART/PostgREST call counts and latencies, rows read and
+written, retries and 429s are collected per step (pipeline_metrics.py) and
+written to scripts/output/pipeline_metrics/ at the end of the run;
+``--prometheus`` also writes daily_pipeline.prom for a textfile collector.
+
+Usage:
+    python3 scripts/run_daily_pipeline.py
+    python3 scripts/run_daily_pipeline.py --date 2026-07-10
+    python3 scripts/run_daily_pipeline.py --date 2026-07-10 --resume
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+if SCRIPT_DIR not in sys.path:
+    sys.path.append(SCRIPT_DIR)
+
+from pipeline_metrics import instrument_supabase, metrics  # noqa: E402
+
+LOG_PREFIX = "[daily-pipeline]"
+STATE_DIR = os.path.join(SCRIPT_DIR, "output", "daily_pipeline_state")
+
+
+def log(message: str) -> None:
+    print(f"{datetime.now():%Y-%m-%d %H:%M:%S} {LOG_PREFIX} {message}", flush=True)
+
+
+def load_env() -> None:
+    env_path = os.path.join(PROJECT_ROOT, ".env.local")
+    if not os.path.exists(env_path):
+        env_path = os.path.join(PROJECT_ROOT, ".env")
+    load_dotenv(dotenv_path=env_path)
+
+
+def step_ingest(ctx) -> None:
+    import update_today_v3
+
+    update_today_v3.main(ctx)
+
+
+def no_bars_on_target_date(ctx) -> bool:
+    """True, logged, when the ingest left no bars on the target date (a KRX
+    holiday): the per-day steps then have nothing to compute."""
+    if ctx.has_bars(ctx.target_date):
+        return False
+    log(f"No bars for {ctx.target_date} (market holiday?), nothing to compute")
+    return True
+
+
+def step_partitions(ctx) -> None:
+    """Create next year's daily_prices_v2 partition if it is missing.
+
+    Idempotent; without it next year's bars would land in
+    daily_prices_v2_default and year pruning would stop helping.
+    """
+    from supabase_batch import execute_with_retry
+
+    year = int(ctx.target_date[:4]) + 1
+    execute_with_retry(
+        lambda: ctx.supabase.rpc("ensure_daily_prices_v2_partition", {"p_year": year}).execute(),
+        "ensure_daily_prices_v2_partition",
+    )
+
+
+def step_trading_value_rank(ctx) -> None:
+    import calculate_trading_value_rank
+
+    if no_bars_on_target_date(ctx):
+        return
+    result = calculate_trading_value_rank.run(
+        ctx.supabase, ctx.target_date, ctx.target_date, ctx
+    )
+    if result is None:
+        raise RuntimeError("trading value ranks were not produced")
+
+
+def step_rs(ctx) -> None:
+    import calculate_rs_v2
+
+    if no_bars_on_target_date(ctx):
+        return
+    if calculate_rs_v2.run(ctx.supabase, ctx.target_date, ctx) is None:
+        raise RuntimeError(f"no RS rows for {ctx.target_date}")
+
+
+def step_leaders(ctx) -> None:
+    import calculate_leader_stocks_daily
+
+    if no_bars_on_target_date(ctx):
+        return
+    calculate_leader_stocks_daily.run_from_context(ctx)
+
+
+def step_group_indices(ctx) -> None:
+    import update_group_indices_daily
+
+    update_group_indices_daily.main(ctx)
+
+
+def step_indicators(ctx) -> None:
+    import update_daily_indicators
+
+    update_daily_indicators.run(ctx.supabase, ctx.target_date, ctx)
+
+
+def step_livermore(ctx) -> None:
+    import update_livermore_states
+
+    update_livermore_states.run(ctx.supabase, ctx.target_date, ctx)
+
+
+def step_patterns(ctx) -> None:
+    import screen_patterns
+
+    screen_patterns.run(ctx.supabase, ctx.target_date, ctx)
+
+
+def step_forward_highs(ctx) -> None:
+    import update_forward_high_returns
+
+    update_forward_high_returns.run(ctx.supabase, ctx.target_date, ctx)
+
+
+def step_trading_metrics(ctx) -> None:
+    import calculate_trading_metrics
+
+    calculate_trading_metrics.run(ctx.supabase, ctx.target_date, ctx)
+
+
+def step_portfolio_snapshots(ctx) -> None:
+    import update_portfolio_snapshots
+
+    update_portfolio_snapshots.run(ctx.supabase, ctx.target_date, ctx)
+
+
+@dataclass
+class Step:
+    key: str
+    name: str
+    run: Callable
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+    retries: int = 1
+
+
+STEPS = [
+    Step("partitions", "Ensure Price Partitions", step_partitions),
+    Step("ingest", "Update Stock Data (V3)", step_ingest,
+         outputs=("daily_prices_v2", "companies")),
+    Step("trading_value_rank", "Calculate Trading Value Rank", step_trading_value_rank,
+         inputs=("daily_prices_v2",), outputs=("trading_value_rankings",)),
+    Step("rs", "Calculate RS (V2)", step_rs,
+         inputs=("daily_prices_v2", "companies"), outputs=("rs_rankings_v2",)),
+    Step("leaders", "Calculate Leader Stocks (Daily)", step_leaders,
+         inputs=("daily_prices_v2", "rs_rankings_v2"), outputs=("leader_stocks_daily",)),
+    Step("group_indices", "Update Market Indices (Daily)", step_group_indices,
+         inputs=("daily_prices_v2",), outputs=("equal_weight_indices",)),
+    Step("indicators", "Update Daily Indicators", step_indicators,
+         inputs=("daily_prices_v2", "companies"), outputs=("daily_indicators",)),
+    Step("livermore", "Update Livermore States", step_livermore,
+         inputs=("daily_prices_v2", "companies"), outputs=("livermore_state_daily",)),
+    Step("patterns", "Screen Chart Patterns", step_patterns,
+         inputs=("daily_prices_v2", "companies"), outputs=("pattern_screen_results",)),
+    Step("forward_highs", "Update Forward High Returns", step_forward_highs,
+         inputs=("daily_prices_v2", "companies"), outputs=("forward_high_returns",)),
+    Step("trading_metrics", "Calculate Group Trading Metrics", step_trading_metrics,
+         inputs=("daily_prices_v2",), outputs=("theme_trading_metrics", "industry_trading_metrics")),
+    Step("portfolio_snapshots", "Update Portfolio Snapshots", step_portfolio_snapshots,
+         inputs=("daily_prices_v2",), outputs=("user_portfolio_snapshots", "user_portfolio_nav")),
+]
+
+
+def build_dependencies(steps: List[Step]) -> Dict[str, set]:
+    """Map each step to the steps producing its inputs."""
+    producers: Dict[str, str] = {}
+    for step in steps:
+        for output in step.outputs:
+            if output in producers:
+                raise ValueError(f"{output} is produced by both {producers[output]} and {step.key}")
+            producers[output] = step.key
+    return {
+        step.key: {producers[name] for name in step.inputs if name in producers}
+        for step in steps
+    }
+
+
+class RunState:
+    """Per-date step status persisted as JSON for --resume."""
+
+    def __init__(self, target_date: str, resume: bool):
+        self.path = os.path.join(STATE_DIR, f"{target_date}.json")
+        self._lock = threading.Lock()
+        self.data = {"target_date": target_date, "steps": {}}
+        if resume and os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+
+    def is_done(self, key: str) -> bool:
+        return self.data["steps"].get(key, {}).get("status") == "done"
+
+    def record(self, key: str, status: str, **fields) -> None:
+        with self._lock:
+            self.data["steps"][key] = {
+                "status": status,
+                "updated_at": datetime.now().isoformat(timespec="seconds"),
+                **fields,
+            }
+            os.makedirs(STATE_DIR, exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+
+
+def run_step_with_retry(step: Step, ctx, state: RunState, retry_delay_sec: float) -> float:
+    started = time.monotonic()
+    for attempt in range(step.retries + 1):
+        log(f"START {step.name}" + (f" (retry {attempt})" if attempt else ""))
+        state.record(step.key, "running", attempt=attempt)
+        try:
+            with metrics.step(step.key):
+                step.run(ctx)
+        except Exception as exc:
+            if attempt >= step.retries:
+                elapsed = time.monotonic() - started
+                state.record(step.key, "failed", error=str(exc), elapsed_sec=round(elapsed, 1))
+                log(f"FAILED {step.name} after {elapsed:.1f}s: {exc}")
+                raise
+            wait_sec = retry_delay_sec * (2 ** attempt)
+            metrics.retry(f"step:{step.key}")
+            log(f"RETRY {step.name} in {wait_sec:.0f}s: {exc}")
+            time.sleep(wait_sec)
+            continue
+
+        elapsed = time.monotonic() - started
+        state.record(step.key, "done", elapsed_sec=round(elapsed, 1))
+        log(f"DONE  {step.name} ({elapsed:.1f}s)")
+        return elapsed
+    raise AssertionError("unreachable")
+
+
+def run_graph(
+    steps: List[Step],
+    ctx,
+    state: RunState,
+    max_workers: int,
+    retry_delay_sec: float,
+) -> Tuple[Dict[str, float], Dict[str, str]]:
+    """Run steps as soon as their dependencies are done.
+
+    Returns (timings, problems) where problems maps failed or skipped step
+    keys to a reason.
+    """
+    deps = build_dependencies(steps)
+    by_key = {step.key: step for step in steps}
+    done = {step.key for step in steps if state.is_done(step.key)}
+    for step in steps:
+        if step.key in done:
+            log(f"SKIP  {step.name} (already done)")
+
+    timings: Dict[str, float] = {}
+    problems: Dict[str, str] = {}
+    pending = [step.key for step in steps if step.key not in done]
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline-step") as pool:
+        while pending or running:
+            for key in list(pending):
+                blocked = deps[key] & set(problems)
+                if blocked:
+                    pending.remove(key)
+                    problems[key] = f"skipped: {', '.join(sorted(blocked))} did not finish"
+                    state.record(key, "skipped", reason=problems[key])
+                    log(f"SKIP  {by_key[key].name} ({problems[key]})")
+                elif deps[key] <= done:
+                    pending.remove(key)
+                    future = pool.submit(
+                        run_step_with_retry, by_key[key], ctx, state, retry_delay_sec
+                    )
+                    running[future] = key
+
+            if not running:
+                continue
+
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                key = running.pop(future)
+                try:
+                    timings[key] = future.result()
+                    done.add(key)
+                except Exception as exc:
+                    problems[key] = str(exc)
+
+    return timings, problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the daily stock pipeline in one process.")
+    parser.add_argument(
+        "--date",
+        default=datetime.now().strftime("%Y-%m-%d"),
+        help="Target trading date (YYYY-MM-DD). Defaults to today.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip steps already recorded as done for this date.",
+    )
+    parser.add_argument("--max-workers", type=int, default=2)
+    parser.add_argument("--retries", type=int, default=1, help="Retries per step.")
+    parser.add_argument("--retry-delay", type=float, default=30.0)
+    parser.add_argument(
+        "--prometheus",
+        action="store_true",
+        help="Also write a Prometheus textfile next to the JSON metrics report.",
+    )
+    args = parser.parse_args()
+
+    load_env()
+    # update_today_v3 validates Supabase/KIS env vars and builds its client
+    # at import time, so import it only after the env file is loaded.
+    import update_today_v3
+    from pipeline_context import PipelineContext
+
+    ctx = PipelineContext(instrument_supabase(update_today_v3.supabase), args.date)
+    state = RunState(args.date, resume=args.resume)
+    for step in STEPS:
+        step.retries = args.retries
+
+    log(f"Job started (target date: {args.date})")
+    job_started = time.monotonic()
+    timings, problems = run_graph(STEPS, ctx, state, args.max_workers, args.retry_delay)
+
+    log("Step timings:")
+    for step in STEPS:
+        if step.key in timings:
+            log(f"  {step.name:<34} {timings[step.key]:8.1f}s")
+        elif step.key in problems:
+            status = "SKIPPED" if problems[step.key].startswith("skipped") else "FAILED"
+            log(f"  {step.name:<34} {status:>9}")
+    elapsed = time.monotonic() - job_started
+
+    try:
+        report_path = metrics.write_report(
+            "daily_pipeline", prometheus=args.prometheus or None
+        )
+        log(f"Metrics report: {report_path}")
+    except Exception as exc:
+        log(f"Failed to write metrics report: {exc}")
+
+    if problems:
+        log(f"Job finished with errors ({elapsed:.1f}s). Rerun with --resume --date {args.date}")
+        sys.exit(1)
+    log(f"Job completed ({elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -42,9 +42,8 @@ run_step() {
 }
 
 log "Job started"
-run_step "Update Stock Data (V3)" "scripts/update_today_v3.py"
-run_step "Calculate Trading Value Rank" "scripts/calculate_trading_value_rank.py"
-run_step "Calculate RS (V2)" "scripts/calculate_rs_v2.py"
-run_step "Calculate Leader Stocks (Daily)" "scripts/calculate_leader_stocks_daily.py"
-run_step "Update Market Indices (Daily)" "scripts/update_group_indices_daily.py"
+# The five daily steps (update_today_v3 -> trading value rank -> RS v2 ->
+# leader stocks -> group indices) run in one Python process that shares
+# prices and RS results in memory. Per-step timings are logged by the runner.
+run_step "Daily Pipeline" "scripts/run_daily_pipeline.py"
 log "Job completed"
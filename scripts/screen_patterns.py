@@ -0,0 +1,336 @@
+"""Screen every stock for chart patterns and store the day's hits.
+
+The chart page runs ``runDetectors`` (src/utils/patternDetectors.ts) one
+stock at a time on its latest 500 bars, so "which stocks show a VCP today"
+meant loading thousands of charts. This batch runs the ported detectors
+(pattern_detectors.py) over the whole RS universe and writes the hits to
+``pattern_screen_results``.
+
+The detectors only ever look at the trailing 500 bars, so the screener
+keeps that window as a dense (codes x bars) matrix in
+scripts/output/pattern_screener/window.npz and each day shifts in only the
+new bars. Trend template and the VCP swing points are evaluated on the
+matrix for all codes at once; the remaining searches run per code in a
+process pool.
+
+A code's window is re-read when it is not cached yet, when its cached last
+close no longer matches daily_prices_v2 (adjusted history reload) or with
+``--rebuild``.
+
+Usage:
+    python3 scripts/screen_patterns.py
+    python3 scripts/screen_patterns.py --date 2026-10-16 --workers 4
+"""
+
+import argparse
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from supabase import Client
+
+from pattern_detectors import (
+    ALL_DETECTORS,
+    TREND_TEMPLATE_DETECTOR,
+    VCP_LOOKBACK,
+    VCP_DETECTOR,
+    Bars,
+    detect_trend_template,
+    run_detectors,
+    swing_flags,
+    trend_template_matrix,
+)
+from pipeline_metrics import report_on_exit
+from rs_universe import load_rs_eligible_codes
+from supabase_batch import (
+    CLOSE_TOLERANCE,
+    chunked,
+    execute_with_retry,
+    fetch_bars,
+    get_supabase_client,
+    load_env,
+    upsert_rows,
+)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_PATH = os.path.join(SCRIPT_DIR, "output", "pattern_screener", "window.npz")
+# Same window as the chart page's pattern scan (.limit(500)).
+WINDOW_BARS = 500
+# Calendar days that comfortably hold WINDOW_BARS sessions.
+WINDOW_FETCH_DAYS = 800
+# Codes per daily_prices_v2 request when advancing the window.
+INCREMENTAL_CODE_CHUNK = 200
+WINDOW_CODE_CHUNK = 20
+SCREEN_CODE_CHUNK = 100
+FIELDS = ("open", "high", "low", "close", "volume")
+BAR_COLUMNS = "code, date, open, high, low, close, volume"
+MIN_BARS = min(detector.min_bars for detector in ALL_DETECTORS)
+
+
+def normalize_bar(bar: dict) -> Tuple[float, ...]:
+    """Same fallbacks as the chart page: empty/zero OHLC -> close, volume -> 0."""
+    close = bar["close"]
+    return (
+        bar.get("open") or close,
+        bar.get("high") or close,
+        bar.get("low") or close,
+        close,
+        bar.get("volume") or 0.0,
+    )
+
+
+class PatternWindow:
+    """Each code's trailing bars, right-aligned in a (codes x WINDOW_BARS x 5) array."""
+
+    def __init__(self, codes: List[str], width: int = WINDOW_BARS):
+        self.codes = list(codes)
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        self.values = np.full((len(self.codes), width, len(FIELDS)), np.nan)
+        self.lengths = np.zeros(len(self.codes), dtype=np.int64)
+        self.last_dates: List[str] = [""] * len(self.codes)
+
+    @property
+    def width(self) -> int:
+        return self.values.shape[1]
+
+    def field(self, name: str) -> np.ndarray:
+        return self.values[:, :, FIELDS.index(name)]
+
+    def last_close(self, i: int) -> float:
+        return float(self.values[i, -1, FIELDS.index("close")])
+
+    def set_bars(self, code: str, bars: List[dict]) -> None:
+        i = self.index[code]
+        bars = bars[-self.width:]
+        self.values[i] = np.nan
+        self.lengths[i] = len(bars)
+        self.last_dates[i] = bars[-1]["date"] if bars else ""
+        if bars:
+            self.values[i, -len(bars):] = [normalize_bar(bar) for bar in bars]
+
+    def push(self, code: str, bars: List[dict]) -> None:
+        """Shift in bars newer than the code's last date."""
+        i = self.index[code]
+        for bar in bars:
+            self.values[i, :-1] = self.values[i, 1:]
+            self.values[i, -1] = normalize_bar(bar)
+            self.lengths[i] = min(self.lengths[i] + 1, self.width)
+            self.last_dates[i] = bar["date"]
+
+    def bars(self, i: int) -> Bars:
+        row = self.values[i, self.width - self.lengths[i]:]
+        return Bars(*(np.ascontiguousarray(row[:, k]) for k in range(len(FIELDS))))
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            codes=np.array(self.codes),
+            values=self.values,
+            lengths=self.lengths,
+            last_dates=np.array(self.last_dates),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, codes: List[str]) -> "PatternWindow":
+        """Cached rows for ``codes``; codes missing from the cache come back empty."""
+        window = cls(codes)
+        if not os.path.exists(path):
+            return window
+        with np.load(path, allow_pickle=False) as cached:
+            values = cached["values"]
+            if values.shape[1] != window.width:
+                return window
+            lengths = cached["lengths"]
+            last_dates = cached["last_dates"].tolist()
+            for j, code in enumerate(cached["codes"].tolist()):
+                i = window.index.get(code)
+                if i is None:
+                    continue
+                window.values[i] = values[j]
+                window.lengths[i] = lengths[j]
+                window.last_dates[i] = last_dates[j]
+        return window
+
+
+def refresh_window(
+    supabase: Client,
+    window: PatternWindow,
+    target_date: str,
+    reload_codes: Iterable[str] = (),
+) -> Dict[str, int]:
+    """Bring every code's window up to ``target_date``."""
+    reload = set(reload_codes)
+    to_reload: List[str] = []
+    by_last_date: Dict[str, List[str]] = defaultdict(list)
+    for i, code in enumerate(window.codes):
+        last_date = window.last_dates[i]
+        if not last_date or code in reload or last_date > target_date:
+            to_reload.append(code)
+        elif last_date < target_date:
+            by_last_date[last_date].append(code)
+
+    advanced = mismatched = 0
+    for last_date, group in sorted(by_last_date.items()):
+        for chunk in chunked(group, INCREMENTAL_CODE_CHUNK):
+            bars_by_code = fetch_bars(supabase, chunk, last_date, target_date, BAR_COLUMNS)
+            for code in chunk:
+                bars = bars_by_code.get(code, [])
+                if (
+                    not bars
+                    or bars[0]["date"] != last_date
+                    or abs(bars[0]["close"] - window.last_close(window.index[code])) > CLOSE_TOLERANCE
+                ):
+                    mismatched += 1
+                    to_reload.append(code)
+                    continue
+                if len(bars) > 1:
+                    window.push(code, bars[1:])
+                    advanced += 1
+
+    start_date = (
+        datetime.strptime(target_date, "%Y-%m-%d") - timedelta(days=WINDOW_FETCH_DAYS)
+    ).strftime("%Y-%m-%d")
+    for n, chunk in enumerate(chunked(to_reload, WINDOW_CODE_CHUNK), start=1):
+        bars_by_code = fetch_bars(supabase, chunk, start_date, target_date, BAR_COLUMNS)
+        for code in chunk:
+            window.set_bars(code, bars_by_code.get(code, []))
+        print(f"   window loaded {min(n * WINDOW_CODE_CHUNK, len(to_reload))}/{len(to_reload)} codes", end="\r")
+    if to_reload:
+        print()
+    return {"advanced": advanced, "reloaded": len(to_reload), "mismatched": mismatched}
+
+
+def _screen_chunk(args) -> List[Tuple[str, str, dict]]:
+    codes, values, lengths, trend_hits, vcp_high, vcp_low = args
+    width = values.shape[1]
+    others = [d for d in ALL_DETECTORS if d.id not in (TREND_TEMPLATE_DETECTOR.id, VCP_DETECTOR.id)]
+    hits: List[Tuple[str, str, dict]] = []
+    for i, code in enumerate(codes):
+        row = values[i, width - lengths[i]:]
+        bars = Bars(*(np.ascontiguousarray(row[:, k]) for k in range(len(FIELDS))))
+        for pattern_id, meta in run_detectors(bars, others).items():
+            hits.append((code, pattern_id, meta))
+        if trend_hits[i]:
+            hits.append((code, TREND_TEMPLATE_DETECTOR.id, detect_trend_template(bars)))
+        if lengths[i] >= VCP_DETECTOR.min_bars:
+            flags = (vcp_high[i], vcp_low[i]) if lengths[i] >= VCP_LOOKBACK else None
+            meta = VCP_DETECTOR.detect(bars, flags)
+            if meta is not None:
+                hits.append((code, VCP_DETECTOR.id, meta))
+    return hits
+
+
+def screen_window(window: PatternWindow, target_date: str, workers: int) -> List[Tuple[str, str, dict]]:
+    """Run all detectors for codes that have a bar on ``target_date``."""
+    active = np.array(
+        [i for i, d in enumerate(window.last_dates) if d == target_date and window.lengths[i] >= MIN_BARS],
+        dtype=np.int64,
+    )
+    if active.size == 0:
+        return []
+
+    values = window.values[active]
+    lengths = window.lengths[active]
+    trend_hits = trend_template_matrix(
+        values[:, :, FIELDS.index("close")],
+        values[:, :, FIELDS.index("high")],
+        values[:, :, FIELDS.index("low")],
+        lengths,
+    )
+    tail = values[:, -VCP_LOOKBACK:]
+    vcp_high, vcp_low = swing_flags(tail[:, :, FIELDS.index("high")], tail[:, :, FIELDS.index("low")])
+
+    codes = [window.codes[i] for i in active]
+    tasks = [
+        (
+            codes[s : s + SCREEN_CODE_CHUNK],
+            values[s : s + SCREEN_CODE_CHUNK],
+            lengths[s : s + SCREEN_CODE_CHUNK],
+            trend_hits[s : s + SCREEN_CODE_CHUNK],
+            vcp_high[s : s + SCREEN_CODE_CHUNK],
+            vcp_low[s : s + SCREEN_CODE_CHUNK],
+        )
+        for s in range(0, len(codes), SCREEN_CODE_CHUNK)
+    ]
+    if workers <= 1 or len(tasks) == 1:
+        results = map(_screen_chunk, tasks)
+        return [hit for chunk in results for hit in chunk]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [hit for chunk in pool.map(_screen_chunk, tasks) for hit in chunk]
+
+
+def upload_hits(supabase: Client, target_date: str, hits: List[Tuple[str, str, dict]]) -> None:
+    # Replace the day's hits so a rerun drops codes that no longer match.
+    execute_with_retry(
+        lambda: supabase.table("pattern_screen_results").delete().eq("date", target_date).execute(),
+        "delete:pattern_screen_results",
+    )
+    rows = [
+        {"date": target_date, "code": code, "pattern_id": pattern_id, "meta": meta}
+        for code, pattern_id, meta in hits
+    ]
+    if rows:
+        upsert_rows(supabase, "pattern_screen_results", rows, "date,code,pattern_id")
+
+
+def run(
+    supabase: Client,
+    target_date: str,
+    ctx=None,
+    codes: Optional[Iterable[str]] = None,
+    rebuild: bool = False,
+    workers: Optional[int] = None,
+    cache_path: str = CACHE_PATH,
+) -> List[Tuple[str, str, dict]]:
+    """Screen ``target_date`` and upload its hits; returns (code, pattern_id, meta)."""
+    if codes is None:
+        eligible = ctx.get_eligible_codes() if ctx is not None else load_rs_eligible_codes(supabase)
+        universe = sorted(eligible)
+    else:
+        universe = sorted({str(code) for code in codes})
+    workers = workers or min(4, os.cpu_count() or 1)
+    print(f"[INFO] Pattern screen: {len(universe)} codes on {target_date} ({workers} workers)")
+
+    window = PatternWindow(universe) if rebuild else PatternWindow.load(cache_path, universe)
+    reloaded = set(ctx.reloaded_codes) if ctx is not None else set()
+    counts = refresh_window(supabase, window, target_date, reloaded)
+    window.save(cache_path)
+    print(
+        f"[INFO] Window: {counts['advanced']} codes advanced, {counts['reloaded']} re-read "
+        f"({counts['mismatched']} after a history change)"
+    )
+
+    hits = screen_window(window, target_date, workers)
+    upload_hits(supabase, target_date, hits)
+
+    per_pattern: Dict[str, int] = defaultdict(int)
+    for _, pattern_id, _ in hits:
+        per_pattern[pattern_id] += 1
+    summary = ", ".join(f"{d.id} {per_pattern.get(d.id, 0)}" for d in ALL_DETECTORS)
+    print(f"[INFO] Pattern hits: {summary}")
+    return hits
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Screen all stocks for chart patterns.")
+    parser.add_argument("--date", default=datetime.now().strftime("%Y-%m-%d"), help="Date to screen.")
+    parser.add_argument("--codes", help="Comma-separated codes (default: RS universe).")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore the cached window and re-read it.")
+    parser.add_argument("--workers", type=int, help="Detector processes (default: min(4, CPUs)).")
+    args = parser.parse_args()
+
+    load_env()
+    supabase = get_supabase_client()
+    report_on_exit("screen_patterns")
+    codes = [c.strip() for c in args.codes.split(",") if c.strip()] if args.codes else None
+    run(supabase, args.date, codes=codes, rebuild=args.rebuild, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
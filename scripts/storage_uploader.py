@@ -0,0 +1,216 @@
+"""Concurrent Supabase Storage uploads with 429-aware adaptive concurrency.
+
+Usage:
+    with StorageUploader(supabase) as uploader:
+        uploader.submit(f"{code}.json", json_data, code=code, name=name)
+    failures = uploader.failures  # [{"code", "name", "error"}], failed_log.json format
+"""
+
+import contextvars
+import json
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+from pipeline_metrics import metrics
+
+DEFAULT_BUCKET = "stocks"
+DEFAULT_FAILED_LOG = "failed_log.json"
+
+
+def is_rate_limited(exc: Exception) -> bool:
+    text = str(exc)
+    return "429" in text or "Too Many Requests" in text
+
+
+class AdaptiveLimit:
+    """AIMD concurrency window shared by every upload worker.
+
+    A fast success grows the window by 1/limit (about +1 per full window),
+    a 429 halves it and a response slower than ``latency_target_sec`` trims
+    it by 10%. Only requests started after the last decrease can shrink the
+    window again, so a burst of 429s from the same window counts once.
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 32,
+        latency_target_sec: float = 2.0,
+        decrease_factor: float = 0.5,
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target_sec = latency_target_sec
+        self.decrease_factor = decrease_factor
+        self._limit = float(min(max(initial, minimum), maximum))
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return max(self.minimum, int(self._limit))
+
+    def acquire(self) -> float:
+        """Wait for a free slot and return the request start time."""
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+            return time.monotonic()
+
+    def release(
+        self,
+        started: float,
+        succeeded: bool = True,
+        throttled: bool = False,
+    ) -> None:
+        latency_sec = time.monotonic() - started
+        with self._cond:
+            self._in_flight -= 1
+            if throttled:
+                self._decrease(started, self.decrease_factor)
+            elif succeeded:
+                if latency_sec > self.latency_target_sec:
+                    self._decrease(started, 0.9)
+                else:
+                    self._limit = min(
+                        float(self.maximum), self._limit + 1.0 / max(self._limit, 1.0)
+                    )
+            self._cond.notify_all()
+
+    def _decrease(self, started: float, factor: float) -> None:
+        if started < self._last_decrease:
+            return
+        self._limit = max(float(self.minimum), self._limit * factor)
+        self._last_decrease = time.monotonic()
+
+
+class StorageUploader:
+    """Bounded pool of concurrent uploads into one Storage bucket.
+
+    ``submit`` blocks once 2 x ``max_concurrency`` uploads are queued so callers that
+    build payloads in a loop never hold the whole bucket in memory.
+    """
+
+    def __init__(
+        self,
+        supabase,
+        bucket: str = DEFAULT_BUCKET,
+        initial_concurrency: int = 4,
+        max_concurrency: int = 32,
+        latency_target_sec: float = 2.0,
+        max_retries: int = 5,
+        retry_delay_sec: float = 1.0,
+        content_type: str = "application/json",
+        progress_every: int = 100,
+    ):
+        self._storage = supabase.storage.from_(bucket)
+        self._limit = AdaptiveLimit(
+            initial=initial_concurrency,
+            maximum=max_concurrency,
+            latency_target_sec=latency_target_sec,
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="storage-upload"
+        )
+        self._pending = threading.BoundedSemaphore(max_concurrency * 2)
+        self._futures: List[Future] = []
+        self._lock = threading.Lock()
+        self.max_retries = max_retries
+        self.retry_delay_sec = retry_delay_sec
+        self.content_type = content_type
+        self.progress_every = progress_every
+        self.success_count = 0
+        self.throttled_count = 0
+        self.failures: List[dict] = []
+
+    @property
+    def concurrency(self) -> int:
+        return self._limit.limit
+
+    def submit(
+        self,
+        path: str,
+        data,
+        code: Optional[str] = None,
+        name: Optional[str] = None,
+    ) -> Future:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._pending.acquire()
+        # Run in the caller's context so metrics keep the current step label.
+        future = self._executor.submit(
+            contextvars.copy_context().run, self._upload, path, data, code, name
+        )
+        future.add_done_callback(lambda _: self._pending.release())
+        self._futures.append(future)
+        return future
+
+    def _upload(self, path: str, data: bytes, code: Optional[str], name: Optional[str]) -> bool:
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries):
+            started = self._limit.acquire()
+            try:
+                self._storage.upload(
+                    file=data,
+                    path=path,
+                    file_options={"content-type": self.content_type, "upsert": "true"},
+                )
+            except Exception as exc:
+                last_error = exc
+                throttled = is_rate_limited(exc)
+                self._limit.release(started, succeeded=False, throttled=throttled)
+                if throttled:
+                    with self._lock:
+                        self.throttled_count += 1
+                if attempt < self.max_retries - 1:
+                    metrics.retry("storage_upload")
+                    wait = self.retry_delay_sec * (2 ** attempt)
+                    time.sleep(wait + random.uniform(0, wait))
+                continue
+
+            self._limit.release(started)
+            with self._lock:
+                self.success_count += 1
+                done = self.success_count
+            if self.progress_every and done % self.progress_every == 0:
+                print(f"   [upload] {done}건 완료 (동시 업로드 {self.concurrency})")
+            return True
+
+        with self._lock:
+            self.failures.append(
+                {
+                    "code": code if code is not None else path.rsplit(".", 1)[0],
+                    "name": name or "",
+                    "error": str(last_error),
+                }
+            )
+        print(f"   ❌ {name or ''}({code or path}) 업로드 최종 실패: {last_error}")
+        return False
+
+    def close(self) -> List[dict]:
+        for future in self._futures:
+            future.result()
+        self._executor.shutdown(wait=True)
+        return self.failures
+
+    def write_failures(self, path: str = DEFAULT_FAILED_LOG) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.failures, f, ensure_ascii=False, indent=2)
+
+    def __enter__(self) -> "StorageUploader":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def load_failed_log(path: str = DEFAULT_FAILED_LOG) -> List[dict]:
+    """Read a failed_log.json written by the upload scripts."""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,386 @@
+"""Real-time quotes for watched codes over the KIS websocket.
+
+Favorites (user_favorite_stocks) and open portfolio positions
+(user_portfolio) otherwise only see daily_prices_v2 closes, and polling
+inquire-price for each of them would eat the REST budget the batch jobs
+share. This service keeps one websocket session, subscribes the union of
+watched codes to the trade feed (H0STCNT0) and writes the latest tick of
+each code to realtime_quotes:
+
+- ticks only update an in-memory book; once a second the codes that ticked
+  are upserted in one request, so a busy code costs one row per second;
+- the watchlist is re-read every ``WATCH_REFRESH_SEC`` and the difference is
+  (un)subscribed on the open session;
+- KIS allows ``MAX_SUBSCRIPTIONS`` registrations per session. Holdings come
+  first, then favorites; codes past the limit are reported and skipped, and
+  codes KIS rejects with MAX SUBSCRIBE OVER are not retried until the
+  watchlist changes;
+- frames that do not parse are reported and dropped;
+- PINGPONG frames are echoed back, and a dropped session is reopened with
+  backoff and every code resubscribed.
+
+``--record`` appends the received trade frames with their offsets to a JSON
+lines file that benchmark/kis_ws_replay.py can serve back offline.
+
+Usage:
+    python3 scripts/stream_watchlist_quotes.py                      # until 15:35
+    python3 scripts/stream_watchlist_quotes.py --record output/ticks.jsonl
+    python3 scripts/stream_watchlist_quotes.py --url ws://127.0.0.1:21000 --approval-key replay
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+import requests
+import websockets
+from supabase import Client
+
+import update_today_v3 as kis
+from pipeline_metrics import metrics, report_on_exit
+from supabase_batch import execute_with_retry, upsert_rows
+
+KIS_WS_URL = "ws://ops.koreainvestment.com:21000"
+TRADE_TR_ID = "H0STCNT0"
+MAX_SUBSCRIPTIONS = 41
+FLUSH_SEC = 1.0
+WATCH_REFRESH_SEC = 60
+RECONNECT_MAX_SEC = 30
+DEFAULT_UNTIL = "15:35"
+KST = timezone(timedelta(hours=9))
+CODE_PATTERN = re.compile(r"[0-9A-Z]{6}")
+
+# H0STCNT0 sends 46 '^'-separated fields per trade; the ones kept here.
+TRADE_FIELD_COUNT = 46
+F_CODE, F_TIME, F_PRICE = 0, 1, 2
+F_CHANGE, F_CHANGE_RATE = 4, 5
+F_OPEN, F_HIGH, F_LOW = 7, 8, 9
+F_ACML_VOL, F_ACML_TR_PBMN = 13, 14
+
+
+def issue_approval_key() -> str:
+    """Websocket approval key for the configured app key (/oauth2/Approval)."""
+    started = time.monotonic()
+    response = requests.post(
+        f"{kis.KIS_BASE_URL}/oauth2/Approval",
+        headers={"content-type": "application/json"},
+        data=json.dumps({"grant_type": "client_credentials", "appkey": kis.APP_KEY, "secretkey": kis.APP_SECRET}),
+    )
+    metrics.record_call("kis", "/oauth2/Approval", time.monotonic() - started, error=response.status_code >= 400)
+    response.raise_for_status()
+    key = response.json().get("approval_key")
+    if not key:
+        raise RuntimeError(f"Failed to issue approval key: {response.text}")
+    return key
+
+
+def subscription_message(approval_key: str, code: str, subscribe: bool = True) -> str:
+    return json.dumps(
+        {
+            "header": {
+                "approval_key": approval_key,
+                "custtype": "P",
+                "tr_type": "1" if subscribe else "2",
+                "content-type": "utf-8",
+            },
+            "body": {"input": {"tr_id": TRADE_TR_ID, "tr_key": code}},
+        }
+    )
+
+
+def _number(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_trades(frame: str, session_date: str) -> List[dict]:
+    """realtime_quotes rows from a plain H0STCNT0 frame ("0|H0STCNT0|<n>|f^f^...")."""
+    parts = frame.split("|", 3)
+    if len(parts) != 4 or parts[0] != "0" or parts[1] != TRADE_TR_ID or not parts[2].isdigit():
+        return []
+    values = parts[3].split("^")
+    rows = []
+    for i in range(int(parts[2])):
+        fields = values[i * TRADE_FIELD_COUNT:(i + 1) * TRADE_FIELD_COUNT]
+        if len(fields) < TRADE_FIELD_COUNT:
+            break
+        price = _number(fields[F_PRICE])
+        if not price:
+            continue
+        hhmmss = fields[F_TIME]
+        volume = _number(fields[F_ACML_VOL])
+        rows.append(
+            {
+                "code": fields[F_CODE],
+                "price": price,
+                "change": _number(fields[F_CHANGE]),
+                "change_rate": _number(fields[F_CHANGE_RATE]),
+                "open": _number(fields[F_OPEN]),
+                "high": _number(fields[F_HIGH]),
+                "low": _number(fields[F_LOW]),
+                "volume": int(volume) if volume is not None else None,
+                "trading_value": _number(fields[F_ACML_TR_PBMN]),
+                "traded_at": f"{session_date}T{hhmmss[:2]}:{hhmmss[2:4]}:{hhmmss[4:6]}+09:00",
+            }
+        )
+    return rows
+
+
+def load_watched_codes(supabase: Client, limit: int = MAX_SUBSCRIPTIONS) -> List[str]:
+    """Open holdings first, then favorites; listed codes only, at most ``limit``."""
+    holdings = execute_with_retry(
+        lambda: supabase.table("user_portfolio")
+        .select("company_code, is_custom_asset")
+        .eq("is_closed", False)
+        .execute(),
+        "watch:user_portfolio",
+    ).data or []
+    favorites = execute_with_retry(
+        lambda: supabase.table("user_favorite_stocks").select("company_code").execute(),
+        "watch:user_favorite_stocks",
+    ).data or []
+
+    codes: List[str] = []
+    for row in [*holdings, *favorites]:
+        code = str(row.get("company_code") or "").strip()
+        if row.get("is_custom_asset") or not CODE_PATTERN.fullmatch(code) or code in codes:
+            continue
+        codes.append(code)
+    if len(codes) > limit:
+        print(f"[WARN] {len(codes)} watched codes, streaming the first {limit}: skipped {', '.join(codes[limit:])}")
+    return codes[:limit]
+
+
+class QuoteBook:
+    """Latest row per code; codes that ticked since the last drain are dirty."""
+
+    def __init__(self):
+        self.latest: Dict[str, dict] = {}
+        self.dirty: set = set()
+        self.ticks = 0
+
+    def apply(self, row: dict) -> None:
+        self.latest[row["code"]] = row
+        self.dirty.add(row["code"])
+        self.ticks += 1
+
+    def drain(self) -> List[dict]:
+        rows = [self.latest[code] for code in sorted(self.dirty)]
+        self.dirty.clear()
+        return rows
+
+
+class QuoteStream:
+    def __init__(
+        self,
+        supabase: Client,
+        url: str,
+        approval_key: str,
+        session_date: str,
+        watched: Callable[[], List[str]],
+        recorder=None,
+        flush_sec: float = FLUSH_SEC,
+        watch_refresh_sec: float = WATCH_REFRESH_SEC,
+    ):
+        self.supabase = supabase
+        self.url = url
+        self.approval_key = approval_key
+        self.session_date = session_date
+        self.watched = watched
+        self.recorder = recorder
+        self.flush_sec = flush_sec
+        self.watch_refresh_sec = watch_refresh_sec
+        self.book = QuoteBook()
+        self.subscribed: set = set()
+        # Codes KIS turned away (MAX SUBSCRIBE OVER) for the current watchlist.
+        self.rejected: set = set()
+        self._wanted: Optional[set] = None
+        self.rows_written = 0
+        self.flushes = 0
+        self.reconnects = 0
+        self._started = time.monotonic()
+
+    async def run(self, deadline: float) -> None:
+        """Stream until ``deadline`` (time.monotonic()), reconnecting on errors."""
+        flusher = asyncio.create_task(self._flush_loop())
+        backoff = 1.0
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    await self._session(deadline)
+                    backoff = 1.0
+                except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as exc:
+                    self.reconnects += 1
+                    metrics.retry("kis_ws")
+                    wait = min(backoff, max(0.0, deadline - time.monotonic()))
+                    print(f"[WARN] websocket session ended ({exc}), reconnecting in {wait:.0f}s...")
+                    await asyncio.sleep(wait)
+                    backoff = min(backoff * 2, RECONNECT_MAX_SEC)
+        finally:
+            flusher.cancel()
+            await self.flush()
+
+    async def _session(self, deadline: float) -> None:
+        async with websockets.connect(self.url, ping_interval=None, max_size=None) as ws:
+            self.subscribed = set()
+            await self._sync_subscriptions(ws)
+            next_watch = time.monotonic() + self.watch_refresh_sec
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    return
+                if now >= next_watch:
+                    await self._sync_subscriptions(ws)
+                    print(f"[INFO] ticks {self.book.ticks}, rows {self.rows_written}, codes {len(self.subscribed)}")
+                    next_watch = now + self.watch_refresh_sec
+                try:
+                    message = await asyncio.wait_for(ws.recv(), timeout=min(deadline, next_watch) - now)
+                except asyncio.TimeoutError:
+                    continue
+                await self._handle(ws, message)
+
+    async def _sync_subscriptions(self, ws) -> None:
+        try:
+            wanted = set(await asyncio.to_thread(self.watched))
+        except Exception as exc:
+            # A Supabase outage must not end the stream: keep the last known
+            # watchlist (also after a reconnect) and read it again next refresh.
+            print(f"[WARN] watchlist read failed ({exc}), keeping {len(self._wanted or ())} codes")
+            wanted = set(self._wanted or ())
+        if wanted != self._wanted:
+            # A changed watchlist may have freed slots; try the rejected codes again.
+            self._wanted = wanted
+            self.rejected.clear()
+        removed = sorted(self.subscribed - wanted)
+        added = sorted(wanted - self.subscribed - self.rejected)
+        for code in removed:
+            await ws.send(subscription_message(self.approval_key, code, subscribe=False))
+            self.subscribed.discard(code)
+        for code in added:
+            await ws.send(subscription_message(self.approval_key, code))
+            self.subscribed.add(code)
+        if removed or added:
+            print(f"[INFO] subscriptions: +{len(added)} -{len(removed)} ({len(self.subscribed)} codes)")
+
+    async def _handle(self, ws, message) -> None:
+        if isinstance(message, bytes):
+            try:
+                message = message.decode("utf-8")
+            except UnicodeDecodeError as exc:
+                print(f"[WARN] dropped a frame that is not UTF-8 ({exc})")
+                return
+        if message[:1] in ("0", "1"):
+            # '1' is an encrypted feed (order notices); only trades are subscribed.
+            if message[0] == "0":
+                for row in parse_trades(message, self.session_date):
+                    self.book.apply(row)
+                if self.recorder is not None:
+                    offset = round(time.monotonic() - self._started, 3)
+                    self.recorder.write(json.dumps({"t": offset, "frame": message}, ensure_ascii=False) + "\n")
+            return
+
+        try:
+            data = json.loads(message)
+        except json.JSONDecodeError as exc:
+            print(f"[WARN] dropped a frame that is not JSON ({exc}): {message[:80]!r}")
+            return
+        if not isinstance(data, dict):
+            return
+        header = data.get("header") or {}
+        if header.get("tr_id") == "PINGPONG":
+            await ws.send(message)
+            return
+        body = data.get("body") or {}
+        if body.get("rt_cd") not in (None, "0"):
+            code = header.get("tr_key")
+            print(f"[WARN] {code}: {body.get('msg_cd')} {body.get('msg1')}")
+            if code and "MAX SUBSCRIBE OVER" in str(body.get("msg1")):
+                self.subscribed.discard(code)
+                self.rejected.add(code)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_sec)
+            await self.flush()
+
+    async def flush(self) -> None:
+        rows = self.book.drain()
+        if not rows:
+            return
+        updated_at = datetime.now(KST).isoformat(timespec="seconds")
+        try:
+            await asyncio.to_thread(
+                upsert_rows,
+                self.supabase,
+                "realtime_quotes",
+                [{**row, "updated_at": updated_at} for row in rows],
+                "code",
+            )
+        except Exception as exc:
+            # Keep them dirty; the next flush writes whatever is latest by then.
+            self.book.dirty.update(row["code"] for row in rows)
+            print(f"[WARN] realtime_quotes flush failed ({exc})")
+            return
+        self.rows_written += len(rows)
+        self.flushes += 1
+
+
+def run(
+    supabase: Client,
+    session_date: str,
+    until: str = DEFAULT_UNTIL,
+    url: str = KIS_WS_URL,
+    approval_key: Optional[str] = None,
+    codes: Optional[List[str]] = None,
+    record_path: Optional[str] = None,
+    duration_sec: Optional[float] = None,
+) -> dict:
+    if duration_sec is None:
+        stop_at = datetime.strptime(f"{session_date} {until}", "%Y-%m-%d %H:%M")
+        duration_sec = max(0.0, (stop_at - datetime.now()).total_seconds())
+    watched = (lambda: list(codes)) if codes else (lambda: load_watched_codes(supabase))
+
+    recorder = open(record_path, "a", encoding="utf-8") if record_path else None
+    try:
+        stream = QuoteStream(supabase, url, approval_key or issue_approval_key(), session_date, watched, recorder)
+        print(f"[INFO] Streaming {url} for {duration_sec:.0f}s")
+        asyncio.run(stream.run(time.monotonic() + duration_sec))
+    finally:
+        if recorder is not None:
+            recorder.close()
+
+    result = {
+        "ticks": stream.book.ticks,
+        "codes": len(stream.book.latest),
+        "rows_written": stream.rows_written,
+        "flushes": stream.flushes,
+        "reconnects": stream.reconnects,
+    }
+    print(f"[INFO] Stream done: {result}")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stream KIS trade ticks for watched codes into realtime_quotes.")
+    parser.add_argument("--date", default=datetime.now().strftime("%Y-%m-%d"), help="Session date.")
+    parser.add_argument("--until", default=DEFAULT_UNTIL, help="Stop time (HH:MM).")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds instead.")
+    parser.add_argument("--url", default=KIS_WS_URL, help="Websocket URL (a kis_ws_replay.py server offline).")
+    parser.add_argument("--approval-key", help="Use this approval key instead of issuing one.")
+    parser.add_argument("--codes", help="Comma-separated codes instead of the watchlist tables.")
+    parser.add_argument("--record", help="Append received trade frames to this JSON lines file.")
+    args = parser.parse_args()
+
+    report_on_exit("stream_watchlist_quotes")
+    codes = [code.strip() for code in args.codes.split(",") if code.strip()] if args.codes else None
+    run(kis.supabase, args.date, args.until, args.url, args.approval_key, codes, args.record, args.duration)
+
+
+if __name__ == "__main__":
+    main()
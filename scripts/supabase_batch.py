@@ -0,0 +1,105 @@
+"""Supabase plumbing shared by the batch scripts.
+
+Client setup from .env.local/.env, retries with backoff (counted in
+pipeline_metrics), chunked upserts and per-code bar reads from
+daily_prices_v2 through KeysetPager.
+"""
+
+import math
+import os
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+from supabase import Client, create_client
+
+from keyset_pager import KeysetPager
+from pipeline_metrics import instrument_supabase, metrics
+
+INDEX_CODES = ("KOSPI", "KOSDAQ")
+PAGE_SIZE = 1000
+UPSERT_CHUNK = 1000
+BAR_COLUMNS = "code, date, open, high, low, close"
+# A stored close further than this from daily_prices_v2 means the history changed.
+CLOSE_TOLERANCE = 1e-6
+
+
+def load_env() -> None:
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.dirname(current_dir)
+    env_path = os.path.join(project_root, ".env.local")
+    if not os.path.exists(env_path):
+        env_path = os.path.join(project_root, ".env")
+    load_dotenv(dotenv_path=env_path)
+
+
+def get_supabase_client() -> Client:
+    url = os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
+    key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+    if not url or not key:
+        raise RuntimeError("Supabase credentials not found in .env.local/.env")
+    return instrument_supabase(create_client(url, key))
+
+
+def execute_with_retry(callable_fn, label: str, retries: int = 5, delay: float = 1.0):
+    attempt = 0
+    while True:
+        try:
+            return callable_fn()
+        except Exception as exc:
+            attempt += 1
+            if attempt > retries:
+                raise
+            wait = delay * (2 ** (attempt - 1))
+            metrics.retry(label.split(":")[0])
+            print(f"[WARN] {label} failed ({exc}), retrying in {wait:.1f}s...")
+            time.sleep(wait)
+
+
+def chunked(items: List, size: int) -> Iterable[List]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def to_float(value) -> Optional[float]:
+    if value is None:
+        return None
+    number = float(value)
+    return None if math.isnan(number) else number
+
+
+def fetch_bars(
+    supabase: Client,
+    codes: List[str],
+    start_date: Optional[str],
+    end_date: str,
+    columns: str = BAR_COLUMNS,
+) -> Dict[str, List[dict]]:
+    """Bars per code in date order; ``start_date=None`` reads the full history.
+
+    Extra ``columns`` (e.g. volume) are passed through as floats.
+    """
+    bars: Dict[str, List[dict]] = defaultdict(list)
+
+    def filters(q):
+        q = q.in_("code", codes).lte("date", end_date)
+        return q if start_date is None else q.gte("date", start_date)
+
+    for page in KeysetPager(supabase, "daily_prices_v2", columns, ("code", "date"), filters, label="fetch_bars"):
+        for row in page:
+            close = to_float(row.get("close"))
+            if close is None:
+                continue
+            bar = {key: to_float(value) for key, value in row.items() if key not in ("code", "date")}
+            bar.update(date=str(row["date"])[:10], close=close)
+            bars[str(row["code"])].append(bar)
+    return bars
+
+
+def upsert_rows(supabase: Client, table: str, rows: List[dict], on_conflict: str) -> None:
+    for chunk in chunked(rows, UPSERT_CHUNK):
+        execute_with_retry(
+            lambda chunk=chunk: supabase.table(table).upsert(chunk, on_conflict=on_conflict).execute(),
+            f"upsert:{table}",
+        )
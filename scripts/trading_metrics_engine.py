@@ -0,0 +1,155 @@
+"""Theme/industry trading-value metrics as matrix operations.
+
+The market is held as date x code matrices (close, close * volume) and the
+groups as a 0/1 membership matrix (group x code), so every metric of every
+group on every date is one product with the membership matrix instead of a
+query per group per date:
+
+- total_trading_value   = TV @ M.T, and its share of the market total;
+- weighted_return       = (return * TV) @ M.T / total, the return being
+  against the previous trading date (the previous matrix row);
+- avg_surge_ratio/count = TV / 20-day average over the members.
+
+Definitions match get_group_trading_metrics
+(20261019005000_create_trading_metrics_functions.sql): a bar counts when
+close and volume are both non-zero, the market total includes every code,
+and the 20-day average is over the last 20 counted bars before the date
+within 30 calendar days. Load the matrix from ``LOOKBACK_DAYS`` before the
+first date to compute so the first row has its history.
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+SURGE_WINDOW = 20
+SURGE_LOOKBACK_DAYS = 30
+SURGE_THRESHOLD = 2.0
+# Calendar days of prices needed before the first computed date: the surge
+# window plus enough to find the previous trading date across holidays.
+LOOKBACK_DAYS = SURGE_LOOKBACK_DAYS + 14
+
+
+class PriceMatrix:
+    """Close and volume of every code on every trading date (NaN where absent)."""
+
+    def __init__(self, dates: np.ndarray, codes: Sequence[str], close: np.ndarray, volume: np.ndarray):
+        self.dates = dates.astype("datetime64[D]")
+        self.codes = list(codes)
+        self.close = close
+        self.volume = volume
+        with np.errstate(invalid="ignore"):
+            self.valid = (
+                np.isfinite(close) & np.isfinite(volume) & (close != 0) & (volume != 0)
+            )
+            self.trading_value = np.where(self.valid, close * volume, 0.0)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "PriceMatrix":
+        """From rows with code, date, close, volume (any order, one row per code/date)."""
+        frame = df[["code", "date", "close", "volume"]].copy()
+        frame["code"] = frame["code"].astype(str)
+        frame["date"] = pd.to_datetime(frame["date"])
+        frame["close"] = pd.to_numeric(frame["close"], errors="coerce")
+        frame["volume"] = pd.to_numeric(frame["volume"], errors="coerce")
+        frame = frame.drop_duplicates(["date", "code"], keep="last")
+        close = frame.pivot(index="date", columns="code", values="close").sort_index().sort_index(axis=1)
+        volume = frame.pivot(index="date", columns="code", values="volume").reindex_like(close)
+        dates = close.index.to_numpy().astype("datetime64[D]")
+        return cls(dates, list(close.columns), close.to_numpy(float), volume.to_numpy(float))
+
+    @property
+    def market_total(self) -> np.ndarray:
+        return self.trading_value.sum(axis=1)
+
+
+def membership_matrix(
+    members: Dict[int, Iterable[str]], codes: Sequence[str]
+) -> Tuple[List[int], np.ndarray]:
+    """Group ids and their 0/1 membership over ``codes`` (unknown codes ignored)."""
+    position = {code: i for i, code in enumerate(codes)}
+    group_ids = sorted(members)
+    matrix = np.zeros((len(group_ids), len(codes)))
+    for row, group_id in enumerate(group_ids):
+        cols = [position[code] for code in set(members[group_id]) if code in position]
+        matrix[row, cols] = 1.0
+    return group_ids, matrix
+
+
+def average_trading_value(prices: PriceMatrix) -> np.ndarray:
+    """Per date/code mean of the last ``SURGE_WINDOW`` counted bars before the
+    date within ``SURGE_LOOKBACK_DAYS`` calendar days (NaN when none)."""
+    n_dates = len(prices.dates)
+    total = np.zeros_like(prices.trading_value)
+    count = np.zeros_like(prices.trading_value)
+    cutoff = prices.dates - np.timedelta64(SURGE_LOOKBACK_DAYS, "D")
+    for k in range(1, n_dates):
+        in_window = prices.dates[:-k] >= cutoff[k:]
+        if not in_window.any():
+            break
+        take = prices.valid[:-k] & in_window[:, None] & (count[k:] < SURGE_WINDOW)
+        total[k:] += np.where(take, prices.trading_value[:-k], 0.0)
+        count[k:] += take
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def group_metrics(
+    prices: PriceMatrix,
+    members: Dict[int, Iterable[str]],
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+) -> List[dict]:
+    """Rows like get_group_trading_metrics for the dates in [start_date, end_date]."""
+    group_ids, membership = membership_matrix(members, prices.codes)
+    if not group_ids:
+        return []
+    member_t = membership.T
+    tv = prices.trading_value
+    valid = prices.valid
+
+    prev_close = np.full_like(prices.close, np.nan)
+    prev_close[1:] = np.where(prices.valid[:-1], prices.close[:-1], np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        has_return = valid & (prev_close > 0)
+        returns = np.where(has_return, (prices.close - prev_close) / prev_close * 100, 0.0)
+
+        avg_20d = average_trading_value(prices)
+        has_surge = valid & (avg_20d > 0)
+        surge = np.where(has_surge, tv / avg_20d, 0.0)
+
+    totals = tv @ member_t
+    counts = valid.astype(float) @ member_t
+    weighted_sums = (returns * tv) @ member_t
+    surge_sums = surge @ member_t
+    surge_counts = has_surge.astype(float) @ member_t
+    surge_hits = (has_surge & (surge >= SURGE_THRESHOLD)).astype(float) @ member_t
+    market = prices.market_total
+
+    first = 0 if start_date is None else int(np.searchsorted(prices.dates, np.datetime64(start_date, "D")))
+    last = len(prices.dates) if end_date is None else int(
+        np.searchsorted(prices.dates, np.datetime64(end_date, "D"), side="right")
+    )
+
+    rows: List[dict] = []
+    for d in range(first, last):
+        if market[d] <= 0:
+            continue
+        date_str = str(prices.dates[d])
+        for g in np.flatnonzero(counts[d] > 0):
+            total = totals[d, g]
+            rows.append({
+                "group_id": group_ids[g],
+                "date": date_str,
+                "total_trading_value": round(float(total), 2),
+                "market_trading_value": round(float(market[d]), 2),
+                "trading_value_ratio": round(float(total / market[d] * 100), 4),
+                "weighted_return": round(float(weighted_sums[d, g] / total), 4) if total else 0.0,
+                "avg_surge_ratio": (
+                    round(float(surge_sums[d, g] / surge_counts[d, g]), 4) if surge_counts[d, g] else 0.0
+                ),
+                "surge_count": int(surge_hits[d, g]),
+                "total_stock_count": int(counts[d, g]),
+            })
+    return rows
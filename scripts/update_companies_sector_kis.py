@@ -1,123 +1,122 @@
+"""companies.sector 를 KIS 종목 마스터 파일의 지수업종 코드로 갱신한다.
+
+예전에는 종목마다 현재가 API(inquire-price)를 한 번씩 불러 업종명을 받았다.
+마스터 파일(kis_master_loader)에 모든 KOSPI/KOSDAQ 종목의 업종 대/중/소분류
+코드가 이미 들어 있으므로, 파일 두 개를 내려받아 kis_sector_codes 의 코드표로
+이름을 붙이고 바뀐 종목만 한 번에 upsert 한다. KIS 토큰은 필요 없다.
+
+Usage:
+    python3 scripts/update_companies_sector_kis.py
+    python3 scripts/update_companies_sector_kis.py --dry-run
+"""
+
+import argparse
 import os
-import requests
-import json
-import time
-from supabase import create_client, Client
+import sys
+from collections import Counter
+
 from dotenv import load_dotenv
+from supabase import Client, create_client
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPT_DIR not in sys.path:
+    sys.path.append(SCRIPT_DIR)
+
+import kis_master_loader  # noqa: E402
+from kis_sector_codes import SECTOR_NAMES, sector_code, sector_name  # noqa: E402
+from pipeline_metrics import instrument_supabase, report_on_exit  # noqa: E402
+
+PAGE_SIZE = 1000
+UPSERT_CHUNK = 1000
+
+
+def get_supabase_client() -> Client:
+    load_dotenv(".env.local")
+    url = os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
+    key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+    if not url or not key:
+        print("❌ Supabase 환경변수 오류")
+        sys.exit(1)
+    return instrument_supabase(create_client(url, key))
+
+
+def fetch_companies(supabase: Client) -> dict:
+    companies = {}
+    offset = 0
+    while True:
+        response = (
+            supabase.table("companies")
+            .select("code, name, sector")
+            .order("code")
+            .range(offset, offset + PAGE_SIZE - 1)
+            .execute()
+        )
+        rows = response.data or []
+        for row in rows:
+            companies[str(row["code"])] = row
+        if len(rows) < PAGE_SIZE:
+            break
+        offset += PAGE_SIZE
+    return companies
+
 
-# 환경 변수 로드
-load_dotenv('.env.local')
-
-url = os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
-key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
-APP_KEY = os.environ.get("KIS_APP_KEY")
-APP_SECRET = os.environ.get("KIS_APP_SECRET")
-
-if not url or not key:
-    print("❌ Supabase 환경변수 오류")
-    exit()
-
-if not APP_KEY or not APP_SECRET:
-    print("❌ 한국투자증권 API 환경변수 오류")
-    exit()
-
-supabase: Client = create_client(url, key)
-
-# ========================================
-# 한국투자증권 API 토큰 발급
-# ========================================
-def get_kis_token():
-    token_url = "https://openapi.koreainvestment.com:9443/oauth2/tokenP"
-    headers = {"content-type": "application/json"}
-    body = {
-        "grant_type": "client_credentials",
-        "appkey": APP_KEY,
-        "appsecret": APP_SECRET
-    }
-    try:
-        res = requests.post(token_url, headers=headers, data=json.dumps(body))
-        res.raise_for_status()
-        return res.json()["access_token"]
-    except Exception as e:
-        print(f"❌ 토큰 발급 실패: {e}")
-        return None
-
-def get_sector_from_kis(code, token):
-    url = "https://openapi.koreainvestment.com:9443/uapi/domestic-stock/v1/quotations/inquire-price"
-    headers = {
-        "content-type": "application/json; charset=utf-8",
-        "authorization": f"Bearer {token}",
-        "appkey": APP_KEY,
-        "appsecret": APP_SECRET,
-        "tr_id": "FHKST01010100"
-    }
-    params = {
-        "FID_COND_MRKT_DIV_CODE": "J",
-        "FID_INPUT_ISCD": code
-    }
-    
-    try:
-        res = requests.get(url, headers=headers, params=params)
-        res.raise_for_status()
-        data = res.json()
-        if data['rt_cd'] == '0':
-            # bstp_kor_isnm: 업종명 (예: 전기전자)
-            return data['output']['bstp_kor_isnm']
-        return None
-    except:
-        return None
-
-def update_sectors_kis():
-    print("🚀 KIS API 기반 업종 정보 업데이트 시작...")
-    
-    token = get_kis_token()
-    if not token: return
-
-    # 1. 대상 종목 조회 (업종 정보가 없는 종목만 조회하면 좋겠지만, 전체 업데이트)
-    # Supabase에서 코드 목록 가져오기
-    print("   대상 종목 목록 조회 중...")
-    res = supabase.table('companies').select('code, name').execute()
-    if not res.data:
-        print("   ❌ 종목 데이터가 없습니다.")
+def build_sector_map(stocks_df) -> tuple[dict, Counter]:
+    """code -> sector name, plus the (market, code) pairs missing from the table."""
+    sectors = {}
+    unmapped: Counter = Counter()
+    for row in stocks_df.itertuples(index=False):
+        name = sector_name(row.Market, row.SectorLarge, row.SectorMedium, row.SectorSmall)
+        if name:
+            sectors[str(row.Code)] = name
+        for value in (row.SectorLarge, row.SectorMedium, row.SectorSmall):
+            code = sector_code(value)
+            if code is not None and code not in SECTOR_NAMES.get(row.Market, {}):
+                unmapped[(row.Market, code)] += 1
+    return sectors, unmapped
+
+
+def update_sectors_kis(dry_run: bool = False) -> None:
+    print("🚀 KIS 마스터 기반 업종 정보 업데이트 시작...")
+
+    stocks_df = kis_master_loader.get_all_stocks()
+    if stocks_df.empty:
+        print("   ❌ 종목 마스터를 불러오지 못했습니다.")
         return
-    
-    targets = res.data
-    total = len(targets)
-    print(f"   총 {total}개 종목 업데이트 예정")
-    
-    upload_list = []
-    
-    for i, stock in enumerate(targets):
-        code = stock['code']
-        # 지수(KOSPI, KOSDAQ)는 건너뜀
-        if code in ['KOSPI', 'KOSDAQ']: continue
-        
-        sector = get_sector_from_kis(code, token)
-        
-        if sector:
-            upload_list.append({
-                'code': code,
-                'name': stock['name'],
-                'sector': sector
-            })
-            # print(f"   [{i+1}/{total}] {stock['name']}: {sector}")
-        
-        # API 제한 고려 (초당 20건) -> 0.05초 대기
-        time.sleep(0.05)
-        
-        # 100개마다 진행상황 출력 및 중간 저장
-        if (i+1) % 100 == 0 or (i+1) == total:
-            print(f"   [{i+1}/{total}] 진행 중... (현재: {stock['name']})")
-            
-            if upload_list:
-                supabase.table('companies').upsert(upload_list, on_conflict='code').execute()
-                upload_list = [] # 초기화
-
-    # 남은 데이터 저장
-    if upload_list:
-        supabase.table('companies').upsert(upload_list, on_conflict='code').execute()
+
+    sectors, unmapped = build_sector_map(stocks_df)
+    print(f"   마스터 {len(stocks_df)}종목 중 {len(sectors)}종목 업종 확인")
+    if unmapped:
+        missing = ", ".join(f"{market}:{code:04d}({count})" for (market, code), count in sorted(unmapped.items()))
+        print(f"   ⚠️ 코드표에 없는 업종 코드: {missing}")
+
+    supabase = get_supabase_client()
+    report_on_exit("update_companies_sector_kis")
+    companies = fetch_companies(supabase)
+
+    # 지수(KOSPI/KOSDAQ)와 마스터에 없는 코드는 건드리지 않는다.
+    upload_list = [
+        {"code": code, "name": companies[code]["name"], "sector": sector}
+        for code, sector in sorted(sectors.items())
+        if code in companies and companies[code].get("sector") != sector
+    ]
+    print(f"   변경 {len(upload_list)}종목")
+    if dry_run:
+        for row in upload_list[:20]:
+            print(f"     {row['code']} {row['name']}: {companies[row['code']].get('sector')} -> {row['sector']}")
+        return
+
+    for i in range(0, len(upload_list), UPSERT_CHUNK):
+        supabase.table("companies").upsert(upload_list[i : i + UPSERT_CHUNK], on_conflict="code").execute()
 
     print("\n✅ 업데이트 완료!")
 
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sync companies.sector from the KIS master files.")
+    parser.add_argument("--dry-run", action="store_true", help="Print the changes without writing.")
+    args = parser.parse_args()
+    update_sectors_kis(dry_run=args.dry_run)
+
+
 if __name__ == "__main__":
-    update_sectors_kis()
+    main()
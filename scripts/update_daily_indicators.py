@@ -0,0 +1,238 @@
+"""Advance the stored chart indicators (daily_indicators) to the latest bars.
+
+The chart pages compute EMA/SMA/WMA/ATR/Keltner/MACD in the browser over a
+stock's whole history on every load, and nothing server-side can screen on
+them. This batch keeps each code's recursive indicator state in
+``indicator_states`` (see indicator_engine.py) and writes the values per
+bar to ``daily_indicators``, so a normal day reads only the bars after each
+code's ``last_date`` and advances every code in one vectorized step.
+
+Codes without a stored state, codes whose close at ``last_date`` changed
+(adjusted history reloaded by the ingest) and all codes under ``--rebuild``
+are replayed from their full history.
+
+Usage:
+    python3 scripts/update_daily_indicators.py
+    python3 scripts/update_daily_indicators.py --codes 005930,KOSPI --rebuild
+"""
+
+import argparse
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from supabase import Client
+
+from indicator_engine import OUTPUT_COLUMNS, IndicatorState, compute_indicator_frame
+from pipeline_metrics import report_on_exit
+from rs_universe import load_rs_eligible_codes
+from supabase_batch import (
+    CLOSE_TOLERANCE,
+    INDEX_CODES,
+    PAGE_SIZE,
+    UPSERT_CHUNK,
+    chunked,
+    execute_with_retry,
+    fetch_bars,
+    get_supabase_client,
+    load_env,
+    upsert_rows,
+)
+
+INCREMENTAL_CODE_CHUNK = 200
+REBUILD_CODE_CHUNK = 20
+VALUE_DECIMALS = 4
+
+
+def fetch_states(supabase: Client) -> Dict[str, dict]:
+    states: Dict[str, dict] = {}
+    offset = 0
+    while True:
+        response = execute_with_retry(
+            lambda: supabase.table("indicator_states")
+            .select("code, last_date, last_close, state")
+            .order("code")
+            .range(offset, offset + PAGE_SIZE - 1)
+            .execute(),
+            "fetch_indicator_states",
+        )
+        rows = response.data or []
+        for row in rows:
+            states[str(row["code"])] = row
+        if len(rows) < PAGE_SIZE:
+            break
+        offset += PAGE_SIZE
+    return states
+
+
+def build_matrix(
+    codes: List[str], bars_by_code: Dict[str, List[dict]], after: Optional[str] = None
+) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+    """Dates and (dates x codes) close/high/low matrices; NaN where a code has no bar."""
+    dates = sorted(
+        {bar["date"] for code in codes for bar in bars_by_code.get(code, []) if after is None or bar["date"] > after}
+    )
+    date_index = {d: i for i, d in enumerate(dates)}
+    shape = (len(dates), len(codes))
+    close, high, low = np.full(shape, np.nan), np.full(shape, np.nan), np.full(shape, np.nan)
+    for j, code in enumerate(codes):
+        for bar in bars_by_code.get(code, []):
+            i = date_index.get(bar["date"])
+            if i is None:
+                continue
+            close[i, j] = bar["close"]
+            high[i, j] = np.nan if bar["high"] is None else bar["high"]
+            low[i, j] = np.nan if bar["low"] is None else bar["low"]
+    return dates, close, high, low
+
+
+class IndicatorWriter:
+    def __init__(self, supabase: Client):
+        self.supabase = supabase
+        self.daily: List[dict] = []
+        self.states: List[dict] = []
+        self.daily_written = 0
+
+    def add(
+        self,
+        codes: List[str],
+        dates: List[str],
+        close: np.ndarray,
+        values: Dict[str, np.ndarray],
+        state: IndicatorState,
+    ) -> None:
+        rounded = {name: np.round(values[name], VALUE_DECIMALS) for name in OUTPUT_COLUMNS}
+        for j, code in enumerate(codes):
+            has_bar = np.flatnonzero(~np.isnan(close[:, j]))
+            if has_bar.size == 0:
+                continue
+            for i in has_bar:
+                row = {"code": code, "date": dates[i], "close": float(close[i, j])}
+                for name in OUTPUT_COLUMNS:
+                    value = rounded[name][i, j]
+                    row[name] = None if np.isnan(value) else float(value)
+                self.daily.append(row)
+            last = has_bar[-1]
+            self.states.append(
+                {
+                    "code": code,
+                    "last_date": dates[last],
+                    "last_close": float(close[last, j]),
+                    "state": state.to_json(j),
+                    "updated_at": datetime.now().isoformat(timespec="seconds"),
+                }
+            )
+        if len(self.daily) >= UPSERT_CHUNK * 5:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.daily:
+            upsert_rows(self.supabase, "daily_indicators", self.daily, "code,date")
+            self.daily_written += len(self.daily)
+            self.daily = []
+        # After the daily rows, so a stored state never runs ahead of them.
+        if self.states:
+            upsert_rows(self.supabase, "indicator_states", self.states, "code")
+            self.states = []
+
+
+def run(
+    supabase: Client,
+    target_date: str,
+    ctx=None,
+    codes: Optional[Iterable[str]] = None,
+    rebuild: bool = False,
+) -> dict:
+    """Advance every code's indicators to ``target_date``; returns counts per path."""
+    if codes is None:
+        eligible = ctx.get_eligible_codes() if ctx is not None else load_rs_eligible_codes(supabase)
+        universe = sorted(set(eligible) | set(INDEX_CODES))
+    else:
+        universe = sorted({str(code) for code in codes})
+    print(f"[INFO] Indicators: {len(universe)} codes up to {target_date}")
+
+    states = {} if rebuild else fetch_states(supabase)
+    reloaded = set(ctx.reloaded_codes) if ctx is not None else set()
+
+    to_rebuild: List[str] = []
+    by_last_date: Dict[str, List[str]] = defaultdict(list)
+    for code in universe:
+        stored = states.get(code)
+        if stored is None or code in reloaded:
+            to_rebuild.append(code)
+        elif str(stored["last_date"])[:10] < target_date:
+            by_last_date[str(stored["last_date"])[:10]].append(code)
+
+    writer = IndicatorWriter(supabase)
+    advanced = mismatched = 0
+    for last_date, group in sorted(by_last_date.items()):
+        for chunk in chunked(group, INCREMENTAL_CODE_CHUNK):
+            bars_by_code = fetch_bars(supabase, chunk, last_date, target_date)
+            ready: List[str] = []
+            for code in chunk:
+                bars = bars_by_code.get(code, [])
+                stored_close = states[code].get("last_close")
+                if (
+                    not bars
+                    or bars[0]["date"] != last_date
+                    or stored_close is None
+                    or abs(bars[0]["close"] - float(stored_close)) > CLOSE_TOLERANCE
+                ):
+                    mismatched += 1
+                    to_rebuild.append(code)
+                elif len(bars) > 1:
+                    ready.append(code)
+            if not ready:
+                continue
+            dates, close, high, low = build_matrix(ready, bars_by_code, after=last_date)
+            state = IndicatorState.from_json([states[code]["state"] for code in ready])
+            values = compute_indicator_frame(close, high, low, state)
+            writer.add(ready, dates, close, values, state)
+            advanced += len(ready)
+
+    if to_rebuild:
+        print(f"[INFO] Rebuilding {len(to_rebuild)} codes from full history ({mismatched} after a history change)")
+    rebuilt = 0
+    for chunk in chunked(to_rebuild, REBUILD_CODE_CHUNK):
+        bars_by_code = fetch_bars(supabase, chunk, None, target_date)
+        present = [code for code in chunk if bars_by_code.get(code)]
+        if present:
+            dates, close, high, low = build_matrix(present, bars_by_code)
+            state = IndicatorState(len(present))
+            values = compute_indicator_frame(close, high, low, state)
+            writer.add(present, dates, close, values, state)
+            rebuilt += len(present)
+        print(f"   rebuilt {rebuilt}/{len(to_rebuild)} codes", end="\r")
+    if to_rebuild:
+        print()
+    writer.flush()
+
+    print(
+        f"[INFO] Indicators done: advanced {advanced}, rebuilt {rebuilt}, "
+        f"{writer.daily_written} daily rows written"
+    )
+    return {
+        "codes": len(universe),
+        "advanced": advanced,
+        "rebuilt": rebuilt,
+        "daily_rows": writer.daily_written,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Advance stored chart indicators.")
+    parser.add_argument("--date", default=datetime.now().strftime("%Y-%m-%d"), help="Last date to include.")
+    parser.add_argument("--codes", help="Comma-separated codes (default: RS universe + KOSPI/KOSDAQ).")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore stored states and replay full histories.")
+    args = parser.parse_args()
+
+    load_env()
+    supabase = get_supabase_client()
+    report_on_exit("update_daily_indicators")
+    codes = [c.strip() for c in args.codes.split(",") if c.strip()] if args.codes else None
+    run(supabase, args.date, codes=codes, rebuild=args.rebuild)
+
+
+if __name__ == "__main__":
+    main()
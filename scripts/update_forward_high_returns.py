@@ -0,0 +1,297 @@
+"""Maintain the forward highs behind get_high_return_rankings.
+
+The /admin/game ranking RPC used to run ``max(high) over (rows between 1
+following and 252 following)`` over every daily_prices_v2 row in the
+requested range on each call. This batch stores that value per bar in
+``forward_high_returns`` (see the 20261019003000 migration), so the RPC only
+has to read the rows above ``min_return``.
+
+A new bar only changes the windows of the 252 bars before it, so a normal
+day reads each code's last ~400 days, recomputes those windows with a
+vectorized reverse rolling max and upserts the rows whose max or
+``window_end_date`` actually changed. ``forward_high_states`` remembers the
+last bar and close per code.
+
+Codes without a state, codes whose close at ``last_date`` changed (adjusted
+history reloaded by the ingest), codes with fewer than 252 bars in the
+fetched tail and all codes under ``--rebuild`` are recomputed from their full
+history. The first run is therefore a full backfill.
+
+Usage:
+    python3 scripts/update_forward_high_returns.py
+    python3 scripts/update_forward_high_returns.py --codes 005930 --rebuild
+"""
+
+import argparse
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from supabase import Client
+
+from pipeline_metrics import report_on_exit
+from supabase_batch import (
+    CLOSE_TOLERANCE,
+    PAGE_SIZE,
+    UPSERT_CHUNK,
+    chunked,
+    execute_with_retry,
+    fetch_bars,
+    get_supabase_client,
+    load_env,
+    upsert_rows,
+)
+
+# Rows following the base bar, as in the RPC's window frame.
+HORIZON = 252
+# Calendar days that hold HORIZON sessions before last_date with some slack.
+TAIL_FETCH_DAYS = 400
+INCREMENTAL_CODE_CHUNK = 100
+REBUILD_CODE_CHUNK = 10
+BAR_COLUMNS = "code, date, high, close"
+
+
+def forward_max(high: np.ndarray, horizon: int = HORIZON) -> np.ndarray:
+    """``out[i] = max(high[i + 1 : i + 1 + horizon])``; NaN where no bar follows.
+
+    Van Herk/Gil-Werman block prefix/suffix maxima, so the cost does not
+    depend on ``horizon``. NaN highs are skipped like SQL nulls in ``max``.
+    """
+    n = len(high)
+    if n == 0:
+        return np.empty(0)
+    values = np.where(np.isnan(high), -np.inf, high)
+    following = np.append(values[1:], -np.inf)
+    width = -(-(n + horizon) // horizon) * horizon
+    padded = np.full(width, -np.inf)
+    padded[:n] = following
+    blocks = padded.reshape(-1, horizon)
+    prefix = np.maximum.accumulate(blocks, axis=1).ravel()
+    suffix = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    out = np.maximum(suffix[:n], prefix[horizon - 1 : horizon - 1 + n])
+    return np.where(np.isneginf(out), np.nan, out)
+
+
+def window_end_index(n: int, horizon: int = HORIZON) -> np.ndarray:
+    """Index of each bar's last window bar, or -1 while the window is still open."""
+    end = np.arange(n) + horizon
+    return np.where(end < n, end, -1)
+
+
+def to_arrays(bars: List[dict]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    # The RPC only ever looked at bars with close > 0, in its windows too.
+    bars = [bar for bar in bars if bar["close"] > 0]
+    dates = [bar["date"] for bar in bars]
+    high = np.array([np.nan if bar.get("high") is None else bar["high"] for bar in bars], dtype=float)
+    close = np.array([bar["close"] for bar in bars], dtype=float)
+    return dates, high, close
+
+
+def build_rows(
+    code: str,
+    dates: List[str],
+    close: np.ndarray,
+    max_high: np.ndarray,
+    end_index: np.ndarray,
+    positions: Iterable[int],
+) -> List[dict]:
+    return [
+        {
+            "code": code,
+            "date": dates[i],
+            "close": float(close[i]),
+            "max_high": None if np.isnan(max_high[i]) else float(max_high[i]),
+            "window_end_date": dates[end_index[i]] if end_index[i] >= 0 else None,
+        }
+        for i in positions
+    ]
+
+
+def fetch_company_codes(supabase: Client) -> List[str]:
+    codes: List[str] = []
+    offset = 0
+    while True:
+        response = execute_with_retry(
+            lambda: supabase.table("companies")
+            .select("code")
+            .order("code")
+            .range(offset, offset + PAGE_SIZE - 1)
+            .execute(),
+            "fetch_companies",
+        )
+        rows = response.data or []
+        codes.extend(str(row["code"]) for row in rows if row.get("code"))
+        if len(rows) < PAGE_SIZE:
+            break
+        offset += PAGE_SIZE
+    return codes
+
+
+def fetch_states(supabase: Client) -> Dict[str, dict]:
+    states: Dict[str, dict] = {}
+    offset = 0
+    while True:
+        response = execute_with_retry(
+            lambda: supabase.table("forward_high_states")
+            .select("code, last_date, last_close")
+            .order("code")
+            .range(offset, offset + PAGE_SIZE - 1)
+            .execute(),
+            "fetch_forward_high_states",
+        )
+        rows = response.data or []
+        for row in rows:
+            states[str(row["code"])] = row
+        if len(rows) < PAGE_SIZE:
+            break
+        offset += PAGE_SIZE
+    return states
+
+
+class ForwardHighWriter:
+    def __init__(self, supabase: Client):
+        self.supabase = supabase
+        self.rows: List[dict] = []
+        self.states: List[dict] = []
+        self.rows_written = 0
+
+    def add(self, code: str, rows: List[dict], last_date: str, last_close: float) -> None:
+        self.rows.extend(rows)
+        self.states.append(
+            {
+                "code": code,
+                "last_date": last_date,
+                "last_close": last_close,
+                "updated_at": datetime.now().isoformat(timespec="seconds"),
+            }
+        )
+        if len(self.rows) >= UPSERT_CHUNK * 5:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.rows:
+            upsert_rows(self.supabase, "forward_high_returns", self.rows, "code,date")
+            self.rows_written += len(self.rows)
+            self.rows = []
+        # After the rows, so a stored state never runs ahead of them.
+        if self.states:
+            upsert_rows(self.supabase, "forward_high_states", self.states, "code")
+            self.states = []
+
+
+def advance_code(
+    code: str, bars: List[dict], last_date: str, last_close: Optional[float]
+) -> Optional[List[dict]]:
+    """Rows whose window changed since ``last_date``; None when the code needs a rebuild."""
+    dates, high, close = to_arrays(bars)
+    try:
+        k = dates.index(last_date)
+    except ValueError:
+        return None
+    if last_close is None or abs(close[k] - last_close) > CLOSE_TOLERANCE or k < HORIZON:
+        return None
+
+    old_max = forward_max(high[: k + 1])
+    old_end = window_end_index(k + 1)
+    new_max = forward_max(high)
+    new_end = window_end_index(len(dates))
+    changed = (old_end != new_end[: k + 1]) | ~(
+        (old_max == new_max[: k + 1]) | (np.isnan(old_max) & np.isnan(new_max[: k + 1]))
+    )
+    positions = list(np.flatnonzero(changed)) + list(range(k + 1, len(dates)))
+    return build_rows(code, dates, close, new_max, new_end, positions)
+
+
+def run(
+    supabase: Client,
+    target_date: str,
+    ctx=None,
+    codes: Optional[Iterable[str]] = None,
+    rebuild: bool = False,
+) -> dict:
+    """Bring every code's forward highs up to ``target_date``; returns counts per path."""
+    universe = sorted({str(code) for code in codes}) if codes is not None else fetch_company_codes(supabase)
+    print(f"[INFO] Forward highs: {len(universe)} codes up to {target_date}")
+
+    states = {} if rebuild else fetch_states(supabase)
+    reloaded = set(ctx.reloaded_codes) if ctx is not None else set()
+
+    to_rebuild: List[str] = []
+    by_last_date: Dict[str, List[str]] = defaultdict(list)
+    for code in universe:
+        stored = states.get(code)
+        if stored is None or code in reloaded:
+            to_rebuild.append(code)
+        elif str(stored["last_date"])[:10] < target_date:
+            by_last_date[str(stored["last_date"])[:10]].append(code)
+
+    writer = ForwardHighWriter(supabase)
+    advanced = mismatched = 0
+    for last_date, group in sorted(by_last_date.items()):
+        start_date = (
+            datetime.strptime(last_date, "%Y-%m-%d") - timedelta(days=TAIL_FETCH_DAYS)
+        ).strftime("%Y-%m-%d")
+        for chunk in chunked(group, INCREMENTAL_CODE_CHUNK):
+            bars_by_code = fetch_bars(supabase, chunk, start_date, target_date, BAR_COLUMNS)
+            for code in chunk:
+                bars = [bar for bar in bars_by_code.get(code, []) if bar["close"] > 0]
+                stored_close = states[code].get("last_close")
+                rows = advance_code(
+                    code, bars, last_date, None if stored_close is None else float(stored_close)
+                )
+                if rows is None:
+                    mismatched += 1
+                    to_rebuild.append(code)
+                    continue
+                if bars[-1]["date"] > last_date:
+                    writer.add(code, rows, bars[-1]["date"], bars[-1]["close"])
+                    advanced += 1
+
+    if to_rebuild:
+        print(f"[INFO] Rebuilding {len(to_rebuild)} codes from full history ({mismatched} with a short or changed tail)")
+    rebuilt = 0
+    for chunk in chunked(to_rebuild, REBUILD_CODE_CHUNK):
+        bars_by_code = fetch_bars(supabase, chunk, None, target_date, BAR_COLUMNS)
+        for code in chunk:
+            dates, high, close = to_arrays(bars_by_code.get(code, []))
+            if not dates:
+                continue
+            rows = build_rows(
+                code, dates, close, forward_max(high), window_end_index(len(dates)), range(len(dates))
+            )
+            writer.add(code, rows, dates[-1], float(close[-1]))
+            rebuilt += 1
+        print(f"   rebuilt {rebuilt}/{len(to_rebuild)} codes", end="\r")
+    if to_rebuild:
+        print()
+    writer.flush()
+
+    print(
+        f"[INFO] Forward highs done: advanced {advanced}, rebuilt {rebuilt}, "
+        f"{writer.rows_written} rows written"
+    )
+    return {
+        "codes": len(universe),
+        "advanced": advanced,
+        "rebuilt": rebuilt,
+        "rows": writer.rows_written,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain forward highs for the high-return ranking.")
+    parser.add_argument("--date", default=datetime.now().strftime("%Y-%m-%d"), help="Last date to include.")
+    parser.add_argument("--codes", help="Comma-separated codes (default: every code in companies).")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore stored states and recompute full histories.")
+    args = parser.parse_args()
+
+    load_env()
+    supabase = get_supabase_client()
+    report_on_exit("update_forward_high_returns")
+    codes = [c.strip() for c in args.codes.split(",") if c.strip()] if args.codes else None
+    run(supabase, args.date, codes=codes, rebuild=args.rebuild)
+
+
+if __name__ == "__main__":
+    main()
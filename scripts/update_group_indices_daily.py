@@ -7,6 +7,8 @@ import time
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+from pipeline_metrics import instrument_supabase, metrics, report_on_exit
+
 
 def load_env() -> None:
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -22,7 +24,7 @@ def get_supabase_client() -> Client:
     key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
     if not url or not key:
         raise RuntimeError("Supabase credentials not found in .env.local/.env")
-    return create_client(url, key)
+    return instrument_supabase(create_client(url, key))
 
 
 def execute_with_retry(callable_fn, label: str, retries: int = 5, delay: float = 1.0):
@@ -35,6 +37,7 @@ def execute_with_retry(callable_fn, label: str, retries: int = 5, delay: float =
             if attempt > retries:
                 raise
             wait = delay * (2 ** (attempt - 1))
+            metrics.retry(label.split(":")[0])
             print(f"[WARN] {label} failed ({exc}), retrying in {wait:.1f}s...")
             time.sleep(wait)
 
@@ -228,6 +231,22 @@ def fetch_prices(
     return rows
 
 
+def fetch_prices_from_context(
+    ctx,
+    codes: List[str],
+    start_date: date,
+    end_date: date,
+) -> List[dict]:
+    df = ctx.price_rows(
+        start_date.isoformat(), end_date.isoformat(), codes, end_inclusive=False
+    )
+    df = df[df["close"].notna()]
+    return [
+        {"code": code, "date": d.strftime("%Y-%m-%d"), "close": float(close)}
+        for code, d, close in zip(df["code"], df["date"], df["close"])
+    ]
+
+
 def compute_daily_avg_returns(
     rows: List[dict],
     period_start: date,
@@ -285,6 +304,7 @@ def update_index_series_incremental(
     rebalance_dates: List[date],
     base_date: date,
     latest_date: date,
+    ctx=None,
 ) -> bool:
     latest_row = fetch_latest_index_row(supabase, index_type, index_code)
     if not latest_row:
@@ -316,7 +336,10 @@ def update_index_series_incremental(
             continue
 
         fetch_start = max(period_start - timedelta(days=7), base_date)
-        rows = fetch_prices(supabase, codes, fetch_start, period_end)
+        if ctx is not None and ctx.covers(fetch_start):
+            rows = fetch_prices_from_context(ctx, codes, fetch_start, period_end)
+        else:
+            rows = fetch_prices(supabase, codes, fetch_start, period_end)
         if not rows:
             continue
 
@@ -350,15 +373,27 @@ def update_index_series_incremental(
     return True
 
 
-def main() -> None:
-    load_env()
-    supabase = get_supabase_client()
+def main(ctx=None) -> None:
+    """Extend every equal-weight index up to the latest trading date.
+
+    Inside the daily pipeline, constituent prices are read from the shared
+    ``PipelineContext`` whenever its window covers the period being extended.
+    """
+    if ctx is not None:
+        supabase = ctx.supabase
+    else:
+        load_env()
+        report_on_exit("update_group_indices_daily")
+        supabase = get_supabase_client()
 
     base_date = datetime.strptime(
         os.environ.get("INDEX_BASE_DATE", "2024-01-01"), "%Y-%m-%d"
     ).date()
 
-    latest_date = fetch_latest_trading_date(supabase)
+    if ctx is not None and not ctx.prices.empty:
+        latest_date = ctx.prices["date"].max().date()
+    else:
+        latest_date = fetch_latest_trading_date(supabase)
     if not latest_date:
         print("[ERROR] No trading dates found.")
         return
@@ -386,6 +421,7 @@ def main() -> None:
                     rebalance_dates=rebalance_dates,
                     base_date=base_date,
                     latest_date=latest_date,
+                    ctx=ctx,
                 )
             except Exception as exc:
                 print(f"[ERROR] {group}:{index_code} failed: {exc}")
@@ -0,0 +1,256 @@
+"""Advance the precomputed Livermore ATR states by the latest bars.
+
+The chart API used to replay the whole price history through
+computeLivermoreStateRows() on every request. This batch keeps the engine's
+terminal state per code in ``livermore_states`` and the per-bar output in
+``livermore_state_daily`` (see livermore_engine.py), so a normal day only
+reads the bars after each code's ``last_date`` and runs one engine step per
+code.
+
+A code is rebuilt from its full history when it has no stored state, when
+the close stored for ``last_date`` no longer matches daily_prices_v2 (the
+ingest rewrote an adjusted history after a split), or with ``--rebuild``.
+
+Usage:
+    python3 scripts/update_livermore_states.py
+    python3 scripts/update_livermore_states.py --codes 005930,KOSPI --rebuild
+"""
+
+import argparse
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from supabase import Client
+
+from livermore_engine import (
+    DEFAULT_CONFIRM_MULTIPLIER,
+    DEFAULT_REVERSAL_MULTIPLIER,
+    LivermoreEngine,
+)
+from pipeline_metrics import report_on_exit
+from rs_universe import load_rs_eligible_codes
+from supabase_batch import (
+    CLOSE_TOLERANCE,
+    INDEX_CODES,
+    PAGE_SIZE,
+    UPSERT_CHUNK,
+    chunked,
+    execute_with_retry,
+    fetch_bars,
+    get_supabase_client,
+    load_env,
+    to_float,
+    upsert_rows,
+)
+
+# Codes per daily_prices_v2 request; full-history rebuilds use fewer.
+INCREMENTAL_CODE_CHUNK = 200
+REBUILD_CODE_CHUNK = 10
+
+
+def fetch_states(
+    supabase: Client, reversal_multiplier: float, confirm_multiplier: float
+) -> Dict[str, dict]:
+    states: Dict[str, dict] = {}
+    offset = 0
+    while True:
+        response = execute_with_retry(
+            lambda: supabase.table("livermore_states")
+            .select("code, last_date, last_close, engine_state")
+            .eq("reversal_multiplier", reversal_multiplier)
+            .eq("confirm_multiplier", confirm_multiplier)
+            .order("code")
+            .range(offset, offset + PAGE_SIZE - 1)
+            .execute(),
+            "fetch_states",
+        )
+        rows = response.data or []
+        for row in rows:
+            states[str(row["code"])] = row
+        if len(rows) < PAGE_SIZE:
+            break
+        offset += PAGE_SIZE
+    return states
+
+
+class StateWriter:
+    """Collects engine output and flushes it in upsert-sized chunks."""
+
+    def __init__(self, supabase: Client, reversal_multiplier: float, confirm_multiplier: float):
+        self.supabase = supabase
+        self.keys = {
+            "reversal_multiplier": reversal_multiplier,
+            "confirm_multiplier": confirm_multiplier,
+        }
+        self.daily: List[dict] = []
+        self.states: List[dict] = []
+        self.daily_written = 0
+
+    def add(self, code: str, engine: LivermoreEngine, rows: List[dict], last_close: float) -> None:
+        self.daily.extend({"code": code, **self.keys, **row} for row in rows)
+        self.states.append(
+            {
+                "code": code,
+                **self.keys,
+                "last_date": engine.last_date,
+                "last_close": last_close,
+                "state": engine.state or rows[-1]["state"],
+                "engine_state": engine.to_state(),
+                "updated_at": datetime.now().isoformat(timespec="seconds"),
+            }
+        )
+        if len(self.daily) >= UPSERT_CHUNK * 5:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.daily:
+            upsert_rows(
+                self.supabase,
+                "livermore_state_daily",
+                self.daily,
+                "code,reversal_multiplier,confirm_multiplier,date",
+            )
+            self.daily_written += len(self.daily)
+            self.daily = []
+        # States go after their daily rows so a crash never leaves a state
+        # ahead of the rows it claims to have written.
+        if self.states:
+            upsert_rows(
+                self.supabase,
+                "livermore_states",
+                self.states,
+                "code,reversal_multiplier,confirm_multiplier",
+            )
+            self.states = []
+
+
+def rebuild_codes(
+    supabase: Client,
+    writer: StateWriter,
+    codes: List[str],
+    end_date: str,
+    reversal_multiplier: float,
+    confirm_multiplier: float,
+) -> int:
+    done = 0
+    for chunk in chunked(codes, REBUILD_CODE_CHUNK):
+        bars_by_code = fetch_bars(supabase, chunk, None, end_date)
+        for code in chunk:
+            bars = bars_by_code.get(code)
+            if not bars:
+                continue
+            engine = LivermoreEngine(reversal_multiplier, confirm_multiplier)
+            rows = engine.run(bars)
+            writer.add(code, engine, rows, bars[-1]["close"])
+            done += 1
+        print(f"   rebuilt {done}/{len(codes)} codes", end="\r")
+    if codes:
+        print()
+    return done
+
+
+def run(
+    supabase: Client,
+    target_date: str,
+    ctx=None,
+    codes: Optional[Iterable[str]] = None,
+    rebuild: bool = False,
+    reversal_multiplier: float = DEFAULT_REVERSAL_MULTIPLIER,
+    confirm_multiplier: float = DEFAULT_CONFIRM_MULTIPLIER,
+) -> dict:
+    """Advance every code to ``target_date``; returns counts per path."""
+    if codes is None:
+        eligible = ctx.get_eligible_codes() if ctx is not None else load_rs_eligible_codes(supabase)
+        universe = sorted(set(eligible) | set(INDEX_CODES))
+    else:
+        universe = sorted({str(code) for code in codes})
+    print(f"[INFO] Livermore states: {len(universe)} codes up to {target_date}")
+
+    states = {} if rebuild else fetch_states(supabase, reversal_multiplier, confirm_multiplier)
+    # Codes whose history the ingest rewrote this run cannot be advanced.
+    reloaded = set(ctx.reloaded_codes) if ctx is not None else set()
+
+    to_rebuild: List[str] = []
+    by_last_date: Dict[str, List[str]] = defaultdict(list)
+    for code in universe:
+        stored = states.get(code)
+        if stored is None or code in reloaded:
+            to_rebuild.append(code)
+        elif str(stored["last_date"])[:10] < target_date:
+            by_last_date[str(stored["last_date"])[:10]].append(code)
+
+    writer = StateWriter(supabase, reversal_multiplier, confirm_multiplier)
+    advanced = mismatched = 0
+    for last_date, group in sorted(by_last_date.items()):
+        for chunk in chunked(group, INCREMENTAL_CODE_CHUNK):
+            bars_by_code = fetch_bars(supabase, chunk, last_date, target_date)
+            for code in chunk:
+                stored = states[code]
+                bars = bars_by_code.get(code, [])
+                last_close = to_float(stored.get("last_close"))
+                if (
+                    not bars
+                    or bars[0]["date"] != last_date
+                    or last_close is None
+                    or abs(bars[0]["close"] - last_close) > CLOSE_TOLERANCE
+                ):
+                    # The bar the state ends on changed or vanished.
+                    mismatched += 1
+                    to_rebuild.append(code)
+                    continue
+                new_bars = bars[1:]
+                if not new_bars:
+                    continue
+                engine = LivermoreEngine.from_state(
+                    stored["engine_state"], reversal_multiplier, confirm_multiplier
+                )
+                rows = engine.run(new_bars)
+                writer.add(code, engine, rows, new_bars[-1]["close"])
+                advanced += 1
+
+    if to_rebuild:
+        print(f"[INFO] Rebuilding {len(to_rebuild)} codes from full history ({mismatched} after a history change)")
+    rebuilt = rebuild_codes(
+        supabase, writer, to_rebuild, target_date, reversal_multiplier, confirm_multiplier
+    )
+    writer.flush()
+
+    summary = {
+        "codes": len(universe),
+        "advanced": advanced,
+        "rebuilt": rebuilt,
+        "daily_rows": writer.daily_written,
+    }
+    print(
+        f"[INFO] Livermore states done: advanced {advanced}, rebuilt {rebuilt}, "
+        f"{writer.daily_written} daily rows written"
+    )
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Advance precomputed Livermore ATR states.")
+    parser.add_argument("--date", default=datetime.now().strftime("%Y-%m-%d"), help="Last date to include.")
+    parser.add_argument("--codes", help="Comma-separated codes (default: RS universe + KOSPI/KOSDAQ).")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore stored states and replay full histories.")
+    parser.add_argument("--reversal-mult", type=float, default=DEFAULT_REVERSAL_MULTIPLIER)
+    parser.add_argument("--confirm-mult", type=float, default=DEFAULT_CONFIRM_MULTIPLIER)
+    args = parser.parse_args()
+
+    load_env()
+    supabase = get_supabase_client()
+    report_on_exit("update_livermore_states")
+    codes = [c.strip() for c in args.codes.split(",") if c.strip()] if args.codes else None
+    run(
+        supabase,
+        args.date,
+        codes=codes,
+        rebuild=args.rebuild,
+        reversal_multiplier=args.reversal_mult,
+        confirm_multiplier=args.confirm_mult,
+    )
+
+
+if __name__ == "__main__":
+    main()
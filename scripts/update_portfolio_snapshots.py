@@ -0,0 +1,447 @@
+"""Nightly mark-to-market snapshots of every user's portfolio.
+
+The portfolio page (admin/MH/portfolio) rebuilt positions from
+user_portfolio, user_portfolio_transactions and
+user_portfolio_group_averages and fetched the latest close of each holding
+on every view. This step computes the same figures for all users at once
+after the price ingest and stores them (20261019011000):
+
+- user_portfolio_snapshots: per user, trading day and (company_code,
+  position_type) group held at the close: quantity, average cost, price,
+  market value, unrealized / realized P&L, R;
+- user_portfolio_nav: per user and trading day: long / short value, cost,
+  unrealized, cumulative realized and total P&L.
+
+Each table is read once for all users and joined in memory. A lot's
+holding on day d is replayed backwards from its current position_size and
+the SELL rows after d (legacy lots closed without a SELL log hold their
+initial size until close_date), so the whole range comes out of one
+cumulative sum over a lots x trading-days event matrix. Average cost is the
+position-weighted lot average, or the stored group average from the
+group's last buy on (buys recalculate it, sells keep it), as on the page.
+Unrealized P&L is signed for 숏 positions.
+
+Without dates the step continues from the day after the newest stored
+snapshot, reaching back to any entry or sell recorded since then with an
+earlier date; the first run covers every day since the first entry.
+Recomputed days are replaced as a whole: the new rows are upserted, then
+the range's older rows are dropped.
+
+Usage:
+    python3 scripts/update_portfolio_snapshots.py
+    python3 scripts/update_portfolio_snapshots.py --start-date 2024-01-01 --end-date 2026-10-16
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from supabase import Client
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPT_DIR not in sys.path:
+    sys.path.append(SCRIPT_DIR)
+
+import pg_bulk  # noqa: E402
+from keyset_pager import fetch_all  # noqa: E402
+from pipeline_metrics import report_on_exit  # noqa: E402
+from supabase_batch import execute_with_retry, get_supabase_client, load_env  # noqa: E402
+
+SNAPSHOT_TABLE = "user_portfolio_snapshots"
+NAV_TABLE = "user_portfolio_nav"
+# Closes are carried forward from up to this many calendar days before the
+# range, so a halted code still has a price.
+PRICE_LOOKBACK_DAYS = 30
+CALENDAR_CODE = "KOSPI"
+SHORT = "숏"
+LOT_COLUMNS = (
+    "id, user_id, entry_date, company_code, company_name, position_type, position_size, avg_price, "
+    "stop_loss, initial_position_size, realized_pnl, sector, is_closed, close_date, is_custom_asset, "
+    "manual_current_price, created_at"
+)
+SELL_COLUMNS = "id, portfolio_id, transaction_date, quantity, realized_pnl, created_at"
+GROUP_KEYS = ["user_id", "company_code", "position_type"]
+
+
+def _shift(date_str: str, days: int) -> str:
+    return (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def _numeric(frame: pd.DataFrame, columns) -> None:
+    for column in columns:
+        frame[column] = pd.to_numeric(frame[column], errors="coerce")
+
+
+# ----------------------------------------------------------------------
+# Loads
+# ----------------------------------------------------------------------
+def load_book(supabase: Client) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """(lots, sells, group averages) of every user."""
+    lots = pd.DataFrame(
+        fetch_all(supabase, "user_portfolio", LOT_COLUMNS, keys=("id",), label="portfolio:lots"),
+        columns=[c.strip() for c in LOT_COLUMNS.split(",")],
+    )
+    sells = pd.DataFrame(
+        fetch_all(
+            supabase,
+            "user_portfolio_transactions",
+            SELL_COLUMNS,
+            keys=("id",),
+            filters=lambda q: q.eq("transaction_type", "SELL"),
+            label="portfolio:sells",
+        ),
+        columns=[c.strip() for c in SELL_COLUMNS.split(",")],
+    )
+    averages = pd.DataFrame(
+        execute_with_retry(
+            lambda: supabase.table("user_portfolio_group_averages")
+            .select("user_id, company_code, position_type, avg_price")
+            .execute(),
+            "portfolio:group_averages",
+        ).data
+        or [],
+        columns=GROUP_KEYS + ["avg_price"],
+    )
+    _numeric(lots, ("position_size", "avg_price", "stop_loss", "initial_position_size", "realized_pnl", "manual_current_price"))
+    _numeric(sells, ("quantity", "realized_pnl"))
+    _numeric(averages, ("avg_price",))
+    lots["is_closed"] = lots["is_closed"].fillna(False).astype(bool)
+    lots["is_custom_asset"] = lots["is_custom_asset"].fillna(False).astype(bool)
+    return lots, sells, averages
+
+
+def load_closes(supabase: Client, codes: List[str], start: str, end: str, ctx=None) -> pd.DataFrame:
+    """code, date (Timestamp), close for ``codes`` and the calendar code over the lookback + range."""
+    lookback = _shift(start, -PRICE_LOOKBACK_DAYS)
+    wanted = sorted(set(codes) | {CALENDAR_CODE})
+    if ctx is not None and ctx.covers(lookback):
+        frame = ctx.price_rows(lookback, end, wanted)[["code", "date", "close"]].copy()
+    else:
+        rows = fetch_all(
+            supabase,
+            "daily_prices_v2",
+            "code, date, close",
+            filters=lambda q: q.in_("code", wanted),
+            start=lookback,
+            end=end,
+            label="portfolio:closes",
+        )
+        frame = pd.DataFrame(rows, columns=["code", "date", "close"])
+        frame["date"] = pd.to_datetime(frame["date"])
+    frame["close"] = pd.to_numeric(frame["close"], errors="coerce")
+    return frame
+
+
+def latest_snapshot(supabase: Client) -> Optional[dict]:
+    rows = execute_with_retry(
+        lambda: supabase.table(NAV_TABLE).select("date, updated_at").order("date", desc=True).limit(1).execute(),
+        "portfolio:latest",
+    ).data
+    return rows[0] if rows else None
+
+
+def default_start(supabase: Client, lots: pd.DataFrame, sells: pd.DataFrame) -> Optional[str]:
+    """Day after the newest snapshot, or the earliest date touched by rows recorded since."""
+    entries = lots["entry_date"].dropna()
+    if entries.empty:
+        return None
+    latest = latest_snapshot(supabase)
+    if latest is None:
+        return str(entries.min())
+    start = _shift(str(latest["date"]), 1)
+    since = pd.Timestamp(latest["updated_at"])
+    since = since.tz_localize("UTC") if since.tzinfo is None else since
+    backdated = [
+        *lots.loc[pd.to_datetime(lots["created_at"], utc=True) > since, "entry_date"].dropna().astype(str),
+        *sells.loc[pd.to_datetime(sells["created_at"], utc=True) > since, "transaction_date"].dropna().astype(str),
+    ]
+    return min([start, *backdated])
+
+
+# ----------------------------------------------------------------------
+# Replay
+# ----------------------------------------------------------------------
+def lot_events(lots: pd.DataFrame, sells: pd.DataFrame) -> pd.DataFrame:
+    """lot (row position in ``lots``), date, quantity change, realized P&L change."""
+    lot_pos = pd.Series(np.arange(len(lots)), index=lots["id"].astype(str))
+    sells = sells[sells["portfolio_id"].astype(str).isin(lot_pos.index)]
+    sell_lot = lot_pos.loc[sells["portfolio_id"].astype(str)].to_numpy()
+    sold = np.bincount(sell_lot, weights=sells["quantity"].fillna(0).to_numpy(), minlength=len(lots))
+    sold_pnl = np.bincount(sell_lot, weights=sells["realized_pnl"].fillna(0).to_numpy(), minlength=len(lots))
+    logged = np.bincount(sell_lot, minlength=len(lots)) > 0
+
+    size = lots["position_size"].fillna(0).to_numpy()
+    initial = lots["initial_position_size"].fillna(0).to_numpy()
+    legacy_closed = lots["is_closed"].to_numpy() & ~logged
+    # Current size plus everything sold since; legacy closed lots never
+    # logged their sells, so their opening size is the initial one.
+    opening = np.where(legacy_closed, np.where(initial > 0, initial, size), size + sold)
+    realized = lots["realized_pnl"].fillna(0).to_numpy()
+    close_date = lots["close_date"].where(lots["close_date"].notna(), lots["entry_date"])
+    last_sell = sells.groupby(sell_lot)["transaction_date"].max().reindex(range(len(lots)))
+    # Realized P&L the SELL log does not explain (legacy closes, manual
+    # edits) counts from the close, or from the last sell / entry.
+    rest_date = np.where(lots["is_closed"].to_numpy(), close_date, last_sell.fillna(lots["entry_date"]).to_numpy())
+
+    lot_index = np.arange(len(lots))
+    frames = [
+        pd.DataFrame({"lot": lot_index, "date": lots["entry_date"], "qty": opening, "pnl": 0.0}),
+        pd.DataFrame(
+            {
+                "lot": sell_lot,
+                "date": sells["transaction_date"].to_numpy(),
+                "qty": -sells["quantity"].fillna(0).to_numpy(),
+                "pnl": sells["realized_pnl"].fillna(0).to_numpy(),
+            }
+        ),
+        pd.DataFrame(
+            {
+                "lot": lot_index[legacy_closed],
+                "date": close_date.to_numpy()[legacy_closed],
+                "qty": -opening[legacy_closed],
+                "pnl": 0.0,
+            }
+        ),
+        pd.DataFrame({"lot": lot_index, "date": rest_date, "qty": 0.0, "pnl": realized - sold_pnl}),
+    ]
+    events = pd.concat(frames, ignore_index=True)
+    events = events[events["date"].notna() & ((events["qty"] != 0) | (events["pnl"] != 0))]
+    events["date"] = pd.to_datetime(events["date"])
+    return events
+
+
+def cumulate(events: pd.DataFrame, n_lots: int, days: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(held, realized) lots x days at each day's close; events before the range count from day 0."""
+    day_idx = np.searchsorted(days, events["date"].to_numpy(dtype="datetime64[ns]"), side="left")
+    inside = day_idx < len(days)
+    lots = events["lot"].to_numpy()[inside]
+    day_idx = day_idx[inside]
+    held = np.zeros((n_lots, len(days)))
+    realized = np.zeros((n_lots, len(days)))
+    np.add.at(held, (lots, day_idx), events["qty"].to_numpy()[inside])
+    np.add.at(realized, (lots, day_idx), events["pnl"].to_numpy()[inside])
+    held = np.cumsum(held, axis=1)
+    held[np.abs(held) < 1e-9] = 0.0
+    return held, np.cumsum(realized, axis=1)
+
+
+def price_matrix(closes: pd.DataFrame, codes: List[str], days: np.ndarray) -> np.ndarray:
+    """codes x days close, carried forward from the lookback (NaN when never priced)."""
+    if closes.empty:
+        return np.full((len(codes), len(days)), np.nan)
+    wide = closes.pivot_table(index="date", columns="code", values="close", aggfunc="last")
+    calendar = wide.index.union(pd.DatetimeIndex(days))
+    wide = wide.reindex(calendar).ffill().reindex(pd.DatetimeIndex(days))
+    return wide.reindex(columns=codes).to_numpy().T
+
+
+def mark_to_market(
+    lots: pd.DataFrame,
+    sells: pd.DataFrame,
+    averages: pd.DataFrame,
+    closes: pd.DataFrame,
+    days: np.ndarray,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """(snapshot rows, nav rows) for ``days`` (datetime64, ascending)."""
+    lots = lots[lots["entry_date"].notna()].reset_index(drop=True)
+    if lots.empty or len(days) == 0:
+        return pd.DataFrame(), pd.DataFrame()
+
+    lots = lots.sort_values(GROUP_KEYS, kind="stable").reset_index(drop=True)
+    held, realized = cumulate(lot_events(lots, sells), len(lots), days)
+
+    group_start = np.flatnonzero(
+        np.r_[True, (lots[GROUP_KEYS].iloc[1:].to_numpy() != lots[GROUP_KEYS].iloc[:-1].to_numpy()).any(axis=1)]
+    )
+    groups = lots.iloc[group_start].reset_index(drop=True)
+
+    def per_group(values: np.ndarray) -> np.ndarray:
+        return np.add.reduceat(values, group_start, axis=0)
+
+    avg = lots["avg_price"].fillna(0).to_numpy()[:, None]
+    stop = lots["stop_loss"].fillna(0).to_numpy()[:, None]
+    sign = np.where(lots["position_type"].to_numpy() == SHORT, -1.0, 1.0)[:, None]
+    initial = lots["initial_position_size"].fillna(lots["position_size"]).fillna(0).to_numpy()[:, None]
+    holding = held > 0
+
+    quantity = per_group(held)
+    cost = per_group(held * avg)
+    stop_amount = per_group(held * stop)
+    r_value = per_group(np.where(holding, (avg - stop) * initial * sign, 0.0))
+    lot_count = per_group(holding.astype(int))
+    realized_g = per_group(realized)
+    open_g = quantity > 0
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_price = np.where(open_g, cost / quantity, 0.0)
+        stop_loss = np.where(open_g, stop_amount / quantity, np.nan)
+
+    # The stored group average holds from the group's last buy on.
+    stored = groups[GROUP_KEYS].merge(averages, on=GROUP_KEYS, how="left")["avg_price"].to_numpy()
+    last_buy = (
+        lots.assign(_g=np.repeat(np.arange(len(groups)), np.diff(np.r_[group_start, len(lots)])))
+        .loc[~lots["is_closed"]]
+        .groupby("_g")["entry_date"]
+        .max()
+        .reindex(range(len(groups)))
+    )
+    last_buy_days = pd.to_datetime(last_buy).to_numpy(dtype="datetime64[ns]")
+    use_stored = (
+        ~np.isnan(stored)[:, None]
+        & (days[None, :] >= last_buy_days[:, None])
+        & open_g
+    )
+    avg_price = np.where(use_stored, stored[:, None], avg_price)
+    cost = np.where(open_g, avg_price * quantity, 0.0)
+
+    codes = groups["company_code"].astype(str).tolist()
+    price = price_matrix(closes, sorted(set(codes)), days)
+    code_row = {code: i for i, code in enumerate(sorted(set(codes)))}
+    price = price[[code_row[code] for code in codes]]
+    manual = lots.groupby(np.repeat(np.arange(len(groups)), np.diff(np.r_[group_start, len(lots)])))[
+        "manual_current_price"
+    ].max()
+    custom = groups["is_custom_asset"].to_numpy()
+    price[custom] = manual.to_numpy()[custom][:, None]
+
+    group_sign = np.where(groups["position_type"].to_numpy() == SHORT, -1.0, 1.0)[:, None]
+    market_value = price * quantity
+    unrealized = group_sign * (market_value - cost)
+
+    g_idx, d_idx = np.nonzero(open_g)
+    day_strings = pd.DatetimeIndex(days).strftime("%Y-%m-%d").to_numpy()
+    snapshots = pd.DataFrame(
+        {
+            "user_id": groups["user_id"].to_numpy()[g_idx],
+            "date": day_strings[d_idx],
+            "company_code": groups["company_code"].to_numpy()[g_idx],
+            "position_type": groups["position_type"].to_numpy()[g_idx],
+            "company_name": groups["company_name"].to_numpy()[g_idx],
+            "sector": groups["sector"].to_numpy()[g_idx],
+            "is_custom_asset": custom[g_idx],
+            "lots": lot_count[g_idx, d_idx],
+            "quantity": np.round(quantity[g_idx, d_idx], 4),
+            "avg_price": np.round(avg_price[g_idx, d_idx], 4),
+            "stop_loss": np.round(stop_loss[g_idx, d_idx], 4),
+            "cost_amount": np.round(cost[g_idx, d_idx], 2),
+            "price": np.round(price[g_idx, d_idx], 4),
+            "market_value": np.round(market_value[g_idx, d_idx], 2),
+            "unrealized_pnl": np.round(unrealized[g_idx, d_idx], 2),
+            "realized_pnl": np.round(realized_g[g_idx, d_idx], 2),
+            "r_value": np.round(r_value[g_idx, d_idx], 2),
+        }
+    )
+
+    # Per user: sums over groups (closed groups still carry realized P&L).
+    users, user_of_group = np.unique(groups["user_id"].astype(str).to_numpy(), return_inverse=True)
+    order = np.argsort(user_of_group, kind="stable")
+    user_start = np.flatnonzero(np.r_[True, np.diff(user_of_group[order]) != 0])
+
+    def per_user(values: np.ndarray) -> np.ndarray:
+        return np.add.reduceat(values[order], user_start, axis=0)
+
+    is_long = (group_sign > 0) & open_g
+    is_short = (group_sign < 0) & open_g
+    long_value = per_user(np.where(is_long, np.nan_to_num(market_value), 0.0))
+    short_value = per_user(np.where(is_short, np.nan_to_num(market_value), 0.0))
+    user_cost = per_user(cost)
+    user_unrealized = per_user(np.where(open_g, np.nan_to_num(unrealized), 0.0))
+    user_realized = per_user(realized_g)
+    positions = per_user(open_g.astype(int))
+    first_entry = (
+        pd.to_datetime(lots.groupby(lots["user_id"].astype(str))["entry_date"].min())
+        .reindex(users)
+        .to_numpy(dtype="datetime64[ns]")
+    )
+    u_idx, n_idx = np.nonzero(days[None, :] >= first_entry[:, None])
+    nav = pd.DataFrame(
+        {
+            "user_id": users[u_idx],
+            "date": day_strings[n_idx],
+            "positions": positions[u_idx, n_idx],
+            "long_value": np.round(long_value[u_idx, n_idx], 2),
+            "short_value": np.round(short_value[u_idx, n_idx], 2),
+            "cost_amount": np.round(user_cost[u_idx, n_idx], 2),
+            "unrealized_pnl": np.round(user_unrealized[u_idx, n_idx], 2),
+            "realized_pnl": np.round(user_realized[u_idx, n_idx], 2),
+            "total_pnl": np.round(user_unrealized[u_idx, n_idx] + user_realized[u_idx, n_idx], 2),
+        }
+    )
+    return snapshots, nav
+
+
+# ----------------------------------------------------------------------
+# Save
+# ----------------------------------------------------------------------
+def _records(frame: pd.DataFrame) -> List[dict]:
+    frame = frame.astype(object).where(frame.notna(), None)
+    return frame.to_dict("records")
+
+
+def save(supabase: Client, snapshots: pd.DataFrame, nav: pd.DataFrame, start: str, end: str) -> None:
+    """Replace the range's snapshots: positions sold or deleted since must not linger.
+
+    The new rows go in first, then the range's rows an earlier run left
+    (older ``updated_at``) are dropped, so a failure part way never leaves
+    the range empty.
+    """
+    stamp = datetime.now().astimezone().isoformat()
+    pg_bulk.upsert(
+        supabase, SNAPSHOT_TABLE, _records(snapshots.assign(updated_at=stamp)),
+        on_conflict="user_id,date,company_code,position_type",
+    )
+    pg_bulk.upsert(supabase, NAV_TABLE, _records(nav.assign(updated_at=stamp)), on_conflict="user_id,date")
+    for table in (SNAPSHOT_TABLE, NAV_TABLE):
+        execute_with_retry(
+            lambda: supabase.table(table).delete().gte("date", start).lte("date", end).lt("updated_at", stamp).execute(),
+            f"portfolio:prune:{table}",
+        )
+
+
+def run(supabase: Client, target_date: str, ctx=None, start_date: Optional[str] = None) -> int:
+    """Snapshots of start_date (default: see module doc) ~ target_date; returns the nav rows written."""
+    lots, sells, averages = load_book(supabase)
+    if start_date is None:
+        start_date = default_start(supabase, lots, sells)
+    if start_date is None:
+        print("[INFO] No portfolio positions")
+        return 0
+    if start_date > target_date:
+        print(f"[INFO] Portfolio snapshots already up to date ({target_date})")
+        return 0
+
+    codes = sorted(set(lots.loc[~lots["is_custom_asset"], "company_code"].dropna().astype(str)))
+    closes = load_closes(supabase, codes, start_date, target_date, ctx)
+    window = closes["date"].between(pd.Timestamp(start_date), pd.Timestamp(target_date))
+    calendar = closes.loc[window & (closes["code"] == CALENDAR_CODE), "date"]
+    if calendar.empty:
+        calendar = closes.loc[window, "date"]
+    days = np.sort(calendar.unique()).astype("datetime64[ns]")
+    if len(days) == 0:
+        print(f"[INFO] No trading days between {start_date} and {target_date}")
+        return 0
+
+    print(f"[INFO] Portfolio snapshots {start_date} ~ {target_date}: {len(lots)} lots, {len(sells)} sells, {len(days)} days")
+    snapshots, nav = mark_to_market(lots, sells, averages, closes, days)
+    save(supabase, snapshots, nav, start_date, target_date)
+    print(f"[INFO] Portfolio snapshots done: {len(snapshots)} positions, {len(nav)} nav rows")
+    return len(nav)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mark every user's portfolio to market.")
+    parser.add_argument("--start-date", help="YYYY-MM-DD (default: day after the newest snapshot)")
+    parser.add_argument("--end-date", default=datetime.now().strftime("%Y-%m-%d"), help="YYYY-MM-DD")
+    args = parser.parse_args()
+
+    load_env()
+    report_on_exit("update_portfolio_snapshots")
+    run(get_supabase_client(), args.end_date, start_date=args.start_date)
+
+
+if __name__ == "__main__":
+    main()
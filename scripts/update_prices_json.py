@@ -3,9 +3,9 @@ import FinanceDataReader as fdr
 import pandas as pd
 from supabase import create_client, Client
 from dotenv import load_dotenv
-import time
 import json
 from datetime import datetime
+from storage_uploader import StorageUploader
 
 # 1. 설정 로드
 load_dotenv('.env.local')
@@ -44,6 +44,7 @@ except Exception as e:
 # 과거 데이터부터 쭉 쌓아두는 용도이므로 2010년부터 시작
 START_DATE = '2010-01-01'
 failed_list = []
+uploader = StorageUploader(supabase)
 
 print(f"2. {START_DATE} ~ 현재 데이터 수집 및 업로드...")
 
@@ -73,36 +74,16 @@ for idx, stock in enumerate(target_stocks):
         
         json_data = df.to_json(orient='records')
 
-        # 업로드 (재시도 로직 포함)
-        max_retries = 5
-        for attempt in range(max_retries):
-            try:
-                supabase.storage.from_("stocks").upload(
-                    file=json_data.encode('utf-8'),
-                    path=f"{code}.json",
-                    file_options={"content-type": "application/json", "upsert": "true"}
-                )
-                break # 성공하면 탈출
-            except Exception as upload_err:
-                error_msg = str(upload_err)
-                # 429 에러(속도 제한) 대응
-                if "429" in error_msg or "Too Many Requests" in error_msg:
-                    wait_time = (attempt + 1) * 5 
-                    if attempt == 0: # 첫 실패 때만 로그 출력 (너무 시끄러우니까)
-                        print(f"   ⏳ 속도 제한! {wait_time}초 대기 후 재시도...")
-                    time.sleep(wait_time)
-                elif attempt == max_retries - 1:
-                    raise upload_err # 마지막 시도도 실패하면 에러 던짐
-                else:
-                    # 다른 에러면 1초만 쉬고 재시도
-                    time.sleep(1)
+        # 업로드는 동시 업로더에 넘기고 다음 종목 수집을 계속한다.
+        # (429 대응/재시도는 업로더가 동시성 창을 줄여가며 처리)
+        uploader.submit(f"{code}.json", json_data, code=code, name=name)
 
     except Exception as e:
         print(f"   ❌ {name}({code}) 최종 실패: {e}")
         failed_list.append({"code": code, "name": name, "error": str(e)})
-        
-    # 기본 안전 딜레이
-    time.sleep(0.05)
+
+print("   - 남은 업로드 마무리 중...")
+failed_list.extend(uploader.close())
 
 # ---------------------------------------------------------
 # 3. 결과 리포트
@@ -4,8 +4,23 @@ import numpy as np
 from supabase import create_client, Client
 from dotenv import load_dotenv
 import json
-import time
 import io
+import sys
+import argparse
+from storage_uploader import StorageUploader, load_failed_log
+from keyset_pager import fetch_all
+
+parser = argparse.ArgumentParser(description="Storage JSON에 RS지수 추가")
+parser.add_argument(
+    "--failed-log",
+    help="failed_log.json 형식 파일을 주면 RS는 전체로 계산하되 해당 종목 파일만 다시 올린다",
+)
+parser.add_argument(
+    "--failures-out",
+    default="failed_log.json",
+    help="업로드 실패 종목을 기록할 파일 (기본: failed_log.json)",
+)
+args = parser.parse_args()
 
 # 1. 설정 로드
 load_dotenv('.env.local')
@@ -26,8 +41,8 @@ print("🚀 JSON 파일 RS지수 업데이트 시작 (대공사)...")
 print("1. 저장된 파일 목록 조회 중...")
 # Storage API는 한 번에 많은 리스트를 가져오기 어려우므로, 
 # 'companies' 테이블(이미 DB에 있음)을 이용해서 코드 리스트를 확보합니다.
-response = supabase.table("companies").select("code, name").range(0, 9999).execute()
-target_stocks = response.data
+# 한 번에 select하면 PostgREST max-rows(1000)에서 잘리므로 코드 순서로 페이지를 넘긴다.
+target_stocks = fetch_all(supabase, "companies", "code, name", keys=("code",), label="companies")
 
 print(f"   - 총 {len(target_stocks)}개 종목 대상")
 
@@ -120,6 +135,13 @@ for c, t, r in zip(rs_long['code'], rs_long['time_str'], rs_long['rs']):
     rs_dict[(c, t)] = r
 
 print("   - 업로드 시작...")
+uploader = StorageUploader(supabase)
+
+# RS 순위는 전체 종목 기준이라 계산은 전부 하고, 실패 로그가 있으면 그 종목만 올린다
+if args.failed_log:
+    only_codes = {row['code'] for row in load_failed_log(args.failed_log)}
+    all_data_frames = [df for df in all_data_frames if df['code'].iloc[0] in only_codes]
+    print(f"   - 실패 로그 대상 {len(all_data_frames)}개만 재업로드")
 
 # 원래 데이터프레임 리스트를 순회하며 업데이트
 for idx, df in enumerate(all_data_frames):
@@ -141,27 +163,16 @@ for idx, df in enumerate(all_data_frames):
         json_data = save_df.to_json(orient='records')
 
         # 재업로드 (덮어쓰기)
-        # 429 에러 방지 로직 포함
-        for attempt in range(5):
-            try:
-                supabase.storage.from_("stocks").upload(
-                    file=json_data.encode('utf-8'),
-                    path=f"{code}.json",
-                    file_options={"content-type": "application/json", "upsert": "true"}
-                )
-                break
-            except Exception as err:
-                if "429" in str(err):
-                    time.sleep(2 * (attempt + 1))
-                elif attempt == 4:
-                    print(f"      ❌ {code} 업로드 실패: {err}")
-                else:
-                    time.sleep(0.5)
-        
-        # 너무 빠르면 로컬 PC 네트워크도 막힐 수 있으니 미세한 딜레이
-        time.sleep(0.02)
+        # 429 대응은 업로더가 동시성 창을 줄여가며 처리
+        uploader.submit(f"{code}.json", json_data, code=code)
 
     except Exception as e:
         print(f"      ❌ {code} 처리 중 에러: {e}")
 
+failed_uploads = uploader.close()
+if failed_uploads:
+    uploader.write_failures(args.failures_out)
+    print(f"\n🚨 {len(failed_uploads)}개 파일 업로드 실패 -> '{args.failures_out}' 확인 후 retry_json_upload.py --failed-log 로 재시도하세요.")
+    sys.exit(1)
+
 print("\n🎉 모든 과거 데이터 RS 업데이트 완료!")
\ No newline at end of file
@@ -1,7 +1,10 @@
+import hashlib
 import os
 import sys
 import json
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 import requests
@@ -15,58 +18,152 @@ if SCRIPT_DIR not in sys.path:
     sys.path.append(SCRIPT_DIR)
 
 import kis_master_loader  # noqa: E402
+from listing_stats import ListingStatsTracker  # noqa: E402
+from pipeline_metrics import instrument_supabase, metrics, report_on_exit  # noqa: E402
 
 
 load_dotenv(".env.local")
 
+
+def load_credentials() -> list[tuple[str, str]]:
+    """KIS (app key, secret) pairs: KIS_APP_KEY/KIS_APP_SECRET, then
+    KIS_APP_KEY_2/KIS_APP_SECRET_2, _3, ... up to the first missing pair."""
+    credentials = []
+    for suffix in ["", *(f"_{n}" for n in range(2, 100))]:
+        app_key = os.environ.get(f"KIS_APP_KEY{suffix}")
+        app_secret = os.environ.get(f"KIS_APP_SECRET{suffix}")
+        if not app_key or not app_secret:
+            break
+        credentials.append((app_key, app_secret))
+    return credentials
+
+
 SUPABASE_URL = os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
-APP_KEY = os.environ.get("KIS_APP_KEY")
-APP_SECRET = os.environ.get("KIS_APP_SECRET")
+KIS_CREDENTIALS = load_credentials()
 
 if not SUPABASE_URL or not SUPABASE_KEY:
     print("ERROR: Missing Supabase environment variables.")
     sys.exit(1)
 
-if not APP_KEY or not APP_SECRET:
+if not KIS_CREDENTIALS:
     print("ERROR: Missing KIS environment variables.")
     print("       Please set KIS_APP_KEY and KIS_APP_SECRET in .env.local.")
     sys.exit(1)
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# The first account; things bound to a single account (websocket approval)
+# use it, quotation calls go through key_pool.
+APP_KEY, APP_SECRET = KIS_CREDENTIALS[0]
+
+supabase: Client = instrument_supabase(create_client(SUPABASE_URL, SUPABASE_KEY))
 
 KIS_BASE_URL = "https://openapi.koreainvestment.com:9443"
 TOKEN_MIN_INTERVAL_SEC = 300
 API_MIN_INTERVAL_SEC = 0.11
+KIS_REQUEST_ATTEMPTS = 3
+# Threads per app key for the stock loop; enough to keep each key's bucket busy
+# while others wait on KIS or the database.
+INGEST_WORKERS_PER_KEY = 3
+
+# Tokens live 24h and KIS issues one per minute per key, so reruns reuse the
+# cached one. The directory is git-ignored.
+TOKEN_CACHE_DIR = os.environ.get("KIS_TOKEN_CACHE_DIR", os.path.join(SCRIPT_DIR, "output", "kis_tokens"))
+TOKEN_EXPIRY_MARGIN_SEC = 600
+# A key failing this many times in a row (token issue, auth) sits out
+# KEY_COOLDOWN_SEC while the other keys carry the load.
+KEY_FAILURE_LIMIT = 3
+KEY_COOLDOWN_SEC = 60
+# How long a rate-limit answer pauses that key's bucket.
+THROTTLE_PAUSE_SEC = 1.0
+
+TOKEN_ERROR_CODES = {"EGW00121", "EGW00123", "EGW00124", "EGW00125"}
+# "초당 거래건수를 초과하였습니다" - KIS answers rate-limit hits with HTTP 500 + this code.
+RATE_LIMIT_CODES = {"EGW00201"}
 
-TOKEN_ERROR_CODES = {"EGW00123", "EGW00124", "EGW00125"}
+
+class KisApiError(RuntimeError):
+    """A KIS call that still failed for a transient reason (throttled, token)
+    after kis_request's retries; worth trying again later."""
 
 
 class RateLimiter:
+    """Spaces calls ``min_interval_sec`` apart, across threads."""
+
     def __init__(self, min_interval_sec: float):
         self.min_interval_sec = min_interval_sec
-        self._last_call = 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def next_free(self) -> float:
+        return max(time.monotonic(), self._next_slot)
+
+    def reserve(self) -> float:
+        """Claim the next free slot (a time.monotonic() value)."""
+        with self._lock:
+            slot = max(time.monotonic(), self._next_slot)
+            self._next_slot = slot + self.min_interval_sec
+            return slot
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._next_slot = max(self._next_slot, time.monotonic() + seconds)
 
     def wait(self) -> None:
-        now = time.monotonic()
-        elapsed = now - self._last_call
-        if elapsed < self.min_interval_sec:
-            time.sleep(self.min_interval_sec - elapsed)
-        self._last_call = time.monotonic()
+        delay = self.reserve() - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
 
 
 class TokenManager:
-    def __init__(self):
+    def __init__(self, app_key: str, app_secret: str, cache_path: str | None = None):
+        self.app_key = app_key
+        self.app_secret = app_secret
+        self.cache_path = cache_path
         self._token = None
         self._issued_at = 0.0
+        self._lock = threading.Lock()
 
     def get_token(self) -> str:
-        if self._token:
-            return self._token
-        return self._issue_token()
-
-    def refresh_token(self) -> str:
-        return self._issue_token()
+        with self._lock:
+            if self._token:
+                return self._token
+            self._token = self._load_cached()
+            if self._token:
+                return self._token
+            return self._issue_token()
+
+    def refresh_token(self, stale: str | None = None) -> str:
+        """Issue a new token; a thread holding an already replaced ``stale``
+        token just gets the current one, and so does a process whose cache
+        file another process sharing it has already replaced."""
+        with self._lock:
+            if stale is not None and self._token and self._token != stale:
+                return self._token
+            cached = self._load_cached() if stale is not None else None
+            if cached and cached != stale:
+                self._token = cached
+                return cached
+            return self._issue_token()
+
+    def _load_cached(self) -> str | None:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get("expires_at", 0) - TOKEN_EXPIRY_MARGIN_SEC <= time.time():
+            return None
+        return cached.get("access_token")
+
+    def _save_cached(self, token: str, expires_in: int) -> None:
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        fd = os.open(self.cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"access_token": token, "expires_at": time.time() + expires_in}, f)
 
     def _issue_token(self) -> str:
         now = time.monotonic()
@@ -80,11 +177,18 @@ class TokenManager:
         headers = {"content-type": "application/json"}
         body = {
             "grant_type": "client_credentials",
-            "appkey": APP_KEY,
-            "appsecret": APP_SECRET,
+            "appkey": self.app_key,
+            "appsecret": self.app_secret,
         }
 
+        started = time.monotonic()
         response = requests.post(token_url, headers=headers, data=json.dumps(body))
+        metrics.record_call(
+            "kis",
+            "/oauth2/tokenP",
+            time.monotonic() - started,
+            error=response.status_code >= 400,
+        )
         response.raise_for_status()
         data = response.json()
 
@@ -94,40 +198,157 @@ class TokenManager:
 
         self._token = token
         self._issued_at = time.monotonic()
+        self._save_cached(token, int(data.get("expires_in") or 86_400))
         return token
 
 
-rate_limiter = RateLimiter(API_MIN_INTERVAL_SEC)
-token_manager = TokenManager()
+class KisKey:
+    """One app key: its own token (and cache file), rate bucket and failure count."""
+
+    def __init__(self, label: str, app_key: str, app_secret: str):
+        self.label = label
+        self.app_key = app_key
+        self.app_secret = app_secret
+        cache_name = hashlib.sha256(app_key.encode("utf-8")).hexdigest()[:16]
+        self.tokens = TokenManager(app_key, app_secret, os.path.join(TOKEN_CACHE_DIR, f"{cache_name}.json"))
+        self.limiter = RateLimiter(API_MIN_INTERVAL_SEC)
+        self.failures = 0
+        self.benched_until = 0.0
+
+
+class KeyPool:
+    """Spreads KIS calls over every configured app key.
+
+    Each call takes the key whose bucket frees up first, so N keys give about
+    N times one key's rate and no key idles while another has a queue. A key
+    that keeps failing is benched for KEY_COOLDOWN_SEC; the rest carry on.
+    """
+
+    def __init__(self, credentials: list[tuple[str, str]]):
+        self.keys = [KisKey(f"key{i + 1}", app_key, secret) for i, (app_key, secret) in enumerate(credentials)]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def set_interval(self, seconds: float) -> None:
+        for key in self.keys:
+            key.limiter.min_interval_sec = seconds
+
+    def acquire(self) -> KisKey:
+        """Reserve the earliest slot among the usable keys and wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            usable = [key for key in self.keys if key.benched_until <= now]
+            if not usable:
+                usable = [min(self.keys, key=lambda key: key.benched_until)]
+            key = min(usable, key=lambda key: max(key.limiter.next_free(), key.benched_until))
+            slot = max(key.limiter.reserve(), key.benched_until)
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return key
+
+    def succeeded(self, key: KisKey) -> None:
+        key.failures = 0
+
+    def failed(self, key: KisKey, reason) -> None:
+        with self._lock:
+            key.failures += 1
+            if key.failures < KEY_FAILURE_LIMIT or len(self.keys) == 1:
+                return
+            key.failures = 0
+            key.benched_until = time.monotonic() + KEY_COOLDOWN_SEC
+        metrics.inc("kis_key_benched_total", key=key.label)
+        print(f"WARNING: KIS {key.label} benched for {KEY_COOLDOWN_SEC}s ({reason})")
+
+    def throttled(self, key: KisKey) -> None:
+        key.limiter.pause(THROTTLE_PAUSE_SEC)
+
+    def warm(self) -> None:
+        """Get every key's token up front (from cache or KIS)."""
+        for key in self.keys:
+            try:
+                key.tokens.get_token()
+            except Exception as exc:
+                self.failed(key, exc)
+
+
+key_pool = KeyPool(KIS_CREDENTIALS)
+
+
+def _refresh_token(key: KisKey, stale: str) -> None:
+    metrics.retry("kis_token")
+    try:
+        key.tokens.refresh_token(stale)
+    except Exception as exc:
+        key_pool.failed(key, exc)
 
 
 def kis_request(method: str, path: str, headers: dict, params: dict | None = None) -> dict:
+    """One KIS call on the pool's next free key.
+
+    Token errors refresh that key's token and rate-limit answers pause its
+    bucket; the call is then retried on whichever key is free next, up to
+    KIS_REQUEST_ATTEMPTS times. The last answer is returned as is.
+    """
     url = f"{KIS_BASE_URL}{path}"
-    for attempt in range(2):
-        token = token_manager.get_token()
+    data: dict = {}
+    for _ in range(KIS_REQUEST_ATTEMPTS):
+        key = key_pool.acquire()
+        try:
+            token = key.tokens.get_token()
+        except Exception as exc:
+            key_pool.failed(key, exc)
+            continue
         req_headers = headers.copy()
         req_headers["authorization"] = f"Bearer {token}"
+        req_headers["appkey"] = key.app_key
+        req_headers["appsecret"] = key.app_secret
 
-        rate_limiter.wait()
+        started = time.monotonic()
         response = requests.request(method, url, headers=req_headers, params=params)
+        latency = time.monotonic() - started
 
         if response.status_code == 401:
-            token_manager.refresh_token()
+            metrics.record_call("kis", path, latency, error=True)
+            key_pool.failed(key, "HTTP 401")
+            _refresh_token(key, token)
             continue
 
         data = response.json()
-        if data.get("rt_cd") != "0":
-            msg_cd = data.get("msg_cd")
-            if msg_cd in TOKEN_ERROR_CODES and attempt == 0:
-                token_manager.refresh_token()
-                continue
+        msg_cd = data.get("msg_cd")
+        throttled = response.status_code == 429 or msg_cd in RATE_LIMIT_CODES
+        metrics.record_call(
+            "kis",
+            path,
+            latency,
+            throttled=throttled,
+            error=data.get("rt_cd") != "0",
+        )
+        if throttled:
+            metrics.retry("kis_throttle")
+            key_pool.throttled(key)
+            continue
+        if data.get("rt_cd") != "0" and msg_cd in TOKEN_ERROR_CODES:
+            _refresh_token(key, token)
+            continue
 
+        key_pool.succeeded(key)
         return data
 
-    return {}
+    return data
 
 
-def get_kis_daily_ohlcv(code: str, start_date: str, end_date: str) -> list[dict]:
+def get_kis_daily_ohlcv(code: str, start_date: str, end_date: str, adjusted: bool = True) -> list[dict]:
+    """Daily bars, newest first (at most 100); ``adjusted=False`` for prices as traded.
+
+    An empty list means KIS has no bars in the range, or rejected the code
+    for good (e.g. a suspended or unknown code; logged), so retrying would
+    not help. A call that still fails after kis_request's retries for a
+    transient reason (throttled, token, no answer) raises KisApiError, so
+    callers do not take it for an empty range.
+    """
     headers = {
         "content-type": "application/json; charset=utf-8",
         "appkey": APP_KEY,
@@ -140,7 +361,7 @@ def get_kis_daily_ohlcv(code: str, start_date: str, end_date: str) -> list[dict]
         "FID_INPUT_DATE_1": start_date,
         "FID_INPUT_DATE_2": end_date,
         "FID_PERIOD_DIV_CODE": "D",
-        "FID_ORG_ADJ_PRC": "0",
+        "FID_ORG_ADJ_PRC": "0" if adjusted else "1",
     }
 
     data = kis_request(
@@ -149,10 +370,18 @@ def get_kis_daily_ohlcv(code: str, start_date: str, end_date: str) -> list[dict]
         headers,
         params,
     )
-    return data.get("output2", []) if data.get("rt_cd") == "0" else []
-
-
-def get_kis_current_quote(code: str) -> dict:
+    if data.get("rt_cd") == "0":
+        return data.get("output2") or []
+    msg_cd = data.get("msg_cd")
+    message = f"daily chart {code} {start_date}-{end_date}: {msg_cd} {data.get('msg1')}"
+    if not msg_cd or msg_cd in RATE_LIMIT_CODES or msg_cd in TOKEN_ERROR_CODES:
+        raise KisApiError(message)
+    print(f"[WARN] {message} (rejected, treated as no bars)")
+    return []
+
+
+def request_current_quote(code: str) -> dict:
+    """Raw inquire-price response (``rt_cd``/``msg_cd`` included)."""
     headers = {
         "content-type": "application/json; charset=utf-8",
         "appkey": APP_KEY,
@@ -164,12 +393,16 @@ def get_kis_current_quote(code: str) -> dict:
         "FID_INPUT_ISCD": code,
     }
 
-    data = kis_request(
+    return kis_request(
         "GET",
         "/uapi/domestic-stock/v1/quotations/inquire-price",
         headers,
         params,
     )
+
+
+def get_kis_current_quote(code: str) -> dict:
+    data = request_current_quote(code)
     return data.get("output", {}) if data.get("rt_cd") == "0" else {}
 
 
@@ -258,7 +491,7 @@ def with_market_cap(record: dict, market_cap: float | None) -> dict:
     return enriched
 
 
-def update_indices() -> None:
+def update_indices(ctx=None) -> None:
     print("\nUpdating indices with KIS data...")
 
     start_date = (datetime.now() - timedelta(days=730)).strftime("%Y%m%d")
@@ -302,6 +535,8 @@ def update_indices() -> None:
         for i in range(0, len(upload_list), 1000):
             chunk = upload_list[i : i + 1000]
             supabase.table("daily_prices_v2").upsert(chunk, on_conflict="code, date").execute()
+        if ctx is not None:
+            ctx.record_ingested_rows(idx["code"], upload_list)
 
         supabase.table("companies").upsert(
             {
@@ -317,20 +552,199 @@ def update_indices() -> None:
         print(f"    Uploaded {len(upload_list)} rows.")
 
 
-def main() -> None:
+def ingest_stock(
+    stock: dict,
+    db_latest_data: dict | None,
+    check_start_date: str,
+    today: str,
+    full_start_date: str,
+) -> dict | None:
+    """Fetch and write one stock's new bars (runs on the ingest thread pool).
+
+    Returns the written rows and call counts; the listing stats and the
+    pipeline context are updated by the caller on the main thread. None on
+    error, a KIS call that still fails for a transient reason after
+    kis_request's retries (KisApiError) included, so the shard retries it. An
+    empty ``rows`` means there was nothing new, or KIS rejected the code for
+    good (logged by get_kis_daily_ohlcv).
+    """
+    code = str(stock["Code"])
+    name = stock["Name"]
+    fallback_market_cap = parse_market_cap(stock)
+    result = {"code": code, "rows": [], "full_reload": False, "api_calls": 0}
+
+    try:
+        if db_latest_data is not None:
+            db_last_data = db_latest_data.get(code)
+        else:
+            res = (
+                supabase.table("daily_prices_v2")
+                .select("date, close")
+                .eq("code", code)
+                .order("date", desc=True)
+                .limit(1)
+                .execute()
+            )
+            db_last_data = res.data[0] if res.data else None
+
+        recent_rows = get_kis_daily_ohlcv(code, check_start_date, today)
+        result["api_calls"] += 1
+
+        if not recent_rows:
+            return result
+
+        recent_by_date = {}
+        for item in recent_rows:
+            date_str = item.get("stck_bsop_date", "")
+            if date_str:
+                formatted_date = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:]}"
+                recent_by_date[formatted_date] = item
+
+        need_full_reload = False
+
+        if db_last_data:
+            db_date_str = db_last_data["date"]
+            db_close = float(db_last_data["close"])
+            if db_date_str in recent_by_date:
+                kis_close = float(recent_by_date[db_date_str].get("stck_clpr", 0) or 0)
+                if db_close and abs(kis_close - db_close) / db_close > 0.01:
+                    print(f"  Adjustment detected for {name}({code}), reloading full data.")
+                    need_full_reload = True
+        else:
+            need_full_reload = True
+
+        quote = get_kis_current_quote(code)
+        result["api_calls"] += 1
+        current_market_cap = parse_current_market_cap(quote)
+        if current_market_cap is None:
+            current_market_cap = fallback_market_cap
+
+        if need_full_reload:
+            result["full_reload"] = True
+            full_series = fetch_kis_daily_series(code, full_start_date, today)
+            result["api_calls"] += max(1, len(full_series) // 100)
+
+            if not full_series:
+                return result
+
+            upload_list = []
+            latest_series_date = max(full_series.keys()) if full_series else None
+            for date_str, item in full_series.items():
+                normalized = normalize_kis_row(item)
+                row = {
+                    "code": code,
+                    "date": date_str,
+                    "open": normalized["open"],
+                    "high": normalized["high"],
+                    "low": normalized["low"],
+                    "close": normalized["close"],
+                    "volume": normalized["volume"],
+                    "trading_value": normalized["trading_value"],
+                    "change": 0.0,
+                }
+                upload_list.append(
+                    with_market_cap(
+                        row,
+                        current_market_cap if date_str == latest_series_date else None,
+                    )
+                )
+
+            for i in range(0, len(upload_list), 1000):
+                chunk = upload_list[i : i + 1000]
+                supabase.table("daily_prices_v2").upsert(
+                    chunk, on_conflict="code, date"
+                ).execute()
+        else:
+            if db_last_data:
+                last_db_date = datetime.strptime(db_last_data["date"], "%Y-%m-%d")
+                new_rows = {
+                    k: v
+                    for k, v in recent_by_date.items()
+                    if datetime.strptime(k, "%Y-%m-%d") > last_db_date
+                }
+            else:
+                new_rows = recent_by_date
+
+            if not new_rows:
+                return result
+
+            upload_list = []
+            for date_str, item in new_rows.items():
+                normalized = normalize_kis_row(item)
+                upload_list.append(
+                    with_market_cap(
+                        {
+                            "code": code,
+                            "date": date_str,
+                            "open": normalized["open"],
+                            "high": normalized["high"],
+                            "low": normalized["low"],
+                            "close": normalized["close"],
+                            "volume": normalized["volume"],
+                            "trading_value": normalized["trading_value"],
+                            "change": 0.0,
+                        },
+                        current_market_cap,
+                    )
+                )
+
+            supabase.table("daily_prices_v2").upsert(
+                upload_list, on_conflict="code, date"
+            ).execute()
+
+        result["rows"] = upload_list
+        return result
+
+    except Exception as e:
+        print(f"  ERROR {name}({code}): {e}")
+        time.sleep(1)
+        return None
+
+
+def shard_of(code: str, shard_count: int) -> int:
+    """Stable shard of a code (same on every process and host)."""
+    digest = hashlib.sha1(code.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % shard_count
+
+
+def main(ctx=None, shard=None) -> dict | None:
+    """Run the daily KIS ingest; returns the run's counters.
+
+    When a ``PipelineContext`` is given, the recent price window is prefetched
+    while KIS is being polled and every written bar is recorded on it, along
+    with the parsed stock master and RS-eligible universe.
+
+    With a ``shard`` (an ingest_shards.ShardCheckpoint) only the codes with
+    ``shard_of(code, shard.count) == shard.index`` are fetched, codes in
+    ``shard.done_codes`` are skipped and every result is reported to
+    ``shard.record(code, ok)``. Indices and companies are written by shard 0.
+    """
     print("Starting update_today_v3 (KIS-only data)...")
 
-    update_indices()
+    if ctx is not None:
+        ctx.start_price_prefetch()
+    else:
+        report_on_exit("update_today_v3")
+
+    writes_shared = shard is None or shard.index == 0
+    if writes_shared:
+        update_indices(ctx)
 
     print("\nLoading stock master from KIS...")
     stocks_df = kis_master_loader.get_all_stocks()
     if stocks_df.empty:
         print("ERROR: Failed to load stock master.")
-        return
+        return None
 
     target_stocks = stocks_df.to_dict("records")
     print(f"Total stocks: {len(target_stocks)}")
 
+    if ctx is not None:
+        ctx.stocks_df = stocks_df
+        ctx.eligible_codes = set(
+            stocks_df.loc[stocks_df["IsRsEligible"], "Code"].astype(str)
+        )
+
     print("Upserting companies table...")
     company_upload_list = []
     for stock in target_stocks:
@@ -345,9 +759,19 @@ def main() -> None:
             }
         )
 
-    for i in range(0, len(company_upload_list), 1000):
-        chunk = company_upload_list[i : i + 1000]
-        supabase.table("companies").upsert(chunk).execute()
+    if writes_shared:
+        for i in range(0, len(company_upload_list), 1000):
+            chunk = company_upload_list[i : i + 1000]
+            supabase.table("companies").upsert(chunk).execute()
+
+    if shard is not None:
+        target_stocks = [
+            stock
+            for stock in target_stocks
+            if shard_of(str(stock["Code"]), shard.count) == shard.index
+            and str(stock["Code"]) not in shard.done_codes
+        ]
+        print(f"Shard {shard.index}/{shard.count}: {len(target_stocks)} stocks to fetch")
 
     today = datetime.now().strftime("%Y%m%d")
     check_start_date = (datetime.now() - timedelta(days=3)).strftime("%Y%m%d")
@@ -355,7 +779,14 @@ def main() -> None:
 
     success_count = 0
     updated_count = 0
+    failed_count = 0
     api_call_count = 0
+    listing_stats = ListingStatsTracker(supabase)
+    try:
+        listing_stats.load()
+    except Exception as e:
+        print(f"WARNING: company_listing_stats unavailable ({e}), not tracking listing stats.")
+        listing_stats = None
 
     print("Fetching latest data snapshot from DB...")
     db_latest_data = {}
@@ -372,146 +803,65 @@ def main() -> None:
     except Exception:
         db_latest_data = None
 
-    for idx, stock in enumerate(target_stocks):
-        code = str(stock["Code"])
-        name = stock["Name"]
-        fallback_market_cap = parse_market_cap(stock)
+    workers = INGEST_WORKERS_PER_KEY * len(key_pool)
+    print(f"Fetching with {workers} workers over {len(key_pool)} KIS app key(s)...")
+    key_pool.warm()
 
-        if idx % 50 == 0:
-            print(
-                f"[{idx + 1}/{len(target_stocks)}] {name}({code}) "
-                f"(API calls: {api_call_count})"
-            )
+    def ingest(stock: dict) -> dict | None:
+        return ingest_stock(stock, db_latest_data, check_start_date, today, full_start_date)
 
-        try:
-            if db_latest_data is not None:
-                db_last_data = db_latest_data.get(code)
-            else:
-                res = (
-                    supabase.table("daily_prices_v2")
-                    .select("date, close")
-                    .eq("code", code)
-                    .order("date", desc=True)
-                    .limit(1)
-                    .execute()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for idx, (stock, result) in enumerate(zip(target_stocks, pool.map(ingest, target_stocks))):
+            if idx % 50 == 0:
+                print(
+                    f"[{idx + 1}/{len(target_stocks)}] {stock['Name']}({stock['Code']}) "
+                    f"(API calls: {api_call_count})"
                 )
-                db_last_data = res.data[0] if res.data else None
-
-            recent_rows = get_kis_daily_ohlcv(code, check_start_date, today)
-            api_call_count += 1
-
-            if not recent_rows:
+            if shard is not None:
+                # Throttled or token-failed KIS calls come back as None, so
+                # the shard keeps the code as failed and a requeue retries it.
+                # A code KIS rejects for good comes back without rows and
+                # counts as done, so it cannot hold up the run.
+                shard.record(str(stock["Code"]), result is not None)
+            if result is None:
+                failed_count += 1
                 continue
 
-            recent_by_date = {}
-            for item in recent_rows:
-                date_str = item.get("stck_bsop_date", "")
-                if date_str:
-                    formatted_date = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:]}"
-                    recent_by_date[formatted_date] = item
-
-            need_full_reload = False
-
-            if db_last_data:
-                db_date_str = db_last_data["date"]
-                db_close = float(db_last_data["close"])
-                if db_date_str in recent_by_date:
-                    kis_close = float(recent_by_date[db_date_str].get("stck_clpr", 0) or 0)
-                    if db_close and abs(kis_close - db_close) / db_close > 0.01:
-                        print(f"  Adjustment detected for {name}({code}), reloading full data.")
-                        need_full_reload = True
-            else:
-                need_full_reload = True
-
-            quote = get_kis_current_quote(code)
-            api_call_count += 1
-            current_market_cap = parse_current_market_cap(quote)
-            if current_market_cap is None:
-                current_market_cap = fallback_market_cap
-
-            if need_full_reload:
+            api_call_count += result["api_calls"]
+            if result["full_reload"]:
                 updated_count += 1
-                full_series = fetch_kis_daily_series(code, full_start_date, today)
-                api_call_count += max(1, len(full_series) // 100)
-
-                if not full_series:
-                    continue
-
-                upload_list = []
-                latest_series_date = max(full_series.keys()) if full_series else None
-                for date_str, item in full_series.items():
-                    normalized = normalize_kis_row(item)
-                    row = {
-                        "code": code,
-                        "date": date_str,
-                        "open": normalized["open"],
-                        "high": normalized["high"],
-                        "low": normalized["low"],
-                        "close": normalized["close"],
-                        "volume": normalized["volume"],
-                        "trading_value": normalized["trading_value"],
-                        "change": 0.0,
-                    }
-                    upload_list.append(
-                        with_market_cap(
-                            row,
-                            current_market_cap if date_str == latest_series_date else None,
-                        )
-                    )
-
-                for i in range(0, len(upload_list), 1000):
-                    chunk = upload_list[i : i + 1000]
-                    supabase.table("daily_prices_v2").upsert(
-                        chunk, on_conflict="code, date"
-                    ).execute()
-            else:
-                if db_last_data:
-                    last_db_date = datetime.strptime(db_last_data["date"], "%Y-%m-%d")
-                    new_rows = {
-                        k: v
-                        for k, v in recent_by_date.items()
-                        if datetime.strptime(k, "%Y-%m-%d") > last_db_date
-                    }
-                else:
-                    new_rows = recent_by_date
-
-                if not new_rows:
-                    continue
-
-                upload_list = []
-                for date_str, item in new_rows.items():
-                    normalized = normalize_kis_row(item)
-                    upload_list.append(
-                        with_market_cap(
-                            {
-                                "code": code,
-                                "date": date_str,
-                                "open": normalized["open"],
-                                "high": normalized["high"],
-                                "low": normalized["low"],
-                                "close": normalized["close"],
-                                "volume": normalized["volume"],
-                                "trading_value": normalized["trading_value"],
-                                "change": 0.0,
-                            },
-                            current_market_cap,
-                        )
-                    )
-
-                supabase.table("daily_prices_v2").upsert(
-                    upload_list, on_conflict="code, date"
-                ).execute()
+            upload_list = result["rows"]
+            if not upload_list:
+                continue
 
+            code = result["code"]
+            if listing_stats is not None:
+                listing_stats.record(code, upload_list)
+            if ctx is not None:
+                ctx.record_ingested_rows(code, upload_list, full_reload=result["full_reload"])
             success_count += 1
 
+    listing_stats_written = 0
+    if listing_stats is not None:
+        try:
+            listing_stats_written = listing_stats.flush()
         except Exception as e:
-            print(f"  ERROR {name}({code}): {e}")
-            time.sleep(1)
+            print(f"  ERROR company_listing_stats: {e}")
 
     print("\nUpdate complete.")
     print(f"  Success: {success_count}")
     print(f"  Full reloads: {updated_count}")
     print(f"  API calls (approx): {api_call_count}")
+    print(f"  Listing stats updated: {listing_stats_written}")
+    if failed_count:
+        print(f"  Failed: {failed_count}")
+    return {
+        "stocks": len(target_stocks),
+        "success": success_count,
+        "full_reloads": updated_count,
+        "failed": failed_count,
+        "api_calls": api_call_count,
+    }
 
 
 if __name__ == "__main__":
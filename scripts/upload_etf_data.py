@@ -6,6 +6,7 @@ import pandas as pd
 from datetime import datetime
 import traceback
 import time
+import pg_bulk
 
 # 환경 변수 로드
 load_dotenv('.env.local')
@@ -126,14 +127,8 @@ def upload_etf_prices(etf_codes, start_date='2024-01-01'):
 
             print(f"{len(records)}개 데이터 업로드 중...", end=' ')
 
-            # Supabase에 업로드 (청크 단위)
-            chunk_size = 500
-            for i in range(0, len(records), chunk_size):
-                chunk = records[i:i+chunk_size]
-                supabase.table("daily_prices_v2").upsert(
-                    chunk,
-                    on_conflict="code,date"
-                ).execute()
+            # Supabase에 업로드 (SUPABASE_DB_URL이 있으면 COPY, 없으면 500개씩)
+            pg_bulk.upsert(supabase, "daily_prices_v2", records, on_conflict="code,date", chunk_size=500)
 
             print(f"✅ 완료")
             success_count += 1
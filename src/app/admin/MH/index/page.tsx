@@ -20,6 +20,8 @@ type ApiResponse = {
     missingHighLowCount: number;
     reversalMultiplier: number;
     confirmMultiplier: number;
+    source?: 'livermore_state_daily' | 'daily_prices_v2';
+    warmup?: string;
   };
   rows: LivermoreComputedRow[];
 };
@@ -251,6 +253,7 @@ export default function MhIndexPage() {
             {meta && (
               <span className="text-xs text-[var(--text-muted)]">
                 missing H/L {meta.missingHighLowCount}
+                {meta.warmup ? ` · warm-up ${meta.warmup === 'full_history' ? 'full history' : meta.warmup}` : ''}
               </span>
             )}
           </div>
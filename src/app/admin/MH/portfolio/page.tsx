@@ -199,6 +199,7 @@ export default function PortfolioManagementPage() {
   const [sellRealizedPnl, setSellRealizedPnl] = useState(0);
   const [sellDate, setSellDate] = useState(() => getTodayDate());
   const [cash, setCash] = useState<number>(0);
+  const [valuationDate, setValuationDate] = useState<string | null>(null);
   const [isEditingCash, setIsEditingCash] = useState(false);
   const [sortField, setSortField] = useState<'entry_date' | 'close_date' | 'company_name' | 'evaluation' | 'sector' | 'pnl_ratio' | 'unrealized_pnl' | 'realized_pnl' | 'total_pnl' | null>(null);
   const [sortOrder, setSortOrder] = useState<'asc' | 'desc'>('asc');
@@ -685,14 +686,64 @@ export default function PortfolioManagementPage() {
 
       if (baseRows.length === 0) {
         setPositions([]);
+        setValuationDate(null);
         return;
       }
 
       const tradablePositions = baseRows.filter(p => !p.is_custom_asset);
       const codes = [...new Set(tradablePositions.map(p => p.company_code))];
 
-      let latestDate: string | undefined;
+      const priceMap = new Map<string, number>();
+      const atrMap = new Map<string, number>();
+      let snapshotDate: string | null = null;
+
+      // 야간 평가 스냅샷(update_portfolio_snapshots.py): 최신 NAV 행과 그 날짜의
+      // 묶음별 종가를 기본키로 읽고, ATR은 같은 날짜의 daily_indicators에서 한 번에 읽는다.
       if (currentTab === 'active' && codes.length > 0) {
+        const { data: navRow, error: navError } = await supabase
+          .from('user_portfolio_nav')
+          .select('date')
+          .eq('user_id', user.id)
+          .order('date', { ascending: false })
+          .limit(1)
+          .maybeSingle();
+
+        if (navError) {
+          console.error('Error fetching portfolio nav:', navError);
+        } else if (navRow?.date) {
+          snapshotDate = navRow.date;
+
+          const { data: snapshotData, error: snapshotError } = await supabase
+            .from('user_portfolio_snapshots')
+            .select('company_code, price')
+            .eq('user_id', user.id)
+            .eq('date', navRow.date);
+
+          if (snapshotError) {
+            console.error('Error fetching portfolio snapshots:', snapshotError);
+          } else {
+            (snapshotData || []).forEach(row => {
+              if (row.price !== null) priceMap.set(row.company_code, Number(row.price));
+            });
+          }
+
+          const { data: indicatorData } = await supabase
+            .from('daily_indicators')
+            .select('code, atr20')
+            .in('code', codes)
+            .eq('date', navRow.date);
+
+          (indicatorData || []).forEach(row => {
+            const atr = Number(row.atr20);
+            if (Number.isFinite(atr) && atr > 0) atrMap.set(row.code, atr);
+          });
+        }
+      }
+
+      // 스냅샷 이후에 새로 담은 종목(또는 스냅샷이 아직 없는 경우)만 직접 조회한다.
+      const missingPriceCodes = codes.filter(code => !priceMap.has(code));
+      let latestDate: string | undefined;
+      if (currentTab === 'active' && missingPriceCodes.length > 0) {
         const { data: dateData } = await supabase
           .from('daily_prices_v2')
           .select('date')
@@ -703,28 +754,27 @@ export default function PortfolioManagementPage() {
         latestDate = dateData?.date;
       }
 
-      const { data: priceData } = currentTab === 'active' && codes.length > 0 && latestDate
+      const { data: priceData } = currentTab === 'active' && missingPriceCodes.length > 0 && latestDate
         ? await supabase
           .from('daily_prices_v2')
           .select('code, close')
-          .in('code', codes)
+          .in('code', missingPriceCodes)
           .eq('date', latestDate)
         : { data: null };
 
-      const priceMap = new Map<string, number>();
       if (priceData) {
         priceData.forEach(p => priceMap.set(p.code, p.close));
       }
 
-      const atrMap = new Map<string, number>();
       if (currentTab === 'active') {
-        for (const code of codes) {
+        for (const code of codes.filter(code => !atrMap.has(code))) {
           const atr = await calculateATR(code);
           if (atr > 0) {
             atrMap.set(code, atr);
           }
         }
       }
+      setValuationDate(snapshotDate);
 
       const enrichedData: PortfolioPosition[] = baseRows.map(p => {
         const groupAvgPrice = currentTab === 'active'
@@ -1053,6 +1103,7 @@ export default function PortfolioManagementPage() {
             <div className="mt-1 flex flex-wrap gap-2 text-xs text-[var(--text-muted)]">
               <span>총 자산 {formatAssetAmount(totalAssets)}원</span>
               <span>현금 {formatAssetAmount(cash)}원</span>
+              {currentTab === 'active' && valuationDate && <span>평가 기준 {valuationDate} 종가</span>}
               {currentTab === 'active' && <span>R 합계 {formatAssetAmount(positionStats.totalR)}원</span>}
               {currentTab === 'closed' && <span>실현손익 {formatAmount(filteredRealizedPnlSum)}원</span>}
             </div>
@@ -1,6 +1,10 @@
 import { NextRequest, NextResponse } from 'next/server';
 import { createClient } from '@supabase/supabase-js';
-import { computeLivermoreStateRows, PriceRow } from '@/lib/livermoreStateMachine';
+import {
+  computeLivermoreStateRows,
+  LivermoreComputedRow,
+  PriceRow,
+} from '@/lib/livermoreStateMachine';
 
 export const dynamic = 'force-dynamic';
 
@@ -15,6 +19,25 @@ type DbRow = {
   close: number;
 };
 
+// Parameters precomputed nightly by scripts/update_livermore_states.py.
+const STORED_REVERSAL_MULTIPLIER = 3;
+const STORED_CONFIRM_MULTIPLIER = 1.5;
+// The stored states are run over each code's full history; the live path
+// warms up over LIVE_WARMUP_YEARS before the display range, so early pivots
+// can differ between the two.
+const LIVE_WARMUP_YEARS = 3;
+
+const STORED_COLUMNS =
+  'date, open, high, low, close, atr20, state, state_changed, reason, ' +
+  'reversal_threshold_value, confirm_threshold_value, pivot_high, pivot_high_date, ' +
+  'pivot_low, pivot_low_date, pivot_ss, pivot_ss_date, pivot_bb, pivot_bb_date';
+
+function toNumberOrNull(value: unknown): number | null {
+  if (value === null || value === undefined) return null;
+  const num = Number(value);
+  return Number.isFinite(num) ? num : null;
+}
+
 function formatDateOnly(value: string): string {
   const date = new Date(value);
   if (Number.isNaN(date.getTime())) {
@@ -60,6 +83,71 @@ async function fetchDailyPrices(code: string, startDate: string, endDate: string
   return allRows;
 }
 
+async function fetchStoredStateRows(
+  code: string,
+  startDate: string,
+  endDate: string,
+): Promise<LivermoreComputedRow[]> {
+  if (!supabaseUrl || !supabaseKey) {
+    throw new Error('Supabase env vars are missing.');
+  }
+
+  const supabase = createClient(supabaseUrl, supabaseKey);
+  const pageSize = 1000;
+  let offset = 0;
+  const allRows: LivermoreComputedRow[] = [];
+
+  while (true) {
+    const { data, error } = await supabase
+      .from('livermore_state_daily')
+      .select(STORED_COLUMNS)
+      .eq('code', code)
+      .eq('reversal_multiplier', STORED_REVERSAL_MULTIPLIER)
+      .eq('confirm_multiplier', STORED_CONFIRM_MULTIPLIER)
+      .gte('date', startDate)
+      .lte('date', endDate)
+      .order('date', { ascending: true })
+      .range(offset, offset + pageSize - 1);
+
+    if (error) {
+      throw error;
+    }
+
+    const batch = (data ?? []) as Record<string, unknown>[];
+    for (const row of batch) {
+      allRows.push({
+        date: formatDateOnly(String(row.date)),
+        open: Number(row.open),
+        high: toNumberOrNull(row.high),
+        low: toNumberOrNull(row.low),
+        close: Number(row.close),
+        atr20: toNumberOrNull(row.atr20),
+        state: row.state as LivermoreComputedRow['state'],
+        state_changed: Boolean(row.state_changed),
+        reason: String(row.reason ?? ''),
+        reversal_threshold_value: toNumberOrNull(row.reversal_threshold_value),
+        confirm_threshold_value: toNumberOrNull(row.confirm_threshold_value),
+        pivot_high: toNumberOrNull(row.pivot_high),
+        pivot_high_date: (row.pivot_high_date as string | null) ?? null,
+        pivot_low: toNumberOrNull(row.pivot_low),
+        pivot_low_date: (row.pivot_low_date as string | null) ?? null,
+        pivot_ss: toNumberOrNull(row.pivot_ss),
+        pivot_ss_date: (row.pivot_ss_date as string | null) ?? null,
+        pivot_bb: toNumberOrNull(row.pivot_bb),
+        pivot_bb_date: (row.pivot_bb_date as string | null) ?? null,
+      });
+    }
+
+    if (batch.length < pageSize) {
+      break;
+    }
+
+    offset += pageSize;
+  }
+
+  return allRows;
+}
+
 function addYears(date: Date, years: number): Date {
   const next = new Date(date);
   next.setFullYear(next.getFullYear() + years);
@@ -85,12 +173,36 @@ export async function GET(req: NextRequest) {
     const end = new Date();
     const displayStart = new Date(end);
     displayStart.setFullYear(end.getFullYear() - years);
-    const warmupStart = addYears(displayStart, -3);
+    const warmupStart = addYears(displayStart, -LIVE_WARMUP_YEARS);
 
     const startDate = displayStart.toISOString().slice(0, 10);
     const fetchStartDate = warmupStart.toISOString().slice(0, 10);
     const endDate = end.toISOString().slice(0, 10);
 
+    if (
+      reversalMultiplier === STORED_REVERSAL_MULTIPLIER &&
+      confirmMultiplier === STORED_CONFIRM_MULTIPLIER
+    ) {
+      const stored = await fetchStoredStateRows(code, startDate, endDate);
+      if (stored.length > 0) {
+        return NextResponse.json({
+          meta: {
+            code,
+            startDate,
+            endDate,
+            rowCount: stored.length,
+            hasTimestampRows: false,
+            missingHighLowCount: stored.filter((row) => row.high === null || row.low === null).length,
+            reversalMultiplier,
+            confirmMultiplier,
+            source: 'livermore_state_daily',
+            warmup: 'full_history',
+          },
+          rows: stored,
+        });
+      }
+    }
+
     const rawRows = await fetchDailyPrices(code, fetchStartDate, endDate);
 
     if (rawRows.length === 0) {
@@ -141,6 +253,8 @@ export async function GET(req: NextRequest) {
         missingHighLowCount,
         reversalMultiplier,
         confirmMultiplier,
+        source: 'daily_prices_v2',
+        warmup: `${LIVE_WARMUP_YEARS}y`,
       },
       rows: computed,
     });
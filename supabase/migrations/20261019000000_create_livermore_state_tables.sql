@@ -0,0 +1,60 @@
+-- Precomputed Livermore ATR record state (scripts/update_livermore_states.py).
+-- livermore_state_daily holds one row per bar in the shape of
+-- computeLivermoreStateRows(); livermore_states holds the engine's terminal
+-- state per code so the daily batch only has to advance one bar.
+
+create table if not exists livermore_state_daily (
+  code text not null,
+  reversal_multiplier numeric(6, 3) not null,
+  confirm_multiplier numeric(6, 3) not null,
+  date date not null,
+  open numeric,
+  high numeric,
+  low numeric,
+  close numeric not null,
+  atr20 numeric,
+  state text not null,
+  state_changed boolean not null default false,
+  reason text,
+  reversal_threshold_value numeric,
+  confirm_threshold_value numeric,
+  pivot_high numeric,
+  pivot_high_date date,
+  pivot_low numeric,
+  pivot_low_date date,
+  pivot_ss numeric,
+  pivot_ss_date date,
+  pivot_bb numeric,
+  pivot_bb_date date,
+  primary key (code, reversal_multiplier, confirm_multiplier, date)
+);
+
+create index if not exists idx_livermore_state_daily_date_state
+  on livermore_state_daily (date desc, state)
+  where reversal_multiplier = 3.0 and confirm_multiplier = 1.5;
+
+create table if not exists livermore_states (
+  code text not null,
+  reversal_multiplier numeric(6, 3) not null,
+  confirm_multiplier numeric(6, 3) not null,
+  last_date date not null,
+  last_close numeric not null,
+  state text not null,
+  engine_state jsonb not null,
+  updated_at timestamptz not null default now(),
+  primary key (code, reversal_multiplier, confirm_multiplier)
+);
+
+comment on column livermore_states.engine_state is
+  'Serialized LivermoreEngine: current column, ledger, running extremes, S/B/SS/BB pivots, ATR20 true-range window';
+
+alter table livermore_state_daily enable row level security;
+alter table livermore_states enable row level security;
+
+drop policy if exists "Public read access" on livermore_state_daily;
+create policy "Public read access" on livermore_state_daily
+  for select using (true);
+
+drop policy if exists "Public read access" on livermore_states;
+create policy "Public read access" on livermore_states
+  for select using (true);
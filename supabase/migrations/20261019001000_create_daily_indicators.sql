@@ -0,0 +1,48 @@
+-- Chart indicators precomputed by scripts/update_daily_indicators.py.
+-- Column definitions follow src/utils/indicators.ts as the chart pages call
+-- it on daily bars: EMA20, SMA30/50, WMA150, ATR20, Keltner(20, ATR10, 2.25)
+-- and MACD(3, 10, 16).
+
+create table if not exists daily_indicators (
+  code text not null,
+  date date not null,
+  close numeric not null,
+  ema20 numeric,
+  sma30 numeric,
+  sma50 numeric,
+  wma150 numeric,
+  atr20 numeric,
+  keltner_upper numeric,
+  keltner_middle numeric,
+  keltner_lower numeric,
+  macd numeric,
+  macd_signal numeric,
+  macd_histogram numeric,
+  primary key (code, date)
+);
+
+-- Screens read one date across all codes.
+create index if not exists idx_daily_indicators_date
+  on daily_indicators (date desc, code);
+
+create table if not exists indicator_states (
+  code text primary key,
+  last_date date not null,
+  last_close numeric not null,
+  state jsonb not null,
+  updated_at timestamptz not null default now()
+);
+
+comment on column indicator_states.state is
+  'Serialized IndicatorState row: bar count, trailing close/TR/MACD windows, EMA and signal values';
+
+alter table daily_indicators enable row level security;
+alter table indicator_states enable row level security;
+
+drop policy if exists "Public read access" on daily_indicators;
+create policy "Public read access" on daily_indicators
+  for select using (true);
+
+drop policy if exists "Public read access" on indicator_states;
+create policy "Public read access" on indicator_states
+  for select using (true);
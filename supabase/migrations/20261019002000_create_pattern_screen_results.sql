@@ -0,0 +1,25 @@
+-- Daily chart-pattern hits from scripts/screen_patterns.py.
+-- pattern_id matches the detector ids in src/utils/patternDetectors.ts
+-- (cup_handle, trend_template, vcp, square_box, high_tight_flag); meta holds
+-- the same per-pattern values the chart badge tooltip shows.
+
+create table if not exists pattern_screen_results (
+  date date not null,
+  code text not null,
+  pattern_id text not null,
+  meta jsonb,
+  created_at timestamptz not null default now(),
+  primary key (date, code, pattern_id)
+);
+
+create index if not exists idx_pattern_screen_results_pattern_date
+  on pattern_screen_results (pattern_id, date desc);
+
+create index if not exists idx_pattern_screen_results_code
+  on pattern_screen_results (code, date desc);
+
+alter table pattern_screen_results enable row level security;
+
+drop policy if exists "Public read access" on pattern_screen_results;
+create policy "Public read access" on pattern_screen_results
+  for select using (true);
@@ -0,0 +1,149 @@
+-- Precomputed forward highs for get_high_return_rankings
+-- (scripts/update_forward_high_returns.py).
+-- forward_high_returns holds, per bar with close > 0, the max high of the
+-- next 252 such bars. window_end_date is the date of the 252nd following bar,
+-- or null while fewer than 252 bars follow (the window still runs to the
+-- code's latest bar). return_rate is derived in SQL so it matches the old
+-- per-call computation exactly.
+
+create table if not exists forward_high_returns (
+  code text not null,
+  date date not null,
+  close numeric not null,
+  max_high numeric,
+  window_end_date date,
+  return_rate numeric generated always as ((max_high - close) / close * 100) stored,
+  primary key (code, date)
+);
+
+create index if not exists idx_forward_high_returns_return_rate
+  on forward_high_returns (return_rate desc);
+
+create index if not exists idx_forward_high_returns_window_end
+  on forward_high_returns (window_end_date);
+
+create table if not exists forward_high_states (
+  code text primary key,
+  last_date date not null,
+  last_close numeric not null,
+  updated_at timestamptz not null default now()
+);
+
+alter table forward_high_returns enable row level security;
+alter table forward_high_states enable row level security;
+
+drop policy if exists "Public read access" on forward_high_returns;
+create policy "Public read access" on forward_high_returns
+  for select using (true);
+
+drop policy if exists "Public read access" on forward_high_states;
+create policy "Public read access" on forward_high_states
+  for select using (true);
+
+-- Same result as the window-function version: a base date's forward window
+-- only sees bars up to end_date. Stored windows that end on or before
+-- end_date are used as is, as are open windows (window_end_date null) of a
+-- code whose last bar (forward_high_states.last_date) is on or before
+-- end_date, e.g. a delisted code. Only the codes with a stored window
+-- running past end_date (their last 252 bars before it) are recomputed,
+-- clipped at end_date, from their first such base date.
+create or replace function public.get_high_return_rankings(
+  start_date date,
+  end_date date,
+  min_return numeric default 100,
+  limit_n integer default 100
+)
+returns table (
+  code text,
+  name text,
+  base_date date,
+  base_price numeric,
+  max_price numeric,
+  return_rate numeric
+)
+language sql
+stable
+as $$
+  with windows as (
+    select
+      f.code,
+      f.date,
+      f.close,
+      f.max_high,
+      f.return_rate,
+      case
+        when f.window_end_date is not null then f.window_end_date > end_date
+        else coalesce(s.last_date > end_date, true)
+      end as past_end
+    from forward_high_returns f
+    left join forward_high_states s on s.code = f.code
+    where f.date between start_date and end_date
+  ),
+  stored as (
+    select
+      code,
+      date as base_date,
+      close as base_price,
+      max_high as max_price,
+      return_rate
+    from windows
+    where not past_end
+      and return_rate >= min_return
+  ),
+  tail_start as (
+    select code, min(date) as date
+    from windows
+    where past_end
+    group by code
+  ),
+  tail as (
+    select
+      p.code,
+      p.date,
+      p.close,
+      max(p.high) over (
+        partition by p.code
+        order by p.date
+        rows between 1 following and 252 following
+      ) as max_high_1y
+    from daily_prices_v2 p
+    join tail_start t on t.code = p.code
+    where p.date between t.date and end_date
+      and p.close > 0
+  ),
+  clipped as (
+    select
+      code,
+      date as base_date,
+      close as base_price,
+      max_high_1y as max_price,
+      (max_high_1y - close) / close * 100 as return_rate
+    from tail
+    where max_high_1y is not null
+  ),
+  ranked as (
+    select distinct on (code)
+      code,
+      base_date,
+      base_price,
+      max_price,
+      return_rate
+    from (
+      select * from stored
+      union all
+      select * from clipped where return_rate >= min_return
+    ) scored
+    order by code, return_rate desc
+  )
+  select
+    r.code,
+    c.name,
+    r.base_date,
+    r.base_price,
+    r.max_price,
+    r.return_rate
+  from ranked r
+  join companies c on c.code = r.code
+  order by r.return_rate desc
+  limit limit_n;
+$$;
@@ -0,0 +1,103 @@
+-- First and latest daily_prices_v2 bar (close > 0) per code, maintained by
+-- scripts/update_today_v3.py (scripts/listing_stats.py). recent_listing_returns
+-- used to find both with two lateral index probes per company on every read.
+
+create table if not exists public.company_listing_stats (
+  code text primary key,
+  first_date date not null,
+  first_close numeric not null,
+  latest_date date not null,
+  latest_close numeric not null,
+  updated_at timestamptz not null default now()
+);
+
+create index if not exists idx_company_listing_stats_first_date
+  on public.company_listing_stats (first_date desc);
+
+insert into public.company_listing_stats (code, first_date, first_close, latest_date, latest_close)
+select f.code, f.date, f.close, l.date, l.close
+from (
+  select distinct on (code) code, date, close
+  from public.daily_prices_v2
+  where close is not null and close > 0
+  order by code, date asc
+) f
+join (
+  select distinct on (code) code, date, close
+  from public.daily_prices_v2
+  where close is not null and close > 0
+  order by code, date desc
+) l on l.code = f.code
+on conflict (code) do update set
+  first_date = excluded.first_date,
+  first_close = excluded.first_close,
+  latest_date = excluded.latest_date,
+  latest_close = excluded.latest_close,
+  updated_at = now();
+
+alter table public.company_listing_stats enable row level security;
+
+drop policy if exists "Public read access" on public.company_listing_stats;
+create policy "Public read access" on public.company_listing_stats
+  for select using (true);
+
+-- The view runs as the caller (security_invoker), hence the read policy above.
+-- Dropped and recreated so the close columns can take the table's types.
+drop view if exists public.recent_listing_returns;
+
+create view public.recent_listing_returns
+with (security_invoker = true) as
+with latest_market as (
+  select max(date) as date
+  from public.daily_prices_v2
+  where code in ('KOSPI', 'KOSDAQ', 'KS11', 'KQ11')
+), eligible_prices as (
+  select
+    c.code,
+    c.name,
+    c.marcap,
+    s.first_date as listing_date,
+    s.first_close as listing_close,
+    latest_price.date as latest_date,
+    latest_price.close as latest_close
+  from public.companies c
+  join public.company_listing_stats s on s.code = c.code
+  cross join latest_market market
+  -- Bars dated after the market date (index bars not in yet) are ignored:
+  -- the stored latest bar is used when it is within the bound, otherwise
+  -- the last bar up to the market date is looked up.
+  cross join lateral (
+    select s.latest_date as date, s.latest_close as close
+    where s.latest_date <= market.date
+    union all
+    (
+      select p.date, p.close
+      from public.daily_prices_v2 p
+      where s.latest_date > market.date
+        and p.code = s.code
+        and p.date <= market.date
+        and p.close is not null
+        and p.close > 0
+      order by p.date desc
+      limit 1
+    )
+  ) latest_price
+  where c.is_rs_eligible = true
+    and s.first_date > market.date - interval '1 year'
+)
+select
+  code,
+  name,
+  marcap,
+  listing_date,
+  listing_close,
+  latest_date,
+  latest_close,
+  round(((latest_close - listing_close) / listing_close * 100)::numeric, 2) as return_since_listing,
+  (latest_date - listing_date) as listed_days
+from eligible_prices;
+
+comment on view public.recent_listing_returns is
+  'RS 및 차트 검토 종목 수 제한과 무관한 상장 1년 이내 보통주의 상장 후 수익률';
+
+grant select on public.recent_listing_returns to anon, authenticated, service_role;
@@ -0,0 +1,160 @@
+-- Trading-value metrics for themes/industries, computed where the prices live.
+-- scripts/calculate_trading_metrics.py used to download every daily_prices_v2
+-- row of a date to sum close * volume, and re-read each theme's bars per date
+-- for returns and 20-day averages. It now calls these functions once per
+-- date chunk and only writes the results.
+--
+-- Same definitions as the old client-side code:
+-- - a bar counts when close and volume are both non-zero;
+-- - the market total is every such bar of the date (index codes included);
+-- - weighted_return weights each member's return vs the previous trading
+--   date by its share of the group's trading value;
+-- - the 20-day average is over the member's last 20 counted bars before the
+--   date, looking back at most 30 calendar days; surge_count counts members
+--   trading at >= 2x that average.
+
+create or replace function public.get_market_trading_totals(
+  start_date date,
+  end_date date
+)
+returns table (
+  date date,
+  market_trading_value numeric,
+  stock_count integer
+)
+language sql
+stable
+as $$
+  select
+    p.date,
+    sum(p.close::numeric * p.volume::numeric) as market_trading_value,
+    count(*)::integer as stock_count
+  from daily_prices_v2 p
+  where p.date between start_date and end_date
+    and p.close <> 0
+    and p.volume <> 0
+  group by p.date
+  order by p.date
+$$;
+
+-- group_type is 'theme' (company_themes) or 'industry' (company_industries);
+-- group_ids limits the result to some groups, null means all of them.
+create or replace function public.get_group_trading_metrics(
+  group_type text,
+  start_date date,
+  end_date date,
+  group_ids integer[] default null
+)
+returns table (
+  group_id integer,
+  date date,
+  total_trading_value numeric,
+  market_trading_value numeric,
+  trading_value_ratio numeric,
+  weighted_return numeric,
+  avg_surge_ratio numeric,
+  surge_count integer,
+  total_stock_count integer
+)
+language sql
+stable
+as $$
+  with members as (
+    select ct.theme_id as group_id, ct.company_code as code
+    from company_themes ct
+    where group_type = 'theme'
+      and (group_ids is null or ct.theme_id = any(group_ids))
+    union
+    select ci.industry_id, ci.company_code
+    from company_industries ci
+    where group_type = 'industry'
+      and (group_ids is null or ci.industry_id = any(group_ids))
+  ),
+  -- Two weeks before start_date is enough to find its previous trading date.
+  trading_days as (
+    select d.date, lag(d.date) over (order by d.date) as prev_date
+    from (
+      select distinct p.date
+      from daily_prices_v2 p
+      where p.date between start_date - 14 and end_date
+    ) d
+  ),
+  bars as (
+    select
+      p.code,
+      p.date,
+      p.close::numeric as close,
+      p.close::numeric * p.volume::numeric as trading_value
+    from daily_prices_v2 p
+    where p.code in (select m.code from members m)
+      and p.date between start_date - 30 and end_date
+      and p.close <> 0
+      and p.volume <> 0
+  ),
+  history as (
+    select
+      b.*,
+      lag(b.date) over w_prev as prev_bar_date,
+      lag(b.close) over w_prev as prev_bar_close,
+      array_agg(b.trading_value) over w_hist as hist_values,
+      array_agg(b.date) over w_hist as hist_dates
+    from bars b
+    window
+      w_prev as (partition by b.code order by b.date),
+      w_hist as (
+        partition by b.code
+        order by b.date
+        rows between 20 preceding and 1 preceding
+      )
+  ),
+  stock_days as (
+    select
+      h.code,
+      h.date,
+      h.trading_value,
+      case
+        when h.prev_bar_date = t.prev_date and h.prev_bar_close > 0
+          then (h.close - h.prev_bar_close) / h.prev_bar_close * 100
+      end as stock_return,
+      (
+        select avg(x.value)
+        from unnest(h.hist_values, h.hist_dates) as x(value, date)
+        where x.date >= h.date - 30
+      ) as avg_20d
+    from history h
+    join trading_days t on t.date = h.date
+    where h.date between start_date and end_date
+  ),
+  grouped as (
+    select
+      m.group_id,
+      s.date,
+      sum(s.trading_value) as total_trading_value,
+      sum(s.stock_return * s.trading_value) as weighted_sum,
+      avg(s.trading_value / s.avg_20d) filter (where s.avg_20d > 0) as avg_surge_ratio,
+      count(*) filter (where s.avg_20d > 0 and s.trading_value / s.avg_20d >= 2) as surge_count,
+      count(*) as total_stock_count
+    from members m
+    join stock_days s on s.code = m.code
+    group by m.group_id, s.date
+  )
+  select
+    g.group_id,
+    g.date,
+    round(g.total_trading_value, 2),
+    round(mt.market_trading_value, 2),
+    round(g.total_trading_value / mt.market_trading_value * 100, 4),
+    round(coalesce(g.weighted_sum / g.total_trading_value, 0), 4),
+    round(coalesce(g.avg_surge_ratio, 0), 4),
+    g.surge_count::integer,
+    g.total_stock_count::integer
+  from grouped g
+  join public.get_market_trading_totals(start_date, end_date) mt on mt.date = g.date
+  where mt.market_trading_value > 0
+  order by g.group_id, g.date
+$$;
+
+grant execute on function public.get_market_trading_totals(date, date)
+  to anon, authenticated, service_role;
+grant execute on function public.get_group_trading_metrics(text, date, date, integer[])
+  to anon, authenticated, service_role;
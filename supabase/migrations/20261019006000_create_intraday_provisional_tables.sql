@@ -0,0 +1,45 @@
+-- Provisional RS ranks and leader scores during the session, written every
+-- few minutes by scripts/intraday_snapshot.py from live KIS quotes. Each
+-- refresh replaces the date's snapshot (as_of is the quote sweep time); the
+-- final values still come from the post-close rs_rankings_v2 /
+-- leader_stocks_daily.
+
+create table if not exists rs_rankings_provisional (
+  date date not null,
+  code text not null,
+  as_of timestamptz not null,
+  price numeric not null,
+  score_weighted double precision,
+  rank_weighted integer not null,
+  primary key (date, code)
+);
+
+create index if not exists idx_rs_rankings_provisional_rank
+  on rs_rankings_provisional (date, rank_weighted desc);
+
+create table if not exists leader_stocks_provisional (
+  date date not null,
+  code text not null,
+  as_of timestamptz not null,
+  leader_score double precision not null,
+  trading_value double precision,
+  ret_1d double precision,
+  ret_rank integer,
+  rank_amount_60 integer,
+  rank_rs integer,
+  primary key (date, code)
+);
+
+create index if not exists idx_leader_stocks_provisional_score
+  on leader_stocks_provisional (date, leader_score desc);
+
+alter table rs_rankings_provisional enable row level security;
+alter table leader_stocks_provisional enable row level security;
+
+drop policy if exists "Public read access" on rs_rankings_provisional;
+create policy "Public read access" on rs_rankings_provisional
+  for select using (true);
+
+drop policy if exists "Public read access" on leader_stocks_provisional;
+create policy "Public read access" on leader_stocks_provisional
+  for select using (true);
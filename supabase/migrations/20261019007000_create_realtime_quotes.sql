@@ -0,0 +1,28 @@
+-- Latest real-time quote per watched code, written about once a second by
+-- scripts/stream_watchlist_quotes.py from the KIS websocket (H0STCNT0 trade
+-- ticks). Only codes in open user_portfolio positions or
+-- user_favorite_stocks are streamed; everything else still reads
+-- daily_prices_v2.
+
+create table if not exists realtime_quotes (
+  code text primary key,
+  price numeric not null,
+  change numeric,
+  change_rate numeric,
+  open numeric,
+  high numeric,
+  low numeric,
+  volume bigint,
+  trading_value numeric,
+  traded_at timestamptz not null,
+  updated_at timestamptz not null default now()
+);
+
+create index if not exists idx_realtime_quotes_traded_at
+  on realtime_quotes (traded_at desc);
+
+alter table realtime_quotes enable row level security;
+
+drop policy if exists "Public read access" on realtime_quotes;
+create policy "Public read access" on realtime_quotes
+  for select using (true);
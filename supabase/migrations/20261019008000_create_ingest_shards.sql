@@ -0,0 +1,29 @@
+-- Work queue and checkpoints for the sharded KIS ingest
+-- (scripts/ingest_shards.py). A run splits the stock universe into
+-- shard_count shards by a stable hash of the code; any process or host
+-- claims a pending shard (pending -> running), records the codes it has
+-- finished as it goes, and ends the shard as done or failed. The
+-- coordinator re-queues failed and stalled shards; a re-run skips
+-- done_codes.
+
+create table if not exists ingest_shards (
+  run_date date not null,
+  shard_count integer not null check (shard_count > 0),
+  shard integer not null check (shard >= 0 and shard < shard_count),
+  status text not null default 'pending'
+    check (status in ('pending', 'running', 'done', 'failed')),
+  attempts integer not null default 0,
+  worker text,
+  done_codes text[] not null default '{}',
+  failed_codes text[] not null default '{}',
+  stats jsonb,
+  error text,
+  heartbeat_at timestamptz,
+  updated_at timestamptz not null default now(),
+  primary key (run_date, shard_count, shard)
+);
+
+create index if not exists idx_ingest_shards_status
+  on ingest_shards (run_date, shard_count, status);
+
+alter table ingest_shards enable row level security;
@@ -0,0 +1,251 @@
+-- daily_prices_v2 as a table range-partitioned by year of date.
+--
+-- Every reader filters by a date range or by (code, date), so yearly
+-- partitions let the planner skip the years a query does not touch, keep
+-- each partition's indexes small, and let old years be vacuumed once and
+-- left alone. The covering indexes and get_latest_prices_by_code follow in
+-- 20261019009100_daily_prices_v2_covering_indexes.sql.
+--
+-- The existing table is renamed to daily_prices_v2_unpartitioned and copied
+-- over. The rename takes an ACCESS EXCLUSIVE lock, held until the migration
+-- commits, so reads of daily_prices_v2 and of every view and RPC built on it
+-- (the chart API, recent_listing_returns, get_latest_prices_by_code, ...)
+-- wait for the whole copy, as do writes. Run it in a maintenance window,
+-- after the post-close batch and with the app idle. Its row level security,
+-- policies and grants are carried over and recent_listing_returns is
+-- recreated, since views follow the renamed table. Any other view still
+-- reading the old table is reported with a NOTICE. Once the new table is
+-- checked, drop the old one:
+--
+--   drop table public.daily_prices_v2_unpartitioned;
+--
+-- Partitions exist from the oldest year in the data to next year; every
+-- empty partition is one more index probe for per-code reads, so years are
+-- not created far ahead. Dates outside them land in daily_prices_v2_default
+-- (nothing fails). scripts/run_daily_pipeline.py calls
+-- ensure_daily_prices_v2_partition(<target year> + 1) on every run, so the
+-- following year exists before its first bar; by hand:
+--
+--   select public.ensure_daily_prices_v2_partition(2028);
+
+do $$
+begin
+  if exists (
+    select 1 from pg_attribute
+    where attrelid = 'public.daily_prices_v2'::regclass
+      and attidentity <> '' and not attisdropped
+  ) then
+    raise exception 'daily_prices_v2 has identity columns, which partitioned tables do not support; convert them to plain defaults first';
+  end if;
+end $$;
+
+-- Taken up front (the rename below would take it anyway) so the copy does
+-- not start behind a lock upgrade.
+lock table public.daily_prices_v2 in access exclusive mode;
+
+alter table public.daily_prices_v2 rename to daily_prices_v2_unpartitioned;
+
+-- Free the index and constraint names (daily_prices_v2_pkey, ...) for the new table.
+do $$
+declare
+  idx record;
+begin
+  for idx in
+    select c.relname
+    from pg_index i
+    join pg_class c on c.oid = i.indexrelid
+    where i.indrelid = 'public.daily_prices_v2_unpartitioned'::regclass
+      and c.relname like 'daily_prices_v2%'
+  loop
+    execute format(
+      'alter index public.%I rename to %I',
+      idx.relname,
+      'daily_prices_v2_unpartitioned' || substr(idx.relname, length('daily_prices_v2') + 1)
+    );
+  end loop;
+end $$;
+
+create table public.daily_prices_v2 (
+  like public.daily_prices_v2_unpartitioned
+  including defaults including constraints including comments including storage
+) partition by range (date);
+
+create table public.daily_prices_v2_default
+  partition of public.daily_prices_v2 default;
+
+alter table public.daily_prices_v2_default enable row level security;
+
+-- Creates the partition for one year if it is missing, moving any rows of
+-- that year out of the default partition first. Security definer so the
+-- daily pipeline (service_role over RPC) can create and attach partitions
+-- of a table it does not own.
+create or replace function public.ensure_daily_prices_v2_partition(p_year integer)
+returns void
+language plpgsql
+security definer
+set search_path = public, pg_temp
+as $$
+declare
+  part text := format('daily_prices_v2_y%s', p_year);
+  lo date := make_date(p_year, 1, 1);
+  hi date := make_date(p_year + 1, 1, 1);
+begin
+  if to_regclass(format('public.%I', part)) is not null then
+    return;
+  end if;
+
+  execute format(
+    'create table public.%I (like public.daily_prices_v2 including defaults including constraints including storage)',
+    part
+  );
+  execute format(
+    'with moved as (delete from public.daily_prices_v2_default where date >= %L and date < %L returning *) '
+    'insert into public.%I select * from moved',
+    lo, hi, part
+  );
+  execute format(
+    'alter table public.daily_prices_v2 attach partition public.%I for values from (%L) to (%L)',
+    part, lo, hi
+  );
+  -- Reads and writes go through the parent; a partition queried directly
+  -- (PostgREST exposes it too) answers nothing to anon/authenticated.
+  execute format('alter table public.%I enable row level security', part);
+end;
+$$;
+
+revoke all on function public.ensure_daily_prices_v2_partition(integer) from public, anon, authenticated;
+grant execute on function public.ensure_daily_prices_v2_partition(integer) to service_role;
+
+do $$
+declare
+  first_year integer;
+begin
+  select coalesce(extract(year from min(date))::integer, extract(year from current_date)::integer)
+    into first_year
+  from public.daily_prices_v2_unpartitioned;
+
+  for y in first_year .. extract(year from current_date)::integer + 1 loop
+    perform public.ensure_daily_prices_v2_partition(y);
+  end loop;
+end $$;
+
+insert into public.daily_prices_v2
+select * from public.daily_prices_v2_unpartitioned;
+
+-- The key carries close and trading_value so per-code history reads
+-- ((code, date) in either direction) are index-only scans.
+alter table public.daily_prices_v2
+  add constraint daily_prices_v2_pkey primary key (code, date) include (close, trading_value);
+
+-- Row level security, policies and grants as they were on the old table.
+do $$
+declare
+  pol record;
+  grant_row record;
+begin
+  if (select relrowsecurity from pg_class where oid = 'public.daily_prices_v2_unpartitioned'::regclass) then
+    alter table public.daily_prices_v2 enable row level security;
+  end if;
+
+  for pol in
+    select * from pg_policies
+    where schemaname = 'public' and tablename = 'daily_prices_v2_unpartitioned'
+  loop
+    execute format(
+      'create policy %I on public.daily_prices_v2 as %s for %s to %s%s%s',
+      pol.policyname,
+      pol.permissive,
+      pol.cmd,
+      (select string_agg(case when r = 'public' then 'public' else quote_ident(r) end, ', ') from unnest(pol.roles) r),
+      case when pol.qual is not null then format(' using (%s)', pol.qual) else '' end,
+      case when pol.with_check is not null then format(' with check (%s)', pol.with_check) else '' end
+    );
+  end loop;
+
+  for grant_row in
+    select grantee, string_agg(privilege_type, ', ') as privileges
+    from information_schema.role_table_grants
+    where table_schema = 'public'
+      and table_name = 'daily_prices_v2_unpartitioned'
+      and grantee <> current_user
+    group by grantee
+  loop
+    execute format(
+      'grant %s on public.daily_prices_v2 to %s',
+      grant_row.privileges,
+      case when grant_row.grantee = 'PUBLIC' then 'public' else quote_ident(grant_row.grantee) end
+    );
+  end loop;
+end $$;
+
+-- Same definition as 20261019004000_create_company_listing_stats.sql,
+-- recreated so it reads the new table.
+create or replace view public.recent_listing_returns
+with (security_invoker = true) as
+with latest_market as (
+  select max(date) as date
+  from public.daily_prices_v2
+  where code in ('KOSPI', 'KOSDAQ', 'KS11', 'KQ11')
+), eligible_prices as (
+  select
+    c.code,
+    c.name,
+    c.marcap,
+    s.first_date as listing_date,
+    s.first_close as listing_close,
+    latest_price.date as latest_date,
+    latest_price.close as latest_close
+  from public.companies c
+  join public.company_listing_stats s on s.code = c.code
+  cross join latest_market market
+  -- Bars dated after the market date (index bars not in yet) are ignored:
+  -- the stored latest bar is used when it is within the bound, otherwise
+  -- the last bar up to the market date is looked up.
+  cross join lateral (
+    select s.latest_date as date, s.latest_close as close
+    where s.latest_date <= market.date
+    union all
+    (
+      select p.date, p.close
+      from public.daily_prices_v2 p
+      where s.latest_date > market.date
+        and p.code = s.code
+        and p.date <= market.date
+        and p.close is not null
+        and p.close > 0
+      order by p.date desc
+      limit 1
+    )
+  ) latest_price
+  where c.is_rs_eligible = true
+    and s.first_date > market.date - interval '1 year'
+)
+select
+  code,
+  name,
+  marcap,
+  listing_date,
+  listing_close,
+  latest_date,
+  latest_close,
+  round(((latest_close - listing_close) / listing_close * 100)::numeric, 2) as return_since_listing,
+  (latest_date - listing_date) as listed_days
+from eligible_prices;
+
+do $$
+declare
+  dependent text;
+begin
+  for dependent in
+    select distinct v.oid::regclass::text
+    from pg_depend d
+    join pg_rewrite r on r.oid = d.objid
+    join pg_class v on v.oid = r.ev_class
+    where d.refobjid = 'public.daily_prices_v2_unpartitioned'::regclass
+      and v.oid <> 'public.daily_prices_v2_unpartitioned'::regclass
+  loop
+    raise notice 'view % still reads daily_prices_v2_unpartitioned; recreate it before dropping that table', dependent;
+  end loop;
+end $$;
+
+analyze public.daily_prices_v2;
@@ -0,0 +1,49 @@
+-- Covering indexes for the daily_prices_v2 reads of the Python scripts,
+-- on the partitioned table from 20261019009000_partition_daily_prices_v2_by_year.sql.
+--
+-- By date: the keyset pager (scripts/keyset_pager.py) walks date ranges
+-- in (date, code) order selecting code, date, close or trading_value, and
+-- the trading value rank reads one date with volume. code is a key column
+-- (not an INCLUDE) so those pages come out of the index already ordered.
+--
+-- By code: the primary key (code, date) include (close, trading_value)
+-- from the previous migration serves (code, date desc) reads backwards.
+
+create index if not exists idx_daily_prices_v2_date_code_covering
+  on public.daily_prices_v2 (date, code) include (close, volume, trading_value);
+
+-- The latest bar per code. DISTINCT ON (code) ... ORDER BY code, date DESC
+-- read every row of the table; this walks the distinct codes through the
+-- primary key (one probe per code and partition) and takes each code's
+-- newest row with one more probe. Same result, including codes that are
+-- no longer in companies.
+create or replace function public.get_latest_prices_by_code()
+returns table(code text, date text, close numeric)
+language sql
+stable
+as $function$
+  with recursive codes as (
+    (select p.code from public.daily_prices_v2 p order by p.code limit 1)
+    union all
+    select (
+      select p.code from public.daily_prices_v2 p
+      where p.code > codes.code
+      order by p.code
+      limit 1
+    )
+    from codes
+    where codes.code is not null
+  )
+  select codes.code, latest.date::text, latest.close
+  from codes
+  cross join lateral (
+    select p.date, p.close
+    from public.daily_prices_v2 p
+    where p.code = codes.code
+    order by p.date desc
+    limit 1
+  ) latest
+  where codes.code is not null;
+$function$;
+
+analyze public.daily_prices_v2;
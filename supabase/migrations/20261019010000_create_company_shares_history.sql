@@ -0,0 +1,41 @@
+-- Point-in-time share counts per code, for the historical market cap that
+-- scripts/market_cap_history.py derives into daily_prices_v2.market_cap.
+--
+-- Rows come from DART 주식의 총수 현황 (source 'dart': common shares issued
+-- at the report's settlement date) and from the KIS master's listed shares
+-- (source 'kis_master': the collection date, stored when the count
+-- changes). shares are raw counts as of date.
+--
+-- daily_prices_v2.close is split-adjusted, so a raw count only multiplies
+-- with it after the price adjustment made since date is undone. Where the
+-- count jumps between two rows, price_raw holds KIS's unadjusted close on
+-- price_date (the last session on or before date); the build divides it by
+-- the stored adjusted close of that day. Between jumps the factor carries
+-- over, since splits and bonus issues change the count.
+
+create table if not exists public.company_shares_history (
+  code text not null,
+  date date not null,
+  source text not null check (source in ('dart', 'kis_master')),
+  shares bigint not null check (shares > 0),
+  bsns_year integer,
+  reprt_code text,
+  rcept_no text,
+  price_date date,
+  price_raw numeric,
+  updated_at timestamptz not null default now(),
+  primary key (code, date)
+);
+
+create index if not exists idx_company_shares_history_report
+  on public.company_shares_history (bsns_year, reprt_code)
+  where source = 'dart';
+
+alter table public.company_shares_history enable row level security;
+
+drop policy if exists "Public read access" on public.company_shares_history;
+create policy "Public read access" on public.company_shares_history
+  for select using (true);
+
+comment on column public.daily_prices_v2.market_cap is
+  'Market capitalization. The bar ingested each day gets the KIS quote (hts_avls, in 100M won, or the master snapshot in won); history is close x point-in-time shares in won (scripts/market_cap_history.py)';
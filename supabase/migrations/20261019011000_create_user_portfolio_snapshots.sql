@@ -0,0 +1,74 @@
+-- Nightly mark-to-market of every user's portfolio, written after the price
+-- ingest by scripts/update_portfolio_snapshots.py (daily pipeline step
+-- "portfolio_snapshots"). Holdings are replayed from user_portfolio and the
+-- SELL log in user_portfolio_transactions and valued at each trading day's
+-- close (manual_current_price for custom assets).
+--
+-- user_portfolio_snapshots has one row per (company_code, position_type)
+-- group a user holds at that day's close, the same grouping the portfolio
+-- page uses. user_portfolio_nav has the per-user totals for every trading
+-- day since the user's first entry; long_value is the page's 총 자산
+-- without cash, which only lives in the browser. A page reads the latest
+-- nav row and that date's snapshot rows through the primary keys.
+
+create table if not exists public.user_portfolio_snapshots (
+  user_id uuid not null references auth.users(id) on delete cascade,
+  date date not null,
+  company_code text not null,
+  position_type text not null,
+  company_name text,
+  sector text,
+  is_custom_asset boolean not null default false,
+  lots integer not null,
+  quantity numeric(18, 4) not null,
+  avg_price numeric(18, 4) not null,
+  stop_loss numeric(18, 4),
+  cost_amount numeric(20, 2) not null,
+  price numeric(18, 4),
+  market_value numeric(20, 2),
+  unrealized_pnl numeric(20, 2),
+  realized_pnl numeric(20, 2) not null default 0,
+  r_value numeric(20, 2),
+  updated_at timestamptz not null default now(),
+  primary key (user_id, date, company_code, position_type)
+);
+
+create table if not exists public.user_portfolio_nav (
+  user_id uuid not null references auth.users(id) on delete cascade,
+  date date not null,
+  positions integer not null,
+  long_value numeric(20, 2) not null,
+  short_value numeric(20, 2) not null,
+  cost_amount numeric(20, 2) not null,
+  unrealized_pnl numeric(20, 2) not null,
+  realized_pnl numeric(20, 2) not null,
+  total_pnl numeric(20, 2) not null,
+  updated_at timestamptz not null default now(),
+  primary key (user_id, date)
+);
+
+create index if not exists idx_user_portfolio_nav_date
+  on public.user_portfolio_nav (date);
+
+alter table public.user_portfolio_snapshots enable row level security;
+alter table public.user_portfolio_nav enable row level security;
+
+drop policy if exists "Users can view own portfolio snapshots" on public.user_portfolio_snapshots;
+create policy "Users can view own portfolio snapshots"
+  on public.user_portfolio_snapshots for select
+  using (auth.uid() = user_id);
+
+drop policy if exists "Users can view own portfolio nav" on public.user_portfolio_nav;
+create policy "Users can view own portfolio nav"
+  on public.user_portfolio_nav for select
+  using (auth.uid() = user_id);
+
+grant select on public.user_portfolio_snapshots to authenticated;
+grant select on public.user_portfolio_nav to authenticated;
+grant all on public.user_portfolio_snapshots to service_role;
+grant all on public.user_portfolio_nav to service_role;
+
+comment on column public.user_portfolio_nav.realized_pnl is
+  'Realized P&L of all lots through date, closed groups included';
+comment on column public.user_portfolio_snapshots.unrealized_pnl is
+  'Signed: (price - avg_price) x quantity for 롱, the reverse for 숏';